@@ -0,0 +1,254 @@
+"""
+asyncio server: same CommandExecutor as the select server,
+with non-blocking writes and no per-iteration O(connections) work
+"""
+
+import asyncio
+import signal
+
+from commands import CommandExecutor
+from connection import ClientConnection
+from photondb import PhotonDB
+from value import clock
+
+
+class AsyncConnection(ClientConnection):
+    """ClientConnection on an asyncio transport"""
+
+    def __init__(self, server, transport: asyncio.Transport, addr: str = ""):
+        super().__init__(server, addr)
+        self.transport = transport
+
+
+    def write_bytes(self, data: bytes) -> None:
+        # never blocks: asyncio keeps what the kernel doesn't accept yet
+        self.transport.write(data)
+        self.executor.stats.net_output_bytes += len(data)
+
+
+    def close_transport(self) -> None:
+        self.transport.close()
+
+
+class PhotonDBProtocol(asyncio.Protocol):
+    """one instance per client connection"""
+
+    def __init__(self, server: "AsyncPhotonDBServer"):
+        self.server = server
+        self.conn: AsyncConnection = None
+        self.transport: asyncio.Transport = None
+
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        peer = transport.get_extra_info("peername")
+        addr = f"{peer[0]}:{peer[1]}" if peer else ""
+        self.conn = AsyncConnection(self.server, transport, addr)
+        self.server.add_client(self.conn)
+
+
+    def data_received(self, data: bytes):
+        self.server.command_executor.stats.net_input_bytes += len(data)
+        self.conn.feed(data)
+
+
+    def connection_lost(self, exc):
+        self.conn.connection_lost()
+
+
+    def pause_writing(self):
+        # the client doesn't read its replies: stop reading its commands
+        self.conn.write_paused = True
+        self.transport.pause_reading()
+
+
+    def resume_writing(self):
+        self.conn.write_paused = False
+        if not self.conn.closed:
+            self.transport.resume_reading()
+            self.conn.resume()
+
+
+class AsyncPhotonDBServer:
+    """
+    PhotonDB server on the asyncio event loop.
+
+    The loop uses epoll/kqueue, so idle connections cost nothing
+    per iteration and there is no 1024 FD limit. Replies produced
+    in a loop iteration are written once, in a callback scheduled
+    at the end of the iteration. Expiry and snapshots are timers
+    on the same loop: they never run concurrently with a command,
+    and the snapshot itself is written by a forked child (BGSAVE).
+    """
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 6379, db: PhotonDB = None,
+                 replicaof: tuple[str, int] = None):
+        self.host = host
+        self.port = port
+
+        self.db = db if db is not None else PhotonDB()
+        self.command_executor = CommandExecutor(self.db)
+        self.command_executor.replication.listening_port = port
+        self.command_executor.stats.tcp_port = port
+        self.command_executor.stats.mode = "asyncio"
+        self.replicaof = replicaof
+
+        self.clients: dict[int, ClientConnection] = {}
+        self.pending_writes: set[ClientConnection] = set()
+
+        self.save_interval = 30
+        self.cron_interval = 0.1
+
+        self.loop: asyncio.AbstractEventLoop = None
+        self.server: asyncio.AbstractServer = None
+        self._flush_scheduled = False
+        self._tasks: list[asyncio.Task] = []
+        self._main_task: asyncio.Task = None
+
+
+    def start(self):
+        """run the event loop until Ctrl+C"""
+
+        try:
+            asyncio.run(self.serve())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+
+        self.server = await self.loop.create_server(
+            lambda: PhotonDBProtocol(self),
+            self.host,
+            self.port,
+            reuse_address=True,
+            backlog=511,
+        )
+
+        print(f"🚀 PhotonDB Server listening on {self.host}:{self.port} (asyncio)")
+        print(f"   Auto-save enabled (every {self.save_interval}s)\n")
+
+        # SIGTERM (kill, docker stop, sharded mode) stops gracefully like Ctrl+C
+        self._main_task = asyncio.current_task()
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self._main_task.cancel)
+        except NotImplementedError:
+            pass
+
+        if self.replicaof is not None:
+            self.command_executor.replication.replicaof(*self.replicaof)
+
+        self._tasks = [
+            asyncio.create_task(self._cron_loop()),
+            asyncio.create_task(self._save_loop()),
+            asyncio.create_task(self._loading_loop()),
+        ]
+
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            print("\n🛑 Server stopping...")
+            for task in self._tasks:
+                task.cancel()
+            self.stop()
+
+
+    def stop(self):
+        """final save and close all the connections"""
+
+        print("💾 Final save before shutdown...")
+        self.db.persistence.wait_bgsave()
+        self.db.persistence.save_snapshot(self.db)
+        if self.db.aof is not None:
+            self.db.aof.close()
+
+        for conn in list(self.clients.values()):
+            conn.close()
+
+        print("✓ Server stopped")
+
+
+    # =============== connections =============== #
+
+
+    def add_client(self, conn: ClientConnection):
+        self.clients[conn.id] = conn
+        self.command_executor.stats.client_connected()
+
+
+    def remove_client(self, conn: ClientConnection):
+        if self.clients.pop(conn.id, None) is not None:
+            self.command_executor.stats.client_disconnected()
+        self.pending_writes.discard(conn)
+
+
+    def schedule_flush(self, conn: ClientConnection):
+        """
+        called by a connection when its write buffer is not empty:
+        the writes happen once, after every read of this iteration
+        """
+
+        self.pending_writes.add(conn)
+
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self.flush_pending)
+
+
+    def flush_pending(self):
+        self._flush_scheduled = False
+
+        # the writes hit the AOF before the clients see their replies
+        if self.db.aof is not None:
+            self.db.aof.flush()
+
+        pending = self.pending_writes
+        self.pending_writes = set()
+        for conn in pending:
+            conn.flush()
+
+
+    # =============== periodic tasks =============== #
+
+
+    async def _cron_loop(self):
+        while True:
+            await asyncio.sleep(self.cron_interval)
+            try:
+                clock.tick()
+                self.db.cleanup_expired_keys()
+                self.command_executor.blocking.expire()
+                self.db.persistence.check_bgsave()
+                self.command_executor.replication.cron()
+                self.command_executor.stats.cron()
+                if self.db.aof is not None:
+                    self.db.aof.cron(self.db)
+            except Exception as e:
+                print(f"✗ Error in expiry cycle: {e}")
+
+
+    async def _loading_loop(self):
+        """lazy snapshot load: a slice per iteration, clients are served in between"""
+
+        try:
+            while self.db.loading_step():
+                await asyncio.sleep(0)
+        except Exception as e:
+            # serving (and saving) a part of the dataset would lose the rest
+            print(f"✗ Snapshot load failed: {e}")
+            print("✗ Stopping the server, the snapshot file is left as it is")
+            self._main_task.cancel()
+
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            if self.db.loader is not None:
+                continue
+            try:
+                # forked child: the loop keeps serving while it writes
+                self.db.persistence.start_bgsave(self.db)
+            except Exception as e:
+                print(f"✗ Error in background save: {e}")
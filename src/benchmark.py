@@ -11,14 +11,29 @@ Purpose:
 """
 
 
+import sys
+import tempfile
 import time
+import tracemalloc
+
 from photondb import PhotonDB
 from commands import CommandExecutor
+from connection import ClientConnection
+from parser import RespEncoder
+
+
+# i benchmark non toccano data/dump.rdb: ogni db ha una cartella qui dentro
+_TMP = tempfile.TemporaryDirectory(prefix="photondb-bench-")
+
+
+def _temp_db(**options) -> PhotonDB:
+    """PhotonDB vuoto su una cartella temporanea"""
+    return PhotonDB(data_dir=tempfile.mkdtemp(dir=_TMP.name), **options)
 
 
 def benchmark_set_1m():
     """SET di 1M chiavi"""
-    db = PhotonDB()
+    db = _temp_db()
     executor = CommandExecutor(db)
     
     start = time.time()
@@ -31,7 +46,7 @@ def benchmark_set_1m():
 
 def benchmark_get_1m():
     """GET di 1M chiavi"""
-    db = PhotonDB()
+    db = _temp_db()
     executor = CommandExecutor(db)
     
     # Popola
@@ -48,7 +63,7 @@ def benchmark_get_1m():
 
 def benchmark_persistence():
     """SAVE di 1M chiavi"""
-    db = PhotonDB()
+    db = _temp_db()
     executor = CommandExecutor(db)
     
     # Popola
@@ -64,9 +79,245 @@ def benchmark_persistence():
     print(f"SAVE 1M keys: {elapsed:.2f} sec")
 
 
+def benchmark_memory(n: int = 1_000_000):
+    """bytes per key of n small string keys, against the raw key + value strings"""
+    db = _temp_db()
+    executor = CommandExecutor(db)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        executor.execute(["SET", f"key:{i}", f"value:{i}"])
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    raw = sum(sys.getsizeof(f"key:{i}") + sys.getsizeof(f"value:{i}") for i in range(n))
+    print(f"MEMORY {n:,} keys: {used / n:.0f} bytes/key "
+          f"({raw / n:.0f} of key and value strings, {(used - raw) / n:.0f} of overhead)")
+
+
+def benchmark_list_queue(sizes=(1_000, 100_000, 10_000_000), ops: int = 100_000):
+    """LPUSH/RPOP queue, LINDEX and LRANGE on lists of growing size: the time per op must not grow"""
+    for size in sizes:
+        db = _temp_db()
+        executor = CommandExecutor(db)
+
+        batch = ["item"] * 1000
+        for _ in range(size // 1000):
+            executor.execute(["RPUSH", "queue", *batch])
+
+        start = time.time()
+        for i in range(ops):
+            executor.execute(["LPUSH", "queue", "job"])
+            executor.execute(["RPOP", "queue"])
+        queue_us = (time.time() - start) / ops * 1e6
+
+        start = time.time()
+        for i in range(ops):
+            executor.execute(["LRANGE", "queue", "-10", "-1"])
+        lrange_us = (time.time() - start) / ops * 1e6
+
+        start = time.time()
+        for i in range(1000):
+            executor.execute(["LINDEX", "queue", str(size // 2)])
+        lindex_us = (time.time() - start) / 1000 * 1e6
+
+        print(f"LIST {size:>12,} items: LPUSH+RPOP {queue_us:.2f} us, "
+              f"LRANGE -10 -1 {lrange_us:.2f} us, LINDEX middle {lindex_us:.2f} us")
+
+
+def benchmark_bulk_load(n: int = 1_000_000):
+    """warm-up di n chiavi: SET uno alla volta vs execute_many (MSET) vs MGET"""
+    cmds = [["SET", f"key:{i}", f"value:{i}"] for i in range(n)]
+
+    executor = CommandExecutor(_temp_db())
+    start = time.time()
+    for cmd in cmds:
+        executor.execute(cmd)
+    single = time.time() - start
+
+    executor = CommandExecutor(_temp_db())
+    start = time.time()
+    executor.execute_many(cmds)
+    bulk = time.time() - start
+
+    keys = [f"key:{i}" for i in range(n)]
+    start = time.time()
+    for i in range(0, n, 1000):
+        executor.execute(["MGET", *keys[i:i + 1000]])
+    mget = time.time() - start
+
+    print(f"BULK {n:,} keys: SET {n/single:,.0f} ops/sec, execute_many {n/bulk:,.0f} ops/sec, "
+          f"MGET x1000 {n/mget:,.0f} keys/sec")
+
+
+def benchmark_zset(n: int = 1_000_000, ops: int = 100_000):
+    """leaderboard da n membri: ZADD, ZINCRBY, ZRANK, top 10, ZRANGEBYSCORE, ZPOPMIN, snapshot"""
+    import random
+
+    db = _temp_db()
+    executor = CommandExecutor(db)
+    scores = [str(random.randrange(10_000_000)) for _ in range(n)]
+
+    start = time.time()
+    for i in range(0, n, 1000):
+        args = []
+        for j in range(i, min(i + 1000, n)):
+            args += [scores[j], f"player:{j}"]
+        executor.execute(["ZADD", "leaderboard", *args])
+    zadd = time.time() - start
+    print(f"ZSET {n:,} members: ZADD {n/zadd:,.0f} members/sec")
+
+    members = [f"player:{random.randrange(n)}" for _ in range(ops)]
+    for name, make in (
+        ("ZINCRBY", lambda m: ["ZINCRBY", "leaderboard", "7", m]),
+        ("ZRANK", lambda m: ["ZRANK", "leaderboard", m]),
+        ("ZSCORE", lambda m: ["ZSCORE", "leaderboard", m]),
+        ("ZREVRANGE 0 9", lambda m: ["ZREVRANGE", "leaderboard", "0", "9", "WITHSCORES"]),
+        ("ZRANGEBYSCORE x10", lambda m: ["ZRANGEBYSCORE", "leaderboard", "5000000", "+inf", "LIMIT", "0", "10"]),
+        ("ZCOUNT", lambda m: ["ZCOUNT", "leaderboard", "1000000", "(2000000"]),
+    ):
+        cmds = [make(m) for m in members]
+        start = time.time()
+        for cmd in cmds:
+            executor.execute(cmd)
+        elapsed = time.time() - start
+        print(f"  {name:<18} {elapsed / ops * 1e6:6.2f} us/op")
+
+    start = time.time()
+    for _ in range(ops):
+        executor.execute(["ZPOPMIN", "leaderboard"])
+    print(f"  {'ZPOPMIN':<18} {(time.time() - start) / ops * 1e6:6.2f} us/op")
+
+    start = time.time()
+    db.persistence.save_snapshot(db)
+    saved = time.time() - start
+    start = time.time()
+    PhotonDB(data_dir=db.persistence.data_dir)
+    print(f"  SAVE {saved:.2f} sec, load {time.time() - start:.2f} sec")
+
+
+def benchmark_sets(keys: int = 10_000, ops: int = 10_000):
+    """set di ID: memoria intset vs hashtable, SINTER piccolo x grande"""
+    db = _temp_db()
+    executor = CommandExecutor(db)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(keys):
+        executor.execute(["SADD", f"tags:{i}", *map(str, range(i % 100, i % 100 + 200))])
+    intsets = tracemalloc.get_traced_memory()[0] - before
+
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(keys):
+        executor.execute(["SADD", f"names:{i}", *(f"u{n}" for n in range(i % 100, i % 100 + 200))])
+    hashtables = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"SET {keys:,} sets of 200 IDs: intset {intsets / keys:,.0f} bytes/set, "
+          f"hashtable {hashtables / keys:,.0f} bytes/set")
+
+    executor.execute(["SADD", "everyone", *(f"u{n}" for n in range(1_000_000))])
+    executor.execute(["SADD", "online", *(f"u{n}" for n in range(0, 1_000_000, 100_000))])
+    start = time.time()
+    for _ in range(ops):
+        executor.execute(["SINTER", "everyone", "online"])
+    print(f"  SINTER 1M x 10 members: {(time.time() - start) / ops * 1e6:.2f} us/op")
+
+
+class _BenchServer:
+    """server finto: raccoglie le connessioni da scrivere, senza socket"""
+    def __init__(self):
+        self.command_executor = CommandExecutor(_temp_db())
+        self.pending_writes = set()
+
+    def schedule_flush(self, conn):
+        self.pending_writes.add(conn)
+
+    def flush_pending(self):
+        pending, self.pending_writes = self.pending_writes, set()
+        for conn in pending:
+            conn.flush()
+
+    def remove_client(self, conn):
+        pass
+
+
+class _BenchConnection(ClientConnection):
+    """connessione finta: conta i byte scritti"""
+    written = 0
+
+    def write_bytes(self, data: bytes) -> None:
+        self.written += len(data)
+
+    def close_transport(self) -> None:
+        pass
+
+
+def benchmark_pubsub(subscribers: int = 10_000, messages: int = 1_000):
+    """PUBLISH verso 10k iscritti (canale e pattern), flush dopo ogni messaggio"""
+    server = _BenchServer()
+    executor = server.command_executor
+    conns = [_BenchConnection(server) for _ in range(subscribers)]
+    for i, conn in enumerate(conns):
+        if i % 2:
+            conn.feed(RespEncoder.encode_command(["SUBSCRIBE", "news"]))
+        else:
+            conn.feed(RespEncoder.encode_command(["PSUBSCRIBE", "news*"]))
+    # pattern che non corrispondono: l'indice evita di provarli a ogni messaggio
+    idle = _BenchConnection(server)
+    idle.feed(RespEncoder.encode_command(["PSUBSCRIBE", *(f"room:{i}:*" for i in range(1_000))]))
+    server.flush_pending()
+
+    payload = "x" * 100
+    start = time.time()
+    for _ in range(messages):
+        executor.execute(["PUBLISH", "news", payload])
+        server.flush_pending()
+    elapsed = time.time() - start
+
+    deliveries = messages * subscribers
+    print(f"PUBLISH to {subscribers:,} subscribers: {messages / elapsed:,.0f} msg/s, "
+          f"{deliveries / elapsed:,.0f} deliveries/s")
+
+
+def benchmark_blocking_pop(ops: int = 100_000, workers: int = 100):
+    """BLPOP: latenza LPUSH -> risposta al worker in attesa, contro LPOP a polling"""
+    server = _BenchServer()
+    producer = _BenchConnection(server)
+    consumers = [_BenchConnection(server) for _ in range(workers)]
+    blpop = RespEncoder.encode_command(["BLPOP", "jobs", "0"])
+    lpush = RespEncoder.encode_command(["LPUSH", "jobs", "job"])
+    for conn in consumers:
+        conn.feed(blpop)
+
+    start = time.perf_counter()
+    for i in range(ops):
+        # la risposta e' gia' nel buffer del worker quando feed() ritorna
+        producer.feed(lpush)
+        worker = consumers[i % workers]
+        worker.output.clear()
+        worker.feed(blpop)
+    elapsed = time.perf_counter() - start
+    print(f"BLPOP handoff with {workers} parked workers: {elapsed / ops * 1e6:.2f} us/job "
+          f"(LPUSH + wake + BLPOP again)")
+
+    lpop = RespEncoder.encode_command(["LPOP", "jobs"])
+    start = time.perf_counter()
+    for _ in range(ops):
+        producer.feed(lpop)
+    print(f"  LPOP on an empty list (one polling round): {(time.perf_counter() - start) / ops * 1e6:.2f} us")
+
+
 if __name__ == "__main__":
     print("PhotonDB Benchmark Suite\n")
     benchmark_set_1m()
     benchmark_get_1m()
     benchmark_persistence()
+    benchmark_memory()
+    benchmark_list_queue()
+    benchmark_bulk_load()
+    benchmark_zset()
+    benchmark_sets()
+    benchmark_pubsub()
+    benchmark_blocking_pop()
     print("\nBenchmark completed for 1M\n.")
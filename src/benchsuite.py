@@ -0,0 +1,585 @@
+"""
+Benchmark suite for PhotonDB: reproducible micro-benchmarks and
+memory figures, compared against a stored baseline.
+
+    python src/benchsuite.py --save baseline.json       # on the reference commit
+    python src/benchsuite.py --compare baseline.json    # exit status 1 on a regression
+    python src/benchsuite.py --quick -k list,hash       # smaller runs, some families only
+
+Every case gets a fresh PhotonDB on a temporary data dir (the real
+data/dump.rdb is never read nor written), is warmed up, then timed
+--repeat times: the report gives the median and the standard
+deviation of the time per operation. Memory is measured apart, with
+tracemalloc (it slows everything down), as bytes per key.
+
+A time is a regression when the median is more than --tolerance
+slower than the baseline and the difference is larger than the
+noise (twice the standard deviation); a memory figure when it grows
+more than --memory-tolerance. Times are compared relative to a fixed
+reference workload timed before each run, so a machine that is
+busier or slower than when the baseline was taken doesn't look like
+a regression; baselines are still best taken on the same host.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+from commands import CommandExecutor
+from netbench import git_revision
+from parser import AsciiParser, RespEncoder, RespParser, SimpleString
+from photondb import PhotonDB
+
+
+class Bench:
+    """what a case times: run() does ops operations, setup() prepares each run untimed"""
+
+    __slots__ = ("run", "ops", "setup")
+
+    def __init__(self, run: Callable[[], None], ops: int, setup: Optional[Callable[[], None]] = None):
+        self.run = run
+        self.ops = ops
+        self.setup = setup
+
+
+class Context:
+    """temporary data dir of the suite, one subfolder per database"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+
+    def executor(self, **options) -> CommandExecutor:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = PhotonDB(data_dir=tempfile.mkdtemp(dir=self.root), **options)
+        return CommandExecutor(db)
+
+
+# family -> [(name, case)], in definition order
+CASES: dict[str, list[tuple[str, Callable]]] = {}
+
+
+def case(family: str, name: str):
+    def register(fn):
+        CASES.setdefault(family, []).append((name, fn))
+        return fn
+    return register
+
+
+def _commands(executor: CommandExecutor, cmds: list[list[str]]) -> Callable[[], None]:
+    execute = executor.execute
+
+    def run():
+        for cmd in cmds:
+            execute(cmd)
+    return run
+
+
+def _flush(executor: CommandExecutor) -> Callable[[], None]:
+    return lambda: executor.execute(["FLUSHDB"])
+
+
+# =============== string =============== #
+
+
+@case("string", "SET")
+def _set(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["SET", f"key:{i}", f"value:{i}"] for i in range(n)]
+    return Bench(_commands(ex, cmds), n, _flush(ex))
+
+
+@case("string", "GET")
+def _get(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    for i in range(n):
+        ex.execute(["SET", f"key:{i}", f"value:{i}"])
+    return Bench(_commands(ex, [["GET", f"key:{i}"] for i in range(n)]), n)
+
+
+@case("string", "GET miss")
+def _get_miss(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    return Bench(_commands(ex, [["GET", f"key:{i}"] for i in range(n)]), n)
+
+
+@case("string", "INCR")
+def _incr(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    return Bench(_commands(ex, [["INCR", f"counter:{i % 1000}"] for i in range(n)]), n)
+
+
+@case("string", "MSET x10")
+def _mset(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["MSET", *(arg for j in range(i, i + 10) for arg in (f"key:{j}", f"value:{j}"))]
+            for i in range(0, n, 10)]
+    return Bench(_commands(ex, cmds), len(cmds), _flush(ex))
+
+
+@case("string", "MGET x10")
+def _mget(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    for i in range(n):
+        ex.execute(["SET", f"key:{i}", f"value:{i}"])
+    cmds = [["MGET", *(f"key:{j}" for j in range(i, i + 10))] for i in range(0, n, 10)]
+    return Bench(_commands(ex, cmds), len(cmds))
+
+
+# =============== list =============== #
+
+
+@case("list", "LPUSH+RPOP")
+def _list_queue(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    ex.execute(["RPUSH", "queue", *(["item"] * 1000)])
+    cmds = []
+    for _ in range(n):
+        cmds.append(["LPUSH", "queue", "job"])
+        cmds.append(["RPOP", "queue"])
+    return Bench(_commands(ex, cmds), n)
+
+
+@case("list", "LRANGE 0 9")
+def _lrange(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    ex.execute(["RPUSH", "list", *(["item"] * 1000)])
+    return Bench(_commands(ex, [["LRANGE", "list", "0", "9"]] * n), n)
+
+
+@case("list", "LINDEX middle")
+def _lindex(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    for _ in range(100):
+        ex.execute(["RPUSH", "list", *(["item"] * 1000)])
+    return Bench(_commands(ex, [["LINDEX", "list", "50000"]] * n), n)
+
+
+# =============== hash =============== #
+
+
+@case("hash", "HSET")
+def _hset(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["HSET", f"user:{i // 10}", f"field:{i % 10}", f"value:{i}"] for i in range(n)]
+    return Bench(_commands(ex, cmds), n, _flush(ex))
+
+
+@case("hash", "HGET")
+def _hget(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["HSET", f"user:{i // 10}", f"field:{i % 10}", f"value:{i}"] for i in range(n)]
+    _commands(ex, cmds)()
+    return Bench(_commands(ex, [["HGET", f"user:{i // 10}", f"field:{i % 10}"] for i in range(n)]), n)
+
+
+@case("hash", "HGETALL 10 fields")
+def _hgetall(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    keys = max(1, n // 10)
+    for i in range(keys):
+        ex.execute(["HMSET", f"user:{i}", *(arg for f in range(10) for arg in (f"field:{f}", "value"))])
+    return Bench(_commands(ex, [["HGETALL", f"user:{i % keys}"] for i in range(n)]), n)
+
+
+# =============== set / sorted set =============== #
+
+
+@case("set", "SADD")
+def _sadd(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["SADD", f"tags:{i // 100}", f"tag:{i % 100}"] for i in range(n)]
+    return Bench(_commands(ex, cmds), n, _flush(ex))
+
+
+@case("set", "SISMEMBER")
+def _sismember(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    ex.execute(["SADD", "ids", *map(str, range(0, 1000, 2))])
+    return Bench(_commands(ex, [["SISMEMBER", "ids", str(i % 1000)] for i in range(n)]), n)
+
+
+@case("zset", "ZADD")
+def _zadd(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["ZADD", "leaderboard", str((i * 7919) % n), f"player:{i}"] for i in range(n)]
+    return Bench(_commands(ex, cmds), n, _flush(ex))
+
+
+@case("zset", "ZRANK")
+def _zrank(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    for i in range(0, n, 1000):
+        ex.execute(["ZADD", "leaderboard",
+                    *(arg for j in range(i, min(i + 1000, n)) for arg in (str((j * 7919) % n), f"player:{j}"))])
+    return Bench(_commands(ex, [["ZRANK", "leaderboard", f"player:{i}"] for i in range(n)]), n)
+
+
+# =============== expiry =============== #
+
+
+@case("expiry", "SET EX")
+def _set_ex(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    cmds = [["SET", f"session:{i}", "data", "EX", "3600"] for i in range(n)]
+    return Bench(_commands(ex, cmds), n, _flush(ex))
+
+
+@case("expiry", "EXPIRE")
+def _expire(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    for i in range(n):
+        ex.execute(["SET", f"session:{i}", "data"])
+    return Bench(_commands(ex, [["EXPIRE", f"session:{i}", "3600"] for i in range(n)]), n)
+
+
+@case("expiry", "active expire cycle")
+def _active_expire(ctx: Context, n: int) -> Bench:
+    ex = ctx.executor()
+    db = ex.db
+
+    def setup():
+        deadline = str(int(time.time() * 1000) + 20)
+        for i in range(n):
+            ex.execute(["SET", f"session:{i}", "data"])
+            ex.execute(["PEXPIREAT", f"session:{i}", deadline])
+        time.sleep(0.03)
+
+    def run():
+        db.expires.active_expire_cycle(db.data, budget_ms=60_000)
+
+    return Bench(run, n, setup)
+
+
+# =============== snapshot =============== #
+
+
+def _snapshot_db(ctx: Context, n: int) -> CommandExecutor:
+    ex = ctx.executor()
+    for i in range(0, n, 1000):
+        ex.execute(["MSET", *(arg for j in range(i, min(i + 1000, n)) for arg in (f"key:{j}", f"value:{j}"))])
+    for i in range(n // 10):
+        ex.execute(["HMSET", f"user:{i}", "name", "alice", "age", "30"])
+    return ex
+
+
+@case("snapshot", "SAVE per key")
+def _save(ctx: Context, n: int) -> Bench:
+    db = _snapshot_db(ctx, n).db
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.persistence.save_snapshot(db)
+    return Bench(run, len(db.data))
+
+
+@case("snapshot", "LOAD per key")
+def _load(ctx: Context, n: int) -> Bench:
+    db = _snapshot_db(ctx, n).db
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.persistence.save_snapshot(db)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            PhotonDB(data_dir=db.persistence.data_dir)
+    return Bench(run, len(db.data))
+
+
+# =============== parser / encoder =============== #
+
+
+@case("protocol", "RESP parse")
+def _resp_parse(ctx: Context, n: int) -> Bench:
+    data = b"".join(RespEncoder.encode_command(["SET", f"key:{i}", f"value:{i}"]) for i in range(n))
+
+    def run():
+        parser = RespParser()
+        parser.feed(data)
+        for _ in parser:
+            pass
+    return Bench(run, n)
+
+
+@case("protocol", "inline parse")
+def _inline_parse(ctx: Context, n: int) -> Bench:
+    lines = [f"SET key:{i} value:{i}" for i in range(n)]
+
+    def run():
+        parse = AsciiParser.parse_ascii_command
+        for line in lines:
+            parse(line)
+    return Bench(run, n)
+
+
+@case("protocol", "encode bulk")
+def _encode_bulk(ctx: Context, n: int) -> Bench:
+    replies = [f"value:{i}" for i in range(n)]
+
+    def run():
+        encode = RespEncoder.encode
+        for reply in replies:
+            encode(reply)
+    return Bench(run, n)
+
+
+@case("protocol", "encode array x10")
+def _encode_array(ctx: Context, n: int) -> Bench:
+    reply = [f"value:{i}" for i in range(10)]
+
+    def run():
+        encode = RespEncoder.encode
+        for _ in range(n):
+            encode(reply)
+    return Bench(run, n)
+
+
+@case("protocol", "encode status+int")
+def _encode_small(ctx: Context, n: int) -> Bench:
+    ok = SimpleString("OK")
+
+    def run():
+        encode = RespEncoder.encode
+        for i in range(n):
+            encode(ok)
+            encode(i)
+    return Bench(run, n)
+
+
+# =============== memory =============== #
+
+
+# family -> command filling key i
+MEMORY_CASES = {
+    "string": lambda i: ["SET", f"key:{i}", f"value:{i}"],
+    "string with TTL": lambda i: ["SET", f"key:{i}", f"value:{i}", "EX", "3600"],
+    "hash 10 fields": lambda i: ["HMSET", f"user:{i}", *(arg for f in range(10) for arg in (f"field:{f}", f"v{f}"))],
+    "list 10 items": lambda i: ["RPUSH", f"list:{i}", *(f"item:{j}" for j in range(10))],
+    "set 10 ints": lambda i: ["SADD", f"ids:{i}", *map(str, range(i % 100, i % 100 + 10))],
+    "zset 10 members": lambda i: ["ZADD", f"rank:{i}", *(arg for j in range(10) for arg in (str(j), f"m{j}"))],
+}
+
+
+def measure_memory(ctx: Context, make: Callable[[int], list[str]], n: int) -> float:
+    """bytes allocated per key, keys and values included"""
+
+    ex = ctx.executor()
+    cmds = [make(i) for i in range(n)]
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for cmd in cmds:
+        ex.execute(cmd)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / n
+
+
+# =============== runner =============== #
+
+
+def _reference(n: int = 20_000) -> None:
+    """fixed interpreter workload (strings, dict, list): the yardstick of the host speed"""
+
+    d = {}
+    for i in range(n):
+        key = f"key:{i}"
+        d[key] = [key, i]
+        d.get(key)
+
+
+def measure(bench: Bench, repeat: int, warmup: int) -> tuple[list[float], list[float]]:
+    """
+    nanoseconds per operation of each timed run, and the same
+    divided by the time of _reference() measured just before it
+
+    The ratios follow the code, not the machine: a host that is
+    slower for a while (shared CPU, frequency scaling) slows the
+    run and its reference alike.
+    """
+
+    perf_counter = time.perf_counter
+    for _ in range(warmup):
+        if bench.setup is not None:
+            bench.setup()
+        bench.run()
+
+    # like timeit: no collector pass in the middle of a run
+    runs = []
+    ratios = []
+    for _ in range(repeat):
+        if bench.setup is not None:
+            bench.setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter()
+            _reference()
+            reference = perf_counter() - start
+            start = perf_counter()
+            bench.run()
+            elapsed = perf_counter() - start
+        finally:
+            gc.enable()
+        runs.append(elapsed / bench.ops * 1e9)
+        ratios.append(elapsed / reference)
+    return runs, ratios
+
+
+def run_suite(opts) -> dict:
+    families = opts.families or list(CASES) + ["memory"]
+    timings = {}
+    memory = {}
+
+    with tempfile.TemporaryDirectory(prefix="photondb-suite-") as root:
+        ctx = Context(root)
+
+        for family, cases in CASES.items():
+            if family not in families:
+                continue
+            for name, make in cases:
+                runs, ratios = measure(make(ctx, opts.n), opts.repeat, opts.warmup)
+                median = statistics.median(runs)
+                stdev = statistics.stdev(runs) if len(runs) > 1 else 0.0
+                timings[f"{family}/{name}"] = {
+                    "median_ns": round(median, 1),
+                    "stdev_ns": round(stdev, 1),
+                    "runs_ns": [round(r, 1) for r in runs],
+                    "relative": round(statistics.median(ratios), 5),
+                    "relative_stdev": round(statistics.stdev(ratios) if len(ratios) > 1 else 0.0, 5),
+                }
+                print(f"  {family:<9} {name:<22} {_fmt_ns(median):>10}  ± {_fmt_ns(stdev):<10}")
+
+        if "memory" in families:
+            for name, make in MEMORY_CASES.items():
+                per_key = measure_memory(ctx, make, opts.memory_keys)
+                memory[name] = {"bytes_per_key": round(per_key, 1)}
+                print(f"  {'memory':<9} {name:<22} {per_key:>10,.0f} bytes/key")
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"n": opts.n, "repeat": opts.repeat, "warmup": opts.warmup, "memory_keys": opts.memory_keys},
+        "timings": timings,
+        "memory": memory,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, memory_tolerance: float) -> list[str]:
+    """print the deltas against baseline, return the regressions"""
+
+    regressions = []
+    if baseline.get("config", {}).get("n") != results["config"]["n"]:
+        print(f"⚠️  baseline measured with n={baseline.get('config', {}).get('n')}, "
+              f"now n={results['config']['n']}: times are not comparable")
+
+    print(f"\nAgainst baseline {baseline.get('revision') or '?'} ({baseline.get('timestamp', '?')}), "
+          f"median per op and change relative to the host speed:")
+
+    for key, now in results["timings"].items():
+        base = baseline.get("timings", {}).get(key)
+        if base is None:
+            continue
+        # judged on the times relative to the host speed, when the baseline has them
+        field = "relative" if "relative" in base else "median_ns"
+        spread = "relative_stdev" if field == "relative" else "stdev_ns"
+        delta = now[field] / base[field] - 1 if base[field] else 0.0
+        noise = 2 * max(now[spread], base[spread])
+        slower = delta > tolerance and now[field] - base[field] > noise
+        mark = "❌ REGRESSION" if slower else ""
+        print(f"  {key:<32} {_fmt_ns(base['median_ns']):>10} -> {_fmt_ns(now['median_ns']):>10}  {delta:+7.1%}  {mark}")
+        if slower:
+            regressions.append(f"{key}: {delta:+.1%} slower")
+
+    for key, now in results["memory"].items():
+        base = baseline.get("memory", {}).get(key)
+        if base is None:
+            continue
+        delta = now["bytes_per_key"] / base["bytes_per_key"] - 1 if base["bytes_per_key"] else 0.0
+        bigger = delta > memory_tolerance
+        mark = "❌ REGRESSION" if bigger else ""
+        print(f"  {'memory/' + key:<32} {base['bytes_per_key']:>8,.0f} B -> {now['bytes_per_key']:>8,.0f} B  "
+              f"{delta:+7.1%}  {mark}")
+        if bigger:
+            regressions.append(f"memory/{key}: {delta:+.1%} bytes per key")
+
+    return regressions
+
+
+def _fmt_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} us"
+    return f"{ns:.0f} ns"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PhotonDB benchmark suite")
+    parser.add_argument("-n", type=int, default=100_000, help="operations per timed run")
+    parser.add_argument("--repeat", type=int, default=7, help="timed runs per case")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before them")
+    parser.add_argument("--memory-keys", type=int, default=100_000, help="keys of the memory cases")
+    parser.add_argument("--quick", action="store_true", help="n=10000, 3 runs: a smoke test, not a measure")
+    parser.add_argument("-k", "--families", default=None,
+                        help=f"comma separated families (default: all of {', '.join([*CASES, 'memory'])})")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON (a new baseline)")
+    parser.add_argument("--compare", metavar="FILE", help="baseline JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown allowed on a median (0.25 = 25%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.02, help="growth allowed on bytes per key")
+
+    opts = parser.parse_args(argv)
+    if opts.quick:
+        opts.n, opts.repeat, opts.memory_keys = 10_000, 3, 10_000
+    if opts.n < 10 or opts.repeat < 1 or opts.warmup < 0 or opts.memory_keys < 1:
+        parser.error("-n must be at least 10, --repeat and --memory-keys positive")
+
+    if opts.families is not None:
+        opts.families = [f.strip() for f in opts.families.split(",") if f.strip()]
+        unknown = set(opts.families) - set(CASES) - {"memory"}
+        if unknown:
+            parser.error(f"unknown families: {', '.join(sorted(unknown))}")
+    return opts
+
+
+def main(argv=None) -> None:
+    opts = parse_args(argv)
+
+    baseline = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            baseline = json.load(f)
+
+    print(f"PhotonDB benchmark suite: n={opts.n:,}, {opts.repeat} runs after {opts.warmup} warmup\n")
+    results = run_suite(opts)
+
+    if opts.save:
+        os.makedirs(os.path.dirname(os.path.abspath(opts.save)), exist_ok=True)
+        with open(opts.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {opts.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, opts.tolerance, opts.memory_tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s):")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("\n✓ No regressions")
+
+
+if __name__ == "__main__":
+    main()
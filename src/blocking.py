@@ -0,0 +1,202 @@
+"""
+Blocking list pops: BLPOP/BRPOP/BLMOVE park the connection
+in per-key FIFO queues until a push serves them
+"""
+
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Optional
+
+
+# commands that park the connection when their lists are empty
+BLOCKING_COMMANDS = {"BLPOP", "BRPOP", "BLMOVE"}
+
+
+def parse_timeout(arg: str) -> float:
+    """timeout in seconds (decimals allowed), 0 = wait forever"""
+
+    try:
+        timeout = float(arg)
+    except ValueError:
+        raise ValueError("timeout is not a float or out of range")
+    if timeout != timeout or timeout in (float("inf"), float("-inf")):
+        raise ValueError("timeout is not a float or out of range")
+    if timeout < 0:
+        raise ValueError("timeout is negative")
+    return timeout
+
+
+class Waiter:
+    """a connection parked on a blocking command"""
+
+    __slots__ = ("conn", "cmd", "keys", "deadline", "done")
+
+    def __init__(self, conn, cmd: list[str], keys: list[str], deadline: Optional[float]):
+        self.conn = conn
+        self.cmd = cmd
+        self.keys = keys
+        self.deadline = deadline
+        self.done = False
+
+
+class BlockingQueues:
+    """
+    Connections waiting for data on list keys.
+
+    A parked connection costs nothing while it waits: there is no
+    polling. Every key has a FIFO queue of waiters; a write command
+    on a key with waiters only marks it ready, and serve() (run by
+    the connection after each command, so after a whole EXEC) pops
+    for the waiters in arrival order while the list has elements:
+    an LPUSH of one element wakes exactly one client. The pop runs
+    as a plain LPOP/RPOP/LMOVE through the executor, so it is
+    logged to the AOF and seen by WATCH like any other write.
+
+    Timeouts are a heap of deadlines checked by the cron (10 times
+    a second). Served, timed out or disconnected waiters are only
+    marked done and skipped when they reach the head of a queue.
+
+    Attributes:
+        waiters: key -> deque of Waiter, first come first served
+        ready: keys written since the last serve() (insertion ordered)
+        blocked: connections currently parked
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.waiters: dict[str, deque[Waiter]] = {}
+        self.ready: dict[str, None] = {}
+        self.blocked = 0
+        self._timeouts: list = []
+        self._seq = itertools.count()
+        self._serving = False
+
+
+    def block(self, conn, cmd: list[str]) -> Waiter:
+        """park conn on cmd, a blocking command that found its lists empty"""
+
+        name = cmd[0].upper()
+        timeout = parse_timeout(cmd[-1])
+        # BLMOVE waits on its source only
+        keys = [cmd[1]] if name == "BLMOVE" else cmd[1:-1]
+
+        waiter = Waiter(conn, cmd, keys, time.monotonic() + timeout if timeout else None)
+        for key in keys:
+            queue = self.waiters.get(key)
+            if queue is None:
+                queue = self.waiters[key] = deque()
+            queue.append(waiter)
+        if waiter.deadline is not None:
+            heapq.heappush(self._timeouts, (waiter.deadline, next(self._seq), waiter))
+
+        self.blocked += 1
+        return waiter
+
+
+    def signal(self, keys: list[str]) -> None:
+        """keys written by a command: wake their waiters at the next serve()"""
+
+        waiters = self.waiters
+        for key in keys:
+            if key in waiters:
+                self.ready[key] = None
+
+
+    def serve(self) -> None:
+        """pop for the waiters of the ready keys, as long as their lists have elements"""
+
+        # a woken connection runs its pending commands from here,
+        # and their pushes are served by this same loop
+        if self._serving:
+            return
+        self._serving = True
+
+        try:
+            data = self.executor.db.data
+            while self.ready:
+                key = next(iter(self.ready))
+                del self.ready[key]
+
+                queue = self.waiters.get(key)
+                while queue:
+                    waiter = queue[0]
+                    if waiter.done:
+                        queue.popleft()
+                        continue
+                    val = data.get(key)
+                    if val is None or val.type != "list":
+                        break
+                    try:
+                        result = self._pop(waiter, key)
+                    except Exception as e:
+                        result = e
+                    if result is None:
+                        break
+                    queue.popleft()
+                    self._finish(waiter, result)
+
+                if queue is not None and not queue and self.waiters.get(key) is queue:
+                    del self.waiters[key]
+        finally:
+            self._serving = False
+
+
+    def _pop(self, waiter: Waiter, key: str):
+        """the non-blocking form of the waiter's command, on key"""
+
+        cmd = waiter.cmd
+        name = cmd[0].upper()
+
+        if name == "BLMOVE":
+            return self.executor.execute(["LMOVE", *cmd[1:5]])
+
+        item = self.executor.execute(["LPOP" if name == "BLPOP" else "RPOP", key])
+        if item is None:
+            return None
+        return [key, item]
+
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """reply nil to the waiters whose timeout has passed"""
+
+        now = time.monotonic() if now is None else now
+        timeouts = self._timeouts
+        while timeouts and timeouts[0][0] <= now:
+            waiter = heapq.heappop(timeouts)[2]
+            if not waiter.done:
+                self._finish(waiter, None)
+
+
+    def cancel(self, waiter: Waiter) -> None:
+        """the parked connection went away"""
+
+        if not waiter.done:
+            self._done(waiter)
+
+
+    def _finish(self, waiter: Waiter, result) -> None:
+        self._done(waiter)
+        waiter.conn.wake(result)
+
+
+    def _done(self, waiter: Waiter) -> None:
+        waiter.done = True
+        self.blocked -= 1
+
+        # drop the waiters done at the head of its queues, so idle keys don't pile up
+        for key in waiter.keys:
+            queue = self.waiters.get(key)
+            if queue is None:
+                continue
+            while queue and queue[0].done:
+                queue.popleft()
+            if not queue:
+                del self.waiters[key]
+
+
+    def info(self) -> dict:
+        """blocking fields for INFO stats"""
+
+        return {"blocked_clients": self.blocked}
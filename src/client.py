@@ -0,0 +1,834 @@
+"""
+Python client for PhotonDB: RESP2 connections from a thread-safe
+pool, pipelines, and an asyncio variant
+
+    from client import PhotonClient
+
+    db = PhotonClient("localhost", 6379)
+    db.set("name", "alice")
+    db.get("name")                          # 'alice'
+
+    with db.pipeline() as pipe:             # one write, one batch of replies
+        for i in range(1000):
+            pipe.incr("visits")
+        replies = pipe.execute()
+
+    db = AsyncPhotonClient("localhost", 6379)
+    await db.set("name", "alice")
+
+The wire format is the server's own: commands are encoded with
+RespEncoder.encode_command and replies decoded by RespReplyParser.
+Arguments are sent as str (ints and floats are converted), replies
+come back as str, int, None and lists, as the server sends them.
+"""
+
+import asyncio
+import os
+import select
+import socket
+import threading
+from collections import deque
+from typing import Optional
+
+from blocking import BLOCKING_COMMANDS
+from parser import ProtocolError, RespEncoder, RespReplyParser, ReplyError
+
+
+def _pairs_to_dict(reply: list) -> dict:
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+def _parse_info(reply: str) -> dict:
+    """INFO "key:value" lines as a dict, numbers converted"""
+
+    info = {}
+    for line in reply.splitlines():
+        if not line or line.startswith("#") or ":" not in line:
+            continue
+        key, val = line.split(":", 1)
+        for convert in (int, float):
+            try:
+                val = convert(val)
+                break
+            except ValueError:
+                pass
+        info[key] = val
+    return info
+
+
+# reply conversions applied by the client (by command name)
+RESPONSE_CALLBACKS = {
+    "HGETALL": _pairs_to_dict,
+    "SMEMBERS": set,
+    "SINTER": set,
+    "SUNION": set,
+    "SDIFF": set,
+    "INFO": _parse_info,
+}
+
+
+class Commands:
+    """
+    One method per server command, all going through
+    execute_command(): the client runs them, a pipeline
+    buffers them, the asyncio client returns a coroutine
+    """
+
+    def execute_command(self, *args):
+        raise NotImplementedError
+
+
+    # =============== strings =============== #
+
+
+    def ping(self):
+        return self.execute_command("PING")
+
+
+    def get(self, key: str):
+        return self.execute_command("GET", key)
+
+
+    def set(self, key: str, value, ex: Optional[int] = None):
+        if ex is not None:
+            return self.execute_command("SET", key, value, "EX", ex)
+        return self.execute_command("SET", key, value)
+
+
+    def mget(self, *keys: str):
+        return self.execute_command("MGET", *keys)
+
+
+    def mset(self, mapping: dict):
+        args = []
+        for key, value in mapping.items():
+            args.append(key)
+            args.append(value)
+        return self.execute_command("MSET", *args)
+
+
+    def delete(self, *keys: str):
+        return self.execute_command("DEL", *keys)
+
+
+    def incr(self, key: str):
+        return self.execute_command("INCR", key)
+
+
+    def expire(self, key: str, seconds: int):
+        return self.execute_command("EXPIRE", key, seconds)
+
+
+    # =============== lists =============== #
+
+
+    def lpush(self, key: str, *values):
+        return self.execute_command("LPUSH", key, *values)
+
+
+    def rpush(self, key: str, *values):
+        return self.execute_command("RPUSH", key, *values)
+
+
+    def lpop(self, key: str):
+        return self.execute_command("LPOP", key)
+
+
+    def rpop(self, key: str):
+        return self.execute_command("RPOP", key)
+
+
+    def llen(self, key: str):
+        return self.execute_command("LLEN", key)
+
+
+    def lrange(self, key: str, start: int, stop: int):
+        return self.execute_command("LRANGE", key, start, stop)
+
+
+    def lmove(self, source: str, destination: str, wherefrom: str = "LEFT", whereto: str = "RIGHT"):
+        return self.execute_command("LMOVE", source, destination, wherefrom, whereto)
+
+
+    def blpop(self, keys, timeout: float = 0):
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        return self.execute_command("BLPOP", *keys, timeout)
+
+
+    def brpop(self, keys, timeout: float = 0):
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        return self.execute_command("BRPOP", *keys, timeout)
+
+
+    def blmove(self, source: str, destination: str, wherefrom: str = "LEFT", whereto: str = "RIGHT",
+               timeout: float = 0):
+        return self.execute_command("BLMOVE", source, destination, wherefrom, whereto, timeout)
+
+
+    # =============== hashes =============== #
+
+
+    def hset(self, key: str, field: str, value):
+        return self.execute_command("HSET", key, field, value)
+
+
+    def hget(self, key: str, field: str):
+        return self.execute_command("HGET", key, field)
+
+
+    def hmget(self, key: str, *fields: str):
+        return self.execute_command("HMGET", key, *fields)
+
+
+    def hgetall(self, key: str):
+        return self.execute_command("HGETALL", key)
+
+
+    def hdel(self, key: str, *fields: str):
+        return self.execute_command("HDEL", key, *fields)
+
+
+    # =============== sets =============== #
+
+
+    def sadd(self, key: str, *members):
+        return self.execute_command("SADD", key, *members)
+
+
+    def srem(self, key: str, *members):
+        return self.execute_command("SREM", key, *members)
+
+
+    def sismember(self, key: str, member):
+        return self.execute_command("SISMEMBER", key, member)
+
+
+    def smembers(self, key: str):
+        return self.execute_command("SMEMBERS", key)
+
+
+    def scard(self, key: str):
+        return self.execute_command("SCARD", key)
+
+
+    # =============== sorted sets =============== #
+
+
+    def zadd(self, key: str, mapping: dict):
+        """mapping: member -> score"""
+
+        args = []
+        for member, score in mapping.items():
+            args.append(score)
+            args.append(member)
+        return self.execute_command("ZADD", key, *args)
+
+
+    def zincrby(self, key: str, increment: float, member: str):
+        return self.execute_command("ZINCRBY", key, increment, member)
+
+
+    def zscore(self, key: str, member: str):
+        return self.execute_command("ZSCORE", key, member)
+
+
+    def zrank(self, key: str, member: str):
+        return self.execute_command("ZRANK", key, member)
+
+
+    def zcard(self, key: str):
+        return self.execute_command("ZCARD", key)
+
+
+    def zrange(self, key: str, start: int, stop: int, withscores: bool = False):
+        if withscores:
+            return self.execute_command("ZRANGE", key, start, stop, "WITHSCORES")
+        return self.execute_command("ZRANGE", key, start, stop)
+
+
+    # =============== server =============== #
+
+
+    def publish(self, channel: str, message):
+        return self.execute_command("PUBLISH", channel, message)
+
+
+    def keys(self, pattern: str = "*"):
+        return self.execute_command("KEYS", pattern)
+
+
+    def scan(self, cursor: int = 0, match: Optional[str] = None, count: Optional[int] = None):
+        args = ["SCAN", cursor]
+        if match is not None:
+            args += ["MATCH", match]
+        if count is not None:
+            args += ["COUNT", count]
+        return self.execute_command(*args)
+
+
+    def dbsize(self):
+        return self.execute_command("DBSIZE")
+
+
+    def flushdb(self):
+        return self.execute_command("FLUSHDB")
+
+
+    def info(self, section: Optional[str] = None):
+        if section is not None:
+            return self.execute_command("INFO", section)
+        return self.execute_command("INFO")
+
+
+    def config_resetstat(self):
+        return self.execute_command("CONFIG", "RESETSTAT")
+
+
+    def slowlog_get(self, count: Optional[int] = None):
+        if count is not None:
+            return self.execute_command("SLOWLOG", "GET", count)
+        return self.execute_command("SLOWLOG", "GET")
+
+
+    def slowlog_len(self):
+        return self.execute_command("SLOWLOG", "LEN")
+
+
+    def slowlog_reset(self):
+        return self.execute_command("SLOWLOG", "RESET")
+
+
+def _result(args: tuple, reply):
+    """the reply of one command: errors raised, RESPONSE_CALLBACKS applied"""
+
+    if isinstance(reply, ReplyError):
+        raise reply
+    callback = RESPONSE_CALLBACKS.get(str(args[0]).upper())
+    if callback is not None and reply is not None:
+        return callback(reply)
+    return reply
+
+
+# =============== blocking client =============== #
+
+
+class Connection:
+    """
+    One socket to the server. Not thread-safe: a thread takes it
+    from the pool, sends its commands, reads all their replies
+    and gives it back.
+
+    An error in the middle of an exchange closes the socket
+    (the replies left on the wire can't be matched anymore);
+    the next command connects again.
+    """
+
+    READ_SIZE = 64 * 1024
+    SEND_CHUNK = 64 * 1024
+
+    def __init__(self, host: str = "localhost", port: int = 6379, timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        self.parser = RespReplyParser()
+
+
+    def connect(self) -> None:
+        try:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+        except OSError as e:
+            raise ConnectionError(f"Error connecting to {self.host}:{self.port}: {e}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.parser = RespReplyParser()
+
+
+    def close(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+    def exchange(self, data: bytes, count: int) -> list:
+        """send encoded commands, return their count replies"""
+
+        if self.sock is None:
+            self.connect()
+
+        try:
+            if len(data) <= self.SEND_CHUNK:
+                self.sock.sendall(data)
+            else:
+                self._send_reading(data)
+            return [self._read_reply() for _ in range(count)]
+        except OSError as e:
+            self.close()
+            if isinstance(e, ConnectionError):
+                raise
+            raise ConnectionError(f"Error talking to {self.host}:{self.port}: {e}")
+        except BaseException:
+            self.close()
+            raise
+
+
+    def _send_reading(self, data: bytes) -> None:
+        """
+        send a big batch while reading the replies already coming:
+        the server stops reading a client that doesn't read its
+        replies, so a blocking sendall() of a long pipeline could
+        wait forever on a server waiting for us
+        """
+
+        sock = self.sock
+        view = memoryview(data)
+        sent = 0
+
+        sock.setblocking(False)
+        try:
+            while sent < len(view):
+                readable, writable, _ = select.select([sock], [sock], [], self.timeout)
+                if not readable and not writable:
+                    raise socket.timeout("timed out")
+                if readable:
+                    self._recv()
+                if writable:
+                    try:
+                        sent += sock.send(view[sent:sent + self.SEND_CHUNK])
+                    except BlockingIOError:
+                        pass
+        finally:
+            view.release()
+            if self.sock is not None:
+                sock.settimeout(self.timeout)
+
+
+    def _read_reply(self):
+        parser = self.parser
+        while True:
+            reply = parser.get_reply()
+            if reply is not parser.INCOMPLETE:
+                return reply
+            self._recv()
+
+
+    def _recv(self) -> None:
+        try:
+            data = self.sock.recv(self.READ_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            raise ConnectionError(f"Connection closed by {self.host}:{self.port}")
+        self.parser.feed(data)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of Connections.
+
+    Connections are made when needed, up to max_connections;
+    when they are all in use, get_connection() waits for one to
+    be released (at most timeout seconds). The last released is
+    the first taken, so a few warm sockets serve most requests.
+
+    After a fork the child starts with an empty pool: the
+    sockets of the parent are never shared.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379,
+                 max_connections: int = 64, timeout: Optional[float] = None):
+        if max_connections < 1:
+            raise ValueError("max_connections must be positive")
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._reset()
+
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._free: list[Connection] = []
+        self._created = 0
+
+
+    def get_connection(self) -> Connection:
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._cond:
+            while not self._free and self._created >= self.max_connections:
+                if not self._cond.wait(self.timeout):
+                    raise ConnectionError("No connection available in the pool")
+            if self._free:
+                return self._free.pop()
+            self._created += 1
+
+        # connected at its first command, outside the lock
+        return Connection(self.host, self.port, self.timeout)
+
+
+    def release(self, conn: Connection) -> None:
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._free.append(conn)
+            self._cond.notify()
+
+
+    def disconnect(self) -> None:
+        """close the idle connections"""
+
+        with self._cond:
+            for conn in self._free:
+                conn.close()
+
+
+class PhotonClient(Commands):
+    """
+    Blocking client, safe to share between threads: every
+    command runs on a connection taken from the pool.
+
+        db = PhotonClient("localhost", 6379, max_connections=16)
+        db.lpush("jobs", "job1")
+        db.blpop("jobs", timeout=5)     # ['jobs', 'job1']
+
+    Error replies are raised as ReplyError, network errors
+    as ConnectionError.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, max_connections: int = 64,
+                 timeout: Optional[float] = None, pool: Optional[ConnectionPool] = None):
+        self.pool = pool if pool is not None else ConnectionPool(host, port, max_connections, timeout)
+
+
+    def execute_command(self, *args):
+        conn = self.pool.get_connection()
+        try:
+            reply = conn.exchange(RespEncoder.encode_command(args), 1)[0]
+        finally:
+            self.pool.release(conn)
+        return _result(args, reply)
+
+
+    def pipeline(self, transaction: bool = False) -> "Pipeline":
+        return Pipeline(self.pool, transaction)
+
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None):
+        """all the keys (matching match), one SCAN page at a time"""
+
+        cursor = 0
+        while True:
+            cursor, keys = self.scan(cursor, match, count)
+            cursor = int(cursor)
+            yield from keys
+            if cursor == 0:
+                return
+
+
+    def close(self) -> None:
+        self.pool.disconnect()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Pipeline(Commands):
+    """
+    Commands buffered on the client and sent with a single write;
+    execute() reads all the replies in one batch, so N commands
+    cost one round trip instead of N.
+
+    With transaction=True the batch is wrapped in MULTI/EXEC and
+    runs atomically on the server. Command methods return the
+    pipeline, so calls can be chained:
+
+        pipe.set("a", 1).incr("a").get("a").execute()    # ['OK', 2, '2']
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool], transaction: bool = False):
+        self.pool = pool
+        self.transaction = transaction
+        self.commands: list[tuple] = []
+
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        return self
+
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.reset()
+
+
+    def reset(self) -> None:
+        self.commands = []
+
+
+    def execute(self, raise_on_error: bool = True) -> list:
+        """
+        send the buffered commands, return their replies in order;
+        with raise_on_error=False the error replies are left in
+        the list as ReplyError instead of raising the first one
+        """
+
+        commands = self.commands
+        if not commands:
+            return []
+        self.commands = []
+
+        data, count = self._encode(commands)
+        conn = self.pool.get_connection()
+        try:
+            replies = conn.exchange(data, count)
+        finally:
+            self.pool.release(conn)
+        return self._results(commands, replies, raise_on_error)
+
+
+    def _encode(self, commands: list[tuple]) -> tuple[bytes, int]:
+        encode = RespEncoder.encode_command
+        if self.transaction:
+            commands = [("MULTI",), *commands, ("EXEC",)]
+        return b"".join([encode(args) for args in commands]), len(commands)
+
+
+    def _results(self, commands: list[tuple], replies: list, raise_on_error: bool) -> list:
+        if self.transaction:
+            # +OK of MULTI, +QUEUED (or the error) of each command, then EXEC
+            replies = replies[-1]
+            if isinstance(replies, ReplyError):
+                raise replies
+            if replies is None:
+                raise ReplyError("EXECABORT Transaction discarded")
+
+        results = []
+        for args, reply in zip(commands, replies):
+            if isinstance(reply, ReplyError):
+                if raise_on_error:
+                    raise reply
+                results.append(reply)
+            else:
+                results.append(_result(args, reply))
+        return results
+
+
+# =============== asyncio client =============== #
+
+
+class AsyncLink(asyncio.Protocol):
+    """
+    Pipelined connection of the asyncio client: requests made in
+    the same loop iteration go out in one write, and the replies
+    come back in request order, so a FIFO of futures matches them
+    """
+
+    def __init__(self):
+        self.transport: Optional[asyncio.Transport] = None
+        self.parser = RespReplyParser()
+        self.waiting: deque = deque()    # [future, replies expected, replies so far]
+        self.output: list[bytes] = []
+        self.closed = False
+
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+    def request(self, data: bytes, count: int) -> asyncio.Future:
+        """send encoded commands, the future gets their count replies"""
+
+        future = asyncio.get_running_loop().create_future()
+        if self.closed:
+            future.set_exception(ConnectionError("Connection closed"))
+            return future
+
+        self.waiting.append([future, count, []])
+        if not self.output:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.output.append(data)
+        return future
+
+
+    def flush(self) -> None:
+        if self.output and not self.closed:
+            data = b"".join(self.output)
+            self.output.clear()
+            self.transport.write(data)
+
+
+    def data_received(self, data: bytes):
+        self.parser.feed(data)
+        waiting = self.waiting
+        try:
+            for reply in self.parser.replies():
+                entry = waiting[0]
+                entry[2].append(reply)
+                if len(entry[2]) == entry[1]:
+                    waiting.popleft()
+                    # a cancelled request still takes its replies off the wire
+                    if not entry[0].done():
+                        entry[0].set_result(entry[2])
+        except ProtocolError as e:
+            # the link can't be resynchronized: fail the waiting requests
+            while waiting:
+                future = waiting.popleft()[0]
+                if not future.done():
+                    future.set_exception(e)
+            self.close()
+
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.output.clear()
+        while self.waiting:
+            future = self.waiting.popleft()[0]
+            if not future.done():
+                future.set_exception(ConnectionError("Connection lost"))
+
+
+    def close(self) -> None:
+        if self.transport is not None and not self.closed:
+            self.closed = True
+            self.transport.close()
+
+
+class AsyncPhotonClient(Commands):
+    """
+    asyncio client: the coroutines of a program share one link,
+    so concurrent commands are pipelined on it with no pool.
+
+        db = AsyncPhotonClient("localhost", 6379)
+        await asyncio.gather(*(db.incr("visits") for _ in range(1000)))
+
+    A blocking command (BLPOP, BRPOP, BLMOVE) would hold up the
+    replies of everyone else on the shared link: it gets a link
+    of its own, kept afterwards for the next blocking command.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._link: Optional[AsyncLink] = None
+        self._connecting: Optional[asyncio.Lock] = None
+        self._spare: list[AsyncLink] = []
+
+
+    async def _open(self) -> AsyncLink:
+        loop = asyncio.get_running_loop()
+        try:
+            _, link = await asyncio.wait_for(
+                loop.create_connection(AsyncLink, self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectionError(f"Error connecting to {self.host}:{self.port}: {e}")
+        return link
+
+
+    async def _shared_link(self) -> AsyncLink:
+        link = self._link
+        if link is not None and not link.closed:
+            return link
+
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._link is None or self._link.closed:
+                self._link = await self._open()
+            return self._link
+
+
+    async def _request(self, data: bytes, count: int, blocking: bool = False) -> list:
+        if not blocking:
+            link = await self._shared_link()
+            return await asyncio.wait_for(link.request(data, count), self.timeout)
+
+        link = None
+        while self._spare and link is None:
+            link = self._spare.pop()
+            if link.closed:
+                link = None
+        if link is None:
+            link = await self._open()
+
+        try:
+            replies = await link.request(data, count)
+        except BaseException:
+            # cancelled while parked: its reply would reach the next caller
+            link.close()
+            raise
+        self._spare.append(link)
+        return replies
+
+
+    async def execute_command(self, *args):
+        blocking = str(args[0]).upper() in BLOCKING_COMMANDS
+        reply = (await self._request(RespEncoder.encode_command(args), 1, blocking))[0]
+        return _result(args, reply)
+
+
+    def pipeline(self, transaction: bool = False) -> "AsyncPipeline":
+        return AsyncPipeline(self, transaction)
+
+
+    async def close(self) -> None:
+        for link in [self._link, *self._spare]:
+            if link is not None:
+                link.close()
+        self._link = None
+        self._spare = []
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncPipeline(Pipeline):
+    """Pipeline of the asyncio client: await pipe.execute()"""
+
+    def __init__(self, client: AsyncPhotonClient, transaction: bool = False):
+        super().__init__(None, transaction)
+        self.client = client
+
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        commands = self.commands
+        if not commands:
+            return []
+        self.commands = []
+
+        data, count = self._encode(commands)
+        blocking = any(str(args[0]).upper() in BLOCKING_COMMANDS for args in commands)
+        replies = await self.client._request(data, count, blocking)
+        return self._results(commands, replies, raise_on_error)
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc):
+        self.reset()
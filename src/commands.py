@@ -1,15 +1,222 @@
 # src/commands.py
 """
 CommandExecutor: Map commands to PhotonDB operations
+
+Every command is a CommandExecutor method registered in the
+COMMANDS table with @command, together with its metadata
+(arity, flags, key positions): dispatch is a dict lookup, and
+the AOF, the eviction, the shard router and COMMAND read the
+same table.
 """
 
+from time import perf_counter_ns
+from typing import Callable, Optional
+
+from blocking import BlockingQueues, parse_timeout
+from multi import WatchTable
 from photondb import PhotonDB
+from parser import RespEncoder, SimpleString
+from pubsub import PubSub
+from replication import Replication
+from slowlog import SlowLog
+from stats import ServerStats, keytypes_info
+from zset import format_score, parse_bound, parse_score
+
+
+# =============== command table =============== #
+
+
+class CommandSpec:
+    """
+    A command of the table, described like Redis COMMAND does.
+
+    Attributes:
+        name: command name, upper case
+        handler: CommandExecutor method, called with the arguments after the name
+        arity: number of arguments including the name, negative = at least -arity
+        flags: "write", "readonly", "denyoom", "admin", "fast"
+        first_key, last_key, step: positions of the keys in the command
+            (0 = no keys, last_key -1 = up to the last argument)
+    """
+
+    __slots__ = ("name", "handler", "arity", "flags", "first_key", "last_key", "step",
+                 "write", "denyoom", "readonly")
+
+    def __init__(self, name: str, handler: Callable, arity: int, flags: tuple,
+                 first_key: int = 0, last_key: int = 0, step: int = 0):
+        self.name = name
+        self.handler = handler
+        self.arity = arity
+        self.flags = flags
+        self.first_key = first_key
+        self.last_key = last_key
+        self.step = step
+
+        # hot flags as attributes, read on every command
+        self.write = "write" in flags
+        self.denyoom = "denyoom" in flags
+        self.readonly = "readonly" in flags
+
+
+    def check_arity(self, argc: int) -> bool:
+        """argc counts the command name"""
+
+        if self.arity >= 0:
+            return argc == self.arity
+        return argc >= -self.arity
+
+
+    def keys(self, cmd: list[str]) -> list[str]:
+        """the keys of a command, from the declared positions"""
+
+        if not self.first_key or len(cmd) <= self.first_key:
+            return []
+        last = self.last_key if self.last_key >= 0 else len(cmd) + self.last_key
+        return cmd[self.first_key:last + 1:self.step]
+
+
+    def describe(self) -> list:
+        """COMMAND INFO entry"""
+
+        return [
+            self.name.lower(),
+            self.arity,
+            [SimpleString(flag) for flag in self.flags],
+            self.first_key,
+            self.last_key,
+            self.step,
+        ]
+
+
+COMMANDS: dict[str, CommandSpec] = {}
+
+
+def command(name: str, arity: int, flags: str = "", first_key: int = 0, last_key: int = 0, step: int = 0):
+    """
+    register the decorated CommandExecutor method as command name
+
+    args:
+        arity: Redis style, e.g. 3 for "GET key", -3 for "SET key value [...]"
+        flags: space separated flags, e.g. "write denyoom"
+    """
+
+    def register(handler: Callable) -> Callable:
+        COMMANDS[name] = CommandSpec(name, handler, arity, tuple(flags.split()), first_key, last_key, step)
+        return handler
+
+    return register
+
+
+def lookup_command(name: str) -> Optional[CommandSpec]:
+    return COMMANDS.get(name.upper())
+
+
+def _pairs(args: list[str], name: str) -> dict[str, str]:
+    """key value [key value ...] -> dict, the last value of a repeated key wins"""
+
+    if len(args) % 2:
+        raise ValueError(f"wrong number of arguments for '{name}' command")
+    return dict(zip(args[::2], args[1::2]))
+
+
+def _scan_options(args: list[str], allow_type: bool) -> tuple[int, int, str, Optional[str]]:
+    """cursor [MATCH pattern] [COUNT count] [TYPE type] -> (cursor, count, pattern, type)"""
+
+    if not args[0].isdigit():
+        raise ValueError("invalid cursor")
+    cursor = int(args[0])
+    count = 10
+    pattern = "*"
+    type_ = None
+
+    i = 1
+    while i < len(args):
+        option = args[i].upper()
+        if i + 1 >= len(args):
+            raise ValueError("syntax error")
+        if option == "MATCH":
+            pattern = args[i + 1]
+        elif option == "COUNT":
+            if not args[i + 1].isdigit() or int(args[i + 1]) < 1:
+                raise ValueError("syntax error")
+            count = int(args[i + 1])
+        elif option == "TYPE" and allow_type:
+            type_ = args[i + 1].lower()
+        else:
+            raise ValueError("syntax error")
+        i += 2
+
+    return cursor, count, pattern, type_
+
+
+def _with_scores(pairs: list[tuple[str, float]], withscores: bool) -> list[str]:
+    """(member, score) -> member [score] flat reply"""
+
+    if not withscores:
+        return [member for member, _ in pairs]
+    reply = []
+    for member, score in pairs:
+        reply.append(member)
+        reply.append(format_score(score))
+    return reply
+
+
+def _withscores_option(args: list[str]) -> bool:
+    if not args:
+        return False
+    if len(args) == 1 and args[0].upper() == "WITHSCORES":
+        return True
+    raise ValueError("syntax error")
+
+
+def _rangebyscore_options(args: list[str]) -> tuple[bool, Optional[tuple[int, int]]]:
+    """[WITHSCORES] [LIMIT offset count] in any order"""
+
+    withscores = False
+    limit = None
+    i = 0
+    while i < len(args):
+        option = args[i].upper()
+        if option == "WITHSCORES":
+            withscores = True
+            i += 1
+        elif option == "LIMIT" and i + 2 < len(args):
+            limit = (int(args[i + 1]), int(args[i + 2]))
+            i += 3
+        else:
+            raise ValueError("syntax error")
+    return withscores, limit
+
+
+# execute_many(): command -> (bulk command, argc of the commands it can merge)
+_BATCHES = {
+    "SET": ("MSET", 3),
+    "GET": ("MGET", 2),
+}
 
 
 class CommandExecutor:
     
-    def __init__(self, db: PhotonDB):
+    def __init__(self, db: PhotonDB, replaying: bool = False):
         self.db = db
+        # AOF replay: no eviction, the log already went through it
+        self.replaying = replaying
+        # version counters of the keys under WATCH
+        self.watches = WatchTable()
+        # channel and pattern subscriptions of the connections
+        self.pubsub = PubSub()
+        # connections parked on BLPOP & co
+        self.blocking = BlockingQueues(self)
+        # primary/replica state, the backlog streamed to the replicas
+        self.replication = Replication(self)
+        # counters and latency histograms for INFO
+        self.stats = ServerStats()
+        # commands slower than a threshold, for SLOWLOG
+        self.slowlog = SlowLog()
+        # address of the client whose command runs, set by its connection
+        self.client_addr = ""
+        # shard of a sharded server: its router forwards the client addresses
+        self.routed = False
     
     def execute(self, cmd: list[str]):
         """
@@ -25,129 +232,968 @@ class CommandExecutor:
         if not cmd:
             raise ValueError("\nempty command\n")
         
-        command_name = cmd[0].upper()
-        args = cmd[1:]
-        
-        # =============== STRING COMMANDS ===============
-        
-        if command_name == "SET":
-            if len(args) < 2:
-                raise ValueError("SET requires at least 2 arguments: SET key value [EX seconds]")
-            
-            key = args[0]
-            value = args[1]
-            ex = None
-            
-            """
-            Optional EX param handling for TTL:
-            1. Check if there are at least 4 args and third is "EX"
-            2. If yes, set 'ex' to the integer value of the fourth arg
-            """
+        spec = COMMANDS.get(cmd[0].upper())
+        if spec is None:
+            raise ValueError(f"unknown command '{cmd[0]}'")
+        arity = spec.arity
+        if (len(cmd) != arity) if arity >= 0 else (len(cmd) < -arity):
+            self.stats.command(spec).rejected_calls += 1
+            raise ValueError(f"wrong number of arguments for '{cmd[0].lower()}' command")
 
+        # the eviction a write pays for is part of its latency (SLOWLOG too)
+        start = perf_counter_ns()
+        accounting = False
+        try:
+            if spec.denyoom and self.db.memory.maxmemory and not self.replaying:
+                memory = self.db.memory
+                evicted = memory.free_memory()
+                if evicted and self.logging:
+                    self.log(["DEL", *evicted])
+                data = self.db.data
+                if spec.last_key == spec.first_key:
+                    if cmd[1] not in data:
+                        memory.added(cmd[1])
+                else:
+                    for key in spec.keys(cmd):
+                        if key not in data:
+                            memory.added(key)
+
+            # maxmemory: the size change of the keys is accounted around the write
+            accounting = spec.write and self.db.memory.accounting and not self.replaying
+            if accounting:
+                self.db.memory.begin(spec.keys(cmd))
+
+            result = spec.handler(self, cmd[1:])
+        except Exception:
+            self.stats.command(spec).failed_calls += 1
+            raise
+        finally:
+            if accounting:
+                self.db.memory.end()
+            # CommandStat bookkeeping inlined, this runs for every command;
+            # looked up after the handler, CONFIG RESETSTAT clears the table
+            elapsed = perf_counter_ns() - start
+            stat = self.stats.commands.get(spec) or self.stats.command(spec)
+            stat.calls += 1
+            stat.nsec += elapsed
+            stat.histogram[(elapsed // 1000).bit_length()] += 1
+            if elapsed >= self.slowlog.threshold_ns:
+                self.slowlog.add(cmd, elapsed, self.client_addr)
+
+        if spec.readonly and spec.first_key:
+            # found or not, as Redis counts the lookups of read commands
+            data = self.db.data
+            stats = self.stats
+            if spec.last_key == spec.first_key:
+                if cmd[1] in data:
+                    stats.keyspace_hits += 1
+                else:
+                    stats.keyspace_misses += 1
+            else:
+                for key in spec.keys(cmd):
+                    if key in data:
+                        stats.keyspace_hits += 1
+                    else:
+                        stats.keyspace_misses += 1
+
+        if spec.write:
+            if self.watches.versions:
+                keys = spec.keys(cmd)
+                if keys:
+                    self.watches.touch(keys)
+                else:
+                    self.watches.touch_all()
+            # only commands that can add data (denyoom) can serve a waiter
+            if spec.denyoom and self.blocking.waiters:
+                self.blocking.signal(spec.keys(cmd))
+            if self.db.aof is not None or self.replication.backlog is not None:
+                self._propagate(spec.name, cmd, result)
+
+        return result
+
+
+    @property
+    def logging(self) -> bool:
+        """writes go somewhere: the AOF or the replicas"""
+        return self.db.aof is not None or self.replication.backlog is not None
+
+
+    def log(self, cmd: list[str]) -> None:
+        """a write for the AOF and the replicas, encoded once"""
+
+        data = RespEncoder.encode_command(cmd)
+        if self.db.aof is not None:
+            self.db.aof.append(data)
+        if self.replication.backlog is not None:
+            self.replication.feed(data)
+
+
+    def execute_many(self, cmds: list[list[str]]) -> list:
+        """
+            Execute a batch of commands in process, for embedded
+            users loading or reading many keys at once
+
+            Runs of plain "SET key value" become one MSET and runs of
+            "GET key" one MGET: a single dispatch, eviction check and
+            AOF entry per run instead of one per key. The other
+            commands go through execute() one by one, and so does a
+            GET of a non-string key (MGET would answer None where GET
+            fails with WRONGTYPE). The results are the ones execute()
+            would give.
+
+            Args:
+                cmds (list[list[str]]): parsed commands
+
+            Returns:
+                list: one result per command, in order; a failed
+                command has its exception in place, the others still run
+        """
+
+        results = []
+        i = 0
+        count = len(cmds)
+        data = self.db.data
+
+        def mergeable(other: list[str], name: str, argc: int) -> bool:
+            if len(other) != argc or other[0].upper() != name:
+                return False
+            if name == "GET":
+                val = data.get(other[1])
+                return val is None or val.type == "string"
+            return True
+
+        while i < count:
+            cmd = cmds[i]
+            name = cmd[0].upper() if cmd else ""
+
+            batch = _BATCHES.get(name)
+            if batch is not None and mergeable(cmd, name, batch[1]):
+                j = i + 1
+                while j < count and mergeable(cmds[j], name, batch[1]):
+                    j += 1
+                if j - i > 1:
+                    merged = [batch[0]]
+                    for other in cmds[i:j]:
+                        merged.extend(other[1:])
+                    try:
+                        reply = self.execute(merged)
+                    except Exception as e:
+                        results.extend([e] * (j - i))
+                    else:
+                        if name == "GET":
+                            results.extend(reply)
+                        else:
+                            # MSET replies OK, each SET returns True
+                            results.extend([True] * (j - i))
+                    i = j
+                    continue
+
+            try:
+                results.append(self.execute(cmd))
+            except Exception as e:
+                results.append(e)
+            i += 1
+
+        return results
+
+
+    def _propagate(self, command_name: str, cmd: list[str], result):
+        """
+        log a successful write to the AOF and the replicas
+
+        relative TTLs become absolute (PEXPIREAT), otherwise
+        a replay would restart them from the loading time
+        """
+
+        log = self.log
+
+        if command_name == "SET" and len(cmd) > 3:
+            log(cmd[:3])
+            val = self.db.data.get(cmd[1])
+            if val is not None and val.ttl_ms is not None:
+                log(["PEXPIREAT", cmd[1], str(int(val.ttl_ms))])
+
+        elif command_name == "EXPIRE":
+            if result:
+                val = self.db.data.get(cmd[1])
+                if val is None:
+                    log(["DEL", cmd[1]])
+                else:
+                    log(["PEXPIREAT", cmd[1], str(int(val.ttl_ms))])
+
+        elif command_name in ("BLPOP", "BRPOP"):
+            # what was popped, a replay must not wait
+            if result is not None:
+                log([command_name[1:], result[0]])
+
+        elif command_name == "BLMOVE":
+            if result is not None:
+                log(["LMOVE", *cmd[1:5]])
+
+        else:
+            log(cmd)
 
-            if len(args) >= 4 and args[2].upper() == "EX":
-                ex = int(args[3])
-            
-            return self.db.set(key, value, ex=ex)
-        
-        elif command_name == "GET":
-            if len(args) != 1:
-                raise ValueError("GET requires exactly  1 argument: GET key")
-            return self.db.get(args[0])
-        
-        elif command_name == "DEL":
-            if len(args) < 1:
-                raise ValueError("DEL requires exaclty 1 argument")
-            count = 0
-            for key in args:
-                if self.db.delete(key):
-                    count += 1
-            return count
-        
-        elif command_name == "INCR":
-            if len(args) != 1:
-                raise ValueError("INCR requires exactly 1 argument: INCR key")
-            return self.db.incr(args[0])
-        
-        # =============== LIST COMMANDS ===============
-        
-        elif command_name == "LPUSH":
-            if len(args) < 2:
-                raise ValueError("LPUSH requires at least 2 arguments: LPUSH key value [value...]")
-            key = args[0]
-            values = args[1:]
-            return self.db.lpush(key, *values)
-        
-        elif command_name == "RPUSH":
-            if len(args) < 2:
-                raise ValueError("RPUSH requires at least 2 arguments: RPUSH key value [value...]")
-            key = args[0]
-            values = args[1:]
-            return self.db.rpush(key, *values)
-        
-        elif command_name == "LPOP":
-            if len(args) != 1:
-                raise ValueError("LPOP requires exactly 1 argument: LPOP key")
-            return self.db.lpop(args[0])
-        
-        elif command_name == "RPOP":
-            if len(args) != 1:
-                raise ValueError("RPOP requires exactly 1 argument: RPOP key")
-            return self.db.rpop(args[0])
-        
-        elif command_name == "LRANGE":
-            if len(args) != 3:
-                raise ValueError("LRANGE richiede esattamente 3 argomenti: LRANGE key start stop")
-            key = args[0]
-            start = int(args[1])
-            stop = int(args[2])
-            return self.db.lrange(key, start, stop)
-        
-        elif command_name == "LSIZE":
-            if len(args) != 1:
-                raise ValueError("LSIZE requires exactly 1 argument: LSIZE key")
-            return self.db.lsize(args[0])
-        
-        # =============== HASH COMMANDS ===============
-        
-        elif command_name == "HSET":
-            if len(args) != 3:
-                raise ValueError("HSET richiede esattamente 3 argomenti: HSET key field value")
-            return self.db.hset(args[0], args[1], args[2])
         
-        elif command_name == "HGET":
-            if len(args) != 2:
-                raise ValueError("HGET richiede esattamente 2 argomenti: HGET key field")
-            return self.db.hget(args[0], args[1])
+    # =============== STRING COMMANDS ===============
+
+
+    @command("SET", -3, "write denyoom", 1, 1, 1)
+    def cmd_set(self, args: list[str]):
+        key = args[0]
+        value = args[1]
+        ex = None
         
-        elif command_name == "HGETALL":
-            if len(args) != 1:
-                raise ValueError("HGETALL requires exactly 1 argument: HGETALL key")
-            return self.db.hgetall(args[0])
+        """
+        Optional EX param handling for TTL:
+        1. Check if there are at least 4 args and third is "EX"
+        2. If yes, set 'ex' to the integer value of the fourth arg
+        """
+
+
+        if len(args) >= 4 and args[2].upper() == "EX":
+            ex = int(args[3])
         
-        elif command_name == "HDEL":
+        return self.db.set(key, value, ex=ex)
+    
+
+    @command("GET", 2, "readonly fast", 1, 1, 1)
+    def cmd_get(self, args: list[str]):
+        return self.db.get(args[0])
+
+
+    @command("MSET", -3, "write denyoom", 1, -1, 2)
+    def cmd_mset(self, args: list[str]):
+        self.db.mset(_pairs(args, "mset"))
+        return SimpleString("OK")
+
+
+    @command("MSETNX", -3, "write denyoom", 1, -1, 2)
+    def cmd_msetnx(self, args: list[str]):
+        return 1 if self.db.msetnx(_pairs(args, "msetnx")) else 0
+
+
+    @command("MGET", -2, "readonly fast", 1, -1, 1)
+    def cmd_mget(self, args: list[str]):
+        return self.db.mget(args)
+    
+
+    @command("DEL", -2, "write", 1, -1, 1)
+    def cmd_del(self, args: list[str]):
+        count = 0
+        for key in args:
+            if self.db.delete(key):
+                count += 1
+        return count
+    
+
+    @command("INCR", 2, "write denyoom fast", 1, 1, 1)
+    def cmd_incr(self, args: list[str]):
+        return self.db.incr(args[0])
+
+
+    @command("EXPIRE", 3, "write fast", 1, 1, 1)
+    def cmd_expire(self, args: list[str]):
+        return 1 if self.db.expire(args[0], int(args[1])) else 0
+    
+
+    @command("PEXPIREAT", 3, "write fast", 1, 1, 1)
+    def cmd_pexpireat(self, args: list[str]):
+        return 1 if self.db.pexpireat(args[0], int(args[1])) else 0
+    
+
+    # =============== LIST COMMANDS ===============
+    
+
+    @command("LPUSH", -3, "write denyoom fast", 1, 1, 1)
+    def cmd_lpush(self, args: list[str]):
+        key = args[0]
+        values = args[1:]
+        return self.db.lpush(key, *values)
+    
+
+    @command("RPUSH", -3, "write denyoom fast", 1, 1, 1)
+    def cmd_rpush(self, args: list[str]):
+        key = args[0]
+        values = args[1:]
+        return self.db.rpush(key, *values)
+    
+
+    @command("LPOP", 2, "write fast", 1, 1, 1)
+    def cmd_lpop(self, args: list[str]):
+        return self.db.lpop(args[0])
+    
+
+    @command("RPOP", 2, "write fast", 1, 1, 1)
+    def cmd_rpop(self, args: list[str]):
+        return self.db.rpop(args[0])
+    
+
+    @command("LMOVE", 5, "write denyoom", 1, 2, 1)
+    def cmd_lmove(self, args: list[str]):
+        return self.db.lmove(*args)
+
+
+    # BLPOP & co try once here: on a connection an empty result parks
+    # the client (blocking.BlockingQueues), in MULTI or in process
+    # they reply nil at once like Redis does inside a transaction
+
+    @command("BLPOP", -3, "write blocking", 1, -2, 1)
+    def cmd_blpop(self, args: list[str]):
+        return self._blocking_pop(args, self.db.lpop)
+
+
+    @command("BRPOP", -3, "write blocking", 1, -2, 1)
+    def cmd_brpop(self, args: list[str]):
+        return self._blocking_pop(args, self.db.rpop)
+
+
+    def _blocking_pop(self, args: list[str], pop: Callable):
+        parse_timeout(args[-1])
+        for key in args[:-1]:
+            item = pop(key)
+            if item is not None:
+                return [key, item]
+        return None
+
+
+    @command("BLMOVE", 6, "write denyoom blocking", 1, 2, 1)
+    def cmd_blmove(self, args: list[str]):
+        parse_timeout(args[4])
+        return self.db.lmove(*args[:4])
+
+
+    @command("LRANGE", 4, "readonly", 1, 1, 1)
+    def cmd_lrange(self, args: list[str]):
+        key = args[0]
+        start = int(args[1])
+        stop = int(args[2])
+        return self.db.lrange(key, start, stop)
+    
+
+    @command("LLEN", 2, "readonly fast", 1, 1, 1)
+    @command("LSIZE", 2, "readonly fast", 1, 1, 1)
+    def cmd_llen(self, args: list[str]):
+        return self.db.lsize(args[0])
+
+
+    @command("LINDEX", 3, "readonly", 1, 1, 1)
+    def cmd_lindex(self, args: list[str]):
+        return self.db.lindex(args[0], int(args[1]))
+
+
+    @command("LSET", 4, "write denyoom", 1, 1, 1)
+    def cmd_lset(self, args: list[str]):
+        return self.db.lset(args[0], int(args[1]), args[2])
+
+
+    @command("LTRIM", 4, "write", 1, 1, 1)
+    def cmd_ltrim(self, args: list[str]):
+        return self.db.ltrim(args[0], int(args[1]), int(args[2]))
+
+
+    @command("LINSERT", 5, "write denyoom", 1, 1, 1)
+    def cmd_linsert(self, args: list[str]):
+        return self.db.linsert(args[0], args[1], args[2], args[3])
+    
+
+    # =============== HASH COMMANDS ===============
+    
+
+    @command("HSET", 4, "write denyoom fast", 1, 1, 1)
+    def cmd_hset(self, args: list[str]):
+        return self.db.hset(args[0], args[1], args[2])
+    
+
+    @command("HGET", 3, "readonly fast", 1, 1, 1)
+    def cmd_hget(self, args: list[str]):
+        return self.db.hget(args[0], args[1])
+    
+
+    @command("HMSET", -4, "write denyoom fast", 1, 1, 1)
+    def cmd_hmset(self, args: list[str]):
+        self.db.hmset(args[0], _pairs(args[1:], "hmset"))
+        return SimpleString("OK")
+
+
+    @command("HMGET", -3, "readonly fast", 1, 1, 1)
+    def cmd_hmget(self, args: list[str]):
+        return self.db.hmget(args[0], args[1:])
+
+
+    @command("HSCAN", -3, "readonly", 1, 1, 1)
+    def cmd_hscan(self, args: list[str]):
+        cursor, count, pattern, _ = _scan_options(args[1:], allow_type=False)
+        cursor, items = self.db.hscan(args[0], cursor, count, pattern)
+        return [str(cursor), items]
+
+
+    @command("HGETALL", 2, "readonly", 1, 1, 1)
+    def cmd_hgetall(self, args: list[str]):
+        return self.db.hgetall(args[0])
+    
+
+    @command("HDEL", -3, "write fast", 1, 1, 1)
+    def cmd_hdel(self, args: list[str]):
+        key = args[0]
+        fields = args[1:]
+        return self.db.hdel(key, *fields)
+    
+
+    # =============== SET COMMANDS ===============
+
+
+    @command("SADD", -3, "write denyoom fast", 1, 1, 1)
+    def cmd_sadd(self, args: list[str]):
+        return self.db.sadd(args[0], *args[1:])
+
+
+    @command("SREM", -3, "write fast", 1, 1, 1)
+    def cmd_srem(self, args: list[str]):
+        return self.db.srem(args[0], *args[1:])
+
+
+    @command("SISMEMBER", 3, "readonly fast", 1, 1, 1)
+    def cmd_sismember(self, args: list[str]):
+        return 1 if self.db.sismember(args[0], args[1]) else 0
+
+
+    @command("SMEMBERS", 2, "readonly", 1, 1, 1)
+    def cmd_smembers(self, args: list[str]):
+        return self.db.smembers(args[0])
+
+
+    @command("SCARD", 2, "readonly fast", 1, 1, 1)
+    def cmd_scard(self, args: list[str]):
+        return self.db.scard(args[0])
+
+
+    @command("SRANDMEMBER", -2, "readonly", 1, 1, 1)
+    def cmd_srandmember(self, args: list[str]):
+        if len(args) > 2:
+            raise ValueError("syntax error")
+        return self.db.srandmember(args[0], int(args[1]) if len(args) == 2 else None)
+
+
+    @command("SINTER", -2, "readonly", 1, -1, 1)
+    def cmd_sinter(self, args: list[str]):
+        return self.db.sinter(*args)
+
+
+    @command("SUNION", -2, "readonly", 1, -1, 1)
+    def cmd_sunion(self, args: list[str]):
+        return self.db.sunion(*args)
+
+
+    @command("SDIFF", -2, "readonly", 1, -1, 1)
+    def cmd_sdiff(self, args: list[str]):
+        return self.db.sdiff(*args)
+
+
+    @command("SINTERSTORE", -3, "write denyoom", 1, -1, 1)
+    def cmd_sinterstore(self, args: list[str]):
+        return self.db.setstore(args[0], self.db.sinter(*args[1:]))
+
+
+    @command("SUNIONSTORE", -3, "write denyoom", 1, -1, 1)
+    def cmd_sunionstore(self, args: list[str]):
+        return self.db.setstore(args[0], self.db.sunion(*args[1:]))
+
+
+    @command("SDIFFSTORE", -3, "write denyoom", 1, -1, 1)
+    def cmd_sdiffstore(self, args: list[str]):
+        return self.db.setstore(args[0], self.db.sdiff(*args[1:]))
+
+
+    @command("SSCAN", -3, "readonly", 1, 1, 1)
+    def cmd_sscan(self, args: list[str]):
+        cursor, count, pattern, _ = _scan_options(args[1:], allow_type=False)
+        cursor, members = self.db.sscan(args[0], cursor, count, pattern)
+        return [str(cursor), members]
+
+
+    # =============== SORTED SET COMMANDS ===============
+
+
+    @command("ZADD", -4, "write denyoom fast", 1, 1, 1)
+    def cmd_zadd(self, args: list[str]):
+        options = {"NX": False, "XX": False, "GT": False, "LT": False, "CH": False, "INCR": False}
+        i = 1
+        while i < len(args) and args[i].upper() in options:
+            options[args[i].upper()] = True
+            i += 1
+
+        rest = args[i:]
+        if not rest or len(rest) % 2:
+            raise ValueError("syntax error")
+        if options["NX"] and options["XX"]:
+            raise ValueError("XX and NX options at the same time are not compatible")
+        if (options["GT"] and options["LT"]) or (options["NX"] and (options["GT"] or options["LT"])):
+            raise ValueError("GT, LT, and/or NX options at the same time are not compatible")
+        if options["INCR"] and len(rest) > 2:
+            raise ValueError("INCR option supports a single increment-element pair")
+
+        pairs = [(parse_score(rest[j]), rest[j + 1]) for j in range(0, len(rest), 2)]
+        result = self.db.zadd(args[0], pairs, nx=options["NX"], xx=options["XX"], gt=options["GT"],
+                              lt=options["LT"], ch=options["CH"], incr=options["INCR"])
+        if options["INCR"]:
+            return format_score(result) if result is not None else None
+        return result
+
+
+    @command("ZINCRBY", 4, "write denyoom fast", 1, 1, 1)
+    def cmd_zincrby(self, args: list[str]):
+        return format_score(self.db.zincrby(args[0], parse_score(args[1]), args[2]))
+
+
+    @command("ZREM", -3, "write fast", 1, 1, 1)
+    def cmd_zrem(self, args: list[str]):
+        return self.db.zrem(args[0], *args[1:])
+
+
+    @command("ZSCORE", 3, "readonly fast", 1, 1, 1)
+    def cmd_zscore(self, args: list[str]):
+        score = self.db.zscore(args[0], args[1])
+        return format_score(score) if score is not None else None
+
+
+    @command("ZCARD", 2, "readonly fast", 1, 1, 1)
+    def cmd_zcard(self, args: list[str]):
+        return self.db.zcard(args[0])
+
+
+    @command("ZRANK", -3, "readonly fast", 1, 1, 1)
+    def cmd_zrank(self, args: list[str]):
+        return self._zrank(args, reverse=False)
+
+
+    @command("ZREVRANK", -3, "readonly fast", 1, 1, 1)
+    def cmd_zrevrank(self, args: list[str]):
+        return self._zrank(args, reverse=True)
+
+
+    def _zrank(self, args: list[str], reverse: bool):
+        """ZRANK key member [WITHSCORE]"""
+
+        if len(args) > 3 or (len(args) == 3 and args[2].upper() != "WITHSCORE"):
+            raise ValueError("syntax error")
+        rank = self.db.zrank(args[0], args[1], reverse)
+        if len(args) == 2 or rank is None:
+            return rank
+        return [rank, format_score(self.db.zscore(args[0], args[1]))]
+
+
+    @command("ZRANGE", -4, "readonly", 1, 1, 1)
+    def cmd_zrange(self, args: list[str]):
+        """ZRANGE key start stop [BYSCORE] [REV] [LIMIT offset count] [WITHSCORES]"""
+
+        options = {"BYSCORE": False, "REV": False, "WITHSCORES": False}
+        limit = None
+        i = 3
+        while i < len(args):
+            option = args[i].upper()
+            if option == "LIMIT" and i + 2 < len(args):
+                limit = (int(args[i + 1]), int(args[i + 2]))
+                i += 3
+            elif option in options:
+                options[option] = True
+                i += 1
+            elif option == "BYLEX":
+                raise ValueError("BYLEX is not supported")
+            else:
+                raise ValueError("syntax error")
+
+        if limit is not None and not options["BYSCORE"]:
+            raise ValueError("syntax error, LIMIT is only supported in combination with either BYSCORE or BYLEX")
+
+        return self._zrange(args[0], args[1], args[2], options["BYSCORE"], options["REV"],
+                            limit, options["WITHSCORES"])
+
+
+    @command("ZREVRANGE", -4, "readonly", 1, 1, 1)
+    def cmd_zrevrange(self, args: list[str]):
+        """ZREVRANGE key start stop [WITHSCORES]"""
+
+        withscores = _withscores_option(args[3:])
+        return self._zrange(args[0], args[1], args[2], False, True, None, withscores)
+
+
+    @command("ZRANGEBYSCORE", -4, "readonly", 1, 1, 1)
+    def cmd_zrangebyscore(self, args: list[str]):
+        """ZRANGEBYSCORE key min max [WITHSCORES] [LIMIT offset count]"""
+
+        withscores, limit = _rangebyscore_options(args[3:])
+        return self._zrange(args[0], args[1], args[2], True, False, limit, withscores)
+
+
+    @command("ZREVRANGEBYSCORE", -4, "readonly", 1, 1, 1)
+    def cmd_zrevrangebyscore(self, args: list[str]):
+        """ZREVRANGEBYSCORE key max min [WITHSCORES] [LIMIT offset count]"""
+
+        withscores, limit = _rangebyscore_options(args[3:])
+        return self._zrange(args[0], args[1], args[2], True, True, limit, withscores)
+
+
+    def _zrange(self, key: str, start: str, stop: str, byscore: bool, rev: bool, limit, withscores: bool):
+        if not byscore:
+            pairs = self.db.zrange(key, int(start), int(stop), reverse=rev)
+            return _with_scores(pairs, withscores)
+
+        # REV: the range is given from max to min
+        low, high = (parse_bound(stop), parse_bound(start)) if rev else (parse_bound(start), parse_bound(stop))
+        offset, count = limit if limit is not None else (0, -1)
+        pairs = self.db.zrangebyscore(key, low, high, reverse=rev, offset=offset, count=count)
+        return _with_scores(pairs, withscores)
+
+
+    @command("ZCOUNT", 4, "readonly fast", 1, 1, 1)
+    def cmd_zcount(self, args: list[str]):
+        return self.db.zcount(args[0], parse_bound(args[1]), parse_bound(args[2]))
+
+
+    @command("ZPOPMIN", -2, "write fast", 1, 1, 1)
+    def cmd_zpopmin(self, args: list[str]):
+        return self._zpop(args, highest=False)
+
+
+    @command("ZPOPMAX", -2, "write fast", 1, 1, 1)
+    def cmd_zpopmax(self, args: list[str]):
+        return self._zpop(args, highest=True)
+
+
+    def _zpop(self, args: list[str], highest: bool):
+        """ZPOPMIN key [count]: member, score, member, score, ..."""
+
+        if len(args) > 2:
+            raise ValueError("syntax error")
+        count = int(args[1]) if len(args) == 2 else 1
+        if count < 0:
+            raise ValueError("value is out of range, must be positive")
+        return _with_scores(self.db.zpop(args[0], count, highest), True)
+
+
+    @command("ZSCAN", -3, "readonly", 1, 1, 1)
+    def cmd_zscan(self, args: list[str]):
+        cursor, count, pattern, _ = _scan_options(args[1:], allow_type=False)
+        cursor, items = self.db.zscan(args[0], cursor, count, pattern)
+        return [str(cursor), [format_score(item) if i % 2 else item for i, item in enumerate(items)]]
+
+
+    # =============== SERVER COMMANDS ===============
+    
+
+    @command("PING", -1, "fast")
+    def cmd_ping(self, args: list[str]):
+        if args:
+            return args[0]
+        return SimpleString("PONG")
+    
+
+    @command("DBSIZE", 1, "readonly fast")
+    def cmd_dbsize(self, args: list[str]):
+        return self.db.dbsize()
+    
+
+    @command("FLUSHDB", 1, "write")
+    def cmd_flushdb(self, args: list[str]):
+        self.db.flushdb()
+        return SimpleString("OK")
+    
+
+    @command("KEYS", -1, "readonly")
+    def cmd_keys(self, args: list[str]):
+        return self.db.keys(args[0] if args else "*")
+
+
+    @command("SCAN", -2, "readonly")
+    def cmd_scan(self, args: list[str]):
+        cursor, count, pattern, type_ = _scan_options(args, allow_type=True)
+        cursor, keys = self.db.scan(cursor, count, pattern, type_)
+        return [str(cursor), keys]
+    
+
+    @command("SAVE", 1, "admin")
+    def cmd_save(self, args: list[str]):
+        if self.db.persistence.bgsave_pid is not None:
+            raise ValueError("Background save already in progress")
+        if not self.db.persistence.save_snapshot(self.db):
+            raise ValueError("Snapshot save failed, see the server log")
+        return SimpleString("OK")
+    
+
+    @command("BGSAVE", 1, "admin")
+    def cmd_bgsave(self, args: list[str]):
+        if self.db.persistence.bgsave_pid is not None:
+            raise ValueError("Background save already in progress")
+        if not self.db.persistence.start_bgsave(self.db):
+            raise ValueError("Background append only file rewriting in progress")
+        return SimpleString("Background saving started")
+    
+
+    @command("LASTSAVE", 1, "fast")
+    def cmd_lastsave(self, args: list[str]):
+        return self.db.persistence.lastsave
+    
+
+    @command("INFO", -1, "")
+    def cmd_info(self, args: list[str]):
+        return self.info(*args)
+    
+
+    @command("CONFIG", -2, "admin")
+    def cmd_config(self, args: list[str]):
+        """
+        CONFIG RESETSTAT   zero the INFO counters: commandstats, keyspace
+                           hits/misses, network, expired and evicted keys
+        """
+
+        if args[0].upper() == "RESETSTAT" and len(args) == 1:
+            self.stats.reset()
+            self.db.expires.expired_keys = 0
+            memory = self.db.memory
+            memory.evicted_keys = memory.evicted_bytes = memory.oom_rejections = 0
+            return SimpleString("OK")
+
+        raise ValueError(f"unknown subcommand or wrong number of arguments for '{args[0]}'. Try CONFIG RESETSTAT")
+
+
+    @command("SLOWLOG", -2, "admin")
+    def cmd_slowlog(self, args: list[str]):
+        return self.slowlog.handle(args)
+
+
+    @command("BGREWRITEAOF", 1, "admin")
+    def cmd_bgrewriteaof(self, args: list[str]):
+        if self.db.aof is None:
+            raise ValueError("AOF is disabled (start with --appendonly yes)")
+        if not self.db.aof.start_rewrite(self.db):
+            raise ValueError("Background append only file rewriting already in progress")
+        if self.db.aof.rewrite_scheduled:
+            return SimpleString("Background append only file rewriting scheduled")
+        return SimpleString("Background append only file rewriting started")
+
+
+    # =============== TRANSACTIONS ===============
+    #
+    # a client's MULTI/EXEC/DISCARD/WATCH are handled by its
+    # connection (multi.Transaction): these run only when the
+    # AOF is replayed, where MULTI/EXEC just mark a transaction
+
+
+    @command("MULTI", 1, "fast")
+    def cmd_multi(self, args: list[str]):
+        return SimpleString("OK")
+
+
+    @command("EXEC", 1, "")
+    def cmd_exec(self, args: list[str]):
+        return []
+
+
+    @command("DISCARD", 1, "fast")
+    def cmd_discard(self, args: list[str]):
+        return SimpleString("OK")
+
+
+    @command("WATCH", -2, "fast", 1, -1, 1)
+    def cmd_watch(self, args: list[str]):
+        return SimpleString("OK")
+
+
+    @command("UNWATCH", 1, "fast")
+    def cmd_unwatch(self, args: list[str]):
+        return SimpleString("OK")
+
+
+    # =============== PUB/SUB ===============
+    #
+    # SUBSCRIBE & co change the state of the connection and are
+    # handled there (pubsub.PubSub.handle): they are in the table
+    # for COMMAND and the arity checks only
+
+
+    @command("PUBLISH", 3, "fast")
+    def cmd_publish(self, args: list[str]):
+        return self.pubsub.publish(args[0], args[1])
+
+
+    @command("PUBSUB", -2, "")
+    def cmd_pubsub(self, args: list[str]):
+        """
+        PUBSUB CHANNELS [pattern]       channels with subscribers
+        PUBSUB NUMSUB [channel ...]     channel, subscribers, ...
+        PUBSUB NUMPAT                   number of subscribed patterns
+        """
+
+        sub = args[0].upper()
+
+        if sub == "CHANNELS" and len(args) <= 2:
+            return self.pubsub.channel_list(args[1] if len(args) > 1 else "*")
+
+        if sub == "NUMSUB":
+            reply = []
+            for channel in args[1:]:
+                reply.append(channel)
+                reply.append(self.pubsub.numsub(channel))
+            return reply
+
+        if sub == "NUMPAT" and len(args) == 1:
+            return len(self.pubsub.patterns)
+
+        raise ValueError(f"unknown subcommand or wrong number of arguments for '{args[0]}'. Try PUBSUB CHANNELS, NUMSUB, NUMPAT")
+
+
+    @command("SUBSCRIBE", -2, "")
+    @command("UNSUBSCRIBE", -1, "")
+    @command("PSUBSCRIBE", -2, "")
+    @command("PUNSUBSCRIBE", -1, "")
+    def cmd_subscribe(self, args: list[str]):
+        raise ValueError("Pub/Sub needs a client connection")
+
+
+    # =============== REPLICATION ===============
+
+
+    @command("REPLICAOF", 3, "admin")
+    @command("SLAVEOF", 3, "admin")
+    def cmd_replicaof(self, args: list[str]):
+        """REPLICAOF host port: follow a primary; REPLICAOF NO ONE: stop"""
+
+        if args[0].upper() == "NO" and args[1].upper() == "ONE":
+            self.replication.replicaof(None)
+            return SimpleString("OK")
+        if not args[1].isdigit():
+            raise ValueError("Invalid master port")
+        self.replication.replicaof(args[0], int(args[1]))
+        return SimpleString("OK")
+
+
+    # a replica's PSYNC/REPLCONF are handled by its connection
+    # (replication.Replication.handle): here for COMMAND only
+    @command("PSYNC", 3, "admin")
+    @command("REPLCONF", -1, "admin")
+    def cmd_psync(self, args: list[str]):
+        raise ValueError("replication needs a client connection")
+
+
+    @command("COMMAND", -1, "")
+    def cmd_command(self, args: list[str]):
+        """
+        COMMAND                    every command with its metadata
+        COMMAND INFO name [...]    the metadata of some commands (None if unknown)
+        COMMAND COUNT              number of commands
+        COMMAND GETKEYS cmd [...]  the keys of a full command
+        """
+
+        if not args:
+            return [spec.describe() for spec in COMMANDS.values()]
+
+        sub = args[0].upper()
+
+        if sub == "COUNT":
+            return len(COMMANDS)
+
+        if sub == "INFO":
+            names = args[1:] or list(COMMANDS)
+            return [spec.describe() if spec is not None else None for spec in map(lookup_command, names)]
+
+        if sub == "GETKEYS":
             if len(args) < 2:
-                raise ValueError("HDEL requires at least 2 arguments: HDEL key field [field...]")
-            key = args[0]
-            fields = args[1:]
-            return self.db.hdel(key, *fields)
-        
-        # =============== SERVER COMMANDS ===============
-        
-        elif command_name == "PING":
-            if args:
-                return args[0]
-            return "PONG"
-        
-        elif command_name == "DBSIZE":
-            return self.db.dbsize()
-        
-        elif command_name == "FLUSHDB":
-            self.db.flushdb()
-            return "OK"
-        
-        elif command_name == "KEYS":
-            return self.db.keys()
-        
-        else:
-            raise ValueError(f"\nunknown command: {command_name}\n")
+                raise ValueError("wrong number of arguments for 'command|getkeys' command")
+            spec = lookup_command(args[1])
+            if spec is None:
+                raise ValueError("Invalid command specified")
+            if not spec.check_arity(len(args) - 1):
+                raise ValueError("Invalid number of arguments specified for command")
+            keys = spec.keys(args[1:])
+            if not keys:
+                raise ValueError("The command has no key arguments")
+            return keys
+
+        if sub == "DOCS":
+            # no docs: redis-cli asks for them on startup
+            return []
+
+        raise ValueError(f"unknown subcommand '{args[0]}'. Try COMMAND INFO, COUNT, GETKEYS")
+
+
+    # =============== INFO =============== #
+
+
+    def info(self, *names: str) -> str:
+        """
+        INFO [section ...]
+        Server statistics as "key:value" lines grouped in "# Section" blocks
+
+        commandstats, latencystats and keytypes (a walk of the whole
+        keyspace) are left out of the default sections, like Redis
+        does; "all" and "everything" include them.
+        """
+
+        sections = {
+            "server": self.stats.server_info,
+            "clients": self._info_clients,
+            "memory": self.db.memory.info,
+            "persistence": self._info_persistence,
+            "stats": self._info_stats,
+            "replication": self.replication.info,
+            "commandstats": self.stats.commandstats_info,
+            "latencystats": self.stats.latencystats_info,
+            "keytypes": self._info_keytypes,
+            "keyspace": self._info_keyspace,
+        }
+        extra = {"commandstats", "latencystats", "keytypes"}
+
+        wanted = {name.lower() for name in names} or {"default"}
+        if wanted & {"all", "everything"}:
+            wanted |= set(sections)
+        if "default" in wanted:
+            wanted |= set(sections) - extra
+
+        lines = []
+        for name, build in sections.items():
+            if name in wanted:
+                lines.append(f"# {name.capitalize()}")
+                lines.extend(f"{key}:{val}" for key, val in build().items())
+                lines.append("")
+
+        return "\r\n".join(lines)
+
+
+    def _info_clients(self) -> dict:
+        fields = self.stats.clients_info()
+        fields.update(self.blocking.info())
+        return fields
+
+
+    def _info_persistence(self) -> dict:
+        loader = self.db.loader
+        fields = {"loading": 1 if loader is not None else 0}
+        if loader is not None:
+            fields.update(loader.info())
+        fields.update(self.db.persistence.info())
+        fields["aof_enabled"] = 1 if self.db.aof is not None else 0
+        if self.db.aof is not None:
+            fields.update(self.db.aof.info())
+        return fields
+
+
+    def _info_stats(self) -> dict:
+        fields = self.stats.stats_info()
+        fields.update(self.db.expires.info())
+        fields.update(self.db.memory.stats())
+        fields.update(self.db.scans.info())
+        fields.update(self.pubsub.info())
+        return fields
+
+
+    def _info_keytypes(self) -> dict:
+        if self.db.loader is not None:
+            return {}
+        return keytypes_info(self.db.data)
+
+
+    def _info_keyspace(self) -> dict:
+        keys = self.db.dbsize()
+        if not keys:
+            return {}
+        return {"db0": f"keys={keys},expires={len(self.db.expires)}"}
@@ -0,0 +1,284 @@
+"""
+ClientConnection: state of a single client connection,
+shared by the select server and the asyncio server
+"""
+
+import itertools
+import time
+from typing import Optional
+
+from blocking import BLOCKING_COMMANDS, Waiter
+from commands import lookup_command
+from multi import MULTI_COMMANDS, Transaction
+from parser import Encoder, ProtocolError, RespEncoder, RespParser, SimpleString
+from pubsub import PUBSUB_COMMANDS, SUBSCRIBED_COMMANDS
+from replication import REPLICATION_COMMANDS
+
+
+# sent by the router of a sharded server before the commands of another
+# client, so the shard records that client's address instead of the link's
+FORWARD_COMMAND = "FORWARDED"
+
+
+class ClientConnection:
+    """
+    A connected client, independent of the socket layer.
+
+    The server feeds it the received bytes; the replies are encoded
+    with the client's protocol and queued in the write buffer, which
+    the server flushes once per loop iteration (one write for a whole
+    pipelined batch).
+
+    Subclasses implement write_bytes() and close_transport().
+
+    Attributes:
+        id: unique connection id
+        addr: "host:port" of the client (on a router's link, of the
+            client whose commands are being forwarded)
+        parser: incremental request parser (read buffer)
+        output: encoded replies not written yet (write buffer)
+        channels, patterns: Pub/Sub subscriptions; while there is
+            one the connection only takes SUBSCRIBE & co and PING
+        blocked: the BLPOP & co it is parked on; the commands sent
+            in the meantime stay in the read buffer
+    """
+
+    _ids = itertools.count(1)
+
+
+    def __init__(self, server, addr: str = ""):
+        self.id = next(ClientConnection._ids)
+        self.addr = addr
+        self.server = server
+        self.executor = server.command_executor
+        self.parser = RespParser()
+        self.output: list[bytes] = []
+        self.created_at = time.time()
+        self.closed = False
+        self.transaction: Transaction = None     # created by the first MULTI/WATCH
+        self.channels: set[str] = set()
+        self.patterns: set[str] = set()
+        self.blocked: Waiter = None
+        self.write_paused = False              # set by the transport's flow control
+
+
+    @property
+    def protocol(self):
+        return self.parser.protocol
+
+
+    @property
+    def subscriptions(self) -> int:
+        return len(self.channels) + len(self.patterns)
+
+
+    # =============== read side =============== #
+
+
+    def feed(self, data: bytes) -> None:
+        """parse and execute every complete command received so far"""
+
+        self.parser.feed(data)
+        if self.blocked is None:
+            self._process()
+
+
+    def _process(self) -> None:
+        blocking = self.executor.blocking
+
+        try:
+            for cmd in self.parser:
+                reply = self.execute(cmd)
+                if blocking.ready:
+                    blocking.serve()
+                if reply is None:
+                    # parked: the next commands run once it is served
+                    break
+                self.output.append(reply)
+
+        except ProtocolError as e:
+            # the stream can't be resynchronized: reply and drop the client
+            self.output.append(self.encode_error(f"Protocol error: {e}"))
+            self.close()
+            return
+
+        if self.output:
+            self.server.schedule_flush(self)
+
+
+    def execute(self, cmd: list[str]) -> Optional[bytes]:
+        """exec a parsed command and encode the reply, None if the connection got parked"""
+
+        try:
+            name = cmd[0].upper()
+            self.executor.client_addr = self.addr
+            tx = self.transaction
+            if self.executor.replication.readonly:
+                self._check_readonly(name, tx)
+            if name == FORWARD_COMMAND and self.executor.routed and len(cmd) == 2:
+                self.addr = cmd[1]
+                result = SimpleString("OK")
+            elif (tx is not None and tx.active) or name in MULTI_COMMANDS:
+                if tx is None:
+                    tx = self.transaction = Transaction(self.executor)
+                result = tx.handle(name, cmd)
+            elif name in PUBSUB_COMMANDS:
+                # one reply per channel
+                replies = self.executor.pubsub.handle(self, name, cmd[1:])
+                return b"".join(map(self.encode, replies))
+            elif self.channels or self.patterns:
+                result = self._execute_subscribed(name, cmd)
+            elif name in REPLICATION_COMMANDS:
+                result = self.executor.replication.handle(self, name, cmd[1:])
+                if result is None:
+                    # REPLCONF ACK, or PSYNC that sent its reply itself
+                    return b""
+            else:
+                result = self.executor.execute(cmd)
+                if result is None and name in BLOCKING_COMMANDS:
+                    self.blocked = self.executor.blocking.block(self, cmd)
+                    return None
+        except Exception as e:
+            return self.encode_error(str(e))
+
+        return self.encode(result)
+
+
+    def wake(self, result) -> None:
+        """the blocking command was served (None: timed out): reply and go on with the input"""
+
+        self.blocked = None
+        if isinstance(result, Exception):
+            self.send(self.encode_error(str(result)))
+        else:
+            self.send(self.encode(result))
+        if not self.closed:
+            self._process()
+
+
+    def _check_readonly(self, name: str, tx: Transaction) -> None:
+        """a replica: clients can't run write commands"""
+
+        spec = lookup_command(name)
+        if spec is not None and spec.write:
+            if tx is not None and tx.active:
+                tx.failed = True
+            raise ValueError("READONLY You can't write against a read only replica.")
+
+
+    def _execute_subscribed(self, name: str, cmd: list[str]):
+        """a command other than SUBSCRIBE & co from a subscribed connection"""
+
+        if name not in SUBSCRIBED_COMMANDS:
+            raise ValueError(f"Can't execute '{cmd[0].lower()}': only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING are allowed in this context")
+        if name == "PING":
+            # a push-mode reply, so clients can tell it from a message
+            return ["pong", cmd[1] if len(cmd) > 1 else ""]
+        return self.executor.execute(cmd)
+
+
+    # =============== write side =============== #
+
+
+    def encode(self, result) -> bytes:
+        if self.parser.protocol == "resp":
+            return RespEncoder.encode(result)
+
+        return (Encoder.format_response(result) + "\n").encode("utf-8", errors="surrogateescape")
+
+
+    def encode_error(self, message: str) -> bytes:
+        if self.parser.protocol == "resp":
+            return RespEncoder.encode_error(message)
+
+        return f"ERROR: {message}\n".encode("utf-8", errors="surrogateescape")
+
+
+    def send(self, data: bytes) -> None:
+        """queue already encoded bytes, written at the next flush"""
+
+        if self.closed:
+            return
+        self.output.append(data)
+        self.server.schedule_flush(self)
+
+
+    def flush(self) -> None:
+        """write the whole output buffer with a single call"""
+
+        if not self.output or self.closed:
+            return
+
+        data = b"".join(self.output)
+        self.output.clear()
+        self.write_bytes(data)
+
+
+    def close(self) -> None:
+        """flush pending replies and close the connection"""
+
+        if self.closed:
+            return
+
+        self.flush()
+        self.closed = True
+        self.output.clear()
+        self.close_transport()
+        self._end_transaction()
+        self._end_subscriptions()
+        self._end_blocking()
+        self._end_replica()
+        self.server.remove_client(self)
+
+
+    def connection_lost(self) -> None:
+        """the peer went away: drop the buffers without writing"""
+
+        if self.closed:
+            return
+
+        self.closed = True
+        self.output.clear()
+        self._end_transaction()
+        self._end_subscriptions()
+        self._end_blocking()
+        self._end_replica()
+        self.server.remove_client(self)
+
+
+    def resume(self) -> None:
+        """the transport drained its write buffer: go on with a full sync"""
+
+        if self.executor is not None and self in self.executor.replication.replicas:
+            self.executor.replication.pump(self)
+
+
+    def _end_transaction(self) -> None:
+        """drop a pending MULTI and the WATCHed keys"""
+
+        if self.transaction is not None:
+            self.transaction.reset()
+
+
+    def _end_subscriptions(self) -> None:
+        if self.channels or self.patterns:
+            self.executor.pubsub.drop(self)
+
+
+    def _end_blocking(self) -> None:
+        if self.blocked is not None:
+            self.executor.blocking.cancel(self.blocked)
+            self.blocked = None
+
+
+    def _end_replica(self) -> None:
+        if self.executor is not None and self in self.executor.replication.replicas:
+            self.executor.replication.drop(self)
+
+
+    def write_bytes(self, data: bytes) -> None:
+        raise NotImplementedError
+
+
+    def close_transport(self) -> None:
+        raise NotImplementedError
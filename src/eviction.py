@@ -0,0 +1,452 @@
+"""
+MemoryManager: maxmemory limit and approximated LRU/LFU eviction
+"""
+
+import bisect
+import os
+import random
+import sys
+from typing import Optional
+
+from intset import IntSet
+from value import clock, value
+from zset import SkipList, ZSet
+
+
+POLICIES = (
+    "noeviction",
+    "allkeys-lru", "allkeys-lfu", "allkeys-random",
+    "volatile-lru", "volatile-lfu", "volatile-random", "volatile-ttl",
+)
+
+OOM_ERROR = "OOM command not allowed when used memory > 'maxmemory'."
+
+_UNITS = {"b": 1, "k": 1000, "kb": 1024, "m": 1000 ** 2, "mb": 1024 ** 2, "g": 1000 ** 3, "gb": 1024 ** 3}
+
+
+def parse_memory(text: str) -> int:
+    """ "100mb", "2gb", "1048576" -> bytes (redis.conf units) """
+
+    text = str(text).strip().lower()
+    digits = text.rstrip("bkmg")
+    unit = text[len(digits):] or "b"
+    if not digits.isdigit() or unit not in _UNITS:
+        raise ValueError(f"invalid memory size: {text}")
+    return int(digits) * _UNITS[unit]
+
+
+def format_memory(size: float) -> str:
+    """bytes -> "1.50M", like used_memory_human"""
+
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            return f"{size:.2f}{unit}" if unit != "B" else f"{int(size)}B"
+        size /= 1024
+
+
+# dict slot + index entry of the keyspace, per key
+_DICT_ENTRY = 3 * 8 + 8
+
+# value wrapper with its attributes
+_sample_value = value(None)
+_VALUE_OVERHEAD = sys.getsizeof(_sample_value) + (
+    sys.getsizeof(vars(_sample_value)) if hasattr(_sample_value, "__dict__") else 0
+)
+del _sample_value
+
+# skiplist member: node with its level lists, score, dict slot
+_sample_node = SkipList().insert(1.5, "")
+_ZSET_NODE = (sys.getsizeof(_sample_node) + sys.getsizeof(_sample_node.next) + sys.getsizeof(_sample_node.span)
+              + sys.getsizeof(1.5) + 3 * 8)
+del _sample_node
+# compact member: (score, member) tuple in a list
+_ZSET_COMPACT = sys.getsizeof((1.5, None)) + sys.getsizeof(1.5) + 8
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def estimate_size(key: str, val) -> int:
+    """
+    approximate bytes held by a key: strings are measured,
+    big containers are extrapolated from their first elements
+    """
+
+    data = val.data
+    size = _DICT_ENTRY + sys.getsizeof(key) + _VALUE_OVERHEAD + sys.getsizeof(data)
+
+    if type(data) is str:
+        # most keys: measured twice per write under maxmemory
+        return size
+
+    if isinstance(data, dict):
+        n = len(data)
+        if n:
+            probe = 0
+            for i, (field, item) in enumerate(data.items()):
+                if i == 16:
+                    break
+                probe += sys.getsizeof(field) + sys.getsizeof(item)
+            size += probe * n // min(n, 16)
+
+    elif isinstance(data, IntSet):
+        pass        # one array, measured by getsizeof
+
+    elif isinstance(data, ZSet):
+        n = len(data)
+        if n:
+            per_member = _ZSET_COMPACT if data.items is not None else _ZSET_NODE
+            probe = 0
+            for i, member in enumerate(data):
+                if i == 16:
+                    break
+                probe += sys.getsizeof(member) + per_member
+            size += probe * n // min(n, 16)
+
+    elif not isinstance(data, (str, bytes, int)):
+        n = len(data)
+        if n:
+            probe = 0
+            for i, item in enumerate(data):
+                if i == 16:
+                    break
+                probe += sys.getsizeof(item)
+            size += probe * n // min(n, 16)
+
+    return size
+
+
+class MemoryManager:
+    """
+    Keeps the dataset under maxmemory, evicting keys on writes.
+
+    With a maxmemory the dataset size is accounted key by key
+    (Python has no allocator stats to read per key): a write command
+    measures its keys with estimate_size() before and after it runs
+    (begin() / end()) and adds the difference to used, expired and
+    evicted keys are subtracted (removed()), and a loaded dataset
+    is measured once (recount(), key by key during a lazy load). A big list grown by RPUSH counts
+    for what it holds, not for the average key. Without a limit
+    used_memory is keys x the average size of random keys, which
+    costs nothing on writes.
+
+    Candidates are picked like Redis does: a few random keys are
+    sampled per eviction and the best ones kept in a small pool
+    (idle time for LRU, inverted LFU counter for LFU), so each write
+    does O(samples) work whatever the size of the keyspace.
+    volatile-ttl takes the first key of the expiry heap.
+
+    Attributes:
+        maxmemory: limit in bytes (0 = no limit)
+        policy: one of POLICIES
+        samples: keys sampled per eviction
+        accounting: keys are accounted one by one (there is a maxmemory)
+        used: accounted bytes of the dataset
+    """
+
+    POOL_SIZE = 16
+    REFRESH_SAMPLES = 64
+
+
+    def __init__(self, db, maxmemory: int = 0, policy: str = "noeviction", samples: int = 5):
+        if policy not in POLICIES:
+            raise ValueError(f"invalid maxmemory policy: {policy}")
+
+        self.db = db
+        self.maxmemory = maxmemory
+        self.policy = policy
+        self.samples = samples
+
+        # values only keep the access metadata the policy reads
+        # (value.touch() mode, copied by PhotonDB for its call sites)
+        if maxmemory and policy.endswith("lru"):
+            self.tracking = "lru"
+        elif maxmemory and policy.endswith("lfu"):
+            self.tracking = "lfu"
+        else:
+            self.tracking = "none"
+
+        self.accounting = bool(maxmemory)
+        self.used = 0
+        self._pending: Optional[dict[str, int]] = None   # key -> size, while a write runs
+
+        self.avg_key_size = 0.0
+        self.pool: list[tuple[int, str]] = []       # (score, key), best candidate last
+        self._keys: list[str] = []                   # sampling view of the keyspace
+
+        # stats
+        self.evicted_keys = 0
+        self.evicted_bytes = 0
+        self.oom_rejections = 0
+
+
+    # =============== accounting =============== #
+
+
+    def used_memory(self) -> int:
+        """estimated bytes of the dataset"""
+
+        if self.accounting:
+            return self.used
+        if not self.avg_key_size and self.db.data:
+            self.refresh()
+        return int(len(self.db.data) * self.avg_key_size)
+
+
+    def begin(self, keys: list[str]) -> None:
+        """a write command is about to run on keys: remember their size"""
+
+        data = self.db.data
+        pending = self._pending = {}
+        for key in keys:
+            val = data.get(key)
+            pending[key] = estimate_size(key, val) if val is not None else 0
+
+
+    def end(self) -> None:
+        """the write command ran: account the size change of its keys"""
+
+        pending = self._pending
+        self._pending = None
+        if not pending:
+            # keyless write (FLUSHDB)
+            self.recount()
+            return
+
+        data = self.db.data
+        used = self.used
+        for key, size in pending.items():
+            val = data.get(key)
+            used += (estimate_size(key, val) if val is not None else 0) - size
+        self.used = used
+
+
+    def removed(self, key: str, val) -> None:
+        """key is being deleted outside of a write command (expiry)"""
+
+        if not self.accounting:
+            return
+        pending = self._pending
+        if pending is not None and key in pending:
+            # the write command running on it accounts it in end()
+            return
+        self.used -= estimate_size(key, val)
+
+
+    def loaded(self, key: str, val) -> None:
+        """a lazy snapshot load decoded key"""
+
+        self.used += estimate_size(key, val)
+
+
+    def recount(self) -> None:
+        """measure the whole dataset, after it was loaded or replaced"""
+
+        if not self.accounting or self.db.loader is not None:
+            return
+        self.used = sum(estimate_size(key, val) for key, val in self.db.data.items())
+
+
+    def refresh(self) -> None:
+        """update the average key size from random keys"""
+
+        keys = self.random_keys(self.REFRESH_SAMPLES)
+        data = self.db.data
+        sizes = [estimate_size(key, data[key]) for key in keys if key in data]
+        if not sizes:
+            return
+
+        current = sum(sizes) / len(sizes)
+        if self.avg_key_size:
+            self.avg_key_size = self.avg_key_size * 0.8 + current * 0.2
+        else:
+            self.avg_key_size = current
+
+
+    # =============== sampling =============== #
+
+
+    def random_keys(self, count: int) -> list[str]:
+        """
+        up to count random keys
+
+        A dict can't be sampled, so this uses a list of the keys:
+        new keys are appended by added(), deleted keys are swap-removed
+        when they are drawn, and the list is rebuilt if it drifts to
+        half (or twice) the keyspace. Amortized O(1) per key drawn.
+        """
+
+        data = self.db.data
+        keys = self._keys
+        if len(keys) < len(data) // 2 or len(keys) > 2 * len(data) + 1024:
+            keys = self._keys = list(data)
+
+        picked = []
+        rand = random.random
+        while keys and len(picked) < count:
+            i = int(rand() * len(keys))
+            key = keys[i]
+            if key in data:
+                picked.append(key)
+            else:
+                # swap-remove the deleted key
+                keys[i] = keys[-1]
+                keys.pop()
+        return picked
+
+
+    def added(self, key: str) -> None:
+        """a write is creating key: make it an eviction candidate"""
+
+        self._keys.append(key)
+
+
+    def _fill_pool(self) -> None:
+        volatile = self.policy.startswith("volatile")
+        if volatile:
+            keys = self.db.expires.random_keys(self.samples)
+        else:
+            keys = self.random_keys(self.samples)
+
+        data = self.db.data
+        pool = self.pool
+        now = clock.ms
+
+        lfu = self.policy.endswith("lfu")
+        pooled = {k for _, k in pool}
+
+        for key in keys:
+            val = data.get(key)
+            if val is None or key in pooled:
+                continue
+            # higher = better candidate: idle time, or inverted LFU counter
+            score = 255 - val.lfu_decay(now) if lfu else now - val.last_accessed
+            if len(pool) < self.POOL_SIZE or score > pool[0][0]:
+                bisect.insort(pool, (score, key))
+                if len(pool) > self.POOL_SIZE:
+                    pool.pop(0)
+
+
+    def _pick(self) -> Optional[str]:
+        """next key to evict, None if the policy has no candidate"""
+
+        policy = self.policy
+        data = self.db.data
+
+        if policy == "volatile-ttl":
+            expires = self.db.expires
+            while True:
+                first = expires.peek()
+                if first is None or first[1] in data:
+                    return first[1] if first is not None else None
+                expires.discard(first[1])
+
+        if policy.endswith("random"):
+            if policy.startswith("volatile"):
+                keys = self.db.expires.random_keys(1)
+            else:
+                keys = self.random_keys(1)
+            return keys[0] if keys else None
+
+        self._fill_pool()
+        while self.pool:
+            _, key = self.pool.pop()
+            if key in data:
+                return key
+        return None
+
+
+    # =============== eviction =============== #
+
+
+    def free_memory(self) -> list[str]:
+        """
+        evict keys until the dataset fits in maxmemory,
+        called before a command that can use more memory
+
+        return:
+            list[str]: evicted keys (the AOF logs them as DEL)
+
+        raises:
+            ValueError: OOM, the policy can't free enough memory
+        """
+
+        if not self.maxmemory or self.db.loader is not None:
+            return []
+
+        if self.used <= self.maxmemory:
+            return []
+
+        if self.policy == "noeviction":
+            self.oom_rejections += 1
+            raise ValueError(OOM_ERROR)
+
+        clock.tick()
+
+        data = self.db.data
+        evicted = []
+        while self.used > self.maxmemory:
+            key = self._pick()
+            if key is None:
+                self.oom_rejections += 1
+                raise ValueError(OOM_ERROR)
+
+            size = estimate_size(key, data[key])
+            self.evicted_bytes += size
+            self.used -= size
+            del data[key]
+            self.db.expires.discard(key)
+            evicted.append(key)
+
+        self.evicted_keys += len(evicted)
+        return evicted
+
+
+    def info(self) -> dict:
+        """memory fields for INFO"""
+
+        used = self.used_memory()
+        return {
+            "used_memory": used,
+            "used_memory_human": format_memory(used),
+            "used_memory_rss": _rss(),
+            "used_memory_peak": _peak_rss(),
+            "avg_key_size": used // len(self.db.data) if self.accounting and self.db.data else int(self.avg_key_size),
+            "maxmemory": self.maxmemory,
+            "maxmemory_human": format_memory(self.maxmemory),
+            "maxmemory_policy": self.policy,
+            "maxmemory_samples": self.samples,
+            "eviction_pool_size": len(self.pool),
+        }
+
+
+    def stats(self) -> dict:
+        """eviction counters for INFO stats"""
+
+        return {
+            "evicted_keys": self.evicted_keys,
+            "evicted_bytes": self.evicted_bytes,
+            "oom_rejections": self.oom_rejections,
+        }
+
+
+def _rss() -> int:
+    """resident set size of the process, 0 where /proc is missing"""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _peak_rss() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
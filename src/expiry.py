@@ -0,0 +1,232 @@
+"""
+ExpiryIndex: keys with a TTL, ordered by deadline,
+and the active expire cycle run by the server cron
+"""
+
+import heapq
+import random
+import time
+from typing import Callable, Optional
+
+
+class ExpiryIndex:
+    """
+    Deduplicated min-heap of (deadline_ms, key).
+
+    `deadlines` maps every key with a TTL to its current deadline and
+    is the source of truth: a heap entry whose deadline doesn't match
+    it anymore (TTL refreshed, persisted or key deleted) is stale and
+    skipped when popped. Refreshing a TTL to the same deadline pushes
+    nothing, and the heap is rebuilt from `deadlines` when the stale
+    entries outnumber the live ones, checked on every add, discard and
+    expire cycle, so it stays O(keys with a TTL) after a mass DEL too.
+
+    Attributes:
+        deadlines: key -> expiry timestamp in ms
+        heap: (deadline_ms, key) entries, possibly stale
+    """
+
+    SAMPLE_SIZE = 20        # TTL keys looked at per cycle for the stale estimate
+    CHECK_EVERY = 16        # keys expired between two clock reads
+    MIN_COMPACT = 1024      # don't rebuild small heaps
+
+
+    def __init__(self):
+        self.deadlines: dict[str, int] = {}
+        self.heap: list[tuple[int, str]] = []
+
+        # stats, exposed by INFO
+        self.expired_keys = 0
+        self.expired_stale_perc = 0.0
+        self.time_cap_reached_count = 0
+        self.cycle_cpu_ms = 0.0
+        self.compactions = 0
+
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+
+    def add(self, key: str, deadline_ms: int) -> None:
+        """set or refresh the deadline of a key"""
+
+        if self.deadlines.get(key) == deadline_ms:
+            return
+
+        self.deadlines[key] = deadline_ms
+        heapq.heappush(self.heap, (deadline_ms, key))
+        self._check_stale()
+
+
+    def discard(self, key: str) -> None:
+        """the key was deleted or lost its TTL: its heap entry becomes stale"""
+
+        if self.deadlines.pop(key, None) is not None:
+            self._check_stale()
+
+
+    def _check_stale(self) -> None:
+        # at most half of a big heap is stale: amortized O(1) per add/discard
+        if len(self.heap) > self.MIN_COMPACT and len(self.heap) > 2 * len(self.deadlines):
+            self.compact()
+
+
+    def clear(self) -> None:
+        self.deadlines.clear()
+        self.heap.clear()
+
+
+    def compact(self) -> None:
+        """drop the stale entries: O(n) heapify of the live deadlines"""
+
+        self.heap = [(deadline, key) for key, deadline in self.deadlines.items()]
+        heapq.heapify(self.heap)
+        self.compactions += 1
+
+
+    def peek(self) -> Optional[tuple[int, str]]:
+        """(deadline, key) of the key expiring first, None if no key has a TTL"""
+
+        heap = self.heap
+        while heap:
+            deadline, key = heap[0]
+            if self.deadlines.get(key) == deadline:
+                return deadline, key
+            heapq.heappop(heap)
+        return None
+
+
+    def next_deadline(self) -> Optional[int]:
+        """earliest live deadline, None if no key has a TTL"""
+
+        first = self.peek()
+        return first[0] if first is not None else None
+
+
+    def random_keys(self, count: int) -> list[str]:
+        """
+        up to count random keys with a TTL, at least one if there is one
+
+        A big heap is at least half live (see _check_stale), so a few
+        draws are enough; a small one may be mostly stale and is
+        sampled through deadlines instead.
+        """
+
+        deadlines = self.deadlines
+        if not deadlines:
+            return []
+
+        heap = self.heap
+        if len(heap) <= self.MIN_COMPACT:
+            return random.sample(list(deadlines), min(count, len(deadlines)))
+
+        keys = []
+        for _ in range(count * 4):
+            deadline, key = heap[random.randrange(len(heap))]
+            if deadlines.get(key) == deadline:
+                keys.append(key)
+                if len(keys) == count:
+                    break
+        if not keys:
+            # unlucky draws: an eviction must not fail while volatile keys exist
+            keys.append(next(iter(deadlines)))
+        return keys
+
+
+    # =============== active expire cycle =============== #
+
+
+    def active_expire_cycle(self, data: dict, budget_ms: float = 25.0,
+                            removed: Optional[Callable] = None) -> int:
+        """
+        delete the expired keys, for at most budget_ms of CPU
+
+        Keys are popped in deadline order, so the cycle stops at the
+        first live one. When there are more expired keys than the
+        budget allows, the rest waits for the next cycle (counted in
+        time_cap_reached_count) and a random sample of the TTL keys
+        estimates how many of them are expired but still resident.
+
+        args:
+            data: the keyspace, key -> value
+            budget_ms: CPU time the cycle can take
+            removed: called with (key, value) before a key is deleted
+
+        return:
+            int: number of keys deleted
+        """
+
+        started = time.perf_counter()
+        stop_at = started + budget_ms / 1000
+        now_ms = time.time() * 1000
+
+        heap = self.heap
+        deadlines = self.deadlines
+        deleted = 0
+        checked = 0
+
+        while heap:
+            deadline, key = heap[0]
+            if deadline > now_ms:
+                break
+
+            heapq.heappop(heap)
+            if deadlines.get(key) == deadline:
+                del deadlines[key]
+                val = data.get(key)
+                # the key could have been replaced without going through discard()
+                if val is not None and val.ttl_ms == deadline:
+                    if removed is not None:
+                        removed(key, val)
+                    del data[key]
+                    deleted += 1
+
+            checked += 1
+            if checked % self.CHECK_EVERY == 0 and time.perf_counter() > stop_at:
+                self.time_cap_reached_count += 1
+                break
+
+        self.expired_keys += deleted
+        self._check_stale()
+        self._sample(now_ms)
+        self.cycle_cpu_ms += (time.perf_counter() - started) * 1000
+        return deleted
+
+
+    def _sample(self, now_ms: float) -> None:
+        """
+        Redis-style estimate of the expired-but-resident keys:
+        random TTL keys, moving average of the expired fraction
+        """
+
+        heap = self.heap
+        if not heap:
+            self.expired_stale_perc *= 0.95
+            return
+
+        sampled = 0
+        expired = 0
+        for _ in range(self.SAMPLE_SIZE):
+            deadline, key = heap[random.randrange(len(heap))]
+            if self.deadlines.get(key) != deadline:
+                continue
+            sampled += 1
+            if deadline <= now_ms:
+                expired += 1
+
+        current = expired / sampled if sampled else 0.0
+        self.expired_stale_perc = self.expired_stale_perc * 0.95 + current * 0.05
+
+
+    def info(self) -> dict:
+        """expiry fields for INFO"""
+
+        return {
+            "expired_keys": self.expired_keys,
+            "expired_stale_perc": f"{self.expired_stale_perc * 100:.2f}",
+            "expired_time_cap_reached_count": self.time_cap_reached_count,
+            "expire_cycle_cpu_milliseconds": int(self.cycle_cpu_ms),
+            "expires": len(self.deadlines),
+            "expiry_heap_entries": len(self.heap),
+            "expiry_heap_compactions": self.compactions,
+        }
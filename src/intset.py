@@ -0,0 +1,118 @@
+"""
+IntSet: compact encoding of the sets made of integers
+"""
+
+import random
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional
+
+
+# set-max-intset-entries of redis.conf
+MAX_INTSET_ENTRIES = 512
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def as_int(member: str) -> Optional[int]:
+    """
+    the integer of a member that can live in an intset, None otherwise
+
+    Only the canonical form counts ("12", "-7", not "012", "+1"
+    or " 1"), so the member reads back as the same string.
+    """
+
+    if not member or len(member) > 20:
+        return None
+    try:
+        number = int(member)
+    except ValueError:
+        return None
+    if str(number) != member or not _INT64_MIN <= number <= _INT64_MAX:
+        return None
+    return number
+
+
+class IntSet:
+    """
+    A set of 64-bit integers as a sorted array('q'), like the Redis
+    intset: 8 bytes per member against about 100 for a str in a
+    Python set, binary search for membership, O(n) memmove for
+    inserts (cheap up to MAX_INTSET_ENTRIES).
+
+    Members go in and out as strings, the same as the hashtable
+    encoding (a Python set of str), so the two can be used alike.
+    """
+
+    __slots__ = ("ints",)
+
+    def __init__(self, ints: Optional[array] = None):
+        self.ints = ints if ints is not None else array("q")
+
+
+    @classmethod
+    def from_members(cls, members: Iterable[str]) -> Optional["IntSet"]:
+        """IntSet of the members, None if one isn't an integer or they are too many"""
+
+        numbers = set()
+        for member in members:
+            number = as_int(member)
+            if number is None:
+                return None
+            numbers.add(number)
+            if len(numbers) > MAX_INTSET_ENTRIES:
+                return None
+        return cls(array("q", sorted(numbers)))
+
+
+    def __len__(self) -> int:
+        return len(self.ints)
+
+
+    def __iter__(self) -> Iterator[str]:
+        return map(str, self.ints)
+
+
+    def __contains__(self, member: str) -> bool:
+        number = as_int(member)
+        if number is None:
+            return False
+        ints = self.ints
+        i = bisect_left(ints, number)
+        return i < len(ints) and ints[i] == number
+
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + self.ints.__sizeof__()
+
+
+    def add(self, number: int) -> bool:
+        """True if added, False if already there"""
+
+        ints = self.ints
+        i = bisect_left(ints, number)
+        if i < len(ints) and ints[i] == number:
+            return False
+        ints.insert(i, number)
+        return True
+
+
+    def discard(self, member: str) -> bool:
+        """True if removed"""
+
+        number = as_int(member)
+        if number is None:
+            return False
+        ints = self.ints
+        i = bisect_left(ints, number)
+        if i < len(ints) and ints[i] == number:
+            del ints[i]
+            return True
+        return False
+
+
+    def random_members(self, count: int) -> list[str]:
+        """count distinct random members (count <= len)"""
+
+        return [str(n) for n in random.sample(self.ints, count)]
@@ -1,13 +1,113 @@
-
-
 import sys
 import os
+import argparse
 
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from photondb import PhotonDB
 from server import PhotonDBServer
+from async_server import AsyncPhotonDBServer
+from sharding import run_sharded
+from eviction import POLICIES, parse_memory
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PhotonDB server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument(
+        "--server",
+        choices=["asyncio", "select"],
+        default="asyncio",
+        help="network core: asyncio event loop (default) or the legacy select loop",
+    )
+    parser.add_argument(
+        "--appendonly",
+        choices=["yes", "no"],
+        default="no",
+        help="log every write to data/appendonly.aof and replay it on startup",
+    )
+    parser.add_argument("--appendfsync", choices=["always", "everysec", "no"], default="everysec")
+    parser.add_argument(
+        "--lazy-load",
+        choices=["yes", "no"],
+        default="yes",
+        help="serve while the snapshot loads in background (keys are decoded on first access)",
+    )
+    parser.add_argument(
+        "--maxmemory",
+        type=parse_memory,
+        default=0,
+        help="memory limit of the dataset, e.g. 100mb, 2gb (0 = no limit; per shard in sharded mode)",
+    )
+    parser.add_argument("--maxmemory-policy", choices=POLICIES, default="noeviction")
+    parser.add_argument("--maxmemory-samples", type=int, default=5, help="keys sampled per eviction")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="sharded mode: number of worker processes (0 = one per CPU core)",
+    )
+    parser.add_argument(
+        "--slowlog-log-slower-than",
+        type=int,
+        default=10000,
+        help="SLOWLOG threshold in microseconds (0 = every command, negative = off)",
+    )
+    parser.add_argument("--slowlog-max-len", type=int, default=128, help="entries kept by SLOWLOG")
+    parser.add_argument("--routers", type=int, default=1, help="sharded mode: front processes sharing the port")
+    parser.add_argument("--shard-base-port", type=int, default=7000, help="sharded mode: port of shard 0")
+    parser.add_argument(
+        "--replicaof",
+        nargs=2,
+        metavar=("HOST", "PORT"),
+        default=None,
+        help="start as a read-only replica of HOST PORT (asyncio server only)",
+    )
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    server = PhotonDBServer()
+    args = parse_args()
+
+    db_options = {
+        "appendonly": args.appendonly == "yes",
+        "appendfsync": args.appendfsync,
+        "lazy_load": args.lazy_load == "yes",
+        "maxmemory": args.maxmemory,
+        "maxmemory_policy": args.maxmemory_policy,
+        "maxmemory_samples": args.maxmemory_samples,
+    }
+    slowlog_options = {
+        "log_slower_than": args.slowlog_log_slower_than,
+        "max_len": args.slowlog_max_len,
+    }
+
+    replicaof = None
+    if args.replicaof is not None:
+        if args.shards is not None or args.server == "select":
+            sys.exit("--replicaof needs the asyncio server, without --shards")
+        replicaof = (args.replicaof[0], int(args.replicaof[1]))
+
+    if args.shards is not None:
+        run_sharded(
+            host=args.host,
+            port=args.port,
+            shards=args.shards,
+            routers=args.routers,
+            shard_base_port=args.shard_base_port,
+            db_options=db_options,
+            slowlog_options=slowlog_options,
+        )
+        sys.exit(0)
+
+    db = PhotonDB(**db_options)
+
+    if args.server == "select":
+        server = PhotonDBServer(host=args.host, port=args.port, db=db)
+    else:
+        server = AsyncPhotonDBServer(host=args.host, port=args.port, db=db, replicaof=replicaof)
+    server.command_executor.slowlog.configure(**slowlog_options)
+
     server.start()
@@ -0,0 +1,231 @@
+"""
+Transactions: MULTI/EXEC/DISCARD queueing per connection,
+WATCH with version counters for optimistic check-and-set
+"""
+
+from typing import Optional
+
+from parser import SimpleString
+
+
+# handled by the connection, not queued
+MULTI_COMMANDS = {"MULTI", "EXEC", "DISCARD", "WATCH", "UNWATCH"}
+
+
+class WatchTable:
+    """
+    Version counters of the watched keys.
+
+    Only keys watched by some connection have a counter: the
+    executor bumps it after every write command touching the key,
+    so nothing is paid per key (or per write) when nobody watches.
+    Deletions that don't go through a command (expiry, eviction,
+    background load) are caught by comparing the value object.
+
+    Attributes:
+        versions: key -> [version, number of watching connections]
+    """
+
+    def __init__(self):
+        self.versions: dict[str, list[int]] = {}
+        self._clock = 0
+
+
+    def watch(self, key: str) -> int:
+        entry = self.versions.get(key)
+        if entry is None:
+            entry = self.versions[key] = [self._clock, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+    def unwatch(self, key: str) -> None:
+        entry = self.versions.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self.versions[key]
+
+
+    def version(self, key: str) -> Optional[int]:
+        entry = self.versions.get(key)
+        return entry[0] if entry is not None else None
+
+
+    def touch(self, keys: list[str]) -> None:
+        """keys written by a command"""
+
+        versions = self.versions
+        for key in keys:
+            entry = versions.get(key)
+            if entry is not None:
+                self._clock += 1
+                entry[0] = self._clock
+
+
+    def touch_all(self) -> None:
+        """FLUSHDB: every watched key changed"""
+
+        for entry in self.versions.values():
+            self._clock += 1
+            entry[0] = self._clock
+
+
+class Transaction:
+    """
+    MULTI/WATCH state of one connection.
+
+    Queued commands are checked (name and arity) when queued, like
+    Redis does: an error there makes EXEC fail with EXECABORT.
+    EXEC runs the queue back to back through the executor, with no
+    other client in between, and replies with one array.
+
+    Attributes:
+        queue: commands queued since MULTI, None outside MULTI
+        failed: a queued command was rejected
+        watched: key -> (version, value object) at WATCH time
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.queue: Optional[list[list[str]]] = None
+        self.failed = False
+        self.watched: dict[str, tuple] = {}
+
+
+    @property
+    def active(self) -> bool:
+        return self.queue is not None
+
+
+    def handle(self, name: str, cmd: list[str]):
+        """a command received while in MULTI, or one of MULTI_COMMANDS"""
+
+        if name == "MULTI":
+            if self.queue is not None:
+                raise ValueError("MULTI calls can not be nested")
+            self.queue = []
+            self.failed = False
+            return SimpleString("OK")
+
+        if name == "EXEC":
+            if self.queue is None:
+                raise ValueError("EXEC without MULTI")
+            return self.exec()
+
+        if name == "DISCARD":
+            if self.queue is None:
+                raise ValueError("DISCARD without MULTI")
+            self.reset()
+            return SimpleString("OK")
+
+        if name == "WATCH":
+            if self.queue is not None:
+                raise ValueError("WATCH inside MULTI is not allowed")
+            if len(cmd) < 2:
+                raise ValueError("wrong number of arguments for 'watch' command")
+            for key in cmd[1:]:
+                self.watch(key)
+            return SimpleString("OK")
+
+        if name == "UNWATCH":
+            self.unwatch()
+            return SimpleString("OK")
+
+        return self.enqueue(cmd)
+
+
+    def enqueue(self, cmd: list[str]):
+        from commands import lookup_command     # commands imports this module
+
+        spec = lookup_command(cmd[0])
+        if spec is None:
+            self.failed = True
+            raise ValueError(f"unknown command '{cmd[0]}'")
+        if not spec.check_arity(len(cmd)):
+            self.failed = True
+            raise ValueError(f"wrong number of arguments for '{cmd[0].lower()}' command")
+
+        self.queue.append(cmd)
+        return SimpleString("QUEUED")
+
+
+    def exec(self):
+        """run the queue; None if a watched key changed"""
+
+        from commands import lookup_command
+
+        queue = self.queue
+        failed = self.failed
+        dirty = self.is_dirty()
+        self.reset()
+
+        if failed:
+            raise ValueError("EXECABORT Transaction discarded because of previous errors.")
+        if dirty:
+            return None
+
+        executor = self.executor
+        logged = executor.logging and any(lookup_command(cmd[0]).write for cmd in queue)
+
+        # the writes are logged as a unit: a replay drops an EXEC-less tail
+        if logged:
+            executor.log(["MULTI"])
+
+        results = []
+        for cmd in queue:
+            try:
+                results.append(executor.execute(cmd))
+            except Exception as e:
+                # like Redis: the other commands still run
+                results.append(e)
+
+        if logged:
+            executor.log(["EXEC"])
+
+        return results
+
+
+    # =============== WATCH =============== #
+
+
+    def watch(self, key: str) -> None:
+        if key in self.watched:
+            return
+        version = self.executor.watches.watch(key)
+        self.watched[key] = (version, self._current(key))
+
+
+    def unwatch(self) -> None:
+        watches = self.executor.watches
+        for key in self.watched:
+            watches.unwatch(key)
+        self.watched.clear()
+
+
+    def is_dirty(self) -> bool:
+        """a watched key was written, deleted, replaced or has expired since WATCH"""
+
+        watches = self.executor.watches
+        for key, (version, val) in self.watched.items():
+            if watches.version(key) != version or self._current(key) is not val:
+                return True
+        return False
+
+
+    def _current(self, key: str):
+        """the value object of key, None if missing or expired"""
+
+        val = self.executor.db.data.get(key)
+        if val is not None and val.is_expired():
+            return None
+        return val
+
+
+    def reset(self) -> None:
+        """end of the transaction: EXEC, DISCARD or disconnection"""
+
+        self.queue = None
+        self.failed = False
+        self.unwatch()
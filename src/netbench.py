@@ -0,0 +1,427 @@
+"""
+Network benchmark for PhotonDB, in the style of redis-benchmark.
+
+benchmark.py times the executor in-process; this one goes through
+the whole path a real client sees: sockets, event loop, parser,
+executor, encoder. It starts its own server (main.py in a temporary
+directory, so no snapshot is touched) unless --no-server is given.
+
+    python src/netbench.py                                  # SET, GET, INCR, LPUSH, LPOP, ...
+    python src/netbench.py -t set,get -c 100 -P 16 -n 1000000
+    python src/netbench.py --mix get:90,set:10 -r 100000 -d 256
+    python src/netbench.py --server-args "--server select" --json select.json
+    python src/netbench.py --no-server --port 6379 -t get
+
+The load comes from --procs worker processes (a Python client is
+about as slow as a Python server: one process alone would measure
+itself). Each one runs its share of the -c clients on an asyncio
+loop, every client with its own connection, sending pipelines of
+-P commands and waiting for their replies. The latency is measured
+per round trip: a whole pipeline, from its write to its last reply.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from typing import Optional
+
+from client import AsyncLink, PhotonClient
+from parser import RespEncoder, ReplyError
+
+
+# command templates: r is a random integer of the keyspace
+TESTS = {
+    "ping": lambda r, value: ["PING"],
+    "set": lambda r, value: ["SET", f"key:{r:012d}", value],
+    "get": lambda r, value: ["GET", f"key:{r:012d}"],
+    "incr": lambda r, value: ["INCR", f"counter:{r:012d}"],
+    "lpush": lambda r, value: ["LPUSH", "mylist", value],
+    "rpush": lambda r, value: ["RPUSH", "mylist", value],
+    "lpop": lambda r, value: ["LPOP", "mylist"],
+    "rpop": lambda r, value: ["RPOP", "mylist"],
+    "lrange": lambda r, value: ["LRANGE", "mylist", "0", "99"],
+    "sadd": lambda r, value: ["SADD", "myset", f"element:{r:012d}"],
+    "hset": lambda r, value: ["HSET", "myhash", f"element:{r:012d}", value],
+    "hget": lambda r, value: ["HGET", "myhash", f"element:{r:012d}"],
+    "zadd": lambda r, value: ["ZADD", "myzset", str(r), f"element:{r:012d}"],
+    "mset": lambda r, value: ["MSET", *(arg for i in range(10) for arg in (f"key:{(r + i):012d}", value))],
+    "mget": lambda r, value: ["MGET", *(f"key:{(r + i):012d}" for i in range(10))],
+}
+
+DEFAULT_TESTS = "ping,set,get,incr,lpush,rpush,lpop,rpop,sadd,hset,zadd,lrange,mset"
+
+# tests reading what others write: the keyspace is filled before them
+READ_TESTS = {"get", "mget", "hget", "lrange"}
+
+# upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = [0.001 * 2 ** i for i in range(31)]
+
+
+def parse_mix(spec: str) -> list[tuple[str, float]]:
+    """ "get:90,set:10" -> [("get", 90.0), ("set", 10.0)]; weights default to 1"""
+
+    mix = []
+    for part in spec.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        name, _, weight = part.partition(":")
+        if name not in TESTS:
+            raise ValueError(f"unknown test '{name}' (available: {', '.join(TESTS)})")
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f"invalid weight '{weight}' for '{name}'")
+        if weight <= 0:
+            raise ValueError(f"invalid weight '{weight}' for '{name}'")
+        mix.append((name, weight))
+    if not mix:
+        raise ValueError("empty command mix")
+    return mix
+
+
+# =============== load generator =============== #
+
+
+async def _run_clients(host, port, clients, requests, pipeline, mix, keyspace, value, seed, barrier):
+    """clients connections of one worker, sending requests commands in total"""
+
+    loop = asyncio.get_running_loop()
+    links = [(await loop.create_connection(AsyncLink, host, port))[1] for _ in range(clients)]
+
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    templates = [TESTS[name] for name in names]
+    rng = random.Random(seed)
+    encode = RespEncoder.encode_command
+    perf_counter = time.perf_counter
+
+    samples = array("d")
+    errors = 0
+    budget = requests
+
+    async def client(link):
+        nonlocal budget, errors
+        while budget > 0:
+            count = min(pipeline, budget)
+            budget -= count
+            if len(templates) == 1:
+                chosen = templates * count
+            else:
+                chosen = rng.choices(templates, weights, k=count)
+            data = b"".join([encode(template(rng.randrange(keyspace), value)) for template in chosen])
+
+            start = perf_counter()
+            replies = await link.request(data, count)
+            samples.append(perf_counter() - start)
+
+            for reply in replies:
+                if isinstance(reply, ReplyError):
+                    errors += 1
+
+    # all the workers start together, once connected
+    await loop.run_in_executor(None, barrier.wait)
+    start = time.monotonic()
+    await asyncio.gather(*(client(link) for link in links))
+    end = time.monotonic()
+
+    for link in links:
+        link.close()
+    return start, end, samples, errors
+
+
+def _worker(args: tuple, barrier, results) -> None:
+    try:
+        results.put(asyncio.run(_run_clients(*args, barrier)))
+    except BaseException as e:
+        barrier.abort()
+        results.put(e)
+
+
+def run_test(opts, mix: list[tuple[str, float]]) -> dict:
+    """one workload across the worker processes, merged"""
+
+    procs = max(1, min(opts.procs, opts.clients))
+    value = "x" * opts.datasize
+
+    barrier = multiprocessing.Barrier(procs)
+    results = multiprocessing.Queue()
+    workers = []
+    for i in range(procs):
+        # the clients and the requests are split evenly
+        clients = opts.clients // procs + (1 if i < opts.clients % procs else 0)
+        requests = opts.requests // procs + (1 if i < opts.requests % procs else 0)
+        args = (opts.host, opts.port, clients, requests, opts.pipeline, mix, opts.keyspace, value, opts.seed + i)
+        worker = multiprocessing.Process(target=_worker, args=(args, barrier, results), daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    parts = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    for part in parts:
+        if isinstance(part, BaseException):
+            raise part
+
+    start = min(part[0] for part in parts)
+    end = max(part[1] for part in parts)
+    samples = array("d")
+    for part in parts:
+        samples.extend(part[2])
+    errors = sum(part[3] for part in parts)
+
+    return summarize(opts.requests, end - start, samples, errors)
+
+
+def summarize(requests: int, seconds: float, samples: array, errors: int) -> dict:
+    """throughput, percentiles and histogram of the round trip latencies (seconds)"""
+
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def percentile(p: float) -> float:
+        if not n:
+            return 0.0
+        return ordered[min(n - 1, int(p / 100 * n))] * 1000
+
+    histogram = []
+    i = 0
+    for bound in BUCKETS_MS:
+        start = i
+        while i < n and ordered[i] * 1000 <= bound:
+            i += 1
+        if i > start or histogram:
+            histogram.append([bound, i - start])
+        if i == n:
+            break
+
+    return {
+        "requests": requests,
+        "seconds": round(seconds, 4),
+        "ops_per_sec": round(requests / seconds, 1) if seconds > 0 else 0.0,
+        "errors": errors,
+        "latency_ms": {
+            "avg": round(sum(ordered) / n * 1000, 4) if n else 0.0,
+            "p50": round(percentile(50), 4),
+            "p99": round(percentile(99), 4),
+            "p99.9": round(percentile(99.9), 4),
+            "max": round(ordered[-1] * 1000, 4) if n else 0.0,
+        },
+        "histogram_ms": histogram,     # [upper bound, round trips], log2 buckets
+    }
+
+
+def prefill(opts) -> None:
+    """the keys the read tests look for, written with pipelined MSET/HSET"""
+
+    db = PhotonClient(opts.host, opts.port, max_connections=1)
+    value = "x" * opts.datasize
+    batch = 1000
+
+    for first in range(0, opts.keyspace, batch):
+        pipe = db.pipeline()
+        last = min(first + batch, opts.keyspace)
+        pairs = {f"key:{r:012d}": value for r in range(first, last + 9)}
+        pipe.mset(pairs)
+        for r in range(first, last):
+            pipe.hset("myhash", f"element:{r:012d}", value)
+        pipe.execute()
+
+    pipe = db.pipeline()
+    pipe.rpush("mylist", *([value] * 100))
+    pipe.execute()
+    db.close()
+
+
+# =============== local server =============== #
+
+
+class LocalServer:
+    """main.py in a throwaway directory, on a free port"""
+
+    def __init__(self, host: str, port: int, extra_args: list[str]):
+        self.host = host
+        self.port = port
+        self.extra_args = extra_args
+        self.tmp = tempfile.TemporaryDirectory(prefix="photondb-bench-")
+        self.log_path = os.path.join(self.tmp.name, "server.log")
+        self.proc: Optional[subprocess.Popen] = None
+
+
+    def start(self, wait: float = 30.0) -> None:
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        cmd = [sys.executable, main, "--host", self.host, "--port", str(self.port), *self.extra_args]
+        self.log = open(self.log_path, "w")
+        self.proc = subprocess.Popen(cmd, cwd=self.tmp.name, stdout=self.log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                with socket.create_connection((self.host, self.port), timeout=1) as sock:
+                    sock.sendall(b"*1\r\n$4\r\nPING\r\n")
+                    if sock.recv(64).startswith(b"+PONG"):
+                        return
+            except OSError:
+                pass
+            time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError(f"the server did not start, see {self.log_path}")
+
+
+    def stop(self) -> None:
+        # the data is thrown away: no need to wait for a final snapshot
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.log.close()
+
+
+    def cleanup(self) -> None:
+        self.tmp.cleanup()
+
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+# =============== report =============== #
+
+
+def print_result(name: str, result: dict, opts) -> None:
+    lat = result["latency_ms"]
+    print(f"====== {name.upper()} ======")
+    print(f"  {result['requests']:,} requests completed in {result['seconds']:.2f} seconds")
+    print(f"  {opts.clients} parallel clients, pipeline {opts.pipeline}, "
+          f"{opts.datasize} bytes payload, keyspace {opts.keyspace:,}")
+    if result["errors"]:
+        print(f"  {result['errors']:,} error replies")
+    print(f"  {result['ops_per_sec']:,.0f} requests per second")
+    print(f"  latency (msec): avg {lat['avg']:.3f}  p50 {lat['p50']:.3f}  p99 {lat['p99']:.3f}  "
+          f"p99.9 {lat['p99.9']:.3f}  max {lat['max']:.3f}")
+
+    total = sum(count for _, count in result["histogram_ms"])
+    seen = 0
+    for bound, count in result["histogram_ms"]:
+        seen += count
+        if count:
+            print(f"    <= {bound:9.3f} ms  {count / total * 100:6.2f}%  ({seen / total * 100:6.2f}% cumulative)")
+    print()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PhotonDB network benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="default: a free port, 6379 with --no-server")
+    parser.add_argument("--no-server", action="store_true", help="benchmark a running server instead of starting one")
+    parser.add_argument("--server-args", default="", help='options of the local server, e.g. "--server select"')
+    parser.add_argument("-c", "--clients", type=int, default=50, help="parallel connections")
+    parser.add_argument("-n", "--requests", type=int, default=100_000, help="commands per test")
+    parser.add_argument("-P", "--pipeline", type=int, default=1, help="commands per round trip")
+    parser.add_argument("-r", "--keyspace", type=int, default=10_000, help="random keys out of this many")
+    parser.add_argument("-d", "--datasize", type=int, default=3, help="value size in bytes")
+    parser.add_argument("-t", "--tests", default=None, help=f"comma separated tests (default: {DEFAULT_TESTS})")
+    parser.add_argument("--mix", default=None, help="one mixed workload with weights, e.g. get:90,set:10")
+    parser.add_argument("--procs", type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)),
+                        help="load generator processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, metavar="FILE", help='write the results as JSON ("-" = stdout)')
+
+    opts = parser.parse_args(argv)
+    for name in ("clients", "requests", "pipeline", "keyspace", "procs"):
+        if getattr(opts, name) < 1:
+            parser.error(f"--{name} must be positive")
+    if opts.datasize < 0:
+        parser.error("--datasize can't be negative")
+    return opts
+
+
+def main(argv=None) -> None:
+    opts = parse_args(argv)
+
+    try:
+        workloads = []
+        if opts.tests is not None or opts.mix is None:
+            for name, _ in parse_mix(opts.tests or DEFAULT_TESTS):
+                workloads.append((name, [(name, 1.0)]))
+        if opts.mix is not None:
+            workloads.append(("mix " + opts.mix, parse_mix(opts.mix)))
+    except ValueError as e:
+        sys.exit(f"netbench: {e}")
+
+    server = None
+    if opts.no_server:
+        opts.port = opts.port or 6379
+    else:
+        opts.port = opts.port or _free_port(opts.host)
+        server = LocalServer(opts.host, opts.port, opts.server_args.split())
+        server.start()
+
+    quiet = opts.json == "-"
+    results = {}
+    try:
+        if any(name in READ_TESTS for _, mix in workloads for name, _ in mix):
+            prefill(opts)
+
+        for label, mix in workloads:
+            results[label] = run_test(opts, mix)
+            if not quiet:
+                print_result(label, results[label], opts)
+    except OSError as e:
+        sys.exit(f"netbench: can't reach {opts.host}:{opts.port}: {e}")
+    finally:
+        if server is not None:
+            server.stop()
+            server.cleanup()
+
+    if opts.json is not None:
+        report = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "server": "external" if opts.no_server else (opts.server_args or "default"),
+                "clients": opts.clients,
+                "requests": opts.requests,
+                "pipeline": opts.pipeline,
+                "keyspace": opts.keyspace,
+                "datasize": opts.datasize,
+                "procs": opts.procs,
+            },
+            "results": results,
+        }
+        if quiet:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(opts.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {opts.json}")
+
+
+if __name__ == "__main__":
+    main()
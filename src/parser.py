@@ -1,7 +1,10 @@
 """
 ASCII command parser (telnet-friendly)
+and RESP2 wire protocol (redis-cli compatible)
 """
 
+from typing import Iterator, Optional
+
 
 class AsciiParser:
 
@@ -60,4 +63,419 @@ class Encoder:
             return '\n'.join(lines)
         
         else:
-            return str(result)
\ No newline at end of file
+            return str(result)
+
+
+# =============== RESP2 =============== #
+
+
+class ProtocolError(ValueError):
+    """malformed data on the wire: the connection can't be resynchronized"""
+
+
+class SimpleString(str):
+    """
+    A status reply ("OK", "PONG", ...).
+    RESP sends it as +OK instead of a bulk string,
+    telnet clients see a normal string.
+    """
+
+
+ERROR_CODES = {"ERR", "WRONGTYPE", "EXECABORT", "READONLY", "LOADING", "OOM", "NOSCRIPT", "BUSYKEY", "CROSSSLOT"}
+
+
+class RespParser:
+    """
+    Incremental request parser for a single connection.
+
+    Bytes are appended with feed() and complete commands are
+    taken out with get_command() (or by iterating the parser),
+    so a client can pipeline thousands of commands in one write
+    and a command split across many reads is parsed only once:
+    the arguments decoded so far, the count still missing and
+    the offset to resume from are kept between reads.
+
+    The protocol is detected on the first request:
+        "*"        → RESP2 multibulk ("*2\\r\\n$3\\r\\nGET\\r\\n$1\\r\\nk\\r\\n")
+        otherwise  → inline ASCII lines ("GET k\\n"), telnet style
+
+    Bulk strings are decoded as utf-8 with surrogateescape, so
+    any byte sequence survives the round trip through a str.
+    """
+
+    MAX_INLINE_SIZE = 64 * 1024
+    MAX_BULK_SIZE = 512 * 1024 * 1024
+    MAX_MULTIBULK_SIZE = 1024 * 1024
+    COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0
+        self.protocol: Optional[str] = None     # "resp" | "ascii"
+        self._need = 0                          # buffer size needed to complete the pending command
+        # a command partly received: self.pos stays on its first byte
+        # (pending() counts it as unparsed), parsing resumes at _cursor
+        self._cursor = 0
+        self._args: Optional[list[str]] = None  # multibulk arguments decoded so far
+        self._remaining = 0                     # multibulk arguments still missing
+
+
+    def feed(self, data: bytes) -> None:
+        """append raw bytes received from the socket"""
+
+        # drop what has already been parsed, without moving
+        # the buffer at every read
+        if self.pos:
+            if self.pos == len(self.buffer):
+                self.buffer.clear()
+                self._shift(self.pos)
+            elif self.pos > self.COMPACT_THRESHOLD:
+                del self.buffer[:self.pos]
+                self._shift(self.pos)
+
+        self.buffer += data
+
+
+    def _shift(self, removed: int) -> None:
+        """the first removed bytes of the buffer were dropped"""
+
+        self._need = max(0, self._need - removed)
+        self._cursor = max(0, self._cursor - removed)
+        self.pos = 0
+
+
+    def pending(self) -> int:
+        """number of bytes received but not parsed yet"""
+        return len(self.buffer) - self.pos
+
+
+    def get_command(self) -> Optional[list[str]]:
+        """
+        return the next complete command, or None if
+        more data is needed
+
+        raises:
+            ProtocolError: the stream is malformed
+        """
+
+        buf = self.buffer
+
+        while self.pos < len(buf):
+            if len(buf) < self._need:
+                return None
+
+            if self.protocol is None:
+                self.protocol = "resp" if buf[self.pos] == 0x2A else "ascii"
+
+            if buf[self.pos] == 0x2A:     # '*'
+                cmd = self._parse_multibulk()
+            else:
+                cmd = self._parse_inline()
+
+            if cmd is None:
+                return None
+            if cmd:
+                return cmd
+
+            # empty line or "*0": skip it
+
+        return None
+
+
+    def __iter__(self) -> Iterator[list[str]]:
+        while True:
+            cmd = self.get_command()
+            if cmd is None:
+                return
+            yield cmd
+
+
+    def _parse_inline(self) -> Optional[list[str]]:
+        buf = self.buffer
+        # the part of the line already received has no newline
+        nl = buf.find(b"\n", max(self.pos, self._cursor))
+
+        if nl == -1:
+            if len(buf) - self.pos > self.MAX_INLINE_SIZE:
+                raise ProtocolError("too big inline request")
+            self._need = len(buf) + 1
+            self._cursor = len(buf)
+            return None
+
+        line = buf[self.pos:nl].decode("utf-8", errors="ignore")
+        self.pos = self._cursor = nl + 1
+        self._need = 0
+
+        return AsciiParser.parse_ascii_command(line)
+
+
+    def _parse_multibulk(self) -> Optional[list[str]]:
+        buf = self.buffer
+        end = len(buf)
+
+        args = self._args
+        if args is None:
+            nl = buf.find(b"\r\n", self.pos)
+            if nl == -1:
+                if end - self.pos > self.MAX_INLINE_SIZE:
+                    raise ProtocolError("too big multibulk count")
+                self._need = end + 1
+                return None
+
+            try:
+                count = int(buf[self.pos + 1:nl])
+            except ValueError:
+                raise ProtocolError("invalid multibulk length")
+            if count > self.MAX_MULTIBULK_SIZE:
+                raise ProtocolError("invalid multibulk length")
+
+            p = nl + 2
+            args = []
+            remaining = count
+        else:
+            # resume the command left incomplete by the previous reads
+            p = self._cursor
+            remaining = self._remaining
+
+        while remaining > 0:
+            if p >= end:
+                return self._suspend(args, remaining, p, p + 1)
+
+            if buf[p] != 0x24:    # '$'
+                self._args = None
+                raise ProtocolError(f"expected '$', got '{chr(buf[p])}'")
+
+            nl = buf.find(b"\r\n", p)
+            if nl == -1:
+                return self._suspend(args, remaining, p, end + 1)
+
+            try:
+                size = int(buf[p + 1:nl])
+            except ValueError:
+                size = -1
+            if size < 0 or size > self.MAX_BULK_SIZE:
+                self._args = None
+                raise ProtocolError("invalid bulk length")
+
+            start = nl + 2
+            stop = start + size
+            if stop + 2 > end:
+                # wait for the whole bulk instead of re-scanning at every read
+                return self._suspend(args, remaining, p, stop + 2)
+
+            args.append(buf[start:stop].decode("utf-8", errors="surrogateescape"))
+            p = stop + 2
+            remaining -= 1
+
+        self._args = None
+        self.pos = self._cursor = p
+        self._need = 0
+        return args
+
+
+    def _suspend(self, args: list[str], remaining: int, cursor: int, need: int) -> None:
+        """keep a partly received multibulk: the next read goes on from cursor"""
+
+        self._args = args
+        self._remaining = remaining
+        self._cursor = cursor
+        self._need = need
+        return None
+
+
+class ReplyError(Exception):
+    """an error reply (-ERR ...) received from a server"""
+
+
+class RespReplyParser(RespParser):
+    """
+    Incremental parser for the replies sent by a server
+    (shard links, replication, client library).
+
+    Same buffer handling as RespParser; get_reply() returns
+    INCOMPLETE until a whole reply has been received, because
+    None is a valid reply (nil).
+
+    Arrays are decoded with an explicit stack of the arrays being
+    filled, kept between reads: a reply of a million elements
+    split across many reads is still parsed once.
+    """
+
+    INCOMPLETE = object()
+
+
+    def __init__(self):
+        super().__init__()
+        # [items, missing] of the arrays partly received, outermost first
+        self._stack: list[list] = []
+
+
+    def get_reply(self):
+        """
+        next decoded reply: str, SimpleString, int, None, list or ReplyError
+
+        raises:
+            ProtocolError: the stream is malformed
+        """
+
+        buf = self.buffer
+        end = len(buf)
+        if end < self._need:
+            return self.INCOMPLETE
+
+        stack = self._stack
+        pos = self._cursor if stack else self.pos
+
+        while True:
+            if pos >= end:
+                return self._wait(pos, pos + 1)
+
+            nl = buf.find(b"\r\n", pos)
+            if nl == -1:
+                return self._wait(pos, end + 1)
+
+            kind = buf[pos]
+            line = buf[pos + 1:nl]
+            after = nl + 2
+
+            if kind == 0x2B:      # '+'
+                item = SimpleString(line.decode("utf-8", errors="surrogateescape"))
+            elif kind == 0x2D:    # '-'
+                item = ReplyError(line.decode("utf-8", errors="surrogateescape"))
+            elif kind == 0x3A:    # ':'
+                item = self._integer(line, "integer")
+            elif kind == 0x24:    # '$'
+                size = self._integer(line, "bulk length")
+                if size < 0:
+                    item = None
+                else:
+                    stop = after + size
+                    if stop + 2 > end:
+                        # wait for the whole bulk instead of re-scanning at every read
+                        return self._wait(pos, stop + 2)
+                    item = buf[after:stop].decode("utf-8", errors="surrogateescape")
+                    after = stop + 2
+            elif kind == 0x2A:    # '*'
+                count = self._integer(line, "multibulk length")
+                if count > 0:
+                    stack.append([[], count])
+                    pos = after
+                    continue
+                item = None if count < 0 else []
+            else:
+                raise ProtocolError(f"unknown reply type '{chr(kind)}'")
+
+            pos = after
+
+            # put the item in the array being filled, closing the full ones
+            while stack:
+                top = stack[-1]
+                top[0].append(item)
+                top[1] -= 1
+                if top[1]:
+                    break
+                item = stack.pop()[0]
+            else:
+                self.pos = self._cursor = pos
+                self._need = 0
+                return item
+
+
+    @staticmethod
+    def _integer(line: bytes, what: str) -> int:
+        try:
+            return int(line)
+        except ValueError:
+            raise ProtocolError(f"invalid {what}")
+
+
+    def _wait(self, cursor: int, need: int):
+        self._cursor = cursor
+        self._need = need
+        return self.INCOMPLETE
+
+
+    def replies(self) -> Iterator:
+        while True:
+            reply = self.get_reply()
+            if reply is self.INCOMPLETE:
+                return
+            yield reply
+
+
+class RespEncoder:
+    """converts command results to RESP2 replies"""
+
+    @staticmethod
+    def encode(result) -> bytes:
+        """Format the result as a RESP2 reply"""
+
+        out: list[bytes] = []
+        RespEncoder._encode_into(result, out)
+        return b"".join(out)
+
+
+    @staticmethod
+    def encode_error(message: str) -> bytes:
+        """-ERR message, keeping the code if the message already has one (WRONGTYPE ...)"""
+
+        message = " ".join(str(message).split())
+        code = message.split(" ", 1)[0]
+        if code not in ERROR_CODES:
+            message = "ERR " + message
+        return b"-" + message.encode("utf-8", errors="surrogateescape") + b"\r\n"
+
+
+    @staticmethod
+    def encode_command(args) -> bytes:
+        """encode a command as a multibulk request (used to forward/log commands)"""
+
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = str(arg).encode("utf-8", errors="surrogateescape")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+
+    @staticmethod
+    def _encode_into(result, out: list) -> None:
+        t = type(result)
+
+        if t is str:
+            data = result.encode("utf-8", errors="surrogateescape")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+
+        elif result is None:
+            out.append(b"$-1\r\n")
+
+        elif t is SimpleString:
+            out.append(b"+" + result.encode("utf-8", errors="surrogateescape") + b"\r\n")
+
+        elif t is bool:
+            out.append(b"+OK\r\n" if result else b"$-1\r\n")
+
+        elif t is int:
+            out.append(b":%d\r\n" % result)
+
+        elif isinstance(result, dict):
+            out.append(b"*%d\r\n" % (len(result) * 2))
+            for k, v in result.items():
+                RespEncoder._encode_into(k, out)
+                RespEncoder._encode_into(v, out)
+
+        elif isinstance(result, (list, tuple, set, frozenset)):
+            out.append(b"*%d\r\n" % len(result))
+            for item in result:
+                RespEncoder._encode_into(item, out)
+
+        elif isinstance(result, Exception):
+            out.append(RespEncoder.encode_error(str(result)))
+
+        elif isinstance(result, str):
+            RespEncoder._encode_into(str(result), out)
+
+        elif isinstance(result, int):
+            out.append(b":%d\r\n" % result)
+
+        else:
+            RespEncoder._encode_into(str(result), out)
@@ -3,9 +3,711 @@ Persistence Layer: save and load the dump from disk
 """
 
 import json
+import mmap
 import os
+import signal
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
+
+from parser import RespEncoder, RespParser, ProtocolError
+from intset import IntSet
+from zset import ZSet, format_score
+
+
+# =============== binary snapshot format =============== #
+#
+#   "PHOTONDB" + version (1 byte)
+#   record*:
+#       opcode (1 byte): type tag, | 0x80 if a TTL follows
+#       [ttl: int64 little endian, unix ms]
+#       key: varint length + utf-8 bytes
+#       value:
+#           string → varint length + bytes
+#           list   → varint count + count * (varint length + bytes)
+#           hash   → varint count + count * (field, value)
+#           zset   → varint count + count * (member, score: float64 le),
+#                    in score order (loaded without sorting)
+#           set    → varint count + count * (varint length + bytes)
+#           intset → varint count + count * int64 le, sorted (a set
+#                    of integers, loaded as one array)
+#   0xFF (end of records)
+#   index (version 2):
+#       bucket count (uint64, power of 2)
+#       buckets: uint64 record offset, 0 = empty
+#       (open addressing on crc32(key), linear probing)
+#   trailer (version 2): index offset (uint64) + record count (uint64)
+#   crc32 of everything above (uint32 little endian)
+#
+# The index lets a server mmap the file and serve any key before
+# the whole snapshot is decoded (lazy loading).
+
+SNAPSHOT_MAGIC = b"PHOTONDB"
+SNAPSHOT_VERSION = 2
+
+TYPE_TAGS = {"string": 0, "list": 1, "hash": 2, "zset": 3, "set": 4}
+TAG_TYPES = {tag: type_ for type_, tag in TYPE_TAGS.items()}
+TAG_INTSET = 5
+TAG_TYPES[TAG_INTSET] = "set"
+TTL_FLAG = 0x80
+OP_EOF = 0xFF
+
+_TTL = struct.Struct("<q")
+_SCORE = struct.Struct("<d")
+_CRC = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_TRAILER = struct.Struct("<QQ")
+
+
+def _varint(n: int) -> bytes:
+    if n < 0x80:
+        return bytes((n,))
+
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _blob(text: str) -> bytes:
+    data = text.encode("utf-8", errors="surrogateescape")
+    size = len(data)
+    return (bytes((size,)) if size < 0x80 else _varint(size)) + data
+
+
+def encode_record(key: str, val) -> bytes:
+    """a single key as a snapshot record"""
+
+    tag = TYPE_TAGS[val.type]
+    if isinstance(val.data, IntSet):
+        tag = TAG_INTSET
+    parts = []
+
+    if val.ttl_ms is not None:
+        parts.append(bytes((tag | TTL_FLAG,)))
+        parts.append(_TTL.pack(int(val.ttl_ms)))
+    else:
+        parts.append(bytes((tag,)))
+
+    parts.append(_blob(key))
+
+    data = val.data
+    if tag == 0:
+        parts.append(_blob(data))
+
+    elif tag == 1:
+        parts.append(_varint(len(data)))
+        parts.extend(map(_blob, data))
+
+    elif tag == 2:
+        parts.append(_varint(len(data)))
+        for field, field_value in data.items():
+            parts.append(_blob(field))
+            parts.append(_blob(field_value))
+
+    elif tag == 3:
+        parts.append(_varint(len(data)))
+        pack = _SCORE.pack
+        for member, score in data.pairs():
+            parts.append(_blob(member))
+            parts.append(pack(score))
+
+    elif tag == 4:
+        parts.append(_varint(len(data)))
+        parts.extend(map(_blob, data))
+
+    else:
+        ints = data.ints
+        if sys.byteorder != "little":
+            ints = array("q", ints)
+            ints.byteswap()
+        parts.append(_varint(len(ints)))
+        parts.append(ints.tobytes())
+
+    return b"".join(parts)
+
+
+def write_snapshot(f, data: dict, chunk_size: int = 1024 * 1024) -> int:
+    """
+    stream data into the binary file f, one record at a time;
+    besides the current chunk nothing grows with the dataset: the
+    offset and hash of every record go to a temp file, read back
+    to fill the index in place through an mmap of f (opened w+b)
+
+    return:
+        int: number of keys written
+    """
+
+    now_ms = time.time() * 1000
+    header = SNAPSHOT_MAGIC + bytes((SNAPSHOT_VERSION,))
+    crc = zlib.crc32(header)
+    f.write(header)
+
+    chunk = []
+    size = 0
+    keys = 0
+    offset = len(header)
+
+    with tempfile.TemporaryFile() as spill:
+        # (record offset, crc32 of the key) of the records of the chunk
+        pairs = array("Q")
+
+        for key, val in data.items():
+            ttl_ms = val.ttl_ms
+
+            if ttl_ms is None and val.type == "string":
+                # fast path, most of the keys: short string without TTL
+                k = key.encode("utf-8", errors="surrogateescape")
+                v = val.data.encode("utf-8", errors="surrogateescape")
+                if len(k) < 0x80 and len(v) < 0x80:
+                    record = b"\x00%c%s%c%s" % (len(k), k, len(v), v)
+                else:
+                    record = b"\x00" + _varint(len(k)) + k + _varint(len(v)) + v
+
+            elif ttl_ms is not None and ttl_ms <= now_ms:
+                continue
+
+            else:
+                k = key.encode("utf-8", errors="surrogateescape")
+                record = encode_record(key, val)
+
+            pairs.append(offset)
+            pairs.append(zlib.crc32(k))
+            offset += len(record)
+
+            chunk.append(record)
+            size += len(record)
+            keys += 1
+
+            if size >= chunk_size:
+                block = b"".join(chunk)
+                crc = zlib.crc32(block, crc)
+                f.write(block)
+                chunk.clear()
+                size = 0
+                pairs.tofile(spill)
+                del pairs[:]
+
+        chunk.append(bytes((OP_EOF,)))
+        block = b"".join(chunk)
+        crc = zlib.crc32(block, crc)
+        f.write(block)
+        pairs.tofile(spill)
+        index_offset = offset + 1
+
+        # hash index, at most half full
+        bucket_count = 1
+        while bucket_count < keys * 2:
+            bucket_count <<= 1
+        mask = bucket_count - 1
+
+        block = _U64.pack(bucket_count)
+        crc = zlib.crc32(block, crc)
+        f.write(block)
+        f.flush()
+
+        # the buckets are written in place: the file grows by a zeroed
+        # region, mapped from the page boundary before it
+        table_start = f.tell()
+        table_end = table_start + 8 * bucket_count
+        f.truncate(table_end)
+        base = table_start - table_start % mmap.ALLOCATIONGRANULARITY
+        swap = sys.byteorder != "little"
+
+        with mmap.mmap(f.fileno(), table_end - base, offset=base) as m:
+            table = memoryview(m)[table_start - base:]
+            buckets = table.cast("Q")
+
+            spill.seek(0)
+            eof = False
+            while not eof:
+                pairs = array("Q")
+                try:
+                    pairs.fromfile(spill, 2 * 65536)
+                except EOFError:
+                    eof = True
+
+                for i in range(0, len(pairs), 2):
+                    record_offset = pairs[i]
+                    if swap:
+                        record_offset = int.from_bytes(record_offset.to_bytes(8, "little"), "big")
+                    slot = pairs[i + 1] & mask
+                    while buckets[slot]:
+                        slot = (slot + 1) & mask
+                    buckets[slot] = record_offset
+
+            crc = zlib.crc32(table, crc)
+            buckets.release()
+            table.release()
+
+    f.seek(table_end)
+    block = _TRAILER.pack(index_offset, keys)
+    crc = zlib.crc32(block, crc)
+    f.write(block)
+
+    f.write(_CRC.pack(crc))
+
+    return keys
+
+
+class SnapshotReader:
+    """decodes the records of a binary snapshot from a buffer (mmap, bytes)"""
+
+    def __init__(self, buf, pos: int = 0):
+        self.buf = buf
+        self.pos = pos
+
+
+    def varint(self) -> int:
+        buf = self.buf
+        pos = self.pos
+        byte = buf[pos]
+        pos += 1
+        if byte < 0x80:
+            self.pos = pos
+            return byte
+
+        result = byte & 0x7F
+        shift = 7
+        while True:
+            byte = buf[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return result
+
+
+    def blob(self) -> str:
+        size = self.varint()
+        start = self.pos
+        self.pos = start + size
+        return self.buf[start:self.pos].decode("utf-8", errors="surrogateescape")
+
+
+    def key_at(self, offset: int) -> bytes:
+        """raw key of the record at offset (index lookups compare it before decoding)"""
+
+        self.pos = offset + (9 if self.buf[offset] & TTL_FLAG else 1)
+        size = self.varint()
+        return self.buf[self.pos:self.pos + size]
+
+
+    def record(self):
+        """
+        next (key, type, data, ttl_ms), or None at the end of the records
+        """
+
+        opcode = self.buf[self.pos]
+        self.pos += 1
+        if opcode == OP_EOF:
+            return None
+
+        ttl_ms = None
+        if opcode & TTL_FLAG:
+            ttl_ms = _TTL.unpack_from(self.buf, self.pos)[0]
+            self.pos += 8
+            opcode &= ~TTL_FLAG
+
+        key = self.blob()
+        blob = self.blob
+
+        if opcode == 0:
+            data = blob()
+        elif opcode == 1:
+            data = deque([blob() for _ in range(self.varint())])
+        elif opcode == 2:
+            count = self.varint()
+            data = {}
+            for _ in range(count):
+                field = blob()
+                data[field] = blob()
+        elif opcode == 3:
+            pairs = []
+            unpack = _SCORE.unpack_from
+            for _ in range(self.varint()):
+                member = blob()
+                pairs.append((member, unpack(self.buf, self.pos)[0]))
+                self.pos += 8
+            data = ZSet.from_sorted(pairs)
+        elif opcode == 4:
+            data = {blob() for _ in range(self.varint())}
+        elif opcode == TAG_INTSET:
+            count = self.varint()
+            ints = array("q")
+            ints.frombytes(self.buf[self.pos:self.pos + 8 * count])
+            if sys.byteorder != "little":
+                ints.byteswap()
+            self.pos += 8 * count
+            data = IntSet(ints)
+        else:
+            raise ValueError(f"unknown record type {opcode} at offset {self.pos}")
+
+        return key, TAG_TYPES[opcode], data, ttl_ms
+
+
+def read_snapshot(path: str, photon_db) -> int:
+    """
+    load a binary snapshot into photon_db (mmap: the file
+    is paged in by the OS, never copied as a whole)
+
+    return:
+        int: number of keys loaded
+    """
+
+    from value import value
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if len(mm) < len(SNAPSHOT_MAGIC) + 1 + 1 + _CRC.size:
+            raise ValueError("snapshot is truncated")
+
+        version = mm[len(SNAPSHOT_MAGIC)]
+        if version not in (1, 2):
+            raise ValueError(f"unsupported snapshot version {version}")
+
+        end = len(mm) - _CRC.size
+        expected = _CRC.unpack_from(mm, end)[0]
+        actual = 0
+        for offset in range(0, end, 1024 * 1024):
+            actual = zlib.crc32(mm[offset:min(offset + 1024 * 1024, end)], actual)
+        if actual != expected:
+            raise ValueError("snapshot checksum mismatch (corrupted file)")
+
+        reader = SnapshotReader(mm, len(SNAPSHOT_MAGIC) + 1)
+        now_ms = time.time() * 1000
+        data = photon_db.data
+        keys = 0
+
+        while True:
+            pos = reader.pos
+            if mm[pos] == 0:
+                # fast path: string without TTL, short key and value
+                key_size = mm[pos + 1]
+                if key_size < 0x80:
+                    value_pos = pos + 2 + key_size
+                    value_size = mm[value_pos]
+                    if value_size < 0x80:
+                        key = mm[pos + 2:value_pos].decode("utf-8", errors="surrogateescape")
+                        reader.pos = value_pos + 1 + value_size
+                        data[key] = value(mm[value_pos + 1:reader.pos].decode("utf-8", errors="surrogateescape"))
+                        keys += 1
+                        continue
+
+            record = reader.record()
+            if record is None:
+                break
+
+            key, type_, payload, ttl_ms = record
+            if ttl_ms is not None and ttl_ms <= now_ms:
+                continue
+
+            val = value(payload, type_=type_)
+            if ttl_ms is not None:
+                val.ttl_ms = ttl_ms
+                photon_db.expires.add(key, ttl_ms)
+
+            data[key] = val
+            keys += 1
+
+    return keys
+
+
+class LazySnapshot:
+    """
+    A version 2 snapshot opened with mmap and loaded while serving.
+
+    The server starts as soon as the trailer is read. Keys are then
+    decoded on first access through the hash index (pull), and a
+    sequential scan driven by the server loop (step) fills in the
+    rest. Keys touched by a command are never overwritten by the
+    scan. The crc is verified before anything is served (one
+    sequential pass over the mapping): a corrupted file is refused
+    like read_snapshot() does. A record that still can't be decoded
+    raises ValueError, and the scan stays on it, so a save (which
+    needs every key) fails too instead of writing a partial dataset.
+    """
+
+    def __init__(self, path: str, photon_db):
+        self.path = path
+        self.db = photon_db
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            mm = self.mm
+            if len(mm) < len(SNAPSHOT_MAGIC) + 1 + 1 + _TRAILER.size + _CRC.size:
+                raise ValueError("snapshot is truncated")
+            self.crc_offset = len(mm) - _CRC.size
+
+            view = memoryview(mm)
+            try:
+                crc = zlib.crc32(view[:self.crc_offset])
+            finally:
+                view.release()
+            if crc != _CRC.unpack_from(mm, self.crc_offset)[0]:
+                raise ValueError("snapshot checksum mismatch (corrupted file)")
+
+            self.index_offset, self.total = _TRAILER.unpack_from(mm, self.crc_offset - _TRAILER.size)
+            self.bucket_count = _U64.unpack_from(mm, self.index_offset)[0]
+        except Exception:
+            self.mm.close()
+            self.file.close()
+            raise
+
+        self.buckets_offset = self.index_offset + _U64.size
+        self.mask = self.bucket_count - 1
+
+        self.reader = SnapshotReader(mm)
+        self.cursor = len(SNAPSHOT_MAGIC) + 1
+
+        self.touched: set[str] = set()
+        self.processed = 0
+        self.done = False
+        self.started = time.time()
+        self.data: Optional["LoadingDict"] = None
+
+
+    # =============== on access =============== #
+
+
+    def pull(self, key: str) -> None:
+        """make sure key is in memory if the snapshot has it"""
+
+        if self.done or key in self.touched:
+            return
+        self.touched.add(key)
+
+        raw_key = key.encode("utf-8", errors="surrogateescape")
+        mm = self.mm
+        slot = zlib.crc32(raw_key) & self.mask
+        offset = None
+
+        try:
+            while True:
+                offset = _U64.unpack_from(mm, self.buckets_offset + 8 * slot)[0]
+                if offset == 0:
+                    return
+                if self.reader.key_at(offset) == raw_key:
+                    break
+                slot = (slot + 1) & self.mask
+
+            if offset < self.cursor:
+                # the scan already loaded it: memory is authoritative
+                return
+
+            self.reader.pos = offset
+            _, type_, payload, ttl_ms = self.reader.record()
+        except Exception as e:
+            raise ValueError(f"snapshot {self.path} is corrupted at offset {offset}: {e}")
+        self.processed += 1
+        self._insert(key, type_, payload, ttl_ms)
+
+
+    def _insert(self, key, type_, payload, ttl_ms) -> None:
+        from value import value
+
+        if ttl_ms is not None and ttl_ms <= time.time() * 1000:
+            return
+
+        val = value(payload, type_=type_)
+        if ttl_ms is not None:
+            val.ttl_ms = ttl_ms
+            self.db.expires.add(key, ttl_ms)
+        dict.__setitem__(self.data, key, val)
+        if self.db.memory.accounting:
+            self.db.memory.loaded(key, val)
+
+
+    # =============== background scan =============== #
+
+
+    def step(self, budget: float = 0.02) -> bool:
+        """
+        decode records for about budget seconds
+
+        return:
+            bool: True if there is more to load
+        """
+
+        if self.done:
+            return False
+
+        from value import value
+
+        mm = self.mm
+        reader = self.reader
+        reader.pos = self.cursor
+        touched = self.touched
+        data = self.data
+        memory = self.db.memory
+        accounting = memory.accounting
+        deadline = time.perf_counter() + budget
+        count = 0
+        record = ()
+        end = self.index_offset
+        pos = reader.pos
+
+        try:
+            while True:
+                count += 1
+                if count & 255 == 0 and time.perf_counter() > deadline:
+                    break
+
+                pos = reader.pos
+                if pos >= end:
+                    raise ValueError("records run into the index")
+                if mm[pos] == 0 and mm[pos + 1] < 0x80:
+                    # fast path: string without TTL, short key and value
+                    value_pos = pos + 2 + mm[pos + 1]
+                    if mm[value_pos] < 0x80:
+                        key = mm[pos + 2:value_pos].decode("utf-8", errors="surrogateescape")
+                        reader.pos = value_pos + 1 + mm[value_pos]
+                        if key not in touched:
+                            self.processed += 1
+                            val = value(mm[value_pos + 1:reader.pos].decode("utf-8", errors="surrogateescape"))
+                            dict.__setitem__(data, key, val)
+                            if accounting:
+                                memory.loaded(key, val)
+                        continue
+
+                record = reader.record()
+                if record is None:
+                    if reader.pos != end:
+                        raise ValueError("end of the records before the index")
+                    break
+
+                if record[0] not in touched:
+                    self.processed += 1
+                    self._insert(*record)
+
+        except Exception as e:
+            # the next step (or a save) starts again from the bad record
+            self.cursor = pos
+            raise ValueError(f"snapshot {self.path} is corrupted at offset {pos}: {e}")
+
+        self.cursor = reader.pos
+
+        if record is None:
+            self._finish()
+            return False
+        return True
+
+
+    def load_all(self) -> None:
+        """keyspace-wide commands need everything in memory"""
+
+        while self.step(budget=3600):
+            pass
+
+
+    def _finish(self) -> None:
+        print(f"✓ Snapshot fully loaded in {time.time() - self.started:.2f}s ({self.total} records)")
+        self.close()
+
+
+    def close(self) -> None:
+        if self.done:
+            return
+        self.done = True
+        self.touched = set()
+        self.mm.close()
+        self.file.close()
+
+
+    def info(self) -> Dict[str, Any]:
+        total_bytes = self.crc_offset
+        loaded = min(self.cursor, total_bytes)
+        elapsed = time.time() - self.started
+        perc = loaded * 100 / total_bytes if total_bytes else 100.0
+        eta = elapsed * (total_bytes - loaded) / loaded if loaded else -1
+
+        return {
+            "loading_start_time": int(self.started),
+            "loading_total_bytes": total_bytes,
+            "loading_loaded_bytes": loaded,
+            "loading_loaded_perc": f"{perc:.2f}",
+            "loading_eta_seconds": int(eta),
+            "loading_total_keys": self.total,
+            "loading_processed_keys": self.processed,
+        }
+
+
+class LoadingDict(dict):
+    """
+    photon_db.data while a LazySnapshot is loading: a normal dict
+    that asks the loader for a key before any operation on it
+    """
+
+    __slots__ = ("loader",)
+
+    def __init__(self, loader: LazySnapshot):
+        super().__init__()
+        self.loader = loader
+        loader.data = self
+
+
+    def __contains__(self, key):
+        self.loader.pull(key)
+        return dict.__contains__(self, key)
+
+    def __getitem__(self, key):
+        self.loader.pull(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, val):
+        self.loader.pull(key)
+        dict.__setitem__(self, key, val)
+
+    def __delitem__(self, key):
+        self.loader.pull(key)
+        dict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        self.loader.pull(key)
+        return dict.get(self, key, default)
+
+    def pop(self, key, *default):
+        self.loader.pull(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self.loader.pull(key)
+        return dict.setdefault(self, key, default)
+
+    def __len__(self):
+        loader = self.loader
+        pending = 0 if loader.done else loader.total - loader.processed
+        return dict.__len__(self) + pending
+
+    # __iter__ is not overridden on purpose: it keeps dict.copy() on the
+    # fast path when loading ends; keyspace-wide code uses keys()/items()
+
+    def keys(self):
+        self.loader.load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self.loader.load_all()
+        return dict.values(self)
+
+    def items(self):
+        self.loader.load_all()
+        return dict.items(self)
+
+    def clear(self):
+        self.loader.close()
+        dict.clear(self)
 
 
 class PersistenceManager:
@@ -29,11 +731,23 @@ class PersistenceManager:
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
             print(f"📁 Created data directory: {data_dir}")
+
+        # BGSAVE state
+        self.bgsave_pid: Optional[int] = None
+        self.bgsave_started = 0.0
+        self.lastsave = int(time.time())
+        self.last_bgsave_status = "ok"
+        self.last_save_duration = -1.0
     
     def save_snapshot(self, photon_db) -> bool:
         """
         save a snapshot of db on the disk
         
+        Records are encoded one by one from photon_db.data and
+        written in 1MB chunks to a temp file, renamed over the
+        old dump only when complete: a crash never leaves a
+        half-written dump.rdb.
+
         Args:
             photon_db: instance of PhotonDB
         
@@ -41,33 +755,129 @@ class PersistenceManager:
             bool: True if it works
         """
         
+        tmp_path = f"{self.rdb_path}.tmp-{os.getpid()}"
+
         try:
+            started = time.time()
 
-            """ open file in write"""
-          
-            snapshot_data = self._serialize_db(photon_db)
-            
-     
-            with open(self.rdb_path, 'w') as f:
-                json.dump(snapshot_data, f, indent=2)
+            with open(tmp_path, 'w+b') as f:
+                keys = write_snapshot(f, photon_db.data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tmp_path, self.rdb_path)
+            self.lastsave = int(time.time())
+            self.last_save_duration = time.time() - started
             
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"✓ Database snapshot saved at {timestamp}")
             print(f"  File: {self.rdb_path}")
-            print(f"  Keys: {len(photon_db.data)}")
+            print(f"  Keys: {keys} ({time.time() - started:.2f}s)")
             
             return True
         
         except Exception as e:
             print(f"✗ Error saving snapshot: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             return False
     
-    def load_snapshot(self, photon_db) -> bool:
+    def start_bgsave(self, photon_db) -> bool:
+        """
+        BGSAVE: fork, the child writes the dataset as it was at
+        fork time (copy-on-write pages) and exits; the parent keeps
+        serving and collects the result in check_bgsave().
+        Without fork (Windows) the snapshot is saved synchronously.
+
+        return:
+            bool: False if a BGSAVE or an AOF rewrite is already running
+        """
+
+        if self.bgsave_pid is not None:
+            return False
+
+        aof = getattr(photon_db, "aof", None)
+        if aof is not None and aof.rewrite_pid is not None:
+            return False
+
+        if not hasattr(os, "fork"):
+            ok = self.save_snapshot(photon_db)
+            self.last_bgsave_status = "ok" if ok else "err"
+            return True
+
+        self.bgsave_started = time.time()
+        pid = os.fork()
+
+        if pid == 0:
+            # child: save and leave, never return into the server loop
+            code = 1
+            try:
+                code = 0 if self.save_snapshot(photon_db) else 1
+            finally:
+                os._exit(code)
+
+        self.bgsave_pid = pid
+        print(f"✓ Background saving started by pid {pid}")
+        return True
+
+
+    def check_bgsave(self) -> None:
+        """called by the server cron: collect a finished BGSAVE child"""
+
+        if self.bgsave_pid is None:
+            return
+
+        pid, status = os.waitpid(self.bgsave_pid, os.WNOHANG)
+        if pid == 0:
+            return
+
+        self.bgsave_pid = None
+        self.last_save_duration = time.time() - self.bgsave_started
+
+        if os.waitstatus_to_exitcode(status) == 0:
+            self.lastsave = int(time.time())
+            self.last_bgsave_status = "ok"
+            print(f"✓ Background saving terminated with success ({self.last_save_duration:.2f}s)")
+        else:
+            self.last_bgsave_status = "err"
+            print("✗ Background saving failed")
+
+
+    def wait_bgsave(self) -> None:
+        """block until the running BGSAVE (if any) is done (shutdown)"""
+
+        if self.bgsave_pid is None:
+            return
+
+        _, status = os.waitpid(self.bgsave_pid, 0)
+        self.bgsave_pid = None
+        self.last_bgsave_status = "ok" if os.waitstatus_to_exitcode(status) == 0 else "err"
+
+
+    def info(self) -> Dict[str, Any]:
+        """fields of the INFO persistence section"""
+
+        return {
+            "rdb_bgsave_in_progress": 1 if self.bgsave_pid is not None else 0,
+            "rdb_last_save_time": self.lastsave,
+            "rdb_last_bgsave_status": self.last_bgsave_status,
+            "rdb_last_save_time_sec": round(self.last_save_duration, 3),
+            "rdb_current_bgsave_time_sec": (
+                round(time.time() - self.bgsave_started, 3) if self.bgsave_pid is not None else -1
+            ),
+        }
+
+    def load_snapshot(self, photon_db, lazy: bool = False) -> bool:
         """
        load a snapshot from the disk
+
+        Binary dumps are read through mmap, old JSON dumps
+        (version 1.0.0) are still imported.
         
         Args:
             photon_db: isntnce of PhotonDB
+            lazy (bool): with an indexed (version 2) dump, return at once
+                and let the server loop load it (photon_db.loader)
         
         Returns:
             bool: True if it works
@@ -78,16 +888,37 @@ class PersistenceManager:
             return False
         
         try:
-            with open(self.rdb_path, 'r') as f:
-                snapshot_data = json.load(f)
-            
-            # Ricrea il database
-            self._deserialize_db(photon_db, snapshot_data)
+            started = time.time()
+
+            with open(self.rdb_path, 'rb') as f:
+                magic = f.read(len(SNAPSHOT_MAGIC))
+                version = f.read(1)
+
+            if magic == SNAPSHOT_MAGIC and lazy and version == bytes((SNAPSHOT_VERSION,)):
+                loader = LazySnapshot(self.rdb_path, photon_db)
+                photon_db.expires.clear()
+                photon_db.data = LoadingDict(loader)
+                photon_db.loader = loader
+
+                print(f"✓ Database snapshot mapped: {self.rdb_path}")
+                print(f"  Keys: {loader.total} (loading in background)")
+                return True
+
+            if magic == SNAPSHOT_MAGIC:
+                photon_db.data.clear()
+                photon_db.expires.clear()
+                read_snapshot(self.rdb_path, photon_db)
+
+            else:
+                # legacy JSON dump
+                with open(self.rdb_path, 'r') as f:
+                    snapshot_data = json.load(f)
+                self._deserialize_db(photon_db, snapshot_data)
             
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"✓ Database snapshot loaded at {timestamp}")
             print(f"  File: {self.rdb_path}")
-            print(f"  Keys: {len(photon_db.data)}")
+            print(f"  Keys: {len(photon_db.data)} ({time.time() - started:.2f}s)")
             
             return True
         
@@ -95,68 +926,448 @@ class PersistenceManager:
             print(f"✗ Error loading snapshot: {e}")
             return False
     
-    def _serialize_db(self, photon_db) -> Dict[str, Any]:
-        """
-        convert PhotonDB in a serializable dict
-        
-        PhotonDB in RAM:
-        {
-            "key1": value(data="Alice", type="string", ttl_ms=None),
-            "key2": value(data=["a", "b"], type="list", ttl_ms=1234567),
-        }
-        
-        we convert it in JSON:
-        {
-            "key1": {
-                "data": "Alice",
-                "type": "string",
-                "ttl_ms": None,
-                "created_at": 1234567890
-            },
-            ...
-        }
-        """
-        
-        serialized = {}
-        
-        for key, value in photon_db.data.items():
-            serialized[key] = {
-                "data": value.data,
-                "type": value.type,
-                "ttl_ms": value.ttl_ms,
-                "created_at": value.created_at,
-                "last_accessed": value.last_accessed,
-                "access_count": value.access_count,
-            }
-        
-        return {
-            "version": "1.0.0",
-            "timestamp": datetime.now().isoformat(),
-            "keys": serialized
-        }
-    
     def _deserialize_db(self, photon_db, snapshot_data: Dict[str, Any]):
-        from value import value  # ← Classe
+        from value import LFU_INIT_VAL, value  # ← Classe
         
         photon_db.data.clear()
-        photon_db.expiry_heap.clear()
+        photon_db.expires.clear()
         
         keys_data = snapshot_data.get("keys", {})
         
         for key, val_data in keys_data.items():  # ← val_data, NON value_data
             redis_value = value(
-                data=val_data["data"],
+                data=deque(val_data["data"]) if val_data["type"] == "list" else val_data["data"],
                 type_=val_data["type"]
             )
             
             redis_value.ttl_ms = val_data.get("ttl_ms")
-            redis_value.created_at = val_data.get("created_at", 0)
             redis_value.last_accessed = val_data.get("last_accessed", 0)
-            redis_value.access_count = val_data.get("access_count", 0)
+            # old dumps stored a plain hit count: clamp to the LFU counter range
+            redis_value.access_count = min(val_data.get("access_count", LFU_INIT_VAL), 255)
             
             photon_db.data[key] = redis_value
             
             if redis_value.ttl_ms is not None:
-                import heapq
+                photon_db.expires.add(key, redis_value.ttl_ms)
+
+
+
+class AppendOnlyFile:
+    """
+    Append-only command log (AOF)
+
+    Every mutating command executed by CommandExecutor is encoded
+    as a RESP multibulk and buffered with feed(); the servers call
+    flush() once per loop iteration, before writing the replies,
+    so a whole batch of writes costs one write() syscall.
+
+    fsync policies:
+        always   → fsync at every flush, before the clients get their replies
+        everysec → fsync at most once per second, in a background thread
+        no       → let the OS decide
+
+    On startup the log is replayed through a CommandExecutor.
+    rewrite() compacts it from the current dataset (in a forked child
+    when possible) so the file doesn't grow forever.
+    """
+
+    FSYNC_POLICIES = ("always", "everysec", "no")
+    REWRITE_MIN_SIZE = 64 * 1024 * 1024
+    REWRITE_PERCENTAGE = 100
+    REWRITE_BATCH = 64
+
+
+    def __init__(self, data_dir: str = "data", fsync: str = "everysec", filename: str = "appendonly.aof"):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"appendfsync must be one of {', '.join(self.FSYNC_POLICIES)}")
+
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, filename)
+        self.fsync = fsync
+
+        self.file = None
+        self.buffer: list[bytes] = []
+        self.size = 0
+        self.base_size = 0
+
+        self._dirty = False
+        self._last_fsync = time.time()
+        self._fsync_executor: Optional[ThreadPoolExecutor] = None
+        self._fsync_pending = None
+
+        # background rewrite state
+        self.rewrite_scheduled = False
+        self.last_rewrite_status = "ok"
+        self.rewrite_pid: Optional[int] = None
+        self.rewrite_buffer: Optional[list[bytes]] = None
+        self._rewrite_tmp: Optional[str] = None
+        self._rewrite_started = 0.0
+
+        os.makedirs(data_dir, exist_ok=True)
+
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+
+    def open(self) -> None:
+        """open the log for appending (unbuffered: feed() already batches)"""
+
+        self.file = open(self.path, "ab", buffering=0)
+        self.size = self.file.tell()
+        if not self.base_size:
+            self.base_size = self.size
+
+
+    def close(self) -> None:
+        if self.rewrite_pid is not None:
+            # shutting down: the rewrite would miss the last writes anyway
+            os.kill(self.rewrite_pid, signal.SIGKILL)
+            os.waitpid(self.rewrite_pid, 0)
+            if os.path.exists(self._rewrite_tmp):
+                os.remove(self._rewrite_tmp)
+            self.rewrite_pid = None
+            self.rewrite_buffer = None
+
+        if self.file is None:
+            return
+
+        self.flush()
+        if self._fsync_pending is not None:
+            self._fsync_pending.result()
+        if self.fsync != "no":
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+        if self._fsync_executor is not None:
+            self._fsync_executor.shutdown(wait=True)
+
+
+    # =============== write path =============== #
+
+
+    def feed(self, cmd: list[str]) -> None:
+        """buffer a command, written at the next flush()"""
+
+        self.append(RespEncoder.encode_command(cmd))
+
+
+    def append(self, data: bytes) -> None:
+        """feed() of an already encoded command"""
+
+        self.buffer.append(data)
+
+        if self.rewrite_buffer is not None:
+            # the child only sees the dataset at fork time
+            self.rewrite_buffer.append(data)
+
+
+    def flush(self) -> None:
+        """write everything buffered in this loop iteration"""
+
+        if not self.buffer or self.file is None:
+            return
+
+        data = b"".join(self.buffer)
+        self.buffer.clear()
+
+        self.file.write(data)
+        self.size += len(data)
+        self._dirty = True
+
+        if self.fsync == "always":
+            os.fsync(self.file.fileno())
+            self._dirty = False
+            self._last_fsync = time.time()
+
+
+    def cron(self, photon_db) -> None:
+        """
+        periodic work, called from the server loop:
+        everysec fsync, rewrite completion and automatic rewrite
+        """
+
+        if self.file is None:
+            return
+
+        now = time.time()
+
+        if self.fsync == "everysec" and self._dirty and now - self._last_fsync >= 1:
+            if self._fsync_pending is None or self._fsync_pending.done():
+                if self._fsync_executor is None:
+                    self._fsync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aof-fsync")
+                self._dirty = False
+                self._last_fsync = now
+                self._fsync_pending = self._fsync_executor.submit(os.fsync, self.file.fileno())
+
+        if self.rewrite_pid is not None:
+            self._check_rewrite(photon_db)
+
+        elif self.rewrite_scheduled:
+            self.start_rewrite(photon_db)
+
+        elif self.size > self.REWRITE_MIN_SIZE and self.size > self.base_size * (100 + self.REWRITE_PERCENTAGE) / 100:
+            print(f"ℹ AOF grew to {self.size} bytes (base {self.base_size}): rewriting")
+            self.start_rewrite(photon_db)
+
+
+    # =============== replay =============== #
+
+
+    def load(self, photon_db) -> int:
+        """
+        replay the log into photon_db
+
+        A command cut in half by a crash at the end of the file
+        is dropped (the file is truncated to the last complete one),
+        and so is a MULTI block without its EXEC: a transaction is
+        replayed whole or not at all.
+
+        return:
+            int: number of replayed commands
+        """
+
+        from commands import CommandExecutor
+
+        executor = CommandExecutor(photon_db, replaying=True)
+        parser = RespParser()
+        replayed = 0
+        started = time.time()
+
+        fed = 0                 # bytes given to the parser
+        multi_start = None      # offset of an open MULTI
+        queued: list = []       # its commands, run at EXEC
+
+        def replay(cmd):
+            try:
+                executor.execute(cmd)
+            except Exception as e:
+                print(f"✗ AOF: error replaying {cmd[0]}: {e}")
+
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                fed += len(chunk)
+                start = fed - parser.pending()
+
+                try:
+                    for cmd in parser:
+                        name = cmd[0].upper()
+                        if name == "MULTI":
+                            multi_start = start
+                        elif name == "EXEC" and multi_start is not None:
+                            for queued_cmd in queued:
+                                replay(queued_cmd)
+                            queued.clear()
+                            multi_start = None
+                        elif multi_start is not None:
+                            queued.append(cmd)
+                        else:
+                            replay(cmd)
+                        replayed += 1
+                        start = fed - parser.pending()
+                except ProtocolError as e:
+                    print(f"✗ AOF is corrupted at command {replayed}: {e}")
+                    raise
+
+        valid_size = None
+        if multi_start is not None:
+            valid_size = multi_start
+            print(f"✗ AOF ends with an incomplete transaction ({len(queued)} commands): "
+                  f"truncating to {valid_size} bytes")
+        elif parser.pending():
+            valid_size = fed - parser.pending()
+            print(f"✗ AOF ends with a truncated command: truncating to {valid_size} bytes")
+
+        if valid_size is not None:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        self.base_size = os.path.getsize(self.path)
+
+        print(f"✓ AOF loaded: {replayed} commands in {time.time() - started:.2f}s")
+        print(f"  File: {self.path}")
+        print(f"  Keys: {len(photon_db.data)}")
+        return replayed
+
+
+    # =============== rewrite =============== #
+
+
+    def info(self) -> Dict[str, Any]:
+        """AOF fields of the INFO persistence section"""
+
+        return {
+            "aof_rewrite_in_progress": 1 if self.rewrite_pid is not None else 0,
+            "aof_rewrite_scheduled": 1 if self.rewrite_scheduled else 0,
+            "aof_last_bgrewrite_status": self.last_rewrite_status,
+            "aof_current_size": self.size,
+            "aof_base_size": self.base_size,
+            "aof_fsync": self.fsync,
+        }
+
+
+    def _dataset_commands(self, photon_db) -> Iterator[list[str]]:
+        """the shortest list of commands rebuilding the current dataset"""
+
+        now_ms = time.time() * 1000
+        batch = self.REWRITE_BATCH
+
+        for key, val in photon_db.data.items():
+            if val.ttl_ms is not None and val.ttl_ms <= now_ms:
+                continue
+
+            if val.type == "string":
+                yield ["SET", key, val.data]
+
+            elif val.type == "list":
+                items = list(val.data)
+                for i in range(0, len(items), batch):
+                    yield ["RPUSH", key] + items[i:i + batch]
+
+            elif val.type == "hash":
+                for field, field_value in val.data.items():
+                    yield ["HSET", key, field, field_value]
+
+            elif val.type == "set":
+                members = list(val.data)
+                for i in range(0, len(members), batch):
+                    yield ["SADD", key] + members[i:i + batch]
+
+            elif val.type == "zset":
+                args = []
+                for member, score in val.data.pairs():
+                    args.append(format_score(score))
+                    args.append(member)
+                    if len(args) == 2 * batch:
+                        yield ["ZADD", key] + args
+                        args = []
+                if args:
+                    yield ["ZADD", key] + args
+
+            if val.ttl_ms is not None:
+                yield ["PEXPIREAT", key, str(int(val.ttl_ms))]
+
+
+    def _write_dataset(self, photon_db, path: str) -> None:
+        with open(path, "wb") as f:
+            chunk = []
+            size = 0
+            for cmd in self._dataset_commands(photon_db):
+                data = RespEncoder.encode_command(cmd)
+                chunk.append(data)
+                size += len(data)
+                if size > 1024 * 1024:
+                    f.write(b"".join(chunk))
+                    chunk.clear()
+                    size = 0
+            f.write(b"".join(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+    def rewrite(self, photon_db) -> None:
+        """synchronous rewrite (startup, or platforms without fork)"""
+
+        tmp = self.path + ".rewrite"
+        self._write_dataset(photon_db, tmp)
+        self._swap(tmp, [])
+
+
+    def start_rewrite(self, photon_db) -> bool:
+        """
+        BGREWRITEAOF: a forked child writes the dataset as it was
+        at fork time (copy-on-write), the parent keeps serving and
+        collects the commands executed meanwhile in rewrite_buffer
+
+        return:
+            bool: False if a rewrite is already running
+        """
+
+        if self.rewrite_pid is not None:
+            return False
+
+        if photon_db.persistence.bgsave_pid is not None:
+            # one child at a time: start when the BGSAVE is done
+            self.rewrite_scheduled = True
+            return True
+
+        self.rewrite_scheduled = False
+        self.flush()
+        tmp = self.path + f".rewrite-{os.getpid()}"
+
+        if not hasattr(os, "fork"):
+            self._write_dataset(photon_db, tmp)
+            self._swap(tmp, [])
+            return True
+
+        self._rewrite_started = time.time()
+        pid = os.fork()
+
+        if pid == 0:
+            # child: write and leave, never return into the server loop
+            code = 1
+            try:
+                self._write_dataset(photon_db, tmp)
+                code = 0
+            except BaseException as e:
+                print(f"✗ AOF rewrite failed: {e}")
+            finally:
+                os._exit(code)
+
+        self.rewrite_pid = pid
+        self.rewrite_buffer = []
+        self._rewrite_tmp = tmp
+        print(f"✓ Background AOF rewrite started by pid {pid}")
+        return True
+
+
+    def _check_rewrite(self, photon_db) -> None:
+        pid, status = os.waitpid(self.rewrite_pid, os.WNOHANG)
+        if pid == 0:
+            return
+
+        buffered = self.rewrite_buffer
+        tmp = self._rewrite_tmp
+        self.rewrite_pid = None
+        self.rewrite_buffer = None
+        self._rewrite_tmp = None
+
+        if os.waitstatus_to_exitcode(status) != 0:
+            self.last_rewrite_status = "err"
+            print("✗ Background AOF rewrite failed, keeping the current log")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+
+        self.flush()
+        self._swap(tmp, buffered)
+        self.last_rewrite_status = "ok"
+        print(f"✓ Background AOF rewrite done in {time.time() - self._rewrite_started:.2f}s ({self.size} bytes)")
+
+
+    def _swap(self, tmp: str, buffered: list[bytes]) -> None:
+        """append the commands received during the rewrite and replace the log"""
+
+        if buffered:
+            with open(tmp, "ab") as f:
+                f.write(b"".join(buffered))
+                f.flush()
+                os.fsync(f.fileno())
+
+        reopen = self.file is not None
+        if reopen:
+            if self._fsync_pending is not None:
+                self._fsync_pending.result()
+            self.file.close()
+
+        os.replace(tmp, self.path)
+        self.base_size = os.path.getsize(self.path)
+        self.size = self.base_size
 
-                heapq.heappush(photon_db.expiry_heap, (redis_value.ttl_ms, key))
+        if reopen:
+            self.file = open(self.path, "ab", buffering=0)
@@ -3,13 +3,20 @@
 
 
 """
-from persistence import PersistenceManager
+from persistence import AppendOnlyFile, LazySnapshot, PersistenceManager
+from eviction import MemoryManager
+from expiry import ExpiryIndex
+from intset import MAX_INTSET_ENTRIES, IntSet, as_int
+from scan import ScanCursors, compile_pattern
+import random
 import threading
 import time
+from collections import deque
+from itertools import islice
 from typing import Dict, Optional
-import heapq
 
 from value import value
+from zset import ZSet
 
 
 class PhotonDB:
@@ -22,13 +29,38 @@ class PhotonDB:
         """
     
     
-    def __init__(self):  # ← NO parametri host/port!
+    def __init__(self, data_dir: str = "data", appendonly: bool = False, appendfsync: str = "everysec",
+                 lazy_load: bool = False, maxmemory: int = 0, maxmemory_policy: str = "noeviction",
+                 maxmemory_samples: int = 5):  # ← NO parametri host/port!
             self.data: Dict[str, value] = {}
-            self.expiry_heap: list[tuple[float, str]] = []
+            self.expires = ExpiryIndex()    # keys with a TTL, by deadline
+            self.memory = MemoryManager(self, maxmemory, maxmemory_policy, maxmemory_samples)
+            self.tracking = self.memory.tracking     # value.touch(self.tracking) mode of this database
+            self.scans = ScanCursors()     # SCAN/HSCAN cursors in progress
             
             # Persistence
-            self.persistence = PersistenceManager(data_dir="data")
-            self.persistence.load_snapshot(self)
+            self.persistence = PersistenceManager(data_dir=data_dir)
+            self.aof: Optional[AppendOnlyFile] = None
+            self.loader: Optional[LazySnapshot] = None   # set while a snapshot loads in background
+
+            if not appendonly:
+                self.persistence.load_snapshot(self, lazy=lazy_load)
+                self.memory.recount()
+                return
+
+            aof = AppendOnlyFile(data_dir=data_dir, fsync=appendfsync)
+
+            if aof.exists():
+                # the log has every write: the snapshot would be older
+                aof.load(self)
+            else:
+                # first start with AOF on: the log begins from the current dataset
+                self.persistence.load_snapshot(self)
+                aof.rewrite(self)
+
+            aof.open()
+            self.aof = aof
+            self.memory.recount()
 
     # =============== Metodi di gestione per le strighe =============== #
 
@@ -49,14 +81,23 @@ class PhotonDB:
         
         """
 
-        val = value(val_, type_="string")
+        val = self.data.get(key)
+        if val is not None and val.type == "string":
+            # overwrite in place: no new value object
+            val.data = val_
+            val.ttl_ms = None
+            val.touch(self.tracking)
+        else:
+            val = value(val_, type_="string")
+            self.data[key] = val
 
         if ex is not None:
             expire_ms = int(time.time() * 1000) + ex * 1000
             val.ttl_ms = expire_ms
-            heapq.heappush(self.expiry_heap, (expire_ms, key))
+            self.expires.add(key, expire_ms)
+        else:
+            self.expires.discard(key)
 
-        self.data[key] = val
         return True
     
 
@@ -70,6 +111,9 @@ class PhotonDB:
         
         return:
             Optional[str]: value associated with the key or None if absent or expired
+
+        raises:
+            TypeError: WRONGTYPE if the key holds a list, hash, set or zset
         
         """
 
@@ -81,10 +125,13 @@ class PhotonDB:
             return None
 
         if value.is_expired():
-            del self.data[key]
+            self._expire_key(key)
             return None
 
-        value.touch()
+        if value.type != "string":
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+        value.touch(self.tracking)
         return value.data
     
 
@@ -102,6 +149,7 @@ class PhotonDB:
 
         if key in self.data:
             del self.data[key]
+            self.expires.discard(key)
             return True
         
         return False
@@ -117,7 +165,7 @@ class PhotonDB:
         if key not in self.data:
             return False
         if self.data[key].is_expired():
-            del self.data[key]
+            self._expire_key(key)
             return False
         return True
     
@@ -178,18 +226,116 @@ class PhotonDB:
         """
 
 
-        if key not in self.data:
+        return self.pexpireat(key, int(time.time() * 1000) + seconds * 1000)
+
+
+    def pexpireat(self, key: str, timestamp_ms: int) -> bool:
+        """ PEXPIREAT key timestamp-ms
+            Sets an absolute expiry time (unix ms) on a key.
+            Used by the AOF, so a replayed TTL doesn't restart from zero.
+
+        return:
+            bool: True if expiry was set, False if key does not exist
+        """
+
+        if key not in self.data or self.data[key].is_expired():
             return False
-        
 
-        expire_ms = int(time.time() * 1000) + seconds * 1000
-        self.data[key].ttl_ms = expire_ms
-        heapq.heappush(self.expiry_heap, (expire_ms, key))
+        if timestamp_ms <= time.time() * 1000:
+            # already in the past: the key is gone
+            self.delete(key)
+            return True
+
+        self.data[key].ttl_ms = timestamp_ms
+        self.expires.add(key, timestamp_ms)
         return True
-    
+
+
+    def _expire_key(self, key: str) -> None:
+        """passive expiry: an expired key was found on access"""
+
+        self.memory.removed(key, self.data[key])
+        del self.data[key]
+        self.expires.discard(key)
+        self.expires.expired_keys += 1
+
+
+    def mset(self, mapping: Dict[str, str]) -> bool:
+        """ MSET key value [key value ...]
+            Sets many string keys in one pass over the keyspace.
+            Like SET: existing strings are overwritten in place
+            and the keys lose their TTL.
+
+        return:
+            bool: True
+        """
+
+        data = self.data
+        discard = self.expires.discard
+        # a single read of the TTL dict when no key has one
+        has_ttl = bool(self.expires.deadlines)
+
+        for key, val_ in mapping.items():
+            val = data.get(key)
+            if val is not None and val.type == "string":
+                val.data = val_
+                if val.ttl_ms is not None:
+                    val.ttl_ms = None
+                    discard(key)
+                val.touch(self.tracking)
+            else:
+                data[key] = value(val_, type_="string")
+                if has_ttl:
+                    discard(key)
+
+        return True
+
+
+    def msetnx(self, mapping: Dict[str, str]) -> bool:
+        """ MSETNX key value [key value ...]
+            Sets the keys only if none of them exists (all or nothing).
+
+        return:
+            bool: True if the keys were set
+        """
+
+        for key in mapping:
+            if self.exists(key):
+                return False
+        return self.mset(mapping)
+
+
+    def mget(self, keys: list[str]) -> list[Optional[str]]:
+        """ MGET key [key ...]
+            Values of many keys, None for the missing, expired
+            or non-string ones (like Redis, MGET never fails)
+        """
+
+        data = self.data
+        values = []
+        append = values.append
+
+        for key in keys:
+            val = data.get(key)
+            if val is None:
+                append(None)
+            elif val.ttl_ms is not None and val.is_expired():
+                self._expire_key(key)
+                append(None)
+            elif val.type != "string":
+                append(None)
+            else:
+                val.touch(self.tracking)
+                append(val.data)
+
+        return values
+
 
     # =============== Metodi di gestione per le liste =============== #
-    
+    #
+    # lists are collections.deque: O(1) push/pop at both ends,
+    # index access walks 64-element blocks from the nearest end
+
     def lpush(self, key: str, *values: str) -> int:
         """ LPUSH key value [value ...]
         Inserts one or more values at the head of the list stored at key.
@@ -201,7 +347,7 @@ class PhotonDB:
 
 
         if key not in self.data:
-            self.data[key] = value([], type_="list")
+            self.data[key] = value(deque(), type_="list")
 
 
         else:
@@ -212,12 +358,11 @@ class PhotonDB:
 
 
         value_obj = self.data[key]
-        for v in values:
-            value_obj.data.insert(0, v)
+        value_obj.data.extendleft(values)
 
 
 
-        value_obj.touch()
+        value_obj.touch(self.tracking)
         return len(value_obj.data)
 
 
@@ -229,7 +374,7 @@ class PhotonDB:
 
 
         if key not in self.data:
-            self.data[key] = value([], type_="list")
+            self.data[key] = value(deque(), type_="list")
         else:
             value_obj = self.data[key]
             if value_obj.type != "list":
@@ -238,11 +383,10 @@ class PhotonDB:
 
 
         value_obj = self.data[key]
-        for v in values:
-            value_obj.data.append(v)
+        value_obj.data.extend(values)
 
 
-        value_obj.touch()
+        value_obj.touch(self.tracking)
         return len(value_obj.data)
 
 
@@ -260,7 +404,7 @@ class PhotonDB:
         if value_obj.type != "list":
             raise TypeError(f"WRONGTYPE Operation against a key holding the wrong kind of value")
         
-        value_obj.touch()
+        value_obj.touch(self.tracking)
         
         # Handle negative indexes like Redis
         length = len(value_obj.data)
@@ -272,9 +416,12 @@ class PhotonDB:
         # If end is negative, convert (but no +1)
         if end < 0:
             end = length + end
+
+        end = min(end, length - 1)
+        if start > end:
+            return []
         
-        # Do the slice
-        return value_obj.data[start:end+1]
+        return _deque_range(value_obj.data, start, end)
 
 
 
@@ -294,11 +441,15 @@ class PhotonDB:
             raise TypeError(f"The key {key} does not contain a list.")
         
         if len(value_obj.data) == 0:
-            del self.data[key]
+            self.delete(key)
             return None
         
-        value_obj.touch()
-        return value_obj.data.pop(0)
+        value_obj.touch(self.tracking)
+        item = value_obj.data.popleft()
+        if not value_obj.data:
+            # an empty list doesn't exist
+            self.delete(key)
+        return item
 
 
 
@@ -317,12 +468,15 @@ class PhotonDB:
             raise TypeError(f"The key {key} does not contain a list.")
         
         if len(value_obj.data) == 0:
-            del self.data[key]
+            self.delete(key)
             return None
 
 
-        value_obj.touch()
-        return value_obj.data.pop()
+        value_obj.touch(self.tracking)
+        item = value_obj.data.pop()
+        if not value_obj.data:
+            self.delete(key)
+        return item
 
 
 
@@ -341,11 +495,161 @@ class PhotonDB:
         if value_obj.type != "list":
             raise TypeError(f"The key {key} does not contain a list.")
         
-        value_obj.touch()
+        value_obj.touch(self.tracking)
         return len(value_obj.data)
 
 
 
+    def lindex(self, key: str, index: int) -> Optional[str]:
+        """
+        LINDEX key index
+        Returns the element at index (negative = from the tail), None if out of range
+        """
+
+        value_obj = self._list_value(key)
+        if value_obj is None:
+            return None
+
+        items = value_obj.data
+        if index < 0:
+            index += len(items)
+        if not 0 <= index < len(items):
+            return None
+
+        value_obj.touch(self.tracking)
+        return items[index]
+
+
+
+    def lset(self, key: str, index: int, element: str) -> bool:
+        """
+        LSET key index element
+        Replaces the element at index
+        """
+
+        value_obj = self._list_value(key)
+        if value_obj is None:
+            raise ValueError("no such key")
+
+        items = value_obj.data
+        if index < 0:
+            index += len(items)
+        if not 0 <= index < len(items):
+            raise ValueError("index out of range")
+
+        items[index] = element
+        value_obj.touch(self.tracking)
+        return True
+
+
+
+    def ltrim(self, key: str, start: int, end: int) -> bool:
+        """
+        LTRIM key start stop
+        Keeps only the elements from start to stop (inclusive, negative = from the tail)
+        """
+
+        value_obj = self._list_value(key)
+        if value_obj is None:
+            return True
+
+        items = value_obj.data
+        length = len(items)
+        if start < 0:
+            start = max(0, length + start)
+        if end < 0:
+            end = length + end
+        end = min(end, length - 1)
+
+        if start > end:
+            self.delete(key)
+            return True
+
+        kept = end - start + 1
+        if kept < length - kept:
+            # keeping less than what is dropped: copy it out
+            value_obj.data = deque(_deque_range(items, start, end))
+        else:
+            for _ in range(start):
+                items.popleft()
+            for _ in range(length - 1 - end):
+                items.pop()
+
+        value_obj.touch(self.tracking)
+        return True
+
+
+
+    def linsert(self, key: str, where: str, pivot: str, element: str) -> int:
+        """
+        LINSERT key BEFORE|AFTER pivot element
+        Inserts element next to the first occurrence of pivot
+
+        return:
+            int: the new length, -1 if pivot is not found, 0 if the key doesn't exist
+        """
+
+        where = where.upper()
+        if where not in ("BEFORE", "AFTER"):
+            raise ValueError("syntax error")
+
+        value_obj = self._list_value(key)
+        if value_obj is None:
+            return 0
+
+        items = value_obj.data
+        try:
+            index = items.index(pivot)
+        except ValueError:
+            return -1
+
+        items.insert(index if where == "BEFORE" else index + 1, element)
+        value_obj.touch(self.tracking)
+        return len(items)
+
+
+
+    def lmove(self, source: str, destination: str, wherefrom: str, whereto: str) -> Optional[str]:
+        """
+        LMOVE source destination LEFT|RIGHT LEFT|RIGHT
+        Pops an element from one end of source and pushes it on one
+        end of destination (source == destination rotates the list)
+
+        return:
+            the element moved, None if source is empty
+        """
+
+        wherefrom = wherefrom.upper()
+        whereto = whereto.upper()
+        if wherefrom not in ("LEFT", "RIGHT") or whereto not in ("LEFT", "RIGHT"):
+            raise ValueError("syntax error")
+
+        if self._list_value(source) is None:
+            return None
+        # WRONGTYPE before anything is popped
+        self._list_value(destination)
+
+        item = self.lpop(source) if wherefrom == "LEFT" else self.rpop(source)
+        if whereto == "LEFT":
+            self.lpush(destination, item)
+        else:
+            self.rpush(destination, item)
+        return item
+
+
+
+    def _list_value(self, key: str):
+        """the value holding the list at key, None if missing"""
+
+        value_obj = self.data.get(key)
+        if value_obj is None:
+            return None
+        if value_obj.type != "list":
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value_obj
+
+
+
     # =============== Hash methods =============== #
 
 
@@ -369,7 +673,7 @@ class PhotonDB:
         value_obj = self.data[key]
         is_new_field = field not in value_obj.data
         value_obj.data[field] = val_
-        value_obj.touch()
+        value_obj.touch(self.tracking)
 
 
         return 1 if is_new_field else 0
@@ -390,7 +694,7 @@ class PhotonDB:
         
 
 
-        value_obj.touch()
+        value_obj.touch(self.tracking)
         return value_obj.data.get(field)
 
 
@@ -407,7 +711,7 @@ class PhotonDB:
         if value_obj.type != "hash":
             raise TypeError(f"WRONGTYPE Operation against a key holding the wrong kind of value")
         
-        value_obj.touch()
+        value_obj.touch(self.tracking)
         return dict(value_obj.data)
 
     def hdel(self, key: str, *fields: str) -> int:
@@ -427,49 +731,554 @@ class PhotonDB:
             if field in value_obj.data:
                 del value_obj.data[field]
                 deleted += 1
-        
-        value_obj.touch()
+
+        value_obj.touch(self.tracking)
         return deleted
 
 
+    def hmset(self, key: str, mapping: Dict[str, str]) -> int:
+        """
+        HMSET key field value [field value ...]
+        Sets many fields of a hash with one lookup of the key.
 
-    # =============== UTILITY =============== #
+        return:
+            int: number of fields that were added
+        """
 
+        value_obj = self.data.get(key)
+        if value_obj is None:
+            value_obj = self.data[key] = value({}, type_="hash")
+        elif value_obj.type != "hash":
+            raise TypeError(f"WRONGTYPE Operation against a key holding the wrong kind of value")
+
+        fields = value_obj.data
+        before = len(fields)
+        fields.update(mapping)
+        value_obj.touch(self.tracking)
+        return len(fields) - before
 
 
-    def cleanup_expired_keys(self):
+    def hmget(self, key: str, fields: list[str]) -> list[Optional[str]]:
         """
-        Removes expired keys from the database.
-        Must be called periodically to keep the database clean.
+        HMGET key field [field ...]
+        Gets many fields of a hash, None for the missing ones.
         """
 
+        value_obj = self.data.get(key)
+        if value_obj is None:
+            return [None] * len(fields)
+        if value_obj.type != "hash":
+            raise TypeError(f"WRONGTYPE Operation against a key holding the wrong kind of value")
 
-        deleted = 0
-        current_time_ms = time.time() * 1000
+        value_obj.touch(self.tracking)
+        get = value_obj.data.get
+        return [get(field) for field in fields]
 
 
-        while self.expiry_heap:
-            expire_time, key = self.expiry_heap
+    def hscan(self, key: str, cursor: int, count: int = 10, pattern: str = "*") -> tuple[int, list[str]]:
+        """
+        HSCAN key cursor [MATCH pattern] [COUNT count]
+        Walks the fields of a hash a few per call,
+        small hashes are returned whole.
 
+        return:
+            (next cursor, 0 at the end; field, value, field, value, ...)
+        """
 
-            """Check if the key at the top of the heap has expired."""
+        value_obj = self.data.get(key)
+        if value_obj is None or value_obj.is_expired():
+            return 0, []
+        if value_obj.type != "hash":
+            raise TypeError(f"WRONGTYPE Operation against a key holding the wrong kind of value")
 
+        fields = value_obj.data
+        cursor, names = self.scans.scan(key, fields, cursor, count, whole_below=128)
+        match = compile_pattern(pattern)
 
-            if expire_time > current_time_ms:
-                break
+        found = []
+        for field in names:
+            if match is None or match(field):
+                found.append(field)
+                found.append(fields[field])
+        return cursor, found
 
 
-            heapq.heappop(self.expiry_heap)
 
+    # =============== Set methods =============== #
+    #
+    # a set of str, or an IntSet (sorted array of int64) while it
+    # only holds up to MAX_INTSET_ENTRIES integers
 
-            if key in self.data and self.data[key].is_expired():
-                del self.data[key]
-                deleted += 1
 
+    def sadd(self, key: str, *members: str) -> int:
+        """
+        SADD key member [member ...]
+        Adds members to a set.
 
-        return deleted
+        return:
+            int: number of members that were added
+        """
 
+        value_obj = self._set_value(key)
+        if value_obj is None:
+            value_obj = self.data[key] = value(_new_set(members), type_="set")
+            value_obj.touch(self.tracking)
+            return len(value_obj.data)
+
+        members_ = value_obj.data
+        before = len(members_)
+
+        if isinstance(members_, IntSet):
+            numbers = [as_int(member) for member in members]
+            if None not in numbers and before + len(numbers) > MAX_INTSET_ENTRIES:
+                # only the new members count: re-adding ones keeps the intset
+                numbers = set(numbers).difference(members_.ints)
+            if None not in numbers and before + len(numbers) <= MAX_INTSET_ENTRIES:
+                added = sum(1 for number in numbers if members_.add(number))
+                value_obj.touch(self.tracking)
+                return added
+            # a string member or too many: convert to a hashtable
+            members_ = value_obj.data = set(members_)
+
+        members_.update(members)
+        value_obj.touch(self.tracking)
+        return len(members_) - before
+
+
+    def srem(self, key: str, *members: str) -> int:
+        """
+        SREM key member [member ...]
+        Removes members, the key is deleted with its last member.
+        """
 
+        value_obj = self._set_value(key)
+        if value_obj is None:
+            return 0
+
+        members_ = value_obj.data
+        if isinstance(members_, IntSet):
+            removed = sum(1 for member in members if members_.discard(member))
+        else:
+            before = len(members_)
+            members_.difference_update(members)
+            removed = before - len(members_)
+
+        if not members_:
+            self.delete(key)
+        return removed
+
+
+    def sismember(self, key: str, member: str) -> bool:
+        """SISMEMBER key member"""
+
+        value_obj = self._set_value(key)
+        if value_obj is None:
+            return False
+        value_obj.touch(self.tracking)
+        return member in value_obj.data
+
+
+    def smembers(self, key: str) -> list[str]:
+        """SMEMBERS key"""
+
+        value_obj = self._set_value(key)
+        if value_obj is None:
+            return []
+        value_obj.touch(self.tracking)
+        return list(value_obj.data)
+
+
+    def scard(self, key: str) -> int:
+        """SCARD key"""
+
+        value_obj = self._set_value(key)
+        return len(value_obj.data) if value_obj is not None else 0
+
+
+    def srandmember(self, key: str, count: Optional[int] = None):
+        """
+        SRANDMEMBER key [count]
+        A random member (None if the set is missing); with count,
+        up to count distinct members, or abs(count) members with
+        repetitions when count is negative.
+
+        An intset is sampled by index; a hashtable has no random
+        access in Python, so it is copied to a list first (O(n)).
+        """
+
+        value_obj = self._set_value(key)
+        if value_obj is None:
+            return None if count is None else []
+
+        members_ = value_obj.data
+        value_obj.touch(self.tracking)
+
+        if count is None:
+            return _random_members(members_, 1)[0]
+        if count >= len(members_):
+            return list(members_)
+        if count >= 0:
+            return _random_members(members_, count)
+
+        pool = members_.ints if isinstance(members_, IntSet) else list(members_)
+        return [str(member) for member in random.choices(pool, k=-count)]
+
+
+    def sinter(self, *keys: str) -> list[str]:
+        """
+        SINTER key [key ...]
+        Members of every set: the smallest set is walked and its
+        members looked up in the others, smallest first, so the
+        cost is O(smallest * number of sets) whatever the big ones hold.
+        """
+
+        sets = [self._set_members(key) for key in keys]
+        if not all(sets):
+            return []
+        sets.sort(key=len)
+
+        smallest, others = sets[0], sets[1:]
+        if all(isinstance(members, set) for members in sets):
+            # same walk, in C
+            return list(smallest.intersection(*others))
+        return [member for member in smallest if all(member in members for members in others)]
+
+
+    def sunion(self, *keys: str) -> list[str]:
+        """SUNION key [key ...]"""
+
+        sets = [self._set_members(key) for key in keys]
+        # the biggest set is copied, the others added to it
+        sets.sort(key=len, reverse=True)
+        union = set(sets[0])
+        for members in sets[1:]:
+            union.update(members)
+        return list(union)
+
+
+    def sdiff(self, *keys: str) -> list[str]:
+        """
+        SDIFF key [key ...]
+        Members of the first set that are in none of the others:
+        each of its members is looked up in the others, biggest
+        first (the likeliest to hold it), unless the others are
+        smaller in total, then they are removed from a copy.
+        """
+
+        first = self._set_members(keys[0])
+        if not first:
+            return []
+        others = [members for members in map(self._set_members, keys[1:]) if members]
+        others.sort(key=len, reverse=True)
+
+        if sum(map(len, others)) < len(first):
+            diff = set(first)
+            for members in others:
+                diff.difference_update(members)
+            return list(diff)
+        return [member for member in first if not any(member in members for members in others)]
+
+
+    def setstore(self, destination: str, members: list[str]) -> int:
+        """
+        SINTERSTORE / SUNIONSTORE / SDIFFSTORE destination ...
+        Replaces destination with a set of members (deleted if empty).
+
+        return:
+            int: size of the new set
+        """
+
+        self.delete(destination)
+        if not members:
+            return 0
+        self.data[destination] = value(_new_set(members), type_="set")
+        return len(self.data[destination].data)
+
+
+    def sscan(self, key: str, cursor: int, count: int = 10, pattern: str = "*") -> tuple[int, list[str]]:
+        """
+        SSCAN key cursor [MATCH pattern] [COUNT count]
+        Walks the members of a set, small sets are returned whole.
+        """
+
+        members_ = self._set_members(key)
+        cursor, members = self.scans.scan(key, members_, cursor, count, whole_below=MAX_INTSET_ENTRIES)
+        match = compile_pattern(pattern)
+        if match is None:
+            return cursor, members
+        return cursor, [member for member in members if match(member)]
+
+
+    def _set_value(self, key: str):
+        """the value holding the set at key, None if missing or expired"""
+
+        value_obj = self.data.get(key)
+        if value_obj is None:
+            return None
+        if value_obj.ttl_ms is not None and value_obj.is_expired():
+            self._expire_key(key)
+            return None
+        if value_obj.type != "set":
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value_obj
+
+
+    def _set_members(self, key: str):
+        """the set (or IntSet) at key, an empty set if missing"""
+
+        value_obj = self._set_value(key)
+        return value_obj.data if value_obj is not None else set()
+
+
+
+    # =============== Sorted set methods =============== #
+    #
+    # small sets are a sorted array, big ones a skiplist with a
+    # member -> score dict (zset.ZSet); scores are floats
+
+
+    def zadd(self, key: str, pairs: list[tuple[float, str]], nx: bool = False, xx: bool = False,
+             gt: bool = False, lt: bool = False, ch: bool = False, incr: bool = False):
+        """
+        ZADD key [NX|XX] [GT|LT] [CH] [INCR] score member [score member ...]
+        Adds members or updates their score.
+
+        return:
+            int: members added (and updated, with CH);
+            with INCR the new score, None if NX/XX/GT/LT skipped it
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            if xx:
+                return None if incr else 0
+            value_obj = self.data[key] = value(ZSet(), type_="zset")
+
+        zset = value_obj.data
+        added = 0
+        updated = 0
+        new_score = None
+
+        for score, member in pairs:
+            old = zset.score(member)
+
+            if old is None:
+                if xx:
+                    continue
+                zset.add(member, score)
+                new_score = score
+                added += 1
+                continue
+
+            if nx:
+                continue
+            new_score = old + score if incr else score
+            if new_score != new_score:
+                raise ValueError("resulting score is not a number (NaN)")
+            if (gt and new_score <= old) or (lt and new_score >= old):
+                new_score = None
+                continue
+            if new_score != old:
+                zset.add(member, new_score)
+                updated += 1
+
+        value_obj.touch(self.tracking)
+        if incr:
+            return new_score
+        return added + updated if ch else added
+
+
+    def zincrby(self, key: str, increment: float, member: str) -> float:
+        """
+        ZINCRBY key increment member
+        Adds increment to the score of member (0 if missing).
+        """
+
+        return self.zadd(key, [(increment, member)], incr=True)
+
+
+    def zrem(self, key: str, *members: str) -> int:
+        """
+        ZREM key member [member ...]
+        Removes members, the key is deleted with its last member.
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return 0
+
+        zset = value_obj.data
+        removed = sum(1 for member in members if zset.remove(member))
+        if not zset:
+            self.delete(key)
+        return removed
+
+
+    def zscore(self, key: str, member: str) -> Optional[float]:
+        """ZSCORE key member"""
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return None
+        value_obj.touch(self.tracking)
+        return value_obj.data.score(member)
+
+
+    def zcard(self, key: str) -> int:
+        """ZCARD key"""
+
+        value_obj = self._zset_value(key)
+        return len(value_obj.data) if value_obj is not None else 0
+
+
+    def zrank(self, key: str, member: str, reverse: bool = False) -> Optional[int]:
+        """
+        ZRANK / ZREVRANK key member
+        0-based position by score, None if the member is missing.
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return None
+        value_obj.touch(self.tracking)
+        return value_obj.data.rank(member, reverse)
+
+
+    def zrange(self, key: str, start: int, stop: int, reverse: bool = False) -> list[tuple[str, float]]:
+        """
+        ZRANGE key start stop [REV]
+        (member, score) by rank, negative indexes count from the end.
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return []
+
+        zset = value_obj.data
+        length = len(zset)
+        if start < 0:
+            start = max(0, length + start)
+        if stop < 0:
+            stop = length + stop
+        stop = min(stop, length - 1)
+        if start > stop:
+            return []
+
+        value_obj.touch(self.tracking)
+        return zset.range_by_rank(start, stop, reverse)
+
+
+    def zrangebyscore(self, key: str, low: tuple[float, bool], high: tuple[float, bool], reverse: bool = False,
+                      offset: int = 0, count: int = -1) -> list[tuple[str, float]]:
+        """
+        ZRANGE key min max BYSCORE [REV] [LIMIT offset count]
+        (member, score) with min <= score <= max, bounds from zset.parse_bound.
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None or offset < 0:
+            return []
+        value_obj.touch(self.tracking)
+        return value_obj.data.range_by_score(low, high, reverse, offset, count)
+
+
+    def zcount(self, key: str, low: tuple[float, bool], high: tuple[float, bool]) -> int:
+        """ZCOUNT key min max"""
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return 0
+        return value_obj.data.count(low, high)
+
+
+    def zpop(self, key: str, count: int = 1, highest: bool = False) -> list[tuple[str, float]]:
+        """
+        ZPOPMIN / ZPOPMAX key [count]
+        Removes and returns the members with the lowest (highest) scores.
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return []
+
+        popped = value_obj.data.pop(count, highest)
+        if not value_obj.data:
+            self.delete(key)
+        return popped
+
+
+    def zscan(self, key: str, cursor: int, count: int = 10, pattern: str = "*") -> tuple[int, list]:
+        """
+        ZSCAN key cursor [MATCH pattern] [COUNT count]
+
+        return:
+            (next cursor, 0 at the end; member, score, member, score, ...)
+        """
+
+        value_obj = self._zset_value(key)
+        if value_obj is None:
+            return 0, []
+
+        zset = value_obj.data
+        cursor, members = self.scans.scan(key, zset, cursor, count, whole_below=128)
+        match = compile_pattern(pattern)
+        scores = zset.dict if zset.dict is not None else dict(zset.pairs())
+
+        found = []
+        for member in members:
+            if match is None or match(member):
+                found.append(member)
+                found.append(scores[member])
+        return cursor, found
+
+
+    def _zset_value(self, key: str):
+        """the value holding the sorted set at key, None if missing or expired"""
+
+        value_obj = self.data.get(key)
+        if value_obj is None:
+            return None
+        if value_obj.ttl_ms is not None and value_obj.is_expired():
+            self._expire_key(key)
+            return None
+        if value_obj.type != "zset":
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value_obj
+
+
+
+    # =============== UTILITY =============== #
+
+
+
+    def cleanup_expired_keys(self, budget_ms: float = 25.0) -> int:
+        """
+        Removes expired keys from the database.
+        Called by the server cron; stops after budget_ms of CPU,
+        the keys left are deleted by the next calls.
+        """
+
+        removed = self.memory.removed if self.memory.accounting else None
+        return self.expires.active_expire_cycle(self.data, budget_ms, removed)
+
+
+
+    def loading_step(self, budget: float = 0.02) -> bool:
+        """
+        Advances a background snapshot load by about budget seconds.
+        Called by the server loop until it returns False.
+        """
+
+        if self.loader is None:
+            return False
+
+        if self.loader.step(budget):
+            return True
+
+        # loaded: back to a plain dict, without the per-access hooks
+        self.data = dict.copy(self.data)
+        self.loader = None
+        return False
 
 
 
@@ -487,7 +1296,7 @@ class PhotonDB:
 
         try:
             self.data.clear()
-            self.expiry_heap.clear()
+            self.expires.clear()
             return True
         
         except Exception as e:
@@ -496,6 +1305,83 @@ class PhotonDB:
         
 
 
-    def keys(self) -> list[str]:
-        """Returns a list of all keys in the database."""
-        return list(self.data.keys())
+    def keys(self, pattern: str = "*") -> list[str]:
+        """Returns the keys matching a glob pattern (all of them by default)."""
+
+        match = compile_pattern(pattern)
+        if match is None:
+            return list(self.data.keys())
+        return [key for key in self.data.keys() if match(key)]
+
+
+
+    def scan(self, cursor: int, count: int = 10, pattern: str = "*",
+             type_: Optional[str] = None) -> tuple[int, list[str]]:
+        """
+        SCAN cursor [MATCH pattern] [COUNT count] [TYPE type]
+        Walks the keyspace a few keys per call (see ScanCursors).
+
+        return:
+            (next cursor, 0 at the end; keys of this step)
+        """
+
+        if self.loader is not None:
+            # keys() would decode the rest of the snapshot in one go
+            raise ValueError("LOADING PhotonDB is loading the dataset in memory")
+
+        data = self.data
+        cursor, keys = self.scans.scan(None, data.keys(), cursor, count)
+        match = compile_pattern(pattern)
+
+        found = []
+        for key in keys:
+            if match is not None and not match(key):
+                continue
+            val = data[key]
+            if val.ttl_ms is not None and val.is_expired():
+                self._expire_key(key)
+                continue
+            if type_ is not None and val.type != type_:
+                continue
+            found.append(key)
+
+        return cursor, found
+
+
+
+def _new_set(members):
+    """set of members: an IntSet if they are few integers, else a set of str"""
+
+    ints = IntSet.from_members(members)
+    return ints if ints is not None else set(members)
+
+
+def _random_members(members, count: int) -> list[str]:
+    """count distinct random members of a set or IntSet (count <= len)"""
+
+    if isinstance(members, IntSet):
+        return members.random_members(count)
+    return random.sample(list(members), count)
+
+
+def _deque_range(items: deque, start: int, end: int) -> list:
+    """
+    items[start:end+1] of a deque (0 <= start <= end < len):
+    walks from the nearest end, or indexes each element when
+    the range is short compared to the walk
+    """
+
+    length = len(items)
+    count = end - start + 1
+
+    if start <= length - 1 - end:
+        if count * 64 < start:
+            return [items[i] for i in range(start, end + 1)]
+        return list(islice(items, start, end + 1))
+
+    skip = length - 1 - end
+    if count * 64 < skip:
+        return [items[i] for i in range(start, end + 1)]
+    tail = list(islice(reversed(items), skip, skip + count))
+    tail.reverse()
+    return tail
@@ -0,0 +1,215 @@
+"""
+Pub/Sub: channel and pattern subscriptions of the connections,
+and the fan-out of PUBLISH
+"""
+
+from typing import Callable, Optional
+
+from scan import compile_pattern
+
+
+# handled by the connection, not by the executor
+PUBSUB_COMMANDS = {"SUBSCRIBE", "UNSUBSCRIBE", "PSUBSCRIBE", "PUNSUBSCRIBE"}
+
+# the only commands a subscribed connection can send
+SUBSCRIBED_COMMANDS = PUBSUB_COMMANDS | {"PING"}
+
+
+class PatternSubscription:
+    """a pattern with its compiled matcher and its subscribers"""
+
+    __slots__ = ("pattern", "match", "subscribers")
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.match: Optional[Callable] = compile_pattern(pattern)    # None: "*"
+        self.subscribers: dict = {}
+
+
+class PubSub:
+    """
+    Subscriptions of the connected clients.
+
+    PUBLISH encodes the message once per protocol and appends the
+    same bytes to the output buffer of every subscriber: they are
+    written at the next flush with the replies, one write per
+    connection however many messages it got in between.
+
+    Patterns are compiled once, at PSUBSCRIBE. The patterns matching
+    a channel are remembered (the index), so a PUBLISH doesn't glob
+    every pattern again: the index is rebuilt lazily when a pattern
+    is added or goes away, and is bounded to MAX_INDEXED channels.
+
+    Attributes:
+        channels: channel -> {connection: None} (insertion ordered)
+        patterns: pattern -> PatternSubscription
+    """
+
+    MAX_INDEXED = 65536
+
+
+    def __init__(self):
+        self.channels: dict[str, dict] = {}
+        self.patterns: dict[str, PatternSubscription] = {}
+        self._index: dict[str, list[PatternSubscription]] = {}
+
+        # stats
+        self.messages = 0
+
+
+    # =============== subscriptions =============== #
+
+
+    def handle(self, conn, name: str, args: list[str]) -> list[list]:
+        """
+        SUBSCRIBE/UNSUBSCRIBE/PSUBSCRIBE/PUNSUBSCRIBE of a connection:
+        one reply per channel, [kind, channel, subscriptions left]
+        """
+
+        if name == "SUBSCRIBE" or name == "PSUBSCRIBE":
+            if not args:
+                raise ValueError(f"wrong number of arguments for '{name.lower()}' command")
+            add = self.subscribe if name == "SUBSCRIBE" else self.psubscribe
+            replies = []
+            for channel in args:
+                add(conn, channel)
+                replies.append([name.lower(), channel, conn.subscriptions])
+            return replies
+
+        if name == "UNSUBSCRIBE":
+            remove, targets = self.unsubscribe, args or list(conn.channels)
+        else:
+            remove, targets = self.punsubscribe, args or list(conn.patterns)
+
+        if not targets:
+            return [[name.lower(), None, conn.subscriptions]]
+
+        replies = []
+        for channel in targets:
+            remove(conn, channel)
+            replies.append([name.lower(), channel, conn.subscriptions])
+        return replies
+
+
+    def subscribe(self, conn, channel: str) -> bool:
+        if channel in conn.channels:
+            return False
+        conn.channels.add(channel)
+        self.channels.setdefault(channel, {})[conn] = None
+        return True
+
+
+    def unsubscribe(self, conn, channel: str) -> bool:
+        if channel not in conn.channels:
+            return False
+        conn.channels.discard(channel)
+        subscribers = self.channels[channel]
+        del subscribers[conn]
+        if not subscribers:
+            del self.channels[channel]
+        return True
+
+
+    def psubscribe(self, conn, pattern: str) -> bool:
+        if pattern in conn.patterns:
+            return False
+        conn.patterns.add(pattern)
+        sub = self.patterns.get(pattern)
+        if sub is None:
+            sub = self.patterns[pattern] = PatternSubscription(pattern)
+            self._index.clear()
+        sub.subscribers[conn] = None
+        return True
+
+
+    def punsubscribe(self, conn, pattern: str) -> bool:
+        if pattern not in conn.patterns:
+            return False
+        conn.patterns.discard(pattern)
+        sub = self.patterns[pattern]
+        del sub.subscribers[conn]
+        if not sub.subscribers:
+            del self.patterns[pattern]
+            self._index.clear()
+        return True
+
+
+    def drop(self, conn) -> None:
+        """a subscribed connection went away"""
+
+        for channel in list(conn.channels):
+            self.unsubscribe(conn, channel)
+        for pattern in list(conn.patterns):
+            self.punsubscribe(conn, pattern)
+
+
+    # =============== PUBLISH =============== #
+
+
+    def publish(self, channel: str, message: str) -> int:
+        """deliver message to the subscribers of channel, return how many got it"""
+
+        self.messages += 1
+        receivers = 0
+
+        subscribers = self.channels.get(channel)
+        if subscribers:
+            receivers += _deliver(subscribers, ["message", channel, message])
+
+        if self.patterns:
+            for sub in self._matching(channel):
+                receivers += _deliver(sub.subscribers, ["pmessage", sub.pattern, channel, message])
+
+        return receivers
+
+
+    def _matching(self, channel: str) -> list[PatternSubscription]:
+        """the patterns matching channel, globbed once per channel"""
+
+        matching = self._index.get(channel)
+        if matching is None:
+            if len(self._index) >= self.MAX_INDEXED:
+                self._index.clear()
+            matching = self._index[channel] = [
+                sub for sub in self.patterns.values() if sub.match is None or sub.match(channel)
+            ]
+        return matching
+
+
+    # =============== introspection =============== #
+
+
+    def channel_list(self, pattern: str = "*") -> list[str]:
+        """PUBSUB CHANNELS: channels with at least one subscriber"""
+
+        match = compile_pattern(pattern)
+        if match is None:
+            return list(self.channels)
+        return [channel for channel in self.channels if match(channel)]
+
+
+    def numsub(self, channel: str) -> int:
+        return len(self.channels.get(channel, ()))
+
+
+    def info(self) -> dict:
+        """pubsub fields for INFO stats"""
+
+        return {
+            "pubsub_channels": len(self.channels),
+            "pubsub_patterns": len(self.patterns),
+            "pubsub_messages": self.messages,
+        }
+
+
+def _deliver(subscribers: dict, reply: list) -> int:
+    """the reply encoded once per protocol, the same bytes queued on every subscriber"""
+
+    frames = {}
+    for conn in subscribers:
+        protocol = conn.parser.protocol
+        frame = frames.get(protocol)
+        if frame is None:
+            frame = frames[protocol] = conn.encode(reply)
+        conn.send(frame)
+    return len(subscribers)
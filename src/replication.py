@@ -0,0 +1,643 @@
+"""
+Replication: a primary streams its writes to read-only replicas
+(REPLICAOF), after a full sync from a snapshot or a partial one
+from the backlog
+"""
+
+import asyncio
+import os
+import secrets
+import time
+from typing import Optional
+
+from parser import RespEncoder, RespParser, SimpleString
+from persistence import read_snapshot
+
+
+# handled by the connection: they change what it is used for
+REPLICATION_COMMANDS = {"PSYNC", "REPLCONF"}
+
+
+class ReplicationBacklog:
+    """
+    The last `size` bytes of the replication stream, in a circular
+    buffer: a replica that was disconnected for a short time asks
+    for the stream from its offset instead of a full sync.
+
+    Attributes:
+        offset: replication offset of the end of the stream
+        histlen: bytes of stream kept (up to size)
+    """
+
+    def __init__(self, size: int, offset: int = 0):
+        self.size = size
+        self.buffer = bytearray(size)
+        self.offset = offset
+        self.histlen = 0
+
+
+    @property
+    def first_offset(self) -> int:
+        return self.offset - self.histlen
+
+
+    def append(self, data: bytes) -> None:
+        size = self.size
+        n = len(data)
+        if n >= size:
+            data = data[n - size:]
+
+        start = (self.offset + n - len(data)) % size
+        head = min(len(data), size - start)
+        self.buffer[start:start + head] = data[:head]
+        if head < len(data):
+            # wraps around
+            self.buffer[:len(data) - head] = data[head:]
+
+        self.offset += n
+        self.histlen = min(self.histlen + n, size)
+
+
+    def covers(self, offset: int) -> bool:
+        return self.first_offset <= offset <= self.offset
+
+
+    def read(self, offset: int) -> bytes:
+        """the stream from offset to the end (covers(offset) must be True)"""
+
+        n = self.offset - offset
+        start = offset % self.size
+        if start + n <= self.size:
+            return bytes(self.buffer[start:start + n])
+        return bytes(self.buffer[start:]) + bytes(self.buffer[:start + n - self.size])
+
+
+class ReplicaState:
+    """
+    a replica connected to this primary
+
+    state: "wait_bgsave" (waiting for a snapshot to start), "bgsave"
+    (snapshot being written, the stream is kept in pending),
+    "send_bulk" (snapshot being sent from rdb, still kept in pending),
+    "online"
+    """
+
+    __slots__ = ("conn", "state", "pending", "port", "ack_offset", "ack_time", "rdb")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.state = "handshake"
+        self.pending: Optional[list[bytes]] = None
+        self.port = 0
+        self.ack_offset = 0
+        self.ack_time = time.time()
+        self.rdb = None
+
+
+class Replication:
+    """
+    Replication state of a server, primary or replica.
+
+    Primary: the first PSYNC creates the backlog, and from then on
+    every write logged by the executor is appended to it and sent to
+    the online replicas. A new replica gets a full sync: a BGSAVE
+    (the same forked snapshot as the periodic save), the dump is sent
+    as one bulk, read from the file a chunk at a time while the
+    replica's transport accepts it, and then the writes done since
+    the fork, kept aside meanwhile. A replica coming back with this server's replication
+    id and an offset still in the backlog gets only what it missed.
+
+    Replica: REPLICAOF connects to the primary (PING, REPLCONF,
+    PSYNC with the last known id and offset), loads the dump of a
+    full sync and then applies the stream through the executor,
+    a MULTI block at once. Clients can only read (READONLY error on
+    write commands). The offset is acknowledged every second, and the
+    link is retried every second when it drops.
+
+    Attributes:
+        replid: replication id of this server's history
+        offset: replication offset (primary: stream produced, replica: applied)
+        backlog: None until a replica connects
+        replicas: connection -> ReplicaState (primary side)
+        master: (host, port) of the primary, None if this is a primary
+    """
+
+    BACKLOG_SIZE = 1024 * 1024
+    SYNC_CHUNK = 64 * 1024
+    ACK_INTERVAL = 1.0
+    RETRY_DELAY = 1.0
+
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.db = executor.db
+        self.replid = secrets.token_hex(20)
+        self.offset = 0
+        self.backlog: Optional[ReplicationBacklog] = None
+        self.replicas: dict = {}
+        self.listening_port = 0
+        self._sync_pid: Optional[int] = None     # BGSAVE started for a full sync (0: saved in process)
+
+        # replica side
+        self.master: Optional[tuple[str, int]] = None
+        self.readonly = False
+        self.master_replid = "?"
+        self.link: Optional[MasterLink] = None
+        self.link_status = "down"
+        self._connecting: Optional[asyncio.Task] = None
+        self._last_ack = 0.0
+
+
+    # =============== primary side =============== #
+
+
+    def handle(self, conn, name: str, args: list[str]) -> Optional[SimpleString]:
+        """REPLCONF and PSYNC of a replica; None: no reply (or already sent)"""
+
+        if name == "REPLCONF":
+            if not args or len(args) % 2:
+                raise ValueError("syntax error")
+            option = args[0].lower()
+
+            if option == "ack":
+                replica = self.replicas.get(conn)
+                if replica is not None:
+                    replica.ack_offset = int(args[1])
+                    replica.ack_time = time.time()
+                return None
+
+            if option == "listening-port":
+                self._replica(conn).port = int(args[1])
+            # other options (capa, ip-address) are accepted and ignored
+            return SimpleString("OK")
+
+        # PSYNC replid offset
+        if len(args) != 2:
+            raise ValueError("wrong number of arguments for 'psync' command")
+        if self.master is not None:
+            raise ValueError("chained replication is not supported: PSYNC the primary")
+
+        replid, offset = args[0], int(args[1])
+        replica = self._replica(conn)
+        if self.backlog is None:
+            self.backlog = ReplicationBacklog(self.BACKLOG_SIZE, self.offset)
+
+        if replid == self.replid and self.backlog.covers(offset):
+            conn.send(b"+CONTINUE %s\r\n" % self.replid.encode())
+            if offset < self.offset:
+                conn.send(self.backlog.read(offset))
+            replica.state = "online"
+            print(f"✓ Replica {conn.addr} resynced from offset {offset} ({self.offset - offset} bytes)")
+            return None
+
+        replica.state = "wait_bgsave"
+        print(f"ℹ Replica {conn.addr} needs a full sync")
+        self._start_sync()
+        return None
+
+
+    def _replica(self, conn) -> ReplicaState:
+        replica = self.replicas.get(conn)
+        if replica is None:
+            replica = self.replicas[conn] = ReplicaState(conn)
+        return replica
+
+
+    def feed(self, data: bytes) -> None:
+        """a write logged by the executor, already encoded"""
+
+        self.backlog.append(data)
+        self.offset += len(data)
+
+        for replica in self.replicas.values():
+            if replica.state == "online":
+                replica.conn.send(data)
+            elif replica.state in ("bgsave", "send_bulk"):
+                replica.pending.append(data)
+
+
+    def drop(self, conn) -> None:
+        """a replica (or a client that sent REPLCONF) went away"""
+
+        replica = self.replicas.pop(conn, None)
+        if replica is not None and replica.rdb is not None:
+            replica.rdb.close()
+            replica.rdb = None
+        if replica is not None and replica.state != "handshake":
+            print(f"✗ Replica {conn.addr} disconnected")
+
+
+    def _start_sync(self) -> None:
+        """start a BGSAVE for the replicas waiting for a full sync"""
+
+        waiting = [replica for replica in self.replicas.values() if replica.state == "wait_bgsave"]
+        persistence = self.db.persistence
+        if not waiting or self._sync_pid is not None or persistence.bgsave_pid is not None:
+            # a periodic BGSAVE started before them is no use: retried by cron()
+            return
+        if not persistence.start_bgsave(self.db):
+            return
+
+        self._sync_pid = persistence.bgsave_pid or 0
+        for replica in waiting:
+            # their stream starts at the fork
+            replica.state = "bgsave"
+            replica.pending = []
+            replica.conn.send(b"+FULLRESYNC %s %d\r\n" % (self.replid.encode(), self.offset))
+
+        if self._sync_pid == 0:
+            self._send_snapshot()
+
+
+    def _send_snapshot(self) -> None:
+        """the BGSAVE is done: send it, then the writes done since the fork"""
+
+        self._sync_pid = None
+        syncing = [replica for replica in self.replicas.values() if replica.state == "bgsave"]
+        persistence = self.db.persistence
+
+        if persistence.last_bgsave_status != "ok":
+            print("✗ Full sync failed: BGSAVE error")
+            for replica in syncing:
+                replica.conn.close()
+            return
+
+        for replica in syncing:
+            # one file object each: a later BGSAVE replaces the file, not
+            # the one already open
+            try:
+                replica.rdb = open(persistence.rdb_path, "rb")
+            except OSError as e:
+                print(f"✗ Full sync failed: {e}")
+                replica.conn.close()
+                continue
+            size = os.fstat(replica.rdb.fileno()).st_size
+            replica.state = "send_bulk"
+            replica.conn.send(b"$%d\r\n" % size)
+            self.pump(replica.conn)
+
+
+    def pump(self, conn) -> None:
+        """
+        send the dump to a replica in send_bulk while its transport
+        takes it: stops when the transport pauses writing, resumed by
+        the connection when it drains (resume_writing)
+        """
+
+        replica = self.replicas.get(conn)
+        if replica is None or replica.rdb is None:
+            return
+
+        conn.flush()
+        while not conn.write_paused and not conn.closed:
+            chunk = replica.rdb.read(self.SYNC_CHUNK)
+            if not chunk:
+                break
+            conn.write_bytes(chunk)
+        if conn.write_paused or conn.closed:
+            return
+
+        size = replica.rdb.tell()
+        replica.rdb.close()
+        replica.rdb = None
+        if replica.pending:
+            conn.send(b"".join(replica.pending))
+        replica.pending = None
+        replica.state = "online"
+        print(f"✓ Full sync of replica {conn.addr} sent ({size} bytes)")
+
+
+    # =============== replica side =============== #
+
+
+    def replicaof(self, host: Optional[str], port: int = 0) -> None:
+        """follow host:port, or become a primary again with host None (REPLICAOF NO ONE)"""
+
+        if host is None:
+            if self.master is None:
+                return
+            self._disconnect()
+            self.master = None
+            self.readonly = False
+            self.executor.replaying = False
+            # a new history: the old primary's replicas must sync again
+            self.replid = secrets.token_hex(20)
+            self.backlog = None
+            print("✓ Replication stopped: this server is a primary")
+            return
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            raise ValueError("REPLICAOF needs the asyncio server")
+
+        if self.master == (host, port):
+            return
+
+        self._disconnect()
+        for replica in list(self.replicas.values()):
+            replica.conn.close()
+
+        self.master = (host, port)
+        self.backlog = None
+        self.readonly = True
+        # the stream already went through the primary's eviction
+        self.executor.replaying = True
+        self.master_replid = "?"
+        self.offset = -1
+        self._connect()
+        print(f"✓ Replica of {host}:{port}")
+
+
+    def _connect(self) -> None:
+        master = self.master
+        self.link_status = "connect"
+
+        async def _retry():
+            loop = asyncio.get_running_loop()
+            while self.master == master and self.link is None:
+                try:
+                    await loop.create_connection(lambda: MasterLink(self), *master)
+                    return
+                except OSError as e:
+                    print(f"✗ Primary {master[0]}:{master[1]} unreachable ({e}), retrying")
+                    await asyncio.sleep(self.RETRY_DELAY)
+
+        self._connecting = asyncio.get_running_loop().create_task(_retry())
+
+
+    def _disconnect(self) -> None:
+        if self._connecting is not None:
+            self._connecting.cancel()
+            self._connecting = None
+        if self.link is not None:
+            link, self.link = self.link, None
+            link.transport.close()
+        self.link_status = "down"
+
+
+    def link_lost(self, link: "MasterLink") -> None:
+        if self.link is not link:
+            return
+        self.link = None
+        self.link_status = "down"
+        if link.state != "stream":
+            # the dataset is not the primary's: no partial sync from here
+            self.master_replid = "?"
+            self.offset = -1
+        if self.master is not None:
+            print(f"✗ Lost the primary {self.master[0]}:{self.master[1]}, reconnecting")
+            asyncio.get_running_loop().call_later(self.RETRY_DELAY, self._reconnect)
+
+
+    def _reconnect(self) -> None:
+        if self.master is not None and self.link is None:
+            self._connect()
+
+
+    def load_sync(self, path: str) -> None:
+        """the dump of a full sync is in path: it replaces the dataset"""
+
+        db = self.db
+        started = time.time()
+
+        if db.loader is not None:
+            db.loader.close()
+            db.loader = None
+            db.data = {}
+        db.data.clear()
+        db.expires.clear()
+
+        keys = read_snapshot(path, db)
+        os.replace(path, db.persistence.rdb_path)
+        db.memory.recount()
+        self.executor.watches.touch_all()
+        if db.aof is not None:
+            db.aof.start_rewrite(db)
+
+        print(f"✓ Full sync loaded: {keys} keys ({time.time() - started:.2f}s)")
+
+
+    def apply(self, link: "MasterLink", data: bytes) -> None:
+        """run the commands of the stream received from the primary"""
+
+        parser = link.parser
+        parser.feed(data)
+        link.received += len(data)
+        executor = self.executor
+        executor.client_addr = "%s:%d" % self.master
+
+        for cmd in parser:
+            name = cmd[0].upper()
+            if name == "MULTI":
+                link.multi = []
+                continue
+            if link.multi is not None and name != "EXEC":
+                link.multi.append(cmd)
+                continue
+
+            # a MULTI block is applied whole, so clients never see half of it
+            batch = link.multi if name == "EXEC" else [cmd]
+            link.multi = None
+            for queued in batch:
+                try:
+                    executor.execute(queued)
+                except Exception as e:
+                    print(f"✗ Replication: error applying {queued[0]}: {e}")
+
+            # the offset moves only past what was applied
+            self.offset = link.stream_offset + link.received - (len(parser.buffer) - parser.pos)
+
+        if self.db.aof is not None:
+            self.db.aof.flush()
+
+
+    # =============== both =============== #
+
+
+    def cron(self) -> None:
+        """called by the server cron: full syncs waiting for a BGSAVE, ACKs to the primary"""
+
+        if self._sync_pid is not None:
+            if self.db.persistence.bgsave_pid != self._sync_pid:
+                # collected by check_bgsave()
+                self._send_snapshot()
+        elif self.replicas:
+            self._start_sync()
+
+        link = self.link
+        if link is not None and link.state == "stream":
+            now = time.time()
+            if now - self._last_ack >= self.ACK_INTERVAL:
+                self._last_ack = now
+                link.transport.write(RespEncoder.encode_command(["REPLCONF", "ACK", str(self.offset)]))
+
+
+    def info(self) -> dict:
+        """fields of the INFO replication section"""
+
+        fields = {"role": "slave" if self.master is not None else "master"}
+
+        if self.master is not None:
+            link = self.link
+            fields.update({
+                "master_host": self.master[0],
+                "master_port": self.master[1],
+                "master_link_status": "up" if link is not None and link.state == "stream" else "down",
+                "master_sync_in_progress": 1 if link is not None and link.state != "stream" else 0,
+                "slave_repl_offset": self.offset,
+                "slave_read_only": 1,
+            })
+
+        replicas = [replica for replica in self.replicas.values() if replica.state != "handshake"]
+        fields["connected_slaves"] = len(replicas)
+        now = time.time()
+        for i, replica in enumerate(replicas):
+            ip = replica.conn.addr.rsplit(":", 1)[0]
+            fields[f"slave{i}"] = (
+                f"ip={ip},port={replica.port},state={replica.state},"
+                f"offset={replica.ack_offset},lag={int(now - replica.ack_time)}"
+            )
+
+        backlog = self.backlog
+        fields.update({
+            "master_replid": self.replid,
+            "master_repl_offset": self.offset,
+            "repl_backlog_active": 1 if backlog is not None else 0,
+            "repl_backlog_size": self.BACKLOG_SIZE,
+            "repl_backlog_first_byte_offset": backlog.first_offset if backlog is not None else 0,
+            "repl_backlog_histlen": backlog.histlen if backlog is not None else 0,
+        })
+        return fields
+
+
+class MasterLink(asyncio.Protocol):
+    """
+    connection of a replica to its primary
+
+    state: "handshake" (replies to PING, REPLCONF, PSYNC), "payload"
+    (receiving the dump of a full sync), "stream" (applying writes)
+    """
+
+    def __init__(self, replication: Replication):
+        self.replication = replication
+        self.transport: asyncio.Transport = None
+        self.state = "handshake"
+        self.buffer = bytearray()
+        self.replies = 0
+
+        # full sync
+        self.payload_left = -1
+        self.payload_file = None
+        self.payload_path = ""
+
+        # stream
+        self.parser = RespParser()
+        self.received = 0
+        self.stream_offset = 0
+        self.multi: Optional[list[list[str]]] = None
+
+
+    def connection_made(self, transport):
+        repl = self.replication
+        self.transport = transport
+        repl.link = self
+        repl._connecting = None
+        repl.link_status = "sync"
+
+        transport.write(b"".join(RespEncoder.encode_command(cmd) for cmd in (
+            ["PING"],
+            ["REPLCONF", "listening-port", str(repl.listening_port)],
+            ["PSYNC", repl.master_replid, str(repl.offset)],
+        )))
+
+
+    def data_received(self, data: bytes):
+        if self.state == "stream":
+            self.replication.apply(self, data)
+            return
+
+        self.buffer += data
+        try:
+            self._advance()
+        except Exception as e:
+            print(f"✗ Replication: sync with the primary failed: {e}")
+            self.transport.close()
+
+
+    def _advance(self) -> None:
+        repl = self.replication
+
+        while self.state == "handshake":
+            line = self._line()
+            if line is None:
+                return
+            if line.startswith("-"):
+                raise ValueError(f"the primary replied {line[1:]}")
+            self.replies += 1
+            if self.replies < 3:
+                continue                        # +PONG, +OK
+
+            if line.startswith("+FULLRESYNC"):
+                _, repl.master_replid, offset = line.split()
+                self.stream_offset = int(offset)
+                self.state = "payload"
+            elif line.startswith("+CONTINUE"):
+                repl.master_replid = line.split()[1]
+                self.stream_offset = repl.offset
+                self._start_stream()
+            else:
+                raise ValueError(f"unexpected reply to PSYNC: {line}")
+
+        if self.state == "payload":
+            if self.payload_left < 0:
+                line = self._line()
+                if line is None:
+                    return
+                if not line.startswith("$"):
+                    raise ValueError(f"unexpected sync payload: {line}")
+                self.payload_left = int(line[1:])
+                self.payload_path = repl.db.persistence.rdb_path + ".sync"
+                self.payload_file = open(self.payload_path, "wb")
+
+            chunk = self.buffer[:self.payload_left]
+            self.payload_file.write(chunk)
+            self.payload_left -= len(chunk)
+            del self.buffer[:len(chunk)]
+            if self.payload_left:
+                return
+
+            self.payload_file.close()
+            self.payload_file = None
+            repl.load_sync(self.payload_path)
+            repl.offset = self.stream_offset
+            self._start_stream()
+
+
+    def _start_stream(self) -> None:
+        repl = self.replication
+        self.state = "stream"
+        repl.link_status = "up"
+        print(f"✓ Replication stream from {repl.master[0]}:{repl.master[1]} at offset {self.stream_offset}")
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            repl.apply(self, data)
+
+
+    def _line(self) -> Optional[str]:
+        end = self.buffer.find(b"\r\n")
+        if end == -1:
+            return None
+        line = self.buffer[:end].decode("utf-8", errors="replace")
+        del self.buffer[:end + 2]
+        return line
+
+
+    def connection_lost(self, exc):
+        if self.payload_file is not None:
+            self.payload_file.close()
+            self.payload_file = None
+            if os.path.exists(self.payload_path):
+                os.remove(self.payload_path)
+        self.replication.link_lost(self)
@@ -0,0 +1,209 @@
+"""
+SCAN family: cursors over the keyspace or over one container,
+and the Redis glob patterns of MATCH and KEYS
+"""
+
+import re
+import time
+from functools import lru_cache
+from typing import Callable, Optional
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern: str) -> Optional[Callable]:
+    """
+    Redis glob -> match function, None for "*" (everything matches)
+
+    *  any sequence    ?  one character    \\x  a literal x
+    [abc] [a-z] [^a]   a character class (^ negates)
+    """
+
+    if pattern == "*":
+        return None
+
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            out.append(".*")
+        elif c == "?":
+            out.append(".")
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        elif c == "[":
+            i += 1
+            negate = i < n and pattern[i] == "^"
+            if negate:
+                i += 1
+            parts = []
+            # like Redis, an unterminated class ends with the pattern
+            while i < n and pattern[i] != "]":
+                if pattern[i] == "\\" and i + 1 < n:
+                    i += 1
+                    parts.append(re.escape(pattern[i]))
+                elif i + 2 < n and pattern[i + 1] == "-" and pattern[i + 2] != "]":
+                    low, high = sorted((pattern[i], pattern[i + 2]))
+                    parts.append(f"{re.escape(low)}-{re.escape(high)}")
+                    i += 2
+                else:
+                    parts.append(re.escape(pattern[i]))
+                i += 1
+            if parts:
+                out.append(("[^" if negate else "[") + "".join(parts) + "]")
+            else:
+                out.append("." if negate else "(?!)")
+        else:
+            out.append(re.escape(c))
+        i += 1
+
+    return re.compile("".join(out), re.DOTALL).fullmatch
+
+
+class ScanState:
+    """a scan in progress: what is scanned and the snapshot of its keys"""
+
+    __slots__ = ("owner", "keys", "last_used")
+
+    def __init__(self, owner, keys: list):
+        self.owner = owner
+        self.keys = keys
+        self.last_used = time.monotonic()
+
+
+class ScanCursors:
+    """
+    Cursors of the SCAN commands.
+
+    A Python dict can't be walked bucket by bucket like the Redis
+    hash table, and a position in it shifts when keys before it are
+    deleted. So SCAN 0 takes a snapshot of the keys (one C-level
+    copy of the pointers, no strings are copied) and the cursor is
+    the scan id and a position in it: every call then visits COUNT
+    keys, skipping the ones deleted since. A key present during the
+    whole scan is returned exactly once; keys added after SCAN 0 may
+    be missed, which is what Redis guarantees too. A cursor can be
+    sent again (a client retrying) until the scan ends.
+
+    The snapshot is taken in one go, so SCAN 0 costs O(keys): about
+    20ms per million keys (twice that for a set), paid by that one
+    call (it shows in SLOWLOG and scan_snapshot_max_usec). It can't
+    be taken in bounded chunks across calls instead: iterating a dict
+    or set that changed since the last step raises, and resuming
+    from a position shifts like the cursor would. Chunking it would
+    take a keyspace with its own stable slots (an incremental rehash
+    like Redis), a cost on every write for the sake of SCAN.
+
+    Small containers are returned whole with cursor 0, without a
+    snapshot. Finished scans are dropped, abandoned ones after
+    IDLE_TIMEOUT seconds. The snapshots together hold at most
+    MAX_RETAINED_KEYS keys (8 bytes each): past that a new scan is
+    refused with an error the client can retry, a scan in progress
+    is never dropped to make room for another one.
+
+    Attributes:
+        states: scan id -> ScanState, least recently used first
+        retained: keys held by the snapshots of the open scans
+    """
+
+    MAX_RETAINED_KEYS = 4 * 1024 * 1024
+    IDLE_TIMEOUT = 300.0
+    POS_BITS = 32           # cursor = scan id << POS_BITS | position
+    MAX_ID = 1 << 24        # ids wrap: cursors stay below 2**56
+
+
+    def __init__(self):
+        self.states: dict[int, ScanState] = {}
+        self.retained = 0
+        self._last_id = 0
+
+        # stats
+        self.snapshots = 0
+        self.dropped = 0
+        self.max_snapshot_usec = 0
+
+
+    def scan(self, owner, container, cursor: int, count: int, whole_below: int = 0) -> tuple[int, list]:
+        """
+        next keys of a scan
+
+        args:
+            owner: what is scanned (None for the keyspace, the key for
+                HSCAN & co): a cursor can't be reused on something else
+            container: dict (or set) being scanned
+            cursor: 0 to start, then the returned cursor
+            count: keys visited by this call
+            whole_below: containers up to this size are returned in one call
+
+        return:
+            (next cursor, 0 when done; keys still in the container)
+
+        raises:
+            ValueError: unknown or expired cursor
+        """
+
+        if cursor == 0:
+            if len(container) <= max(count, whole_below):
+                return 0, list(container)
+            scan_id, pos = self._open(owner, container), 0
+        else:
+            scan_id, pos = cursor >> self.POS_BITS, cursor & ((1 << self.POS_BITS) - 1)
+
+        state = self.states.get(scan_id)
+        if state is None or state.owner != owner:
+            raise ValueError("invalid cursor")
+        # re-inserted below: the most recently used scan goes last
+        del self.states[scan_id]
+        state.last_used = time.monotonic()
+
+        keys = state.keys
+        end = pos + count
+        batch = [key for key in keys[pos:end] if key in container]
+
+        if end >= len(keys):
+            # done: the snapshot is released
+            self.retained -= len(keys)
+            return 0, batch
+
+        self.states[scan_id] = state
+        return scan_id << self.POS_BITS | end, batch
+
+
+    def _open(self, owner, container) -> int:
+        states = self.states
+        now = time.monotonic()
+
+        # least recently used first: drop the abandoned scans
+        while states:
+            oldest = next(iter(states))
+            if now - states[oldest].last_used < self.IDLE_TIMEOUT:
+                break
+            self.retained -= len(states.pop(oldest).keys)
+            self.dropped += 1
+
+        # checked before copying; a scan alone can always start
+        if states and self.retained + len(container) > self.MAX_RETAINED_KEYS:
+            raise ValueError("too many scans in progress, try again later")
+
+        start = time.perf_counter_ns()
+        keys = list(container)
+        self.max_snapshot_usec = max(self.max_snapshot_usec, (time.perf_counter_ns() - start) // 1000)
+        self.retained += len(keys)
+        self.snapshots += 1
+        self._last_id = self._last_id % (self.MAX_ID - 1) + 1
+        states[self._last_id] = ScanState(owner, keys)
+        return self._last_id
+
+
+    def info(self) -> dict:
+        """scan fields for INFO stats"""
+
+        return {
+            "scan_cursors": len(self.states),
+            "scan_retained_keys": self.retained,
+            "scan_snapshots": self.snapshots,
+            "scan_cursors_dropped": self.dropped,
+            "scan_snapshot_max_usec": self.max_snapshot_usec,
+        }
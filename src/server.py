@@ -1,44 +1,63 @@
 import socket
-from parser import AsciiParser, Encoder
 from commands import CommandExecutor
+from connection import ClientConnection
 from photondb import PhotonDB
-import threading
+from value import clock
 
 import time
 
+
+class SocketConnection(ClientConnection):
+    """ClientConnection on a plain socket (select server)"""
+
+    def __init__(self, server, client_socket: socket.socket, addr: str = ""):
+        super().__init__(server, addr)
+        self.sock = client_socket
+
+
+    def write_bytes(self, data: bytes) -> None:
+        self.server.send_to_client(self.sock, data)
+        self.executor.stats.net_output_bytes += len(data)
+
+
+    def close_transport(self) -> None:
+        self.sock.close()
+
+
 class PhotonDBServer:
-    def __init__(self, host: str = '0.0.0.0', port: int = 6379):
+    def __init__(self, host: str = '0.0.0.0', port: int = 6379, db: PhotonDB = None):
         self.host = host
         self.port = port
         self.server_socket = None
-        self.clients = {}
+        self.clients: dict[socket.socket, SocketConnection] = {}
         
-        self.db = PhotonDB()
+        self.db = db if db is not None else PhotonDB()
         self.command_executor = CommandExecutor(self.db)
+        self.command_executor.replication.listening_port = port
+        self.command_executor.stats.tcp_port = port
+        self.command_executor.stats.mode = "select"
         
-        # ← AGGIUNGI QUESTE RIGHE
         self.save_interval = 30  # Salva ogni 30 secondi
-        self.save_thread = None
+        self.cron_interval = 0.1  # expiry cycle, 10 times per second
         self.running = False
 
+        # connections with replies waiting in their write buffer
+        self.pending_writes: set[ClientConnection] = set()
+        self._last_save = time.time()
+        self._last_cron = 0.0
+
     def start(self):
         """create server socket and start SELECT's loop"""
         
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
+        self.server_socket.listen(128)
         
-        print(f"🚀 PhotonDB Server listening on {self.host}:{self.port}")
+        print(f"🚀 PhotonDB Server listening on {self.host}:{self.port} (select)")
         print(f"   Auto-save enabled (every {self.save_interval}s)\n")
         
-        # ← NUOVO: Avvia il thread di background saving
         self.running = True
-        self.save_thread = threading.Thread(
-            target=self._background_save_loop,
-            daemon=True  # Thread daemon = muore quando main thread muore
-        )
-        self.save_thread.start()
         
         import select
         
@@ -48,14 +67,21 @@ class PhotonDBServer:
                     [self.server_socket] + list(self.clients.keys()),
                     [],
                     [],
-                    1.0
+                    0 if self.db.loader is not None else self.cron_interval
                 )
                 
                 for sock in readable:
                     if sock is self.server_socket:
                         self.handle_new_connection()
-                    else:
+                    elif sock in self.clients:
                         self.handle_client_data(sock)
+
+                # one write per client for everything executed in this iteration
+                self.flush_pending()
+                self._cron()
+
+                # lazy snapshot load, a slice per iteration
+                self.db.loading_step()
         
         except KeyboardInterrupt:
             print("\n🛑 Server stopping...")
@@ -69,17 +95,20 @@ class PhotonDBServer:
 
         print(f"✓ Client connected: {client_host}:{client_port}")
     
-        return client_socket
+        return client_socket, f"{client_host}:{client_port}"
     
 
 
-    def receive_from_client(self, client_socket: socket.socket, buffer_size: int = 4096) -> str:
+    def receive_from_client(self, client_socket: socket.socket, buffer_size: int = 65536) -> bytes:
         """receive data from client's socket"""
 
 
 
-        """receive max 4096byte from client"""
-        data = client_socket.recv(4096)
+        """receive max buffer_size bytes from client, a pipelined batch fits in one read"""
+        try:
+            data = client_socket.recv(buffer_size)
+        except ConnectionError:
+            return None
 
         
         """ ## """
@@ -87,59 +116,85 @@ class PhotonDBServer:
             return None
         
 
-        """decode data in UTF8"""
-        
-        command_text = data.decode('utf-8', errors='ignore')
+        """raw bytes: the parser decodes them (RESP bulk strings are binary-safe)"""
 
-        return command_text 
+        return data
     
 
-    def send_to_client(self, client_socket: socket.socket, response: str):
+    def send_to_client(self, client_socket: socket.socket, response: bytes):
         """send a response to client"""
 
-        response_bytes = response.encode('utf-8')
-        client_socket.sendall(response_bytes)
-
-        print(f"→ Sent to client: {response}")   
+        try:
+            client_socket.sendall(response)
+        except OSError:
+            # the client is gone, the next recv() will report it
+            pass
 
 
     def handle_new_connection(self):
         """new conn in"""
-        client_socket = self.accept_client()
-        self.clients[client_socket] = ""
+        client_socket, addr = self.accept_client()
+        self.clients[client_socket] = SocketConnection(self, client_socket, addr)
+        self.command_executor.stats.client_connected()
 
     def handle_client_data(self, client_socket: socket.socket):
         """receive data from client -> in buffer ##"""
         
+        conn = self.clients[client_socket]
         data = self.receive_from_client(client_socket)
         
         if not data:
             print(f"✗ Client disconnected")
             client_socket.close()
-            del self.clients[client_socket]
+            conn.connection_lost()
             return
         
-        # Accumula nel buffer
-        self.clients[client_socket] += data
-        
-        # ← NUOVO: Processa comandi
-        self._process_buffer(client_socket)
+        # parse + exec, replies are queued until flush_pending()
+        self.command_executor.stats.net_input_bytes += len(data)
+        conn.feed(data)
+
+
+    def schedule_flush(self, conn: ClientConnection):
+        """called by a connection when its write buffer is not empty"""
+        self.pending_writes.add(conn)
+
+
+    def flush_pending(self):
+        """write the buffered replies of every connection"""
+
+        if not self.pending_writes:
+            return
+
+        # the writes hit the AOF before the clients see their replies
+        if self.db.aof is not None:
+            self.db.aof.flush()
+
+        pending = self.pending_writes
+        self.pending_writes = set()
+        for conn in pending:
+            conn.flush()
+
+
+    def remove_client(self, conn: ClientConnection):
+        if self.clients.pop(conn.sock, None) is not None:
+            self.command_executor.stats.client_disconnected()
+        self.pending_writes.discard(conn)
 
     def stop(self):
         """stop the server and close all the connection"""
         
         self.running = False
         
-        if self.save_thread and self.save_thread.is_alive():
-            self.save_thread.join(timeout=2)
-        
         # ← CORRETTO: Passa self.db
         print("\n💾 Final save before shutdown...")
+        self.db.persistence.wait_bgsave()
         self.db.persistence.save_snapshot(self.db)
+        if self.db.aof is not None:
+            self.db.aof.close()
         
         # Chiudi tutti i client
-        for sock in list(self.clients.keys()):
-            sock.close()
+        for conn in list(self.clients.values()):
+            conn.close()
         
         # Chiudi il server socket
         if self.server_socket:
@@ -148,71 +203,25 @@ class PhotonDBServer:
         print("✓ Server stopped")
 
 
+    def _cron(self):
+        """periodic work, run from the loop so it never races command execution"""
 
+        now = time.time()
 
-    def _process_buffer(self, client_socket: socket.socket):
-        """process commands from buffer"""
-        
-        buffer = self.clients[client_socket]
-        
-        # Cerca linee complete
-        while '\n' in buffer:
-            # Separa in modo sicuro
-            parts = buffer.split('\n', 1)
-            
-            if len(parts) != 2:
-                break
-            
-            line = parts[0].strip()
-            buffer = parts[1]
-            
-            if not line:
-                continue
-            
-            self._execute_command(client_socket, line)
-        
-        self.clients[client_socket] = buffer
-
-
+        if now - self._last_cron >= self.cron_interval:
+            self._last_cron = now
+            clock.tick()
+            self.db.cleanup_expired_keys()
+            self.command_executor.blocking.expire()
+            self.db.persistence.check_bgsave()
+            self.command_executor.replication.cron()
+            self.command_executor.stats.cron()
+            if self.db.aof is not None:
+                self.db.aof.cron(self.db)
 
-
-    def _execute_command(self, client_socket: socket.socket, command_line: str):
-        """parse and exec commands"""
-        
-        try:
-            # Parsa la linea ASCII
-            cmd = AsciiParser.parse_ascii_command(command_line)
-            
-            # Esegui con CommandExecutor
-            result = self.command_executor.execute(cmd)
-            
-            # Formatta la risposta
-            response = Encoder.format_response(result)
-            
-            # Invia al client
-            self.send_to_client(client_socket, response + "\n")
-        
-        except Exception as e:
-            error_response = f"ERROR: {str(e)}"
-            self.send_to_client(client_socket, error_response+"\n") 
-
-
-
-        
-    def _background_save_loop(self):
-        """thread loop to save db in rdb"""
-        
-        while self.running:
+        if now - self._last_save >= self.save_interval and self.db.loader is None:
+            self._last_save = now
             try:
-                for _ in range(self.save_interval):
-                    if not self.running:
-                        break
-                    import time
-                    time.sleep(1)
-                
-                if self.running:
-                   
-                    self.db.persistence.save_snapshot(self.db)
-            
+                self.db.persistence.start_bgsave(self.db)
             except Exception as e:
-                print(f"✗ Error in background save: {e}")
\ No newline at end of file
+                print(f"✗ Error in background save: {e}")
@@ -0,0 +1,712 @@
+"""
+Sharded mode: N worker processes, each one owning a
+hash-partitioned slice of the keyspace
+
+    clients ──► router(s) :6379 ──► shard 0  127.0.0.1:7000  data/shard-0/
+                   (SO_REUSEPORT)  ├► shard 1  127.0.0.1:7001  data/shard-1/
+                                   └► ...
+
+Every shard is a normal PhotonDB asyncio server with its own
+snapshot. The routers parse the requests, send single-key commands
+to the owning shard and scatter/gather the multi-key ones.
+Routers and shards are separate processes, so the work is spread
+on all the cores; more routers can share the public port.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import zlib
+from collections import deque
+from typing import Callable, Optional
+
+from commands import lookup_command
+from connection import FORWARD_COMMAND, ClientConnection
+from blocking import BLOCKING_COMMANDS
+from multi import MULTI_COMMANDS
+from replication import REPLICATION_COMMANDS
+from parser import ProtocolError, RespEncoder, RespReplyParser, ReplyError, SimpleString
+from pubsub import PUBSUB_COMMANDS
+
+
+def key_shard(key: str, shards: int) -> int:
+    """
+    shard owning a key: crc32 of the key, or of the
+    {hash tag} part if present, so related keys can be
+    kept together ("{user:1}:name", "{user:1}:email")
+    """
+
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+
+    return zlib.crc32(key.encode("utf-8", errors="surrogateescape")) % shards
+
+
+# =============== routing table =============== #
+
+
+def _sum(replies: list):
+    return sum(replies)
+
+
+def _first(replies: list):
+    return replies[0]
+
+
+def _concat(replies: list):
+    merged = []
+    for reply in replies:
+        merged.extend(reply)
+    return merged
+
+
+def _min(replies: list):
+    return min(replies)
+
+
+def _info(replies: list):
+    return "\r\n".join(f"# Shard {index}\r\n{reply}" for index, reply in enumerate(replies))
+
+
+def _slowlog(replies: list):
+    """LEN: summed, GET: the entries of every shard, newest first, RESET: OK"""
+
+    if isinstance(replies[0], int):
+        return sum(replies)
+    if isinstance(replies[0], list):
+        return sorted(_concat(replies), key=lambda entry: entry[1], reverse=True)
+    return replies[0]
+
+
+# keyless commands sent to every shard, with the function merging the replies
+# (the other keyless commands are answered by shard 0)
+BROADCAST_COMMANDS: dict[str, Callable] = {
+    "DBSIZE": _sum,
+    "FLUSHDB": _first,
+    "KEYS": _concat,
+    "SAVE": _first,
+    "BGSAVE": _first,
+    "BGREWRITEAOF": _first,
+    "LASTSAVE": _min,
+    "INFO": _info,
+    "SLOWLOG": _slowlog,
+    "CONFIG": _first,
+}
+
+def _ordered(replies: list, positions: list[list[int]]):
+    """MGET: the values back in the order of the keys"""
+
+    merged = [None] * sum(map(len, positions))
+    for reply, shard_positions in zip(replies, positions):
+        for position, item in zip(shard_positions, reply):
+            merged[position] = item
+    return merged
+
+
+# commands with more keys (positions from the command table), split by shard:
+# merge(replies, positions), positions[i] = indexes of the keys sent to the i-th shard
+MULTI_KEY_COMMANDS: dict[str, Callable] = {
+    "DEL": lambda replies, positions: _sum(replies),
+    "MGET": _ordered,
+    "MSET": lambda replies, positions: _first(replies),
+}
+
+
+# state kept by the process the client is connected to: Pub/Sub subscribers
+# aren't shared by the routers, a parked BLPOP would hold up the link the
+# other clients share, and a shard is not a replication primary
+LOCAL_COMMANDS = (
+    PUBSUB_COMMANDS | BLOCKING_COMMANDS | REPLICATION_COMMANDS
+    | {"PUBLISH", "PUBSUB", "REPLICAOF", "SLAVEOF"}
+)
+
+
+# =============== router side =============== #
+
+
+class ReplySlot:
+    """placeholder for a reply that may not have arrived yet"""
+
+    __slots__ = ("value", "done", "callback")
+
+    def __init__(self, callback: Optional[Callable] = None):
+        self.value = None
+        self.done = False
+        self.callback = callback
+
+
+    def resolve(self, value) -> None:
+        self.value = value
+        self.done = True
+        if self.callback is not None:
+            self.callback(value)
+
+
+class GatherSlot(ReplySlot):
+    """resolved when all the parts are, with the merged replies"""
+
+    __slots__ = ("parts", "remaining", "merge")
+
+    def __init__(self, count: int, merge: Callable):
+        super().__init__()
+        self.parts = [None] * count
+        self.remaining = count
+        self.merge = merge
+
+
+    def part(self, index: int) -> ReplySlot:
+        def _done(value):
+            self.parts[index] = value
+            self.remaining -= 1
+            if self.remaining == 0:
+                self._merge()
+
+        return ReplySlot(_done)
+
+
+    def _merge(self) -> None:
+        for value in self.parts:
+            if isinstance(value, Exception):
+                self.resolve(value)
+                return
+        try:
+            self.resolve(self.merge(self.parts))
+        except Exception as e:
+            self.resolve(e)
+
+
+class ShardLink(asyncio.Protocol):
+    """
+    pipelined connection from a router to one shard:
+    replies come back in request order, so a FIFO of
+    slots is enough to match them. The commands of all
+    the clients share it: when they change client, a
+    FORWARDED addr goes first, so the shard's SLOWLOG
+    shows the client and not the link
+    """
+
+    def __init__(self, index: int, router: "ShardRouter"):
+        self.index = index
+        self.router = router
+        self.transport: asyncio.Transport = None
+        self.parser = RespReplyParser()
+        self.waiting: deque[ReplySlot] = deque()
+        self.output: list[bytes] = []
+        self.client_addr: Optional[str] = None     # last one forwarded on this connection
+
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client_addr = None
+        transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+    def request(self, args: list[str], slot: ReplySlot) -> None:
+        if self.transport is None or self.transport.is_closing():
+            slot.resolve(ReplyError(f"ERR shard {self.index} is not available"))
+            return
+
+        addr = self.router.client_addr
+        if addr != self.client_addr:
+            self.client_addr = addr
+            self.waiting.append(ReplySlot())
+            self.output.append(RespEncoder.encode_command([FORWARD_COMMAND, addr]))
+
+        self.waiting.append(slot)
+        self.output.append(RespEncoder.encode_command(args))
+        self.router.schedule_flush(self)
+
+
+    def flush(self) -> None:
+        if self.output and self.transport is not None:
+            data = b"".join(self.output)
+            self.output.clear()
+            self.transport.write(data)
+
+
+    def data_received(self, data: bytes):
+        self.parser.feed(data)
+        try:
+            for reply in self.parser.replies():
+                self.waiting.popleft().resolve(reply)
+        except ProtocolError as e:
+            # can't tell the replies apart any more: connection_lost() fails the waiting ones
+            print(f"✗ Shard {self.index}: protocol error: {e}")
+            self.transport.close()
+
+
+    def connection_lost(self, exc):
+        print(f"✗ Lost connection to shard {self.index}")
+        self.transport = None
+        while self.waiting:
+            self.waiting.popleft().resolve(ReplyError(f"ERR shard {self.index} connection lost"))
+        self.router.reconnect(self.index)
+
+
+class RouterConnection(ClientConnection):
+    """
+    client of a router: commands are forwarded, and the replies
+    are written back in order even when they come from
+    different shards
+    """
+
+    def __init__(self, server: "ShardRouter", transport: asyncio.Transport, addr: str = ""):
+        super().__init__(server, addr)
+        self.transport = transport
+        self.slots: deque[ReplySlot] = deque()
+        self.queued: Optional[list[list[str]]] = None    # commands since MULTI
+        self.queue_failed = False
+
+
+    def feed(self, data: bytes) -> None:
+        self.parser.feed(data)
+        # forwarded to the shards with the commands routed below
+        self.server.client_addr = self.addr
+
+        try:
+            for cmd in self.parser:
+                if self.queued is not None or cmd[0].upper() in MULTI_COMMANDS:
+                    slot = self._transaction(cmd)
+                else:
+                    slot = self.server.route(cmd)
+                self.slots.append(slot)
+                if not slot.done:
+                    slot.callback = self._on_reply
+
+        except ProtocolError as e:
+            slot = ReplySlot()
+            slot.resolve(ReplyError(f"Protocol error: {e}"))
+            self.slots.append(slot)
+            self._drain()
+            self.close()
+            return
+
+        self._drain()
+
+
+    def _on_reply(self, value) -> None:
+        self._drain()
+
+
+    def _transaction(self, cmd: list[str]) -> ReplySlot:
+        """
+        MULTI is queued here and EXEC sends the whole block to
+        the shard owning its keys, where it runs atomically.
+        A block spanning shards is refused (CROSSSLOT); WATCH
+        would need a connection of its own to the shard.
+        """
+
+        name = cmd[0].upper()
+        slot = ReplySlot()
+
+        if name == "MULTI":
+            if self.queued is not None:
+                slot.resolve(ReplyError("ERR MULTI calls can not be nested"))
+            else:
+                self.queued = []
+                self.queue_failed = False
+                slot.resolve(SimpleString("OK"))
+
+        elif name == "DISCARD":
+            if self.queued is None:
+                slot.resolve(ReplyError("ERR DISCARD without MULTI"))
+            else:
+                self.queued = None
+                slot.resolve(SimpleString("OK"))
+
+        elif name == "WATCH":
+            slot.resolve(ReplyError("ERR WATCH is not supported in sharded mode"))
+
+        elif name == "UNWATCH":
+            slot.resolve(SimpleString("OK"))
+
+        elif name == "EXEC":
+            if self.queued is None:
+                slot.resolve(ReplyError("ERR EXEC without MULTI"))
+                return slot
+            queued, self.queued = self.queued, None
+            if self.queue_failed:
+                slot.resolve(ReplyError("EXECABORT Transaction discarded because of previous errors."))
+                return slot
+            return self.server.route_transaction(queued)
+
+        else:
+            spec = lookup_command(name)
+            if spec is None or not spec.check_arity(len(cmd)):
+                self.queue_failed = True
+                slot = self.server.route(cmd)       # the same error as outside MULTI
+            else:
+                self.queued.append(cmd)
+                slot.resolve(SimpleString("QUEUED"))
+
+        return slot
+
+
+    def _drain(self) -> None:
+        slots = self.slots
+        while slots and slots[0].done:
+            value = slots.popleft().value
+            if isinstance(value, Exception):
+                self.output.append(self.encode_error(str(value)))
+            else:
+                self.output.append(self.encode(value))
+
+        if self.output:
+            self.server.schedule_flush(self)
+
+
+    def write_bytes(self, data: bytes) -> None:
+        self.transport.write(data)
+
+
+    def close_transport(self) -> None:
+        self.transport.close()
+
+
+class RouterProtocol(asyncio.Protocol):
+
+    def __init__(self, router: "ShardRouter"):
+        self.router = router
+        self.conn: RouterConnection = None
+
+
+    def connection_made(self, transport):
+        peer = transport.get_extra_info("peername")
+        addr = f"{peer[0]}:{peer[1]}" if peer else ""
+        self.conn = RouterConnection(self.router, transport, addr)
+        self.router.add_client(self.conn)
+
+
+    def data_received(self, data: bytes):
+        self.conn.feed(data)
+
+
+    def connection_lost(self, exc):
+        self.conn.connection_lost()
+
+
+class ShardRouter:
+    """front process: accepts clients and routes their commands to the shards"""
+
+    def __init__(self, host: str, port: int, shard_ports: list[int], reuse_port: bool = False):
+        self.host = host
+        self.port = port
+        self.shard_ports = shard_ports
+        self.reuse_port = reuse_port
+        self.command_executor = None
+        self.client_addr = ""     # of the client whose commands are being routed
+
+        self.links: list[ShardLink] = [None] * len(shard_ports)
+        self.clients: dict[int, ClientConnection] = {}
+        self.pending_writes: set = set()
+        self.loop: asyncio.AbstractEventLoop = None
+        self._flush_scheduled = False
+
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+        for index in range(len(self.shard_ports)):
+            await self._connect(index)
+
+        server = await self.loop.create_server(
+            lambda: RouterProtocol(self),
+            self.host,
+            self.port,
+            reuse_address=True,
+            reuse_port=self.reuse_port or None,
+            backlog=511,
+        )
+
+        print(f"🔀 Router (pid {os.getpid()}) listening on {self.host}:{self.port}, {len(self.links)} shards")
+
+        async with server:
+            await server.serve_forever()
+
+
+    async def _connect(self, index: int, attempts: int = 100):
+        for _ in range(attempts):
+            try:
+                _, link = await self.loop.create_connection(
+                    lambda: ShardLink(index, self), "127.0.0.1", self.shard_ports[index]
+                )
+                self.links[index] = link
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        raise ConnectionError(f"shard {index} on port {self.shard_ports[index]} is not reachable")
+
+
+    def reconnect(self, index: int):
+        async def _retry():
+            try:
+                await self._connect(index)
+                print(f"✓ Reconnected to shard {index}")
+            except ConnectionError as e:
+                print(f"✗ {e}")
+
+        if self.loop.is_running():
+            self.loop.create_task(_retry())
+
+
+    # =============== routing =============== #
+
+
+    def route(self, cmd: list[str]) -> ReplySlot:
+        name = cmd[0].upper()
+        shards = len(self.links)
+        spec = lookup_command(name)
+
+        if spec is None or not spec.check_arity(len(cmd)):
+            # same errors as a shard, without the round trip
+            slot = ReplySlot()
+            if spec is None:
+                slot.resolve(ReplyError(f"ERR unknown command '{cmd[0]}'"))
+            else:
+                slot.resolve(ReplyError(f"ERR wrong number of arguments for '{cmd[0].lower()}' command"))
+            return slot
+
+        if name == "PING":
+            slot = ReplySlot()
+            slot.resolve(cmd[1] if len(cmd) > 1 else SimpleString("PONG"))
+            return slot
+
+        if name in LOCAL_COMMANDS:
+            slot = ReplySlot()
+            slot.resolve(ReplyError(f"ERR {name} is not supported in sharded mode"))
+            return slot
+
+        if name == "SCAN":
+            return self.route_scan(cmd)
+
+        if name in BROADCAST_COMMANDS:
+            slot = GatherSlot(shards, BROADCAST_COMMANDS[name])
+            for index, link in enumerate(self.links):
+                link.request(cmd, slot.part(index))
+            return slot
+
+        keys = spec.keys(cmd)
+
+        if name in MULTI_KEY_COMMANDS and len(keys) > 1:
+            # each key with the arguments following it (MSET: its value)
+            step = spec.step
+            by_shard: dict[int, tuple[list[str], list[int]]] = {}
+            for position, key in enumerate(keys):
+                args, positions = by_shard.setdefault(key_shard(key, shards), ([cmd[0]], []))
+                start = spec.first_key + position * step
+                args.extend(cmd[start:start + step])
+                positions.append(position)
+
+            merge = MULTI_KEY_COMMANDS[name]
+            positions = [shard_positions for _, shard_positions in by_shard.values()]
+            slot = GatherSlot(len(by_shard), lambda replies: merge(replies, positions))
+            for i, (index, (args, _)) in enumerate(by_shard.items()):
+                self.links[index].request(args, slot.part(i))
+            return slot
+
+        if len(keys) > 1 and len({key_shard(key, shards) for key in keys}) > 1:
+            # all or nothing (MSETNX): can't be split between shards
+            slot = ReplySlot()
+            slot.resolve(ReplyError("CROSSSLOT Keys in request don't hash to the same slot"))
+            return slot
+
+        # single-key command (or no key at all: any shard can answer)
+        index = key_shard(keys[0], shards) if keys else 0
+        slot = ReplySlot()
+        self.links[index].request(cmd, slot)
+        return slot
+
+
+    def route_scan(self, cmd: list[str]) -> ReplySlot:
+        """
+        SCAN walks the shards one after the other:
+        router cursor = shard cursor * shards + shard index
+        """
+
+        shards = len(self.links)
+        if not cmd[1].isdigit():
+            slot = ReplySlot()
+            slot.resolve(ReplyError("ERR invalid cursor"))
+            return slot
+
+        cursor = int(cmd[1])
+        index = cursor % shards
+
+        def _next(replies: list):
+            shard_cursor, keys = replies[0]
+            if int(shard_cursor):
+                return [str(int(shard_cursor) * shards + index), keys]
+            # this shard is done: the next one starts from its cursor 0
+            return [str(index + 1) if index + 1 < shards else "0", keys]
+
+        slot = GatherSlot(1, _next)
+        self.links[index].request([cmd[0], str(cursor // shards), *cmd[2:]], slot.part(0))
+        return slot
+
+
+    def route_transaction(self, queued: list[list[str]]) -> ReplySlot:
+        """EXEC: the MULTI block goes to the one shard owning all its keys"""
+
+        shards = len(self.links)
+        owners = {key_shard(key, shards) for cmd in queued for key in lookup_command(cmd[0]).keys(cmd)}
+
+        slot = ReplySlot()
+        if len(owners) > 1:
+            slot.resolve(ReplyError("CROSSSLOT Keys in request don't hash to the same slot"))
+            return slot
+
+        # sent back to back on the link, so no other client's command gets in between
+        link = self.links[owners.pop() if owners else 0]
+        link.request(["MULTI"], ReplySlot())
+        for cmd in queued:
+            link.request(cmd, ReplySlot())
+        link.request(["EXEC"], slot)
+        return slot
+
+
+    # =============== connections =============== #
+
+
+    def add_client(self, conn: ClientConnection):
+        self.clients[conn.id] = conn
+
+
+    def remove_client(self, conn: ClientConnection):
+        self.clients.pop(conn.id, None)
+        self.pending_writes.discard(conn)
+
+
+    def schedule_flush(self, conn):
+        """conn is a client connection or a shard link: both have flush()"""
+
+        self.pending_writes.add(conn)
+
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self.flush_pending)
+
+
+    def flush_pending(self):
+        self._flush_scheduled = False
+
+        pending = self.pending_writes
+        self.pending_writes = set()
+        for conn in pending:
+            conn.flush()
+
+
+# =============== processes =============== #
+
+
+def run_shard(index: int, port: int, data_dir: str, db_options: dict, slowlog_options: dict):
+    """worker process: a normal server, bound to localhost, on its own data dir"""
+
+    from async_server import AsyncPhotonDBServer
+    from photondb import PhotonDB
+
+    # the parent stops the workers with SIGTERM, once
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    db = PhotonDB(data_dir=os.path.join(data_dir, f"shard-{index}"), **db_options)
+    server = AsyncPhotonDBServer(host="127.0.0.1", port=port, db=db)
+    server.command_executor.routed = True
+    server.command_executor.slowlog.configure(**slowlog_options)
+    server.start()
+
+
+def run_router(host: str, port: int, shard_ports: list[int], reuse_port: bool):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ShardRouter(host, port, shard_ports, reuse_port=reuse_port).start()
+
+
+def check_layout(data_dir: str, shards: int):
+    """
+    keys are placed by hash modulo the number of shards:
+    restarting with a different count would hide them
+    """
+
+    os.makedirs(data_dir, exist_ok=True)
+    meta_path = os.path.join(data_dir, "shards.json")
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            previous = json.load(f).get("shards")
+        if previous != shards:
+            raise SystemExit(
+                f"✗ {data_dir} was written by {previous} shards, not {shards}: "
+                f"start with --shards {previous}"
+            )
+        return
+
+    with open(meta_path, "w") as f:
+        json.dump({"shards": shards}, f)
+
+
+def run_sharded(host: str = "0.0.0.0", port: int = 6379, shards: int = 0,
+                routers: int = 1, shard_base_port: int = 7000, data_dir: str = "data",
+                db_options: dict = None, slowlog_options: dict = None):
+    """
+    start the shard workers and the routers, then wait for them
+
+    Args:
+        shards (int): number of worker processes (0 = one per CPU)
+        routers (int): front processes sharing the public port with SO_REUSEPORT
+        shard_base_port (int): shard i listens on 127.0.0.1:shard_base_port + i
+        db_options (dict): PhotonDB settings of every shard (appendonly, ...)
+        slowlog_options (dict): SlowLog.configure() arguments of every shard
+    """
+
+    shards = shards or os.cpu_count() or 1
+    check_layout(data_dir, shards)
+
+    if routers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("ℹ SO_REUSEPORT not available, starting a single router")
+        routers = 1
+
+    shard_ports = [shard_base_port + i for i in range(shards)]
+
+    processes = [
+        multiprocessing.Process(target=run_shard, args=(i, shard_ports[i], data_dir, db_options or {}, slowlog_options or {}), name=f"shard-{i}")
+        for i in range(shards)
+    ]
+    processes += [
+        multiprocessing.Process(target=run_router, args=(host, port, shard_ports, routers > 1), name=f"router-{i}")
+        for i in range(routers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    print(f"🚀 PhotonDB sharded mode: {shards} shards, {routers} router(s) on {host}:{port}\n")
+
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _terminate)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping shards...")
+        # routers first, then every shard does its final save
+        for process in reversed(processes):
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,103 @@
+"""
+SLOWLOG: the last commands slower than a threshold, in a ring buffer
+"""
+
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from parser import SimpleString
+
+
+# an entry keeps at most this many arguments (the last one says how many
+# were dropped) and this many characters per argument, like Redis
+SLOWLOG_MAX_ARGS = 32
+SLOWLOG_MAX_ARG_LEN = 128
+
+
+class SlowLog:
+    """
+    Ring buffer of the commands slower than log_slower_than microseconds.
+
+    CommandExecutor.execute already times every command for INFO,
+    so the fast path only adds a comparison with threshold_ns; an
+    entry (and the truncated copy of the arguments) is only built
+    for a slow command.
+
+    Attributes:
+        log_slower_than: threshold in microseconds, 0 = log every
+            command, negative = disabled
+        max_len: entries kept, the oldest are dropped
+        threshold_ns: log_slower_than in nanoseconds, compared with
+            the duration measured by execute (inf when disabled)
+    """
+
+    def __init__(self, log_slower_than: int = 10000, max_len: int = 128):
+        self.entries: deque = deque(maxlen=max_len)
+        self.next_id = 0
+        self.configure(log_slower_than, max_len)
+
+
+    def configure(self, log_slower_than: Optional[int] = None, max_len: Optional[int] = None) -> None:
+        if log_slower_than is not None:
+            self.log_slower_than = log_slower_than
+            self.threshold_ns = log_slower_than * 1000 if log_slower_than >= 0 else math.inf
+        if max_len is not None:
+            if max_len < 0:
+                raise ValueError("slowlog max len must be positive")
+            self.max_len = max_len
+            # the newest entries are at the left
+            self.entries = deque(self.entries, maxlen=max_len)
+
+
+    def add(self, cmd: list[str], nsec: int, addr: str) -> None:
+        """a command took nsec: keep it, newest first"""
+
+        if len(cmd) > SLOWLOG_MAX_ARGS:
+            args = cmd[:SLOWLOG_MAX_ARGS - 1]
+            args.append(f"... ({len(cmd) - SLOWLOG_MAX_ARGS + 1} more arguments)")
+        else:
+            args = list(cmd)
+        for i, arg in enumerate(args):
+            if len(arg) > SLOWLOG_MAX_ARG_LEN:
+                args[i] = f"{arg[:SLOWLOG_MAX_ARG_LEN]}... ({len(arg) - SLOWLOG_MAX_ARG_LEN} more bytes)"
+
+        # id, unix time, duration (usec), arguments, client address, client name
+        self.entries.appendleft([self.next_id, int(time.time()), nsec // 1000, args, addr, ""])
+        self.next_id += 1
+
+
+    def handle(self, args: list[str]):
+        """
+        SLOWLOG GET [count]   the newest entries (10 by default, -1 = all)
+        SLOWLOG LEN           number of entries
+        SLOWLOG RESET         drop the entries
+        """
+
+        if not args:
+            raise ValueError("wrong number of arguments for 'slowlog' command")
+
+        sub = args[0].upper()
+
+        if sub == "GET" and len(args) <= 2:
+            count = 10
+            if len(args) == 2:
+                try:
+                    count = int(args[1])
+                except ValueError:
+                    raise ValueError("value is not an integer or out of range")
+                if count < -1:
+                    raise ValueError("count should be greater than or equal to -1")
+            if count == -1:
+                count = len(self.entries)
+            return [entry for entry, _ in zip(self.entries, range(count))]
+
+        if sub == "LEN" and len(args) == 1:
+            return len(self.entries)
+
+        if sub == "RESET" and len(args) == 1:
+            self.entries.clear()
+            return SimpleString("OK")
+
+        raise ValueError(f"unknown subcommand or wrong number of arguments for '{args[0]}'. Try SLOWLOG GET, LEN, RESET")
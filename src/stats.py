@@ -0,0 +1,235 @@
+"""
+Server statistics for INFO: command counters and latency
+histograms, keyspace hits, clients, network traffic, ops/sec
+"""
+
+import os
+import platform
+import time
+from collections import Counter, deque
+from typing import Optional
+
+
+# latency buckets: bucket b holds the calls of [2^(b-1), 2^b) microseconds
+# (bucket 0: under 1us); 64 buckets fit any duration, no bound check needed
+HISTOGRAM_BUCKETS = 64
+
+# instantaneous_* are the average of the last samples, one per cron (100ms)
+METRIC_SAMPLES = 16
+
+
+class CommandStat:
+    """
+    counters of one command, updated inline by CommandExecutor.execute:
+    calls += 1, nsec += elapsed, histogram[(elapsed // 1000).bit_length()] += 1
+    (int.bit_length() is the log2 bucket, with no log() call)
+    """
+
+    __slots__ = ("calls", "nsec", "failed_calls", "rejected_calls", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.nsec = 0
+        self.failed_calls = 0
+        self.rejected_calls = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+
+    def percentile(self, p: float) -> float:
+        """upper bound (usec) of the bucket holding the p-th percentile call"""
+
+        total = sum(self.histogram)
+        if not total:
+            return 0.0
+        rank = p / 100 * total
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return float(1 << bucket)
+        return float(1 << (HISTOGRAM_BUCKETS - 1))
+
+
+class _Metric:
+    """per second rate of a growing counter, averaged over the last samples"""
+
+    __slots__ = ("samples", "last_value", "last_time")
+
+    def __init__(self):
+        self.samples: deque[float] = deque(maxlen=METRIC_SAMPLES)
+        self.last_value = 0
+        self.last_time = time.monotonic()
+
+
+    def sample(self, value: int, now: float) -> None:
+        elapsed = now - self.last_time
+        if elapsed > 0:
+            self.samples.append((value - self.last_value) / elapsed)
+        self.last_value = value
+        self.last_time = now
+
+
+    def rate(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+
+class ServerStats:
+    """
+    Counters of a server, read by INFO.
+
+    Recording is kept off the hot path: a command costs two clock
+    reads and a few integer updates of its CommandStat (no lock,
+    no allocation, no call, the histogram bucket is a bit_length()); totals
+    and rates are derived when INFO asks, or sampled by the cron.
+
+    Attributes:
+        commands: CommandSpec -> CommandStat, commands called at least once
+        keyspace_hits, keyspace_misses: keys found / not found by read commands
+        connected_clients, total_connections_received
+        net_input_bytes, net_output_bytes: bytes read from / written to clients
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.tcp_port = 0
+        self.mode = "embedded"      # "asyncio" | "select", set by the server
+
+        self.commands: dict = {}
+        self.keyspace_hits = 0
+        self.keyspace_misses = 0
+
+        self.connected_clients = 0
+        self.total_connections_received = 0
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+
+        self._ops = _Metric()
+        self._input = _Metric()
+        self._output = _Metric()
+
+
+    # =============== recording =============== #
+
+
+    def command(self, spec) -> CommandStat:
+        stat = self.commands.get(spec)
+        if stat is None:
+            stat = self.commands[spec] = CommandStat()
+        return stat
+
+
+    def client_connected(self) -> None:
+        self.connected_clients += 1
+        self.total_connections_received += 1
+
+
+    def client_disconnected(self) -> None:
+        self.connected_clients -= 1
+
+
+    def cron(self, now: Optional[float] = None) -> None:
+        """sample the counters behind the instantaneous_* fields"""
+
+        now = time.monotonic() if now is None else now
+        self._ops.sample(self.total_commands(), now)
+        self._input.sample(self.net_input_bytes, now)
+        self._output.sample(self.net_output_bytes, now)
+
+
+    def reset(self) -> None:
+        """drop the command stats and the counters (not the clients)"""
+
+        self.commands.clear()
+        self.keyspace_hits = 0
+        self.keyspace_misses = 0
+        self.total_connections_received = self.connected_clients
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+        self._ops = _Metric()
+        self._input = _Metric()
+        self._output = _Metric()
+
+
+    def total_commands(self) -> int:
+        return sum(stat.calls for stat in self.commands.values())
+
+
+    # =============== INFO sections =============== #
+
+
+    def server_info(self) -> dict:
+        uptime = int(time.time() - self.started)
+        return {
+            "server_mode": self.mode,
+            "python_version": platform.python_version(),
+            "os": f"{platform.system()} {platform.release()} {platform.machine()}",
+            "process_id": os.getpid(),
+            "tcp_port": self.tcp_port,
+            "server_time_usec": int(time.time() * 1_000_000),
+            "uptime_in_seconds": uptime,
+            "uptime_in_days": uptime // 86400,
+            "hz": 10,
+        }
+
+
+    def clients_info(self) -> dict:
+        return {
+            "connected_clients": self.connected_clients,
+        }
+
+
+    def stats_info(self) -> dict:
+        hits, misses = self.keyspace_hits, self.keyspace_misses
+        return {
+            "total_connections_received": self.total_connections_received,
+            "total_commands_processed": self.total_commands(),
+            "instantaneous_ops_per_sec": int(self._ops.rate()),
+            "total_net_input_bytes": self.net_input_bytes,
+            "total_net_output_bytes": self.net_output_bytes,
+            "instantaneous_input_kbps": round(self._input.rate() / 1024, 2),
+            "instantaneous_output_kbps": round(self._output.rate() / 1024, 2),
+            "keyspace_hits": hits,
+            "keyspace_misses": misses,
+            "keyspace_hit_rate": f"{hits / (hits + misses) * 100:.2f}" if hits + misses else "0.00",
+            "total_failed_calls": sum(stat.failed_calls for stat in self.commands.values()),
+            "total_rejected_calls": sum(stat.rejected_calls for stat in self.commands.values()),
+        }
+
+
+    def commandstats_info(self) -> dict:
+        """
+        cmdstat_<name>: calls, usec, usec_per_call, failed and rejected
+        calls, and histogram_usec: "<bound>:<calls>" for the non-empty
+        log2 buckets, a call in bucket <bound> took less than <bound>us
+        """
+
+        fields = {}
+        for spec, stat in sorted(self.commands.items(), key=lambda item: item[0].name):
+            histogram = ";".join(f"{1 << bucket}:{count}" for bucket, count in enumerate(stat.histogram) if count)
+            fields[f"cmdstat_{spec.name.lower()}"] = (
+                f"calls={stat.calls},usec={stat.nsec // 1000},"
+                f"usec_per_call={stat.nsec / 1000 / stat.calls if stat.calls else 0:.2f},"
+                f"rejected_calls={stat.rejected_calls},failed_calls={stat.failed_calls},"
+                f"histogram_usec={histogram}"
+            )
+        return fields
+
+
+    def latencystats_info(self) -> dict:
+        """p50/p99/p99.9 of each command, read from its histogram (bucket upper bounds)"""
+
+        fields = {}
+        for spec, stat in sorted(self.commands.items(), key=lambda item: item[0].name):
+            if stat.calls:
+                fields[f"latency_percentiles_usec_{spec.name.lower()}"] = (
+                    f"p50={stat.percentile(50):.3f},p99={stat.percentile(99):.3f},"
+                    f"p99.9={stat.percentile(99.9):.3f}"
+                )
+        return fields
+
+
+def keytypes_info(data) -> dict:
+    """keys per type: walks the whole keyspace (about 60ms per million keys)"""
+
+    counts = Counter(val.type for val in data.values())
+    return {f"{kind}_keys": counts[kind] for kind in ("string", "list", "hash", "set", "zset")}
@@ -2,39 +2,75 @@
 
 questa classe è un wrapper per salvare 
 un valore con i suoi metadati come 
-tipo di dato, timestamp di creazione,
+tipo di dato, scadenza,
 ultimo accesso, contatore di accessi
 
 
 """
 
+import random
 import time
 from typing import Any, Optional
 
+
+# logarithmic LFU counter, as in Redis: 0..255, new keys start at LFU_INIT_VAL
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10         # higher = more hits needed to increment
+LFU_DECAY_TIME = 60_000     # ms of idle time that decrement the counter by one
+
+class Clock:
+    """
+    Coarse clock in ms: the server cron refreshes it once per tick,
+    so reads don't call time.time() for the access metadata.
+    Every value touched in the same tick shares the same int object.
+    """
+
+    __slots__ = ("ms",)
+
+
+    def __init__ (self):
+        self.tick()
+
+
+    def tick (self) -> int:
+        self.ms = int(time.time() * 1000)
+        return self.ms
+
+
+clock = Clock()
+
+# the access metadata touch() keeps up to date is chosen per database by
+# its eviction policy (PhotonDB.tracking): only LRU/LFU policies need it
+
+
 class value: 
     """
     
     Definition of the value class representing a single value
     with its associated metadata.
+
+    __slots__ instead of a __dict__: a value is 72 bytes with its GC
+    header. The metadata never allocates: last_accessed is the shared
+    clock int and access_count a cached small int, and touch() only
+    updates them for the eviction policy that reads them.
     
     Attributes:
         data: The actual value (string, list, dict, etc)
         type_: Logical data type ("string", "list", "hash", "set", "zset")
-        created_at: Creation timestamp (ms)
-        last_accessed: Timestamp of last access (ms)
-        access_count: Number of accesses (for LFU)
+        last_accessed: Timestamp of last access (ms, coarse clock)
+        access_count: Logarithmic access counter for LFU (0..255, decays while idle)
         ttl_ms: Expiration timestamp in ms (None = no expiry)
     """
 
+    __slots__ = ("data", "type", "ttl_ms", "last_accessed", "access_count")
 
 
     def __init__ (self, data: Any, type_: str = "string"):  
         self.data = data
         self.type = type_
-        self.created_at = int(time.time() * 1000)
-        self.last_accessed = self.created_at
-        self.access_count = 0
         self.ttl_ms: Optional[float] = None
+        self.last_accessed = clock.ms
+        self.access_count = LFU_INIT_VAL
 
 
     def is_expired (self) -> bool:
@@ -51,18 +87,38 @@ class value:
         return time.time() * 1000 > self.ttl_ms
     
 
-    def touch (self):
+    def touch (self, tracking: str):
         """
             Updates access metadata when a value
             is read or modified.
+            No-op unless the database has an LRU/LFU eviction
+            policy (tracking: "none", "lru" or "lfu", PhotonDB.tracking).
         
         """
-        self.last_accessed = int(time.time() * 1000)
-        self.access_count += 1
-
+        if tracking == "none":
+            return
 
+        now = clock.ms
+        if tracking == "lfu":
+            counter = self.lfu_decay(now)
 
+            # probabilistic increment: ~1M hits to reach 255 with factor 10
+            if counter < 255:
+                base = max(counter - LFU_INIT_VAL, 0)
+                if random.random() < 1.0 / (base * LFU_LOG_FACTOR + 1):
+                    counter += 1
 
+            self.access_count = counter
 
+        self.last_accessed = now
 
 
+    def lfu_decay (self, now: int) -> int:
+        """
+            LFU counter decremented by the minutes of idle
+            time since the last access (not stored)
+        """
+        periods = (now - self.last_accessed) // LFU_DECAY_TIME
+        if periods <= 0:
+            return self.access_count
+        return max(self.access_count - periods, 0)
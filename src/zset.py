@@ -0,0 +1,582 @@
+"""
+Sorted sets: skiplist with span counts + member -> score dict,
+and a compact sorted array for small sets
+"""
+
+import math
+import random
+from bisect import bisect_left, insort
+from typing import Iterator, Optional
+
+
+# zset-max-listpack-entries / zset-max-listpack-value of redis.conf
+MAX_COMPACT_ENTRIES = 128
+MAX_COMPACT_VALUE = 64
+
+MAX_LEVEL = 32
+LEVEL_P = 0.25
+
+
+def parse_score(text: str) -> float:
+    """a ZADD score: float, "inf", "-inf" (never NaN)"""
+
+    try:
+        score = float(text)
+    except ValueError:
+        raise ValueError("value is not a valid float")
+    if math.isnan(score):
+        raise ValueError("value is not a valid float")
+    return score
+
+
+def parse_bound(text: str) -> tuple[float, bool]:
+    """a range bound: "1.5", "(1.5" (exclusive), "-inf", "+inf" -> (score, exclusive)"""
+
+    exclusive = text.startswith("(")
+    try:
+        score = float(text[1:] if exclusive else text)
+    except ValueError:
+        raise ValueError("min or max is not a float")
+    if math.isnan(score):
+        raise ValueError("min or max is not a float")
+    return score, exclusive
+
+
+def format_score(score: float) -> str:
+    """score in a reply: "3", "1.5", "inf" (shortest repr, like Redis)"""
+
+    if score.is_integer() and abs(score) < 1e17:
+        return str(int(score))
+    if math.isinf(score):
+        return "inf" if score > 0 else "-inf"
+    return repr(score)
+
+
+def _above_min(score: float, low: tuple[float, bool]) -> bool:
+    return score > low[0] or (score == low[0] and not low[1])
+
+
+def _below_max(score: float, high: tuple[float, bool]) -> bool:
+    return score < high[0] or (score == high[0] and not high[1])
+
+
+# =============== skiplist =============== #
+
+
+class _Node:
+    __slots__ = ("member", "score", "backward", "next", "span")
+
+    def __init__(self, member, score: float, level: int):
+        self.member = member
+        self.score = score
+        self.backward: Optional[_Node] = None
+        self.next: list[Optional[_Node]] = [None] * level
+        # span[i]: elements skipped by next[i], for O(log n) ranks
+        self.span = [0] * level
+
+
+def _random_level() -> int:
+    level = 1
+    rand = random.random
+    while level < MAX_LEVEL and rand() < LEVEL_P:
+        level += 1
+    return level
+
+
+class SkipList:
+    """
+    Redis zskiplist: ordered by (score, member), every forward
+    pointer knows how many elements it skips, so insert, delete,
+    rank and access by rank are O(log n). Ranks are 1-based, the
+    header is rank 0. The span of a pointer to the end counts the
+    elements left after its node.
+    """
+
+    def __init__(self):
+        self.header = _Node(None, -math.inf, MAX_LEVEL)
+        self.tail: Optional[_Node] = None
+        self.length = 0
+        self.level = 1
+
+
+    def insert(self, score: float, member: str) -> _Node:
+        """the member must not be in the list"""
+
+        update = [None] * MAX_LEVEL     # rightmost node before the new one, per level
+        rank = [0] * MAX_LEVEL          # rank of update[i]
+        x = self.header
+        r = 0
+
+        for i in range(self.level - 1, -1, -1):
+            nxt = x.next[i]
+            while nxt is not None:
+                next_score = nxt.score
+                if next_score < score or (next_score == score and nxt.member < member):
+                    r += x.span[i]
+                    x = nxt
+                    nxt = x.next[i]
+                else:
+                    break
+            update[i] = x
+            rank[i] = r
+
+        level = _random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.header
+                self.header.span[i] = self.length
+            self.level = level
+
+        node = _Node(member, score, level)
+        node_next = node.next
+        node_span = node.span
+        for i in range(level):
+            prev = update[i]
+            skipped = r - rank[i]
+            node_next[i] = prev.next[i]
+            prev.next[i] = node
+            node_span[i] = prev.span[i] - skipped
+            prev.span[i] = skipped + 1
+
+        # the levels above the new node skip one more element
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+
+        node.backward = update[0] if update[0] is not self.header else None
+        if node_next[0] is not None:
+            node_next[0].backward = node
+        else:
+            self.tail = node
+
+        self.length += 1
+        return node
+
+
+    def delete(self, score: float, member: str) -> bool:
+        update = [None] * MAX_LEVEL
+        x = self.header
+
+        for i in range(self.level - 1, -1, -1):
+            nxt = x.next[i]
+            while nxt is not None and (nxt.score < score or (nxt.score == score and nxt.member < member)):
+                x = nxt
+                nxt = x.next[i]
+            update[i] = x
+
+        x = x.next[0]
+        if x is None or x.score != score or x.member != member:
+            return False
+
+        self._unlink(x, update)
+        return True
+
+
+    def _unlink(self, x: _Node, update: list) -> None:
+        for i in range(self.level):
+            if update[i].next[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].span[i] -= 1
+
+        if x.next[0] is not None:
+            x.next[0].backward = x.backward
+        else:
+            self.tail = x.backward
+
+        while self.level > 1 and self.header.next[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+
+
+    def update_score(self, score: float, member: str, new_score: float) -> None:
+        """move a member to a new score; in place when its position doesn't change"""
+
+        update = [None] * MAX_LEVEL
+        x = self.header
+
+        for i in range(self.level - 1, -1, -1):
+            nxt = x.next[i]
+            while nxt is not None and (nxt.score < score or (nxt.score == score and nxt.member < member)):
+                x = nxt
+                nxt = x.next[i]
+            update[i] = x
+
+        x = x.next[0]
+        prev, nxt = x.backward, x.next[0]
+        if (prev is None or prev.score < new_score or (prev.score == new_score and prev.member < member)) and \
+                (nxt is None or nxt.score > new_score or (nxt.score == new_score and nxt.member > member)):
+            x.score = new_score
+            return
+
+        self._unlink(x, update)
+        self.insert(new_score, member)
+
+
+    def rank(self, score: float, member: str) -> int:
+        """1-based rank, 0 if missing"""
+
+        rank = 0
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            nxt = x.next[i]
+            while nxt is not None and (nxt.score < score or (nxt.score == score and nxt.member <= member)):
+                rank += x.span[i]
+                x = nxt
+                nxt = x.next[i]
+            if x is not self.header and x.member == member:
+                return rank
+        return 0
+
+
+    def by_rank(self, rank: int) -> Optional[_Node]:
+        """the node at a 1-based rank"""
+
+        traversed = 0
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            while x.next[i] is not None and traversed + x.span[i] <= rank:
+                traversed += x.span[i]
+                x = x.next[i]
+            if traversed == rank:
+                return x
+        return None
+
+
+    def first_in_range(self, low: tuple, high: tuple) -> tuple[Optional[_Node], int]:
+        """(first node with low <= score <= high, its rank), (None, 0) if none"""
+
+        rank = 0
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            nxt = x.next[i]
+            while nxt is not None and not _above_min(nxt.score, low):
+                rank += x.span[i]
+                x = nxt
+                nxt = x.next[i]
+
+        x = x.next[0]
+        if x is None or not _below_max(x.score, high):
+            return None, 0
+        return x, rank + 1
+
+
+    def last_in_range(self, low: tuple, high: tuple) -> tuple[Optional[_Node], int]:
+        """(last node with low <= score <= high, its rank), (None, 0) if none"""
+
+        rank = 0
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            nxt = x.next[i]
+            while nxt is not None and _below_max(nxt.score, high):
+                rank += x.span[i]
+                x = nxt
+                nxt = x.next[i]
+
+        if x is self.header or not _above_min(x.score, low):
+            return None, 0
+        return x, rank
+
+
+    def load_sorted(self, pairs) -> None:
+        """
+        bulk load of an empty list from (member, score) in order:
+        each node is linked after the last one of its levels, O(1)
+        expected per member instead of a search from the top
+        """
+
+        header = self.header
+        last = [header] * MAX_LEVEL          # rightmost node per level
+        last_rank = [0] * MAX_LEVEL
+        rank = 0
+        prev = None
+
+        for member, score in pairs:
+            rank += 1
+            level = _random_level()
+            node = _Node(member, score, level)
+            for i in range(level):
+                last[i].next[i] = node
+                last[i].span[i] = rank - last_rank[i]
+                last[i] = node
+                last_rank[i] = rank
+            node.backward = prev
+            prev = node
+            if level > self.level:
+                self.level = level
+
+        # pointers to the end: the elements left after their node
+        for i in range(MAX_LEVEL):
+            last[i].span[i] = rank - last_rank[i]
+
+        self.tail = prev
+        self.length = rank
+
+
+    def __iter__(self) -> Iterator[_Node]:
+        x = self.header.next[0]
+        while x is not None:
+            yield x
+            x = x.next[0]
+
+
+# =============== sorted set =============== #
+
+
+class ZSet:
+    """
+    A sorted set, with two encodings like Redis:
+
+    compact:  a sorted list of (score, member), up to
+              MAX_COMPACT_ENTRIES members of at most MAX_COMPACT_VALUE
+              characters; bisect for ranges, a scan to find a member
+              (small sets: faster and far smaller than the skiplist)
+    skiplist: member -> score dict (O(1) ZSCORE, membership) and a
+              SkipList (O(log n) ranks and ranges)
+
+    A compact set is converted once it grows past the limits, and
+    never converted back.
+    """
+
+    __slots__ = ("items", "dict", "zsl")
+
+    def __init__(self):
+        self.items: Optional[list[tuple[float, str]]] = []
+        self.dict: Optional[dict[str, float]] = None
+        self.zsl: Optional[SkipList] = None
+
+
+    @classmethod
+    def from_sorted(cls, pairs: list[tuple[str, float]]) -> "ZSet":
+        """snapshot load: (member, score) already in order"""
+
+        zset = cls()
+        if len(pairs) <= MAX_COMPACT_ENTRIES and all(len(m) <= MAX_COMPACT_VALUE for m, _ in pairs):
+            zset.items = [(score, member) for member, score in pairs]
+        else:
+            zset._load_skiplist(pairs)
+        return zset
+
+
+    def _load_skiplist(self, pairs: list[tuple[str, float]]) -> None:
+        """skiplist encoding from (member, score) in order, without searching"""
+
+        self.items = None
+        self.dict = dict(pairs)
+        self.zsl = SkipList()
+        self.zsl.load_sorted(pairs)
+
+
+    @property
+    def encoding(self) -> str:
+        return "listpack" if self.items is not None else "skiplist"
+
+
+    def __len__(self) -> int:
+        return len(self.items) if self.items is not None else len(self.dict)
+
+
+    def __iter__(self) -> Iterator[str]:
+        """the members (ZSCAN)"""
+
+        if self.items is not None:
+            return (member for _, member in self.items)
+        return iter(self.dict)
+
+
+    def __contains__(self, member: str) -> bool:
+        return self.score(member) is not None
+
+
+    def score(self, member: str) -> Optional[float]:
+        if self.items is not None:
+            for score, m in self.items:
+                if m == member:
+                    return score
+            return None
+        return self.dict.get(member)
+
+
+    def pairs(self) -> Iterator[tuple[str, float]]:
+        """(member, score) in order"""
+
+        if self.items is not None:
+            for score, member in self.items:
+                yield member, score
+        else:
+            for node in self.zsl:
+                yield node.member, node.score
+
+
+    # =============== writes =============== #
+
+
+    def add(self, member: str, score: float) -> bool:
+        """set the score of member, True if it was added"""
+
+        items = self.items
+        if items is not None:
+            for i, (old, m) in enumerate(items):
+                if m == member:
+                    if old != score:
+                        del items[i]
+                        insort(items, (score, member))
+                    return False
+
+            if len(items) < MAX_COMPACT_ENTRIES and len(member) <= MAX_COMPACT_VALUE:
+                insort(items, (score, member))
+                return True
+            self._convert()
+
+        old = self.dict.get(member)
+        if old is None:
+            self.dict[member] = score
+            self.zsl.insert(score, member)
+            return True
+        if old != score:
+            self.dict[member] = score
+            self.zsl.update_score(old, member, score)
+        return False
+
+
+    def remove(self, member: str) -> bool:
+        items = self.items
+        if items is not None:
+            for i, (_, m) in enumerate(items):
+                if m == member:
+                    del items[i]
+                    return True
+            return False
+
+        score = self.dict.pop(member, None)
+        if score is None:
+            return False
+        self.zsl.delete(score, member)
+        return True
+
+
+    def pop(self, count: int, highest: bool = False) -> list[tuple[str, float]]:
+        """ZPOPMIN / ZPOPMAX: remove and return count members from one end"""
+
+        popped = []
+        items = self.items
+        if items is not None:
+            count = min(count, len(items))
+            if highest:
+                popped = [(m, s) for s, m in reversed(items[len(items) - count:])]
+                del items[len(items) - count:]
+            else:
+                popped = [(m, s) for s, m in items[:count]]
+                del items[:count]
+            return popped
+
+        zsl = self.zsl
+        for _ in range(min(count, zsl.length)):
+            node = zsl.tail if highest else zsl.header.next[0]
+            popped.append((node.member, node.score))
+            del self.dict[node.member]
+            zsl.delete(node.score, node.member)
+        return popped
+
+
+    def _convert(self) -> None:
+        """compact -> skiplist"""
+
+        self._load_skiplist([(member, score) for score, member in self.items])
+
+
+    # =============== reads =============== #
+
+
+    def rank(self, member: str, reverse: bool = False) -> Optional[int]:
+        """0-based rank, None if missing"""
+
+        if self.items is not None:
+            for i, (_, m) in enumerate(self.items):
+                if m == member:
+                    return len(self.items) - 1 - i if reverse else i
+            return None
+
+        score = self.dict.get(member)
+        if score is None:
+            return None
+        rank = self.zsl.rank(score, member) - 1
+        return self.zsl.length - 1 - rank if reverse else rank
+
+
+    def range_by_rank(self, start: int, stop: int, reverse: bool = False) -> list[tuple[str, float]]:
+        """members from rank start to stop included (0 <= start <= stop < len)"""
+
+        items = self.items
+        if items is not None:
+            if reverse:
+                n = len(items)
+                return [(m, s) for s, m in reversed(items[n - 1 - stop:n - start])]
+            return [(m, s) for s, m in items[start:stop + 1]]
+
+        zsl = self.zsl
+        count = stop - start + 1
+        node = zsl.by_rank(zsl.length - start if reverse else start + 1)
+
+        result = []
+        while node is not None and len(result) < count:
+            result.append((node.member, node.score))
+            node = node.backward if reverse else node.next[0]
+        return result
+
+
+    def range_by_score(self, low: tuple, high: tuple, reverse: bool = False,
+                       offset: int = 0, count: int = -1) -> list[tuple[str, float]]:
+        """
+        members with low <= score <= high, bounds from parse_bound;
+        reverse starts from high, LIMIT offset count (-1 = all)
+        """
+
+        first, last = self._range_ranks(low, high)
+        if first is None:
+            return []
+
+        size = last - first + 1
+        if offset >= size or count == 0:
+            return []
+        size -= offset
+        if 0 <= count < size:
+            size = count
+
+        if reverse:
+            start = len(self) - 1 - (last - offset)
+            return self.range_by_rank(start, start + size - 1, reverse=True)
+        return self.range_by_rank(first + offset, first + offset + size - 1)
+
+
+    def count(self, low: tuple, high: tuple) -> int:
+        """ZCOUNT: O(log n) from the ranks of the first and last member in range"""
+
+        first, last = self._range_ranks(low, high)
+        return 0 if first is None else last - first + 1
+
+
+    def _range_ranks(self, low: tuple, high: tuple) -> tuple[Optional[int], Optional[int]]:
+        """0-based ranks of the first and last member in range, (None, None) if empty"""
+
+        if low[0] > high[0] or (low[0] == high[0] and (low[1] or high[1])):
+            return None, None
+
+        items = self.items
+        if items is not None:
+            i = bisect_left(items, (low[0],))
+            while i < len(items) and not _above_min(items[i][0], low):
+                i += 1
+            j = bisect_left(items, (high[0],))
+            while j < len(items) and _below_max(items[j][0], high):
+                j += 1
+            if i >= j:
+                return None, None
+            return i, j - 1
+
+        node, first = self.zsl.first_in_range(low, high)
+        if node is None:
+            return None, None
+        _, last = self.zsl.last_in_range(low, high)
+        return first - 1, last - 1
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# the modules live flat in src/ and import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from commands import CommandExecutor
+from photondb import PhotonDB
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path / "data")
+
+
+@pytest.fixture
+def db(data_dir):
+    return PhotonDB(data_dir=data_dir)
+
+
+@pytest.fixture
+def executor(db):
+    return CommandExecutor(db)
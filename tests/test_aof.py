@@ -0,0 +1,99 @@
+import os
+
+from commands import CommandExecutor
+from parser import RespEncoder
+from photondb import PhotonDB
+
+
+def write_log(data_dir, commands):
+    """run commands on an AOF database and close it"""
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    executor = CommandExecutor(db)
+    for cmd in commands:
+        executor.execute(cmd)
+    db.aof.flush()
+    db.aof.close()
+    return db.aof.path
+
+
+def test_replay(data_dir):
+    write_log(data_dir, [
+        ["SET", "a", "1"],
+        ["INCR", "a"],
+        ["RPUSH", "list", "x", "y", "z"],
+        ["LPOP", "list"],
+        ["HSET", "hash", "field", "value"],
+        ["SET", "gone", "x"],
+        ["DEL", "gone"],
+    ])
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("a") == "2"
+    assert list(db.data["list"].data) == ["y", "z"]
+    assert db.data["hash"].data == {"field": "value"}
+    assert "gone" not in db.data
+
+
+def test_truncated_command_is_dropped(data_dir):
+    path = write_log(data_dir, [["SET", "a", "1"], ["SET", "b", "2"]])
+    valid_size = os.path.getsize(path)
+
+    # a crash in the middle of the next write
+    with open(path, "ab") as f:
+        f.write(RespEncoder.encode_command(["SET", "c", "3"])[:-4])
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("a") == "1"
+    assert db.get("b") == "2"
+    assert "c" not in db.data
+    # truncated to the last complete command, so new writes follow it
+    assert os.path.getsize(path) == valid_size
+
+    CommandExecutor(db).execute(["SET", "d", "4"])
+    db.aof.flush()
+    db.aof.close()
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("d") == "4"
+
+
+def test_incomplete_transaction_is_dropped(data_dir):
+    path = write_log(data_dir, [["SET", "a", "1"]])
+    valid_size = os.path.getsize(path)
+
+    with open(path, "ab") as f:
+        f.write(RespEncoder.encode_command(["MULTI"]))
+        f.write(RespEncoder.encode_command(["SET", "a", "2"]))
+        f.write(RespEncoder.encode_command(["SET", "b", "2"]))
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("a") == "1"
+    assert "b" not in db.data
+    assert os.path.getsize(path) == valid_size
+
+
+def test_transaction_is_replayed_whole(data_dir):
+    path = write_log(data_dir, [["SET", "a", "1"]])
+
+    with open(path, "ab") as f:
+        for cmd in (["MULTI"], ["SET", "a", "2"], ["SET", "b", "2"], ["EXEC"]):
+            f.write(RespEncoder.encode_command(cmd))
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("a") == "2"
+    assert db.get("b") == "2"
+
+
+def test_rewrite_keeps_the_dataset(data_dir):
+    write_log(data_dir, [["INCR", "counter"] for _ in range(100)] + [["SADD", "set", "1", "2", "3"]])
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    size = os.path.getsize(db.aof.path)
+    db.aof.rewrite(db)
+    db.aof.close()
+    assert os.path.getsize(db.aof.path) < size
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("counter") == "100"
+    assert sorted(CommandExecutor(db).execute(["SMEMBERS", "set"])) == ["1", "2", "3"]
@@ -0,0 +1,159 @@
+import time
+
+from commands import CommandExecutor
+from connection import ClientConnection
+from parser import RespEncoder, RespParser, RespReplyParser
+from photondb import PhotonDB
+
+
+class Server:
+    """what a ClientConnection needs of its server"""
+
+    def __init__(self, executor):
+        self.command_executor = executor
+
+    def schedule_flush(self, conn):
+        conn.flush()
+
+    def remove_client(self, conn):
+        pass
+
+
+class Connection(ClientConnection):
+    """a connection whose replies are parsed back as they are written"""
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.replies = RespReplyParser()
+
+    def write_bytes(self, data):
+        self.replies.feed(data)
+
+    def close_transport(self):
+        pass
+
+    def send_commands(self, *cmds):
+        self.feed(b"".join(RespEncoder.encode_command(cmd) for cmd in cmds))
+
+    def received(self):
+        return list(self.replies.replies())
+
+
+def connect(executor, count):
+    server = Server(executor)
+    return [Connection(server) for _ in range(count)]
+
+
+def test_waiter_is_served_by_a_later_push(executor):
+    waiter, pusher = connect(executor, 2)
+
+    # the GET sent behind the BLPOP waits for it
+    waiter.send_commands(["BLPOP", "list", "other", "0"], ["GET", "x"])
+    assert waiter.received() == []
+    assert executor.blocking.blocked == 1
+
+    pusher.send_commands(["SET", "x", "1"], ["RPUSH", "other", "a", "b"])
+    assert pusher.received() == ["OK", 2]
+    assert waiter.received() == [["other", "a"], "1"]
+    assert executor.blocking.blocked == 0
+    assert executor.blocking.waiters == {}
+    assert executor.execute(["LRANGE", "other", "0", "-1"]) == ["b"]
+
+    # the list isn't empty: no wait
+    waiter.send_commands(["BRPOP", "other", "0"])
+    assert waiter.received() == [["other", "b"]]
+
+
+def test_waiters_are_served_first_come_first_served(executor):
+    first, second, third, pusher = connect(executor, 4)
+    first.send_commands(["BLPOP", "list", "0"])
+    second.send_commands(["BLPOP", "other", "list", "0"])
+    third.send_commands(["BRPOP", "list", "0"])
+
+    # one element wakes exactly one client
+    pusher.send_commands(["RPUSH", "list", "a"])
+    assert first.received() == [["list", "a"]]
+    assert second.received() == third.received() == []
+
+    pusher.send_commands(["RPUSH", "list", "b", "c"])
+    assert second.received() == [["list", "b"]]
+    assert third.received() == [["list", "c"]]
+    assert executor.execute(["LLEN", "list"]) == 0
+    # the second client left the queue of "other" too
+    assert executor.blocking.waiters == {}
+
+
+def test_timeout_replies_nil(executor):
+    waiter, forever, pusher = connect(executor, 3)
+    waiter.send_commands(["BLPOP", "list", "0.05"], ["PING"])
+    forever.send_commands(["BLPOP", "list", "0"])
+
+    executor.blocking.expire()
+    assert waiter.received() == []
+    executor.blocking.expire(time.monotonic() + 1)
+    assert waiter.received() == [None, "PONG"]
+    assert forever.received() == []
+    assert executor.blocking.blocked == 1
+
+    # the timed out waiter is skipped
+    pusher.send_commands(["RPUSH", "list", "a"])
+    assert forever.received() == [["list", "a"]]
+    assert waiter.received() == []
+
+
+def test_disconnected_waiter_is_skipped(executor):
+    gone, waiter, pusher = connect(executor, 3)
+    gone.send_commands(["BLPOP", "list", "0"])
+    waiter.send_commands(["BLPOP", "list", "0"])
+    gone.connection_lost()
+
+    pusher.send_commands(["RPUSH", "list", "a", "b"])
+    assert waiter.received() == [["list", "a"]]
+    assert executor.execute(["LRANGE", "list", "0", "-1"]) == ["b"]
+    assert executor.blocking.blocked == 0
+
+
+def test_blocking_commands_in_process_and_in_multi(executor):
+    # no connection to park: nil at once
+    assert executor.execute(["BLPOP", "list", "0"]) is None
+    client, = connect(executor, 1)
+    client.send_commands(["MULTI"], ["BLPOP", "list", "0"], ["EXEC"])
+    assert client.received() == ["OK", "QUEUED", [None]]
+    assert executor.blocking.blocked == 0
+
+
+def logged_commands(db):
+    db.aof.flush()
+    parser = RespParser()
+    with open(db.aof.path, "rb") as f:
+        parser.feed(f.read())
+    return list(parser)
+
+
+def test_aof_logs_the_pops(data_dir):
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    executor = CommandExecutor(db)
+    start = len(logged_commands(db))
+    popper, mover, pusher = connect(executor, 3)
+
+    popper.send_commands(["BLPOP", "list", "0"])
+    mover.send_commands(["BLMOVE", "list", "dst", "LEFT", "RIGHT", "0"])
+    pusher.send_commands(["RPUSH", "list", "a", "b", "c"])
+    # not blocked: logged the same way
+    popper.send_commands(["BRPOP", "list", "0"])
+    assert popper.received() == [["list", "a"], ["list", "c"]]
+    assert mover.received() == ["b"]
+
+    assert logged_commands(db)[start:] == [
+        ["RPUSH", "list", "a", "b", "c"],
+        ["LPOP", "list"],
+        ["LMOVE", "list", "dst", "LEFT", "RIGHT"],
+        ["RPOP", "list"],
+    ]
+    db.aof.close()
+
+    # the replay doesn't wait
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    executor = CommandExecutor(db)
+    assert executor.execute(["LLEN", "list"]) == 0
+    assert executor.execute(["LRANGE", "dst", "0", "-1"]) == ["b"]
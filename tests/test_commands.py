@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from commands import CommandExecutor
+from photondb import PhotonDB
+
+
+@pytest.mark.parametrize("cmd", [
+    ["RPUSH", "key", "a"],
+    ["HSET", "key", "field", "value"],
+    ["SADD", "key", "1"],
+    ["ZADD", "key", "1", "a"],
+])
+def test_get_on_a_non_string_key(db, executor, cmd):
+    executor.execute(cmd)
+    with pytest.raises(TypeError, match="WRONGTYPE"):
+        executor.execute(["GET", "key"])
+    with pytest.raises(TypeError, match="WRONGTYPE"):
+        db.get("key")
+    # MGET never fails
+    assert executor.execute(["MGET", "key"]) == [None]
+
+
+def one_by_one(executor, cmds):
+    results = []
+    for cmd in cmds:
+        try:
+            results.append(executor.execute(cmd))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def comparable(results):
+    return [(type(r), str(r)) if isinstance(r, Exception) else r for r in results]
+
+
+def check_execute_many(tmp_path, cmds, setup=()):
+    dbs = []
+    replies = []
+    for name, run in (("many", lambda ex: ex.execute_many(cmds)), ("single", lambda ex: one_by_one(ex, cmds))):
+        db = PhotonDB(data_dir=tmp_path / name)
+        executor = CommandExecutor(db)
+        one_by_one(executor, setup)
+        replies.append(run(executor))
+        dbs.append(db)
+
+    assert comparable(replies[0]) == comparable(replies[1])
+    assert [type(r) for r in replies[0]] == [type(r) for r in replies[1]]
+    assert {k: (v.type, v.data) for k, v in dbs[0].data.items()} == {k: (v.type, v.data) for k, v in dbs[1].data.items()}
+    return replies[0]
+
+
+def test_execute_many_mixed_batch(tmp_path):
+    cmds = [
+        ["SET", "a", "1"],
+        ["SET", "b", "2"],
+        ["set", "c", "3"],
+        ["GET", "a"],
+        ["GET", "missing"],
+        ["GET", "list"],
+        ["GET", "b"],
+        ["INCR", "a"],
+        ["GET", "a"],
+        ["GET", "c"],
+        ["SET", "d", "4", "EX", "100"],
+        ["SET", "e"],
+        ["GET", "d"],
+        ["NOSUCHCOMMAND"],
+        ["SET", "list", "now a string"],
+        ["GET", "list"],
+    ]
+    results = check_execute_many(tmp_path, cmds, setup=[["RPUSH", "list", "x"]])
+    assert results[:5] == [True, True, True, "1", None]
+    assert isinstance(results[5], TypeError)
+    assert results[7:10] == [2, "2", "3"]
+    assert results[-1] == "now a string"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_execute_many_random_batches(tmp_path, seed):
+    rng = random.Random(seed)
+    cmds = []
+    for _ in range(500):
+        key = f"key:{rng.randrange(20)}"
+        op = rng.random()
+        if op < 0.4:
+            cmds.append(["SET", key, str(rng.randrange(100))])
+        elif op < 0.8:
+            cmds.append(["GET", key])
+        elif op < 0.9:
+            cmds.append(["INCR", key])
+        elif op < 0.95:
+            cmds.append(["RPUSH", key, "x"])
+        else:
+            cmds.append(["DEL", key])
+    check_execute_many(tmp_path, cmds)
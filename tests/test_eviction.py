@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from commands import CommandExecutor
+from eviction import OOM_ERROR, POLICIES, estimate_size
+from photondb import PhotonDB
+
+
+def make_db(data_dir, maxmemory, policy="noeviction"):
+    db = PhotonDB(data_dir=data_dir, maxmemory=maxmemory, maxmemory_policy=policy)
+    return db, CommandExecutor(db)
+
+
+def measured(db):
+    return sum(estimate_size(key, val) for key, val in db.data.items())
+
+
+def test_accounting_follows_the_writes(data_dir):
+    db, executor = make_db(data_dir, 10**9)
+    executor.execute(["SET", "base", "x"])
+    baseline = db.memory.used
+    assert baseline == measured(db)
+
+    executor.execute(["SET", "a", "1" * 1000])
+    executor.execute(["SET", "a", "2" * 10])
+    executor.execute(["MSET", "b", "x", "c", "y" * 500])
+    for i in range(200):
+        executor.execute(["RPUSH", "list", "x" * 100])
+    executor.execute(["HSET", "hash", "field", "v" * 300])
+    executor.execute(["SADD", "set", "1", "2", "member"])
+    executor.execute(["ZADD", "zset", "1", "a", "2", "b"])
+    executor.execute(["INCR", "counter"])
+    assert db.memory.used == measured(db)
+    assert db.memory.used > baseline + 200 * 100
+
+    executor.execute(["LPOP", "list"])
+    executor.execute(["DEL", "a", "b", "c", "list", "hash", "set", "zset", "counter"])
+    assert db.memory.used == baseline
+
+    executor.execute(["FLUSHDB"])
+    assert db.memory.used == 0
+
+
+def test_accounting_after_expiry(data_dir):
+    db, executor = make_db(data_dir, 10**9)
+    executor.execute(["SET", "kept", "x"])
+    baseline = db.memory.used
+    executor.execute(["SET", "passive", "x" * 1000])
+    executor.execute(["SET", "active", "x" * 1000])
+    for key in ("passive", "active"):
+        executor.execute(["PEXPIREAT", key, "9999999999999"])
+        db.data[key].ttl_ms = 1
+        db.expires.add(key, 1)
+
+    assert executor.execute(["GET", "passive"]) is None
+    db.cleanup_expired_keys()
+    assert db.memory.used == baseline == measured(db)
+
+
+@pytest.mark.parametrize("policy", [p for p in POLICIES if p != "noeviction"])
+def test_policies_evict_under_maxmemory(data_dir, policy):
+    random.seed(1)
+    db, executor = make_db(data_dir, 200 * 1024, policy)
+    value = "x" * 1000
+
+    # one key in 10 without TTL: they fit, the volatile ones don't
+    for i in range(1000):
+        if i % 10:
+            executor.execute(["SET", f"key:{i}", value, "EX", str(1000 + i)])
+        else:
+            executor.execute(["SET", f"key:{i}", value])
+
+    memory = db.memory
+    assert memory.evicted_keys > 0
+    # checked before each write: at most the last write over the limit
+    assert memory.used <= memory.maxmemory + estimate_size("key:999", db.data["key:999"])
+    assert memory.used == measured(db)
+
+    if policy.startswith("volatile"):
+        # only keys with a TTL are candidates
+        assert all(f"key:{i}" in db.data for i in range(0, 1000, 10))
+    if policy == "volatile-ttl":
+        # the shortest TTLs went first
+        volatile = [i for i in range(1000) if i % 10]
+        kept = [i for i in volatile if f"key:{i}" in db.data]
+        assert kept == volatile[volatile.index(kept[0]):]
+
+
+def test_volatile_policy_without_volatile_keys_rejects(data_dir):
+    db, executor = make_db(data_dir, 50 * 1024, "volatile-lru")
+    with pytest.raises(ValueError, match="OOM"):
+        for i in range(1000):
+            executor.execute(["SET", f"key:{i}", "x" * 1000])
+    assert db.memory.oom_rejections == 1
+
+
+def test_noeviction_rejects_writes(data_dir):
+    db, executor = make_db(data_dir, 50 * 1024)
+    with pytest.raises(ValueError) as error:
+        for i in range(1000):
+            executor.execute(["SET", f"key:{i}", "x" * 1000])
+    assert str(error.value) == OOM_ERROR
+    count = len(db.data)
+    assert db.memory.evicted_keys == 0
+
+    # reads and deletes still work, and make room again
+    assert executor.execute(["GET", "key:0"]) == "x" * 1000
+    with pytest.raises(ValueError, match="OOM"):
+        executor.execute(["RPUSH", "list", "x"])
+    executor.execute(["DEL", *[f"key:{i}" for i in range(10)]])
+    executor.execute(["SET", "again", "x"])
+    assert len(db.data) == count - 10 + 1
@@ -0,0 +1,135 @@
+import random
+import time
+
+from expiry import ExpiryIndex
+from value import value
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def test_refresh_to_the_same_deadline_pushes_nothing():
+    index = ExpiryIndex()
+    index.add("a", 1000)
+    index.add("a", 1000)
+    assert len(index.heap) == 1
+    index.add("a", 2000)
+    assert len(index) == 1
+    assert index.peek() == (2000, "a")
+
+
+def test_discard_compacts_the_heap():
+    index = ExpiryIndex()
+    for i in range(10000):
+        index.add(f"key:{i}", 10**15 + i)
+    for i in range(9990):
+        index.discard(f"key:{i}")
+
+    assert len(index) == 10
+    assert len(index.heap) <= max(ExpiryIndex.MIN_COMPACT, 2 * len(index)) + 1
+    assert index.compactions > 0
+    assert index.peek() == (10**15 + 9990, "key:9990")
+
+
+def test_random_keys_are_live():
+    index = ExpiryIndex()
+    for i in range(5000):
+        index.add(f"key:{i}", 10**15 + i)
+    # just under the compaction threshold: the heap is about half stale
+    for i in range(2400):
+        index.discard(f"key:{i}")
+
+    for _ in range(200):
+        keys = index.random_keys(5)
+        assert 1 <= len(keys) <= 5
+        assert all(key in index.deadlines for key in keys)
+
+
+def test_active_cycle_deletes_the_expired_keys_only():
+    index = ExpiryIndex()
+    data = {}
+    now = now_ms()
+    for i in range(100):
+        deadline = now - 1000 if i % 2 else now + 10**7
+        data[f"key:{i}"] = value("x")
+        data[f"key:{i}"].ttl_ms = deadline
+        index.add(f"key:{i}", deadline)
+
+    # replaced by a value without TTL, without going through discard()
+    data["key:1"] = value("new")
+
+    removed = []
+    deleted = index.active_expire_cycle(data, budget_ms=1000, removed=lambda key, val: removed.append(key))
+
+    assert deleted == 49
+    assert sorted(removed) == sorted(f"key:{i}" for i in range(3, 100, 2))
+    assert "key:1" in data
+    assert sorted(data) == sorted(["key:1"] + [f"key:{i}" for i in range(0, 100, 2)])
+    assert len(index) == 50
+
+
+def test_model_check():
+    """random adds, refreshes, discards and cycles against a plain dict"""
+
+    rng = random.Random(42)
+    index = ExpiryIndex()
+    data = {}
+    model = {}      # key -> deadline
+    now = now_ms()
+
+    for step in range(20000):
+        key = f"key:{rng.randrange(3000)}"
+        op = rng.random()
+        if op < 0.5:
+            deadline = now - rng.randrange(1, 1000) if rng.random() < 0.3 else now + 10**7 + rng.randrange(1000)
+            data[key] = value("x")
+            data[key].ttl_ms = deadline
+            index.add(key, deadline)
+            model[key] = deadline
+        elif op < 0.8:
+            data.pop(key, None)
+            index.discard(key)
+            model.pop(key, None)
+        elif op < 0.99:
+            keys = index.random_keys(5)
+            assert all(index.deadlines[k] == model[k] for k in keys)
+            if model:
+                assert keys
+        else:
+            index.active_expire_cycle(data, budget_ms=1000)
+            model = {k: d for k, d in model.items() if d > now}
+
+        assert index.deadlines == model
+        assert len(index.heap) <= max(ExpiryIndex.MIN_COMPACT, 2 * len(model)) + 1
+
+    index.active_expire_cycle(data, budget_ms=1000)
+    assert set(data) == {k for k, d in model.items() if d > now}
+
+
+def test_passive_and_active_expiry(db, executor):
+    executor.execute(["SET", "a", "1"])
+    executor.execute(["SET", "b", "2"])
+    executor.execute(["SET", "c", "3"])
+    executor.execute(["EXPIRE", "c", "100"])
+    executor.execute(["PEXPIREAT", "a", str(now_ms() + 10**6)])
+    db.data["a"].ttl_ms = now_ms() - 1
+    db.expires.add("a", db.data["a"].ttl_ms)
+
+    # passive: found expired on access
+    assert executor.execute(["GET", "a"]) is None
+    assert "a" not in db.data
+    assert "a" not in db.expires.deadlines
+
+    db.data["b"].ttl_ms = now_ms() - 1
+    db.expires.add("b", db.data["b"].ttl_ms)
+    assert db.cleanup_expired_keys() == 1
+    assert sorted(db.data) == ["c"]
+    assert db.expires.expired_keys == 2
+
+
+def test_pexpireat_in_the_past_deletes(db, executor):
+    executor.execute(["SET", "a", "1"])
+    executor.execute(["PEXPIREAT", "a", str(now_ms() - 1000)])
+    assert "a" not in db.data
+    assert len(db.expires) == 0
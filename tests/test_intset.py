@@ -0,0 +1,152 @@
+import random
+
+import pytest
+
+from intset import MAX_INTSET_ENTRIES, IntSet, as_int
+
+
+def encoding(db, key):
+    return "intset" if isinstance(db.data[key].data, IntSet) else "hashtable"
+
+
+def test_as_int_takes_the_canonical_form_only():
+    assert as_int("12") == 12
+    assert as_int("-7") == -7
+    assert as_int(str(-(1 << 63))) == -(1 << 63)
+    for member in ("007", "+1", " 1", "1 ", "-0", "1.0", "", "abc", str(1 << 63)):
+        assert as_int(member) is None
+
+
+def test_non_canonical_member_forces_the_hashtable(db, executor):
+    executor.execute(["SADD", "s", "1", "7"])
+    assert encoding(db, "s") == "intset"
+    assert executor.execute(["SISMEMBER", "s", "007"]) == 0
+
+    # "007" must read back as "007", not as 7
+    assert executor.execute(["SADD", "s", "007"]) == 1
+    assert encoding(db, "s") == "hashtable"
+    assert sorted(executor.execute(["SMEMBERS", "s"])) == ["007", "1", "7"]
+
+    executor.execute(["SADD", "created", "007"])
+    assert encoding(db, "created") == "hashtable"
+
+
+def test_growth_past_max_entries(db, executor):
+    executor.execute(["SADD", "s", *map(str, range(MAX_INTSET_ENTRIES))])
+    assert encoding(db, "s") == "intset"
+    assert executor.execute(["SADD", "s", "0", "1"]) == 0
+    assert encoding(db, "s") == "intset"
+
+    assert executor.execute(["SADD", "s", str(MAX_INTSET_ENTRIES)]) == 1
+    assert encoding(db, "s") == "hashtable"
+    assert executor.execute(["SCARD", "s"]) == MAX_INTSET_ENTRIES + 1
+    assert executor.execute(["SISMEMBER", "s", str(MAX_INTSET_ENTRIES)]) == 1
+
+    # created over the limit in one go
+    executor.execute(["SADD", "big", *map(str, range(MAX_INTSET_ENTRIES + 1))])
+    assert encoding(db, "big") == "hashtable"
+
+
+@pytest.mark.parametrize("members", [["1", "2", "3"], ["a", "b", "c"]])
+def test_srem_empties_the_key(db, executor, members):
+    executor.execute(["SADD", "s", *members])
+    executor.execute(["EXPIRE", "s", "100"])
+    assert executor.execute(["SREM", "s", members[0], "missing"]) == 1
+    assert executor.execute(["SREM", "s", *members]) == 2
+    assert "s" not in db.data
+    assert "s" not in db.expires.deadlines
+    assert executor.execute(["SCARD", "s"]) == 0
+    assert executor.execute(["SREM", "s", "1"]) == 0
+
+
+def test_set_operations_across_encodings(db, executor):
+    executor.execute(["SADD", "ints", "1", "2", "3", "4"])
+    executor.execute(["SADD", "strings", "3", "4", "5", "x"])
+    executor.execute(["SADD", "padded", "03", "4"])
+    assert encoding(db, "ints") == "intset"
+    assert encoding(db, "strings") == "hashtable"
+
+    assert sorted(executor.execute(["SINTER", "ints", "strings"])) == ["3", "4"]
+    assert sorted(executor.execute(["SINTER", "strings", "ints", "padded"])) == ["4"]
+    assert sorted(executor.execute(["SUNION", "ints", "strings"])) == ["1", "2", "3", "4", "5", "x"]
+    assert sorted(executor.execute(["SDIFF", "ints", "strings"])) == ["1", "2"]
+    assert sorted(executor.execute(["SDIFF", "strings", "ints"])) == ["5", "x"]
+    assert sorted(executor.execute(["SDIFF", "ints", "padded", "missing"])) == ["1", "2", "3"]
+    assert executor.execute(["SINTER", "ints", "missing"]) == []
+
+    # the stored result gets the encoding of its members
+    assert executor.execute(["SINTERSTORE", "dest", "ints", "strings"]) == 2
+    assert encoding(db, "dest") == "intset"
+    assert executor.execute(["SUNIONSTORE", "dest", "ints", "strings"]) == 6
+    assert encoding(db, "dest") == "hashtable"
+    assert executor.execute(["SDIFFSTORE", "dest", "ints", "ints"]) == 0
+    assert "dest" not in db.data
+
+
+def test_model_check(db, executor):
+    """random set commands on small integer, big integer and string sets against Python sets"""
+
+    rng = random.Random(7)
+    model = {}
+    keys = ["a", "b", "c"]
+    seen = set()
+
+    def member():
+        kind = rng.random()
+        if kind < 0.7:
+            return str(rng.randrange(-20, 1500))
+        if kind < 0.9:
+            return rng.choice(["007", "-0", "+5", "x", "1.5"])
+        return str(rng.choice([1 << 62, -(1 << 63), 1 << 63]))
+
+    for step in range(3000):
+        key = rng.choice(keys)
+        op = rng.random()
+        current = model.get(key, set())
+        if op < 0.5:
+            # mostly integers, so the sets go back and forth across the limit
+            members = [member() for _ in range(rng.randrange(1, 40))]
+            assert executor.execute(["SADD", key, *members]) == len(set(members) - current)
+            model[key] = current | set(members)
+        elif op < 0.65:
+            members = [member() for _ in range(rng.randrange(1, 20))]
+            assert executor.execute(["SREM", key, *members]) == len(current & set(members))
+            model[key] = current - set(members)
+            if not model[key]:
+                del model[key]
+        elif op < 0.75:
+            m = member()
+            assert executor.execute(["SISMEMBER", key, m]) == int(m in current)
+        elif op < 0.85:
+            others = rng.sample(keys + ["missing"], 2)
+            sets = [model.get(k, set()) for k in [key] + others]
+            assert sorted(executor.execute(["SINTER", key, *others])) == sorted(set.intersection(*sets))
+            assert sorted(executor.execute(["SUNION", key, *others])) == sorted(set.union(*sets))
+            assert sorted(executor.execute(["SDIFF", key, *others])) == sorted(sets[0].difference(*sets[1:]))
+        elif op < 0.97:
+            count = rng.randrange(-5, 10)
+            picked = executor.execute(["SRANDMEMBER", key, str(count)])
+            assert set(picked) <= current
+            if count >= 0:
+                assert len(picked) == min(count, len(current)) == len(set(picked))
+            elif current:
+                assert len(picked) == -count
+        else:
+            executor.execute(["DEL", key])
+            model.pop(key, None)
+
+        for k in keys:
+            if k not in model:
+                assert k not in db.data
+                continue
+            members = db.data[k].data
+            seen.add((encoding(db, k), len(members) > MAX_INTSET_ENTRIES))
+            assert sorted(members) == sorted(model[k])
+            # the intset is used whenever it can be, and only then
+            fits = len(model[k]) <= MAX_INTSET_ENTRIES and all(as_int(m) is not None for m in model[k])
+            if not fits:
+                assert not isinstance(members, IntSet)
+            if isinstance(members, IntSet):
+                assert list(members.ints) == sorted(members.ints)
+
+    assert seen == {("intset", False), ("hashtable", False), ("hashtable", True)}
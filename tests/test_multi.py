@@ -0,0 +1,171 @@
+import pytest
+
+from commands import CommandExecutor
+from multi import Transaction
+from parser import RespParser
+from photondb import PhotonDB
+
+
+def run(tx, *cmd):
+    return tx.handle(cmd[0].upper(), list(cmd))
+
+
+def test_exec_runs_the_queue(executor):
+    tx = Transaction(executor)
+    assert run(tx, "MULTI") == "OK"
+    assert run(tx, "SET", "a", "1") == "QUEUED"
+    assert run(tx, "INCR", "a") == "QUEUED"
+    assert run(tx, "GET", "a") == "QUEUED"
+    # nothing runs before EXEC
+    assert executor.execute(["GET", "a"]) is None
+
+    assert run(tx, "EXEC") == [True, 2, "2"]
+    assert not tx.active
+
+
+def test_runtime_error_does_not_stop_the_others(executor):
+    executor.execute(["RPUSH", "list", "x"])
+    tx = Transaction(executor)
+    run(tx, "MULTI")
+    run(tx, "INCR", "list")
+    run(tx, "SET", "a", "1")
+
+    results = run(tx, "EXEC")
+    assert isinstance(results[0], Exception)
+    assert results[1] is True
+    assert executor.execute(["GET", "a"]) == "1"
+
+
+def test_exec_aborts_after_a_watched_key_is_written(executor):
+    executor.execute(["SET", "balance", "100"])
+    tx = Transaction(executor)
+    other = Transaction(executor)
+
+    run(tx, "WATCH", "balance")
+    run(tx, "MULTI")
+    run(tx, "SET", "balance", "50")
+    # another client writes the key in the meantime
+    executor.execute(["INCR", "balance"])
+
+    assert run(tx, "EXEC") is None
+    assert executor.execute(["GET", "balance"]) == "101"
+
+    # the watch is over: the next transaction runs
+    run(tx, "MULTI")
+    run(tx, "SET", "balance", "50")
+    assert run(tx, "EXEC") == [True]
+
+    # a key watched by the other client only doesn't abort this one
+    run(other, "WATCH", "unrelated")
+    run(tx, "WATCH", "balance")
+    executor.execute(["SET", "unrelated", "x"])
+    run(tx, "MULTI")
+    run(tx, "GET", "balance")
+    assert run(tx, "EXEC") == ["50"]
+
+
+def test_watch_on_a_missing_key(executor):
+    tx = Transaction(executor)
+
+    run(tx, "WATCH", "missing")
+    run(tx, "MULTI")
+    run(tx, "SET", "missing", "mine")
+    assert run(tx, "EXEC") == [True]
+
+    run(tx, "WATCH", "created")
+    executor.execute(["SET", "created", "theirs"])
+    run(tx, "MULTI")
+    run(tx, "SET", "created", "mine")
+    assert run(tx, "EXEC") is None
+    assert executor.execute(["GET", "created"]) == "theirs"
+
+
+def test_watched_key_deleted_by_expiry(db, executor):
+    executor.execute(["SET", "a", "1"])
+    tx = Transaction(executor)
+    run(tx, "WATCH", "a")
+
+    # gone without a command touching it
+    db.data["a"].ttl_ms = 1
+    db.expires.add("a", 1)
+    db.cleanup_expired_keys()
+
+    run(tx, "MULTI")
+    run(tx, "SET", "b", "1")
+    assert run(tx, "EXEC") is None
+    assert executor.execute(["GET", "b"]) is None
+
+
+def test_queueing_errors_abort_exec(executor):
+    tx = Transaction(executor)
+    run(tx, "MULTI")
+    run(tx, "SET", "a", "1")
+    with pytest.raises(ValueError, match="wrong number of arguments"):
+        run(tx, "GET", "a", "b")
+    run(tx, "SET", "c", "1")
+
+    with pytest.raises(ValueError, match="EXECABORT"):
+        run(tx, "EXEC")
+    assert executor.execute(["GET", "a"]) is None
+    assert executor.execute(["GET", "c"]) is None
+
+    run(tx, "MULTI")
+    with pytest.raises(ValueError, match="unknown command"):
+        run(tx, "NOSUCHCOMMAND")
+    with pytest.raises(ValueError, match="EXECABORT"):
+        run(tx, "EXEC")
+
+
+def test_discard(executor):
+    executor.execute(["SET", "a", "1"])
+    tx = Transaction(executor)
+    run(tx, "WATCH", "a")
+    run(tx, "MULTI")
+    run(tx, "SET", "a", "2")
+    assert run(tx, "DISCARD") == "OK"
+    assert not tx.active
+    assert executor.execute(["GET", "a"]) == "1"
+    # DISCARD also drops the watches
+    assert executor.watches.versions == {}
+
+    with pytest.raises(ValueError, match="DISCARD without MULTI"):
+        run(tx, "DISCARD")
+    with pytest.raises(ValueError, match="EXEC without MULTI"):
+        run(tx, "EXEC")
+    run(tx, "MULTI")
+    with pytest.raises(ValueError, match="nested"):
+        run(tx, "MULTI")
+    with pytest.raises(ValueError, match="WATCH inside MULTI"):
+        run(tx, "WATCH", "a")
+
+
+def logged_commands(db):
+    db.aof.flush()
+    parser = RespParser()
+    with open(db.aof.path, "rb") as f:
+        parser.feed(f.read())
+    return list(parser)
+
+
+def test_aof_framing(data_dir):
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    executor = CommandExecutor(db)
+    tx = Transaction(executor)
+    start = len(logged_commands(db))
+
+    run(tx, "MULTI")
+    run(tx, "SET", "a", "1")
+    run(tx, "GET", "a")
+    run(tx, "INCR", "a")
+    run(tx, "EXEC")
+
+    # a read-only transaction logs nothing
+    run(tx, "MULTI")
+    run(tx, "GET", "a")
+    run(tx, "EXEC")
+
+    assert logged_commands(db)[start:] == [["MULTI"], ["SET", "a", "1"], ["INCR", "a"], ["EXEC"]]
+    db.aof.close()
+
+    db = PhotonDB(data_dir=data_dir, appendonly=True)
+    assert db.get("a") == "2"
@@ -0,0 +1,147 @@
+import random
+
+import pytest
+
+from parser import ProtocolError, ReplyError, RespEncoder, RespParser, RespReplyParser, SimpleString
+
+
+def chunks(data: bytes, rng: random.Random, max_size: int):
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, max_size)
+        yield data[pos:pos + size]
+        pos += size
+
+
+def parse_requests(data: bytes, sizes) -> list:
+    parser = RespParser()
+    commands = []
+    for chunk in sizes(data):
+        parser.feed(chunk)
+        commands.extend(parser)
+    assert parser.pending() == 0
+    return commands
+
+
+COMMANDS = [
+    ["SET", "key", "value"],
+    ["GET", "key"],
+    ["MSET"] + [f"k{i}" for i in range(500)],
+    ["SET", "empty", ""],
+    ["SET", "binary", "\r\n\x00é"],
+    ["LPUSH", "list", "x" * 100000],
+]
+
+
+def test_request_parser_one_write():
+    data = b"".join(RespEncoder.encode_command(cmd) for cmd in COMMANDS)
+    assert parse_requests(data, lambda d: [d]) == COMMANDS
+
+
+def test_request_parser_byte_by_byte():
+    data = b"".join(RespEncoder.encode_command(cmd) for cmd in COMMANDS[:4])
+    assert parse_requests(data, lambda d: (d[i:i + 1] for i in range(len(d)))) == COMMANDS[:4]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_request_parser_random_chunks(seed):
+    rng = random.Random(seed)
+    data = b"".join(RespEncoder.encode_command(cmd) for cmd in COMMANDS)
+    assert parse_requests(data, lambda d: chunks(d, rng, 4096)) == COMMANDS
+
+
+def test_request_parser_pending_counts_partial_command():
+    parser = RespParser()
+    first = RespEncoder.encode_command(["SET", "a", "1"])
+    second = RespEncoder.encode_command(["MSET", "b", "2", "c", "3"])
+
+    parser.feed(first + second[:20])
+    assert list(parser) == [["SET", "a", "1"]]
+    # the partial MSET is still unparsed as a whole
+    assert parser.pending() == 20
+
+    parser.feed(second[20:])
+    assert list(parser) == [["MSET", "b", "2", "c", "3"]]
+    assert parser.pending() == 0
+
+
+def test_request_parser_large_multibulk_in_chunks():
+    cmd = ["MSET"] + [f"key:{i}" for i in range(100000)]
+    data = RespEncoder.encode_command(cmd)
+    sizes = lambda d: (d[i:i + 65536] for i in range(0, len(d), 65536))
+    assert parse_requests(data, sizes) == [cmd]
+
+
+def test_request_parser_inline():
+    parser = RespParser()
+    parser.feed(b"SET a b\r\nGE")
+    assert list(parser) == [["SET", "a", "b"]]
+    parser.feed(b"T a\n")
+    assert list(parser) == [["GET", "a"]]
+    assert parser.protocol == "ascii"
+
+
+def test_request_parser_protocol_error():
+    parser = RespParser()
+    parser.feed(b"*1\r\n+OK\r\n")
+    with pytest.raises(ProtocolError):
+        list(parser)
+
+
+REPLIES = [
+    SimpleString("OK"),
+    "bulk",
+    "",
+    None,
+    42,
+    -1,
+    ["a", None, 1, ["nested", [], ["deeper"]], SimpleString("PONG")],
+    [str(i) for i in range(1000)],
+    [],
+]
+
+
+def parse_replies(data: bytes, sizes) -> list:
+    parser = RespReplyParser()
+    replies = []
+    for chunk in sizes(data):
+        parser.feed(chunk)
+        replies.extend(parser.replies())
+    assert parser.get_reply() is RespReplyParser.INCOMPLETE
+    return replies
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_reply_parser_random_chunks(seed):
+    rng = random.Random(seed)
+    data = b"".join(RespEncoder.encode(reply) for reply in REPLIES)
+    assert parse_replies(data, lambda d: chunks(d, rng, 64)) == REPLIES
+
+
+def test_reply_parser_byte_by_byte():
+    data = b"".join(RespEncoder.encode(reply) for reply in REPLIES[:7])
+    assert parse_replies(data, lambda d: (d[i:i + 1] for i in range(len(d)))) == REPLIES[:7]
+
+
+def test_reply_parser_large_array_in_chunks():
+    reply = [f"member:{i}" for i in range(200000)]
+    data = RespEncoder.encode(reply)
+    sizes = lambda d: (d[i:i + 65536] for i in range(0, len(d), 65536))
+    assert parse_replies(data, sizes) == [reply]
+
+
+def test_reply_parser_error_inside_array():
+    parser = RespReplyParser()
+    parser.feed(b"*2\r\n-ERR bad\r\n:1\r\n")
+    reply = parser.get_reply()
+    assert isinstance(reply[0], ReplyError)
+    assert str(reply[0]) == "ERR bad"
+    assert reply[1] == 1
+
+
+@pytest.mark.parametrize("data", [b":abc\r\n", b"$x\r\n", b"*1x\r\n", b"*2\r\n:1\r\n$-\r\n", b"?\r\n"])
+def test_reply_parser_protocol_error(data):
+    parser = RespReplyParser()
+    parser.feed(data)
+    with pytest.raises(ProtocolError):
+        parser.get_reply()
@@ -0,0 +1,253 @@
+import asyncio
+
+from commands import CommandExecutor
+from connection import ClientConnection
+from multi import Transaction
+from photondb import PhotonDB
+from replication import MasterLink, Replication, ReplicationBacklog
+
+
+class Server:
+    """what a ClientConnection needs of its server"""
+
+    def __init__(self, executor):
+        self.command_executor = executor
+
+    def schedule_flush(self, conn):
+        conn.flush()
+
+    def remove_client(self, conn):
+        pass
+
+
+class ReplicaConnection(ClientConnection):
+    """
+    the primary's end of the link: what it writes is kept for the
+    replica, and writing pauses past `window` bytes like a transport
+    whose buffer is full
+    """
+
+    def __init__(self, server, window=None):
+        super().__init__(server, "127.0.0.1:50000")
+        self.window = window
+        self.unread = bytearray()
+        self.sent = bytearray()
+        self.writes = []
+
+    def write_bytes(self, data):
+        self.writes.append(len(data))
+        self.unread += data
+        self.sent += data
+        if self.window is not None and len(self.unread) >= self.window:
+            self.write_paused = True
+
+    def close_transport(self):
+        pass
+
+
+class Transport:
+    """the replica's end of the link"""
+
+    def __init__(self):
+        self.unread = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.unread += data
+
+    def close(self):
+        self.closed = True
+
+
+class Node:
+    def __init__(self, path):
+        self.db = PhotonDB(data_dir=path)
+        self.executor = CommandExecutor(self.db)
+        self.repl = self.executor.replication
+
+
+def follow(replica, primary, window=None):
+    """what REPLICAOF and the connection to the primary do, with an in-memory link"""
+
+    repl = replica.repl
+    if repl.master is None:
+        repl.master = ("127.0.0.1", 6379)
+        repl.readonly = True
+        replica.executor.replaying = True
+        repl.offset = -1
+
+    conn = ReplicaConnection(Server(primary.executor), window)
+    link = MasterLink(repl)
+    link.connection_made(Transport())
+    deliver(conn, link)
+    return conn, link
+
+
+def deliver(conn, link):
+    """move the bytes both ways until the link is quiet"""
+
+    while link.transport.unread or conn.unread:
+        if link.transport.unread:
+            data = bytes(link.transport.unread)
+            link.transport.unread.clear()
+            conn.feed(data)
+        if conn.unread:
+            data = bytes(conn.unread)
+            conn.unread.clear()
+            link.data_received(data)
+
+
+def finish_bgsave(primary, conn, link):
+    """the forked BGSAVE is over: the cron sends it"""
+
+    primary.db.persistence.wait_bgsave()
+    primary.repl.cron()
+    deliver(conn, link)
+
+
+def disconnect(conn, link):
+    conn.connection_lost()
+
+    async def lost():
+        link.connection_lost(None)
+
+    # link_lost() schedules the reconnection on the running loop
+    asyncio.run(lost())
+
+
+def contents(node):
+    out = {}
+    for key in sorted(node.db.data):
+        if node.db.data[key].type == "list":
+            out[key] = node.executor.execute(["LRANGE", key, "0", "-1"])
+        else:
+            out[key] = node.executor.execute(["GET", key])
+    return out
+
+
+def write(node, count, prefix="key"):
+    for i in range(count):
+        node.executor.execute(["SET", f"{prefix}:{i}", "x" * 20])
+
+
+def test_backlog_wraps_around():
+    backlog = ReplicationBacklog(16, offset=100)
+    backlog.append(b"0123456789")
+    assert backlog.read(100) == b"0123456789"
+    backlog.append(b"abcdefghij")
+    assert backlog.offset == 120
+    assert backlog.first_offset == 104
+    assert not backlog.covers(103)
+    assert backlog.read(104) == b"456789abcdefghij"
+    assert backlog.read(118) == b"ij"
+    backlog.append(b"z" * 40)
+    assert backlog.read(backlog.first_offset) == b"z" * 16
+
+
+def test_full_sync_then_stream(tmp_path):
+    primary, replica = Node(tmp_path / "primary"), Node(tmp_path / "replica")
+    write(primary, 100)
+    primary.executor.execute(["RPUSH", "list", "a", "b"])
+
+    conn, link = follow(replica, primary)
+    replica_state = primary.repl.replicas[conn]
+    assert replica_state.port == 0
+    assert link.state == "payload"
+    assert replica_state.state == "bgsave"
+
+    # written after the fork: kept for after the dump
+    primary.executor.execute(["SET", "during", "sync"])
+    finish_bgsave(primary, conn, link)
+
+    assert link.state == "stream"
+    assert replica_state.state == "online"
+    assert replica.repl.master_replid == primary.repl.replid
+    assert contents(replica) == contents(primary)
+
+    primary.executor.execute(["DEL", "key:0"])
+    primary.executor.execute(["LPUSH", "list", "z"])
+    tx = Transaction(primary.executor)
+    for cmd in (["MULTI"], ["SET", "a", "1"], ["INCR", "a"], ["EXEC"]):
+        tx.handle(cmd[0], cmd)
+    deliver(conn, link)
+    assert contents(replica) == contents(primary)
+    assert replica.repl.offset == primary.repl.offset
+
+    # the replica acknowledges its offset
+    replica.repl.cron()
+    deliver(conn, link)
+    assert replica_state.ack_offset == primary.repl.offset
+
+
+def test_partial_resync_after_disconnect(tmp_path):
+    primary, replica = Node(tmp_path / "primary"), Node(tmp_path / "replica")
+    write(primary, 10)
+    conn, link = follow(replica, primary)
+    finish_bgsave(primary, conn, link)
+    disconnect(conn, link)
+    assert replica.repl.link is None
+
+    # missed while disconnected, still in the backlog
+    write(primary, 10, prefix="missed")
+    primary.executor.execute(["DEL", "key:1"])
+
+    conn, link = follow(replica, primary)
+    assert conn.sent.startswith(b"+PONG\r\n+OK\r\n+CONTINUE %s\r\n" % primary.repl.replid.encode())
+    assert link.state == "stream"
+    assert primary.repl.replicas[conn].state == "online"
+    assert primary.db.persistence.bgsave_pid is None
+    assert contents(replica) == contents(primary)
+    assert replica.repl.offset == primary.repl.offset
+
+
+def test_backlog_overflow_falls_back_to_a_full_sync(tmp_path, monkeypatch):
+    monkeypatch.setattr(Replication, "BACKLOG_SIZE", 1024)
+    primary, replica = Node(tmp_path / "primary"), Node(tmp_path / "replica")
+    conn, link = follow(replica, primary)
+    finish_bgsave(primary, conn, link)
+    disconnect(conn, link)
+
+    # more than the backlog holds
+    write(primary, 100, prefix="missed")
+    assert not primary.repl.backlog.covers(replica.repl.offset)
+
+    conn, link = follow(replica, primary)
+    assert b"+FULLRESYNC" in conn.sent
+    assert link.state == "payload"
+    assert primary.repl.replicas[conn].state == "bgsave"
+    finish_bgsave(primary, conn, link)
+    assert contents(replica) == contents(primary)
+    assert len(replica.db.data) == 100
+
+
+def test_full_sync_is_streamed_in_chunks(tmp_path):
+    primary, replica = Node(tmp_path / "primary"), Node(tmp_path / "replica")
+    for i in range(5000):
+        primary.executor.execute(["SET", f"key:{i}", "v" * 100])
+
+    window = 2 * Replication.SYNC_CHUNK
+    conn, link = follow(replica, primary, window=window)
+    primary.db.persistence.wait_bgsave()
+    primary.repl.cron()
+    replica_state = primary.repl.replicas[conn]
+
+    # the transport is full: the rest waits for resume()
+    assert conn.write_paused
+    assert replica_state.state == "send_bulk"
+    assert len(conn.unread) <= window + Replication.SYNC_CHUNK
+    primary.executor.execute(["SET", "during", "bulk"])
+
+    resumed = 0
+    while replica_state.state == "send_bulk":
+        deliver(conn, link)
+        conn.write_paused = False
+        conn.resume()
+        resumed += 1
+    deliver(conn, link)
+
+    assert resumed > 1
+    assert max(conn.writes) <= Replication.SYNC_CHUNK + 100
+    assert replica_state.rdb is None and replica_state.pending is None
+    assert link.state == "stream"
+    assert contents(replica) == contents(primary)
+    assert replica.executor.execute(["GET", "during"]) == "bulk"
@@ -0,0 +1,97 @@
+import pytest
+
+from scan import ScanCursors
+
+
+def full_scan(executor, *options):
+    """every key returned by a SCAN from 0 to 0"""
+
+    keys = []
+    cursor = "0"
+    while True:
+        cursor, found = executor.execute(["SCAN", cursor, *options])
+        keys.extend(found)
+        if cursor == "0":
+            return keys
+
+
+def test_scan_returns_every_key_once(executor):
+    for i in range(1000):
+        executor.execute(["SET", f"key:{i}", "x"])
+
+    keys = full_scan(executor, "COUNT", "37")
+    assert sorted(keys) == sorted(f"key:{i}" for i in range(1000))
+
+
+def test_scan_stable_under_writes(executor):
+    for i in range(1000):
+        executor.execute(["SET", f"key:{i}", "x"])
+
+    added = iter(range(1000, 10000))
+    deleted = iter(range(0, 1000, 2))
+    steps = []          # keys returned by each step
+    deleted_at = {}     # key -> steps done when it was deleted
+
+    cursor = "0"
+    while True:
+        cursor, found = executor.execute(["SCAN", cursor, "COUNT", "10"])
+        steps.append(found)
+        if cursor == "0":
+            break
+        # keys are added and deleted while the scan goes on
+        for _ in range(5):
+            executor.execute(["SET", f"key:{next(added)}", "x"])
+        key = f"key:{next(deleted)}"
+        executor.execute(["DEL", key])
+        deleted_at[key] = len(steps)
+
+    keys = [key for found in steps for key in found]
+    assert len(keys) == len(set(keys))
+    # a key present during the whole scan is returned
+    assert set(keys) >= {f"key:{i}" for i in range(1000)} - set(deleted_at)
+    # a deleted key is not returned any more
+    for key, done in deleted_at.items():
+        assert all(key not in found for found in steps[done:])
+
+
+def test_scan_cursor_can_be_retried(executor):
+    for i in range(100):
+        executor.execute(["SET", f"key:{i}", "x"])
+
+    cursor, first = executor.execute(["SCAN", "0", "COUNT", "10"])
+    _, again = executor.execute(["SCAN", cursor, "COUNT", "10"])
+    _, retried = executor.execute(["SCAN", cursor, "COUNT", "10"])
+    assert again == retried
+    assert not set(first) & set(again)
+
+
+def test_scan_match_and_type(executor):
+    for i in range(50):
+        executor.execute(["SET", f"user:{i}", "x"])
+        executor.execute(["RPUSH", f"queue:{i}", "x"])
+
+    assert sorted(full_scan(executor, "MATCH", "user:1*")) == sorted(
+        f"user:{i}" for i in range(50) if str(i).startswith("1"))
+    assert len(full_scan(executor, "TYPE", "list")) == 50
+
+
+def test_scan_invalid_cursor(executor):
+    for i in range(100):
+        executor.execute(["SET", f"key:{i}", "x"])
+
+    with pytest.raises(ValueError):
+        executor.execute(["SCAN", str(12345 << ScanCursors.POS_BITS)])
+
+
+def test_scan_snapshots_are_capped(executor, monkeypatch):
+    monkeypatch.setattr(ScanCursors, "MAX_RETAINED_KEYS", 250)
+    for i in range(100):
+        executor.execute(["SET", f"key:{i}", "x"])
+
+    open_cursors = [executor.execute(["SCAN", "0", "COUNT", "10"])[0] for _ in range(2)]
+    with pytest.raises(ValueError, match="too many scans"):
+        executor.execute(["SCAN", "0", "COUNT", "10"])
+
+    # the scans in progress are never dropped for a new one
+    for cursor in open_cursors:
+        executor.execute(["SCAN", cursor, "COUNT", "10"])
@@ -0,0 +1,156 @@
+import time
+import zlib
+
+import pytest
+
+from commands import CommandExecutor
+from photondb import PhotonDB
+
+
+def populate(executor):
+    commands = [
+        ["SET", "string", "value"],
+        ["SET", "long", "x" * 1000],
+        ["SET", "unicode", "héllo wörld"],
+        ["SET", "empty", ""],
+        ["SET", "ttl", "soon", "EX", "1000"],
+        ["RPUSH", "list", "a", "b", "c"],
+        ["HSET", "hash", "f1", "v1"],
+        ["HSET", "hash", "f2", "v2"],
+        ["SADD", "set", "x", "y"],
+        ["SADD", "intset", "3", "1", "-2"],
+        ["ZADD", "zset", "2.5", "b", "1", "a", "-inf", "low"],
+    ]
+    for i in range(2000):
+        commands.append(["SET", f"key:{i}", str(i)])
+    for cmd in commands:
+        executor.execute(cmd)
+
+
+def dump(executor, db):
+    """every key with its type, value and TTL, read through the commands"""
+
+    out = {}
+    for key in sorted(db.data):
+        type_ = db.data[key].type
+        if type_ == "string":
+            content = executor.execute(["GET", key])
+        elif type_ == "list":
+            content = executor.execute(["LRANGE", key, "0", "-1"])
+        elif type_ == "hash":
+            content = executor.execute(["HGETALL", key])
+        elif type_ == "set":
+            content = sorted(executor.execute(["SMEMBERS", key]))
+        else:
+            content = executor.execute(["ZRANGE", key, "0", "-1", "WITHSCORES"])
+        out[key] = (type_, content, db.data[key].ttl_ms is not None)
+    return out
+
+
+def test_round_trip(data_dir, db, executor):
+    populate(executor)
+    expected = dump(executor, db)
+    assert expected["ttl"][2]
+    assert db.persistence.save_snapshot(db)
+
+    loaded = PhotonDB(data_dir=data_dir)
+    assert dump(CommandExecutor(loaded), loaded) == expected
+    assert loaded.data["ttl"].ttl_ms == db.data["ttl"].ttl_ms
+
+
+def test_expired_keys_are_not_saved(data_dir, db, executor):
+    executor.execute(["SET", "kept", "1"])
+    executor.execute(["SET", "expired", "1"])
+    db.data["expired"].ttl_ms = time.time() * 1000 - 1000
+    db.persistence.save_snapshot(db)
+
+    loaded = PhotonDB(data_dir=data_dir)
+    assert list(loaded.data) == ["kept"]
+
+
+def flip_byte(path, offset, fix_crc=False):
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        data[offset] ^= 0xFF
+        if fix_crc:
+            # a damaged record the checksum doesn't catch
+            data[-4:] = zlib.crc32(data[:-4]).to_bytes(4, "little")
+        f.seek(0)
+        f.write(data)
+
+
+def test_corrupted_snapshot_is_refused(data_dir, db, executor):
+    populate(executor)
+    db.persistence.save_snapshot(db)
+    flip_byte(db.persistence.rdb_path, 100)
+
+    loaded = PhotonDB(data_dir=data_dir)
+    assert len(loaded.data) == 0
+
+
+@pytest.mark.parametrize("offset", [100, -20])
+def test_corrupted_snapshot_is_refused_lazy(data_dir, db, executor, offset):
+    # a record, or the index
+    populate(executor)
+    db.persistence.save_snapshot(db)
+    flip_byte(db.persistence.rdb_path, offset)
+
+    loaded = PhotonDB(data_dir=data_dir, lazy_load=True)
+    assert loaded.loader is None
+    assert len(loaded.data) == 0
+    assert CommandExecutor(loaded).execute(["GET", "key:1000"]) is None
+
+
+def test_undecodable_record_fails_loudly(data_dir, db, executor):
+    for i in range(2000):
+        executor.execute(["SET", f"key{i}", f"value-{i}"])
+    db.persistence.save_snapshot(db)
+    path = db.persistence.rdb_path
+    with open(path, "rb") as f:
+        before = f.read()
+
+    # the type tag of the first record
+    flip_byte(path, len(b"PHOTONDB") + 1, fix_crc=True)
+    with open(path, "rb") as f:
+        damaged = f.read()
+
+    loaded = PhotonDB(data_dir=data_dir, lazy_load=True)
+    assert loaded.loader is not None
+    with pytest.raises(ValueError, match="corrupted"):
+        while loaded.loading_step():
+            pass
+    # it stays on the bad record instead of skipping it
+    with pytest.raises(ValueError, match="corrupted"):
+        loaded.loading_step()
+
+    # a save needs the whole dataset: the file is not replaced
+    assert not loaded.persistence.save_snapshot(loaded)
+    with open(path, "rb") as f:
+        assert f.read() == damaged != before
+
+
+def test_lazy_load(data_dir, db, executor):
+    populate(executor)
+    expected = dump(executor, db)
+    db.persistence.save_snapshot(db)
+
+    loaded = PhotonDB(data_dir=data_dir, lazy_load=True)
+    loaded_executor = CommandExecutor(loaded)
+    assert loaded.loader is not None
+
+    # served before the load is over, decoded on access
+    assert loaded_executor.execute(["GET", "key:1999"]) == "1999"
+    assert loaded_executor.execute(["LRANGE", "list", "0", "-1"]) == ["a", "b", "c"]
+    with pytest.raises(ValueError, match="LOADING"):
+        loaded_executor.execute(["SCAN", "0"])
+
+    # writes during the load win over the snapshot
+    loaded_executor.execute(["SET", "string", "changed"])
+    loaded_executor.execute(["DEL", "key:0"])
+
+    while loaded.loading_step(0.001):
+        pass
+
+    expected["string"] = ("string", "changed", False)
+    del expected["key:0"]
+    assert dump(loaded_executor, loaded) == expected
@@ -0,0 +1,45 @@
+import pytest
+
+
+def commandstats(executor):
+    fields = {}
+    for line in executor.execute(["INFO", "commandstats"]).splitlines():
+        if line.startswith("cmdstat_"):
+            name, values = line.split(":", 1)
+            stat = dict(item.split("=", 1) for item in values.split(","))
+            fields[name[len("cmdstat_"):]] = {k: stat[k] for k in ("calls", "failed_calls", "rejected_calls")}
+    return fields
+
+
+def test_commandstats_counts_calls(executor):
+    executor.execute(["SET", "a", "1"])
+    executor.execute(["GET", "a"])
+    executor.execute(["GET", "missing"])
+    with pytest.raises(ValueError):
+        executor.execute(["INCR", "a", "b"])
+    executor.execute(["SET", "s", "x"])
+    with pytest.raises(ValueError):
+        executor.execute(["INCR", "s"])
+
+    stats = commandstats(executor)
+    assert stats["get"] == {"calls": "2", "failed_calls": "0", "rejected_calls": "0"}
+    assert stats["set"]["calls"] == "2"
+    # a wrong arity is rejected before the call, a failed call is still a call
+    assert stats["incr"] == {"calls": "1", "failed_calls": "1", "rejected_calls": "1"}
+    # and the INFO that read them
+    assert executor.stats.total_commands() == 6
+    assert executor.stats.keyspace_hits == 1
+    assert executor.stats.keyspace_misses == 1
+
+
+def test_resetstat_counts_itself(executor):
+    executor.execute(["SET", "a", "1"])
+    executor.execute(["CONFIG", "RESETSTAT"])
+
+    # the stats start again with the CONFIG call that reset them
+    stats = commandstats(executor)
+    assert set(stats) == {"config"}
+    assert stats["config"]["calls"] == "1"
+
+    executor.execute(["CONFIG", "RESETSTAT"])
+    assert commandstats(executor)["config"]["calls"] == "1"
@@ -0,0 +1,151 @@
+import random
+
+import pytest
+
+from zset import MAX_COMPACT_ENTRIES, MAX_COMPACT_VALUE, ZSet, format_score, parse_bound, parse_score
+
+
+def ordered(model):
+    """(member, score) in ZSet order: score, then member"""
+
+    return sorted(model.items(), key=lambda item: (item[1], item[0]))
+
+
+def in_range(score, low, high):
+    above = score > low[0] if low[1] else score >= low[0]
+    below = score < high[0] if high[1] else score <= high[0]
+    return above and below
+
+
+def check(zset, model):
+    pairs = ordered(model)
+    assert len(zset) == len(model)
+    assert list(zset.pairs()) == pairs
+    assert sorted(zset) == sorted(model)
+    for rank, (member, score) in enumerate(pairs):
+        assert zset.score(member) == score
+        assert zset.rank(member) == rank
+        assert zset.rank(member, reverse=True) == len(pairs) - 1 - rank
+
+
+def test_compact_converts_past_the_limits():
+    zset = ZSet()
+    for i in range(MAX_COMPACT_ENTRIES):
+        zset.add(f"m{i}", i)
+    assert zset.encoding == "listpack"
+    zset.add("one-more", 0.5)
+    assert zset.encoding == "skiplist"
+    # never converted back
+    zset.pop(MAX_COMPACT_ENTRIES)
+    assert len(zset) == 1
+    assert zset.encoding == "skiplist"
+
+    zset = ZSet()
+    zset.add("short", 1)
+    zset.add("x" * (MAX_COMPACT_VALUE + 1), 2)
+    assert zset.encoding == "skiplist"
+    assert list(zset.pairs()) == [("short", 1), ("x" * (MAX_COMPACT_VALUE + 1), 2)]
+
+
+def test_from_sorted_picks_the_encoding():
+    small = [(f"m{i}", float(i)) for i in range(10)]
+    big = [(f"m{i:04}", float(i)) for i in range(1000)]
+    assert ZSet.from_sorted(small).encoding == "listpack"
+    zset = ZSet.from_sorted(big)
+    assert zset.encoding == "skiplist"
+    check(zset, dict(big))
+
+
+def test_scores_and_bounds():
+    assert parse_score("-inf") == float("-inf")
+    assert parse_bound("(1.5") == (1.5, True)
+    assert parse_bound("+inf") == (float("inf"), False)
+    for text in ("nan", "abc"):
+        with pytest.raises(ValueError):
+            parse_score(text)
+        with pytest.raises(ValueError):
+            parse_bound(text)
+    assert format_score(2.0) == "2"
+    assert format_score(2.5) == "2.5"
+    assert format_score(float("-inf")) == "-inf"
+
+
+@pytest.mark.parametrize("size", [50, 2000])
+def test_model_check(size):
+    """random writes and range reads against a dict, in both encodings"""
+
+    rng = random.Random(size)
+    zset = ZSet()
+    model = {}
+
+    for step in range(5000):
+        member = f"m{rng.randrange(size)}"
+        op = rng.random()
+        if op < 0.45:
+            score = float(rng.randrange(-50, 50)) if rng.random() < 0.8 else rng.choice([float("inf"), float("-inf")])
+            assert zset.add(member, score) == (member not in model)
+            model[member] = score
+        elif op < 0.65:
+            assert zset.remove(member) == (member in model)
+            model.pop(member, None)
+        elif op < 0.7:
+            count = rng.randrange(4)
+            highest = rng.random() < 0.5
+            pairs = ordered(model)
+            expected = pairs[::-1][:count] if highest else pairs[:count]
+            assert zset.pop(count, highest) == expected
+            for m, _ in expected:
+                del model[m]
+        else:
+            low = (float(rng.randrange(-60, 60)), rng.random() < 0.3)
+            high = (low[0] + rng.randrange(0, 30), rng.random() < 0.3)
+            offset, count = rng.randrange(5), rng.choice([-1, 0, 1, 5])
+            reverse = rng.random() < 0.5
+
+            expected = [p for p in ordered(model) if in_range(p[1], low, high)]
+            assert zset.count(low, high) == len(expected)
+            if reverse:
+                expected.reverse()
+            expected = expected[offset:]
+            if count >= 0:
+                expected = expected[:count]
+            assert zset.range_by_score(low, high, reverse, offset, count) == expected
+
+            if model:
+                start = rng.randrange(len(model))
+                stop = rng.randrange(start, len(model))
+                pairs = ordered(model)
+                if reverse:
+                    pairs.reverse()
+                assert zset.range_by_rank(start, stop, reverse) == pairs[start:stop + 1]
+
+        if step % 500 == 0:
+            check(zset, model)
+
+    check(zset, model)
+    if size > MAX_COMPACT_ENTRIES:
+        assert zset.encoding == "skiplist"
+
+
+def test_commands(executor):
+    assert executor.execute(["ZADD", "z", "1", "a", "2", "b", "3", "c"]) == 3
+    assert executor.execute(["ZADD", "z", "5", "a"]) == 0
+    assert executor.execute(["ZINCRBY", "z", "0.5", "b"]) == "2.5"
+    assert executor.execute(["ZRANGE", "z", "0", "-1", "WITHSCORES"]) == ["b", "2.5", "c", "3", "a", "5"]
+    assert executor.execute(["ZREVRANGE", "z", "0", "0"]) == ["a"]
+    assert executor.execute(["ZRANGEBYSCORE", "z", "(2.5", "+inf"]) == ["c", "a"]
+    assert executor.execute(["ZREVRANGEBYSCORE", "z", "+inf", "-inf", "LIMIT", "1", "1"]) == ["c"]
+    assert executor.execute(["ZCOUNT", "z", "-inf", "3"]) == 2
+    assert executor.execute(["ZRANK", "z", "a"]) == 2
+    assert executor.execute(["ZSCORE", "z", "missing"]) is None
+    assert executor.execute(["ZPOPMIN", "z"]) == ["b", "2.5"]
+
+    with pytest.raises(ValueError, match="not a valid float"):
+        executor.execute(["ZADD", "z", "nan", "x"])
+    with pytest.raises(TypeError):
+        executor.execute(["LPUSH", "z", "x"])
+
+    # the key goes with its last member
+    assert executor.execute(["ZREM", "z", "a", "c", "missing"]) == 2
+    assert executor.execute(["ZCARD", "z"]) == 0
+    assert executor.execute(["DBSIZE"]) == 0